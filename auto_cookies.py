@@ -5,16 +5,21 @@
 包含cookies缓存机制和详细异常处理
 """
 
+import json
 import logging
 import os
 import shutil
 import sqlite3
 import sys
 import tempfile
+import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 
+from core.metrics import record_cache
+
 try:
     from typing import Dict, List, Optional, Tuple
 except ImportError:
@@ -27,6 +32,39 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 缓存文件头部记录来源浏览器数据库签名的注释前缀
+SIGNATURE_HEADER = "# source-signature: "
+
+# 进程内共享的缓存状态: 缓存文件路径 -> (来源浏览器, 数据库路径, 数据库签名)
+_memory_cache: Dict[str, Tuple[str, List[str], list]] = {}
+# 每个域名一把锁，并发的刷新请求只触发一次提取
+_domain_locks: Dict[str, threading.Lock] = {}
+_domain_locks_guard = threading.Lock()
+
+
+def _domain_lock(domain: str) -> threading.Lock:
+    with _domain_locks_guard:
+        return _domain_locks.setdefault(domain, threading.Lock())
+
+
+def _database_signature(db_paths: List[str]) -> list:
+    """
+    浏览器cookies数据库及其WAL文件的 (mtime_ns, size)；浏览器写入新cookies时签名随之变化。
+    空WAL与不存在等价：只读打开未被占用的WAL数据库时，SQLite会创建一个空WAL文件。
+    """
+    signature = []
+    for db_path in db_paths:
+        for path in (db_path, f"{db_path}-wal"):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is None or (path != db_path and stat.st_size == 0):
+                signature.append([path, None, None])
+            else:
+                signature.append([path, stat.st_mtime_ns, stat.st_size])
+    return signature
+
 
 # 定义特定的异常类
 class BrowserCookieError(Exception):
@@ -51,12 +89,13 @@ class BrowserCookiesExtractor:
     """浏览器cookies提取器。
 
     支持从Chrome、Firefox、Safari、Edge等主流浏览器提取cookies，
-    并提供缓存机制以提高性能和减少浏览器访问频率。
+    并按域名缓存：每个域名一个Netscape文件，浏览器cookies数据库
+    （含WAL）的mtime和大小不变时缓存一直有效。
 
     Attributes:
         cache_enabled (bool): 是否启用缓存机制。
-        cache_file (str): 缓存文件路径。
-        cache_duration (timedelta): 缓存有效期。
+        cache_file (str): 缓存文件路径模板，按域名派生为 cookies.cache.<域名>.txt。
+        cache_duration (timedelta): 无法取得数据库签名的来源（如Safari）的缓存有效期。
         supported_browsers (dict): 支持的浏览器及其处理方法。
     """
 
@@ -70,8 +109,8 @@ class BrowserCookiesExtractor:
 
         Args:
             cache_enabled (bool): 是否启用缓存机制，默认为True。
-            cache_file (str): 缓存文件路径，默认为'cookies.cache.txt'。
-            cache_duration_hours (int): 缓存有效期（小时），默认为24小时。
+            cache_file (str): 缓存文件路径模板，默认为'cookies.cache.txt'。
+            cache_duration_hours (int): 无数据库签名时的缓存有效期（小时），默认为24小时。
         """
         self.cache_enabled = cache_enabled
         self.cache_file = cache_file
@@ -95,34 +134,39 @@ class BrowserCookiesExtractor:
         Returns:
             str: cookies文件路径，如果失败则返回None
         """
-        # 1. 首先检查缓存 (卫语句)
-        if self.cache_enabled and self._is_cache_valid():
-            logger.info(f"✅ 使用有效的cookies缓存: {self.cache_file}")
-            return self.cache_file
-
-        # 2. 确定要尝试的浏览器列表
-        browsers_to_try = self.supported_browsers.keys() if browser == "auto" else [browser]
-
-        # 3. 遍历并尝试提取
-        for browser_name in browsers_to_try:
-            if browser_name not in self.supported_browsers:
-                logger.error(f"不支持的浏览器: {browser_name}")
-                continue
+        # 同一域名的并发请求串行化：等待者醒来时直接命中刚写好的缓存
+        with _domain_lock(domain):
+            # 1. 首先检查缓存 (卫语句)
+            if self.cache_enabled:
+                cached = self.get_cached_cookies(domain)
+                record_cache("cookies", bool(cached))
+                if cached:
+                    logger.info(f"✅ 使用有效的cookies缓存: {cached}")
+                    return cached
+
+            # 2. 确定要尝试的浏览器列表
+            browsers_to_try = self.supported_browsers.keys() if browser == "auto" else [browser]
+
+            # 3. 遍历并尝试提取
+            for browser_name in browsers_to_try:
+                if browser_name not in self.supported_browsers:
+                    logger.error(f"不支持的浏览器: {browser_name}")
+                    continue
+
+                try:
+                    cookies_file = self._try_extract_and_save(browser_name, domain)
+                    if cookies_file:
+                        return cookies_file  # 成功提取，立即返回
+                except BrowserCookieError as e:
+                    log_message = f"从 {browser_name} 获取cookies失败: {e}"
+                    if browser == "auto":
+                        logger.debug(log_message)  # 在自动模式下，失败是正常的，使用debug级别
+                    else:
+                        logger.error(log_message)  # 在指定浏览器模式下，失败是错误
+                except Exception as e:
+                    logger.warning(f"从 {browser_name} 获取cookies时发生未知错误: {e}")
 
-            try:
-                cookies_file = self._try_extract_and_save(browser_name, domain)
-                if cookies_file:
-                    return cookies_file  # 成功提取，立即返回
-            except BrowserCookieError as e:
-                log_message = f"从 {browser_name} 获取cookies失败: {e}"
-                if browser == "auto":
-                    logger.debug(log_message)  # 在自动模式下，失败是正常的，使用debug级别
-                else:
-                    logger.error(log_message)  # 在指定浏览器模式下，失败是错误
-            except Exception as e:
-                logger.warning(f"从 {browser_name} 获取cookies时发生未知错误: {e}")
-
-        return None
+            return None
 
     def _try_extract_and_save(self, browser: str, domain: str) -> Optional[str]:
         """
@@ -135,15 +179,14 @@ class BrowserCookiesExtractor:
         Returns:
             str: 成功后的cookies文件路径，否则返回None
         """
+        # 先取签名再读取：读取期间浏览器写入的变化会让下次校验失效，而不是被漏掉
+        db_paths = self._cookie_db_paths(browser)
+        signature = _database_signature(db_paths)
         cookies = self._extract_cookies_with_retry(browser, domain)
         if not cookies:
             return None
 
-        cookies_file = self._save_cookies_to_file(cookies, domain)
-        if cookies_file and self.cache_enabled:
-            self._update_cache(cookies_file)
-
-        return cookies_file
+        return self._save_cookies_to_file(cookies, domain, (browser, db_paths, signature))
 
     def _extract_cookies_with_retry(self, browser: str, domain: str, max_retries: int = 2) -> List[Dict]:
         """带重试机制的cookies提取。
@@ -187,57 +230,84 @@ class BrowserCookiesExtractor:
             return BrowserCookieError(f"未找到{browser}cookies文件，请确保浏览器已安装并使用过")
         return BrowserCookieError(f"从{browser}获取cookies失败: {e}")
 
-    def _is_cache_valid(self) -> bool:
-        """检查缓存是否有效。
+    def domain_cache_file(self, domain: str) -> Path:
+        """域名对应的缓存文件路径，如 cookies.cache.youtube.com.txt"""
+        template = Path(self.cache_file)
+        return template.with_name(f"{template.stem}.{domain}{template.suffix or '.txt'}")
+
+    def get_cached_cookies(self, domain: str) -> Optional[str]:
+        """返回仍然有效的域名缓存文件路径，无效或不存在时返回None。"""
+        return str(self.domain_cache_file(domain)) if self._is_cache_valid(domain) else None
+
+    def _is_cache_valid(self, domain: str) -> bool:
+        """检查域名缓存是否有效。
+
+        缓存记录了写入时来源浏览器数据库的签名；签名未变说明浏览器里的cookies
+        没有变化，重新提取只会得到同样的结果。无签名的来源按缓存有效期判断。
+
+        Args:
+            domain (str): 目标域名。
 
         Returns:
-            bool: 如果缓存文件存在且在有效期内则返回True，否则返回False。
+            bool: 缓存有效返回True，否则返回False。
         """
+        cache_path = self.domain_cache_file(domain)
         try:
-            cache_path = Path(self.cache_file)
-            if not cache_path.exists():
-                return False
-
-            # 检查文件修改时间
-            file_mtime = datetime.fromtimestamp(cache_path.stat().st_mtime)
-            current_time = datetime.now()
-
-            return (current_time - file_mtime) < self.cache_duration
+            stat = cache_path.stat()
+        except FileNotFoundError:
+            _memory_cache.pop(str(cache_path), None)
+            return False
         except (OSError, PermissionError) as e:
             logger.debug(f"检查缓存有效性时无法访问文件: {e}")
             return False
+
+        try:
+            source = _memory_cache.get(str(cache_path)) or self._read_cache_source(cache_path)
         except Exception as e:
             logger.warning(f"检查缓存有效性时发生未知错误: {e}", exc_info=True)
             return False
+        if not source:
+            return False
 
-    def _update_cache(self, cookies_file: str) -> None:
-        """更新cookies缓存。
-
-        Args:
-            cookies_file (str): 要复制到缓存的cookies文件路径。
-        """
-        try:
-            if cookies_file != self.cache_file:
-                shutil.copy2(cookies_file, self.cache_file)
-                logger.info(f"✅ cookies缓存已更新: {self.cache_file}")
-        except (OSError, PermissionError) as e:
-            logger.warning(f"无法写入cookies缓存文件: {e}")
-        except Exception as e:
-            logger.error(f"更新cookies缓存时发生未知错误: {e}", exc_info=True)
+        browser, db_paths, signature = source
+        if db_paths:
+            valid = _database_signature(db_paths) == signature
+        else:
+            file_mtime = datetime.fromtimestamp(stat.st_mtime)
+            valid = (datetime.now() - file_mtime) < self.cache_duration
+
+        if valid:
+            _memory_cache[str(cache_path)] = source
+        else:
+            _memory_cache.pop(str(cache_path), None)
+            logger.debug(f"{browser} cookies数据库已变化，{domain} 的缓存失效")
+        return valid
+
+    def _read_cache_source(self, cache_path: Path) -> Optional[Tuple[str, List[str], list]]:
+        """从缓存文件头部读取来源浏览器和数据库签名。"""
+        with open(cache_path, encoding="utf-8") as f:
+            for _ in range(4):
+                line = f.readline()
+                if line.startswith(SIGNATURE_HEADER):
+                    source = json.loads(line[len(SIGNATURE_HEADER) :])
+                    return source["browser"], source["databases"], source["signature"]
+        return None
 
     def clear_cache(self) -> bool:
-        """清除cookies缓存。
+        """清除所有域名的cookies缓存。
 
         Returns:
             bool: 如果成功清除缓存则返回True，否则返回False。
         """
+        template = Path(self.cache_file)
+        removed = False
         try:
-            cache_path = Path(self.cache_file)
-            if cache_path.exists():
+            for cache_path in template.parent.glob(f"{template.stem}.*{template.suffix or '.txt'}"):
+                _memory_cache.pop(str(cache_path), None)
                 cache_path.unlink()
-                logger.info(f"✅ cookies缓存已清除: {self.cache_file}")
-                return True
-            return False
+                logger.info(f"✅ cookies缓存已清除: {cache_path}")
+                removed = True
+            return removed
         except (OSError, PermissionError) as e:
             logger.error(f"无法删除cookies缓存文件，权限不足: {e}")
             return False
@@ -245,6 +315,78 @@ class BrowserCookiesExtractor:
             logger.error(f"清除cookies缓存时发生未知错误: {e}", exc_info=True)
             return False
 
+    def _cookie_db_paths(self, browser: str) -> List[str]:
+        """浏览器cookies数据库文件路径（用于计算缓存签名）。"""
+        if browser in ("chrome", "edge"):
+            return [self._chromium_cookies_path(browser)]
+        if browser == "firefox":
+            firefox_path = self._firefox_profiles_path()
+            if not os.path.isdir(firefox_path):
+                return []
+            return sorted(
+                os.path.join(firefox_path, profile, "cookies.sqlite")
+                for profile in os.listdir(firefox_path)
+                if os.path.exists(os.path.join(firefox_path, profile, "cookies.sqlite"))
+            )
+        return []
+
+    @staticmethod
+    def _chromium_cookies_path(browser: str) -> str:
+        """Chrome/Edge 默认配置下的cookies数据库路径。"""
+        if sys.platform == "darwin":
+            base = {
+                "chrome": "~/Library/Application Support/Google/Chrome",
+                "edge": "~/Library/Application Support/Microsoft Edge",
+            }
+        elif sys.platform == "win32":
+            base = {
+                "chrome": "~/AppData/Local/Google/Chrome/User Data",
+                "edge": "~/AppData/Local/Microsoft/Edge/User Data",
+            }
+        else:  # Linux
+            base = {"chrome": "~/.config/google-chrome", "edge": "~/.config/microsoft-edge"}
+        return os.path.expanduser(f"{base[browser]}/Default/Cookies")
+
+    @staticmethod
+    def _firefox_profiles_path() -> str:
+        if sys.platform == "darwin":
+            return os.path.expanduser("~/Library/Application Support/Firefox/Profiles")
+        if sys.platform == "win32":
+            return os.path.expanduser("~/AppData/Roaming/Mozilla/Firefox/Profiles")
+        return os.path.expanduser("~/.mozilla/firefox")
+
+    @contextmanager
+    def _open_cookie_db(self, db_path: str):
+        """
+        打开浏览器cookies数据库。
+
+        优先以只读方式直接打开；浏览器以独占锁占用数据库时，才把数据库
+        连同WAL文件复制到临时目录再读取（不复制WAL会漏掉尚未检查点的新cookies）。
+        """
+        try:
+            conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, timeout=1.0)
+            conn.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+        except sqlite3.OperationalError:
+            conn = None
+
+        if conn is not None:
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_db = os.path.join(temp_dir, "cookies.db")
+            shutil.copy2(db_path, temp_db)
+            if os.path.exists(f"{db_path}-wal"):
+                shutil.copy2(f"{db_path}-wal", f"{temp_db}-wal")
+            conn = sqlite3.connect(temp_db, timeout=10.0)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
     def _get_chrome_cookies(self, domain: str) -> List[Dict]:
         """从Chrome浏览器获取cookies。
 
@@ -257,84 +399,21 @@ class BrowserCookiesExtractor:
         Raises:
             BrowserCookieError: 当无法访问Chrome cookies数据库时。
         """
-        cookies = []
-
-        # Chrome cookies数据库路径（macOS）
-        if sys.platform == "darwin":
-            chrome_cookies_path = os.path.expanduser("~/Library/Application Support/Google/Chrome/Default/Cookies")
-        elif sys.platform == "win32":
-            chrome_cookies_path = os.path.expanduser("~/AppData/Local/Google/Chrome/User Data/Default/Cookies")
-        else:  # Linux
-            chrome_cookies_path = os.path.expanduser("~/.config/google-chrome/Default/Cookies")
-
+        chrome_cookies_path = self._chromium_cookies_path("chrome")
         if not os.path.exists(chrome_cookies_path):
             raise BrowserCookieError("未找到Chrome cookies数据库，请确保Chrome已安装并使用过")
 
-        # 复制数据库到临时文件（因为Chrome可能正在使用）
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".db") as temp_file:
-                shutil.copy2(chrome_cookies_path, temp_file.name)
-                temp_cookies_path = temp_file.name
+            with self._open_cookie_db(chrome_cookies_path) as conn:
+                cookies = self._query_chromium_cookies(conn, domain)
         except PermissionError as e:
             raise BrowserCookieError("无法访问Chrome cookies文件，请关闭Chrome浏览器后重试") from e
         except (OSError, IOError) as e:
             raise BrowserCookieError(f"Chrome cookies文件操作失败: {e}") from e
-        except Exception as e:
-            raise BrowserCookieError(f"复制Chrome cookies文件时发生未知错误: {e}") from e
-
-        try:
-            conn = sqlite3.connect(temp_cookies_path, timeout=10.0)
-            cursor = conn.cursor()
-
-            # 查询指定域名的cookies
-            query = """
-            SELECT name, value, host_key, path, expires_utc, is_secure, is_httponly
-            FROM cookies 
-            WHERE host_key LIKE ? OR host_key LIKE ?
-            """
-
-            cursor.execute(query, (f"%{domain}%", f"%.{domain}"))
-            rows = cursor.fetchall()
-
-            for row in rows:
-                name, value, host_key, path, expires_utc, is_secure, is_httponly = row
-
-                # 转换Chrome时间戳格式
-                if expires_utc:
-                    # Chrome使用Windows epoch (1601年1月1日)
-                    expires = (expires_utc / 1000000) - 11644473600
-                else:
-                    expires = 0
-
-                cookies.append(
-                    {
-                        "name": name,
-                        "value": value,
-                        "domain": host_key,
-                        "path": path,
-                        "expires": int(expires),
-                        "secure": bool(is_secure),
-                        "httponly": bool(is_httponly),
-                    }
-                )
-
-            conn.close()
-
         except sqlite3.DatabaseError as e:
             raise BrowserCookieError(f"Chrome数据库访问失败，可能被浏览器占用: {e}") from e
-        except sqlite3.Error as e:
-            raise BrowserCookieError(f"Chrome数据库操作失败: {e}") from e
         except Exception as e:
             raise BrowserCookieError(f"读取Chrome cookies时发生未知错误: {e}") from e
-        finally:
-            # 清理临时文件
-            try:
-                os.unlink(temp_cookies_path)
-            except (OSError, FileNotFoundError):
-                # 文件可能已被删除或不存在，忽略错误
-                pass
-            except Exception as e:
-                logger.warning(f"清理Chrome临时文件失败: {e}")
 
         if not cookies:
             logger.warning(f"在Chrome中未找到域名 {domain} 的cookies")
@@ -353,12 +432,7 @@ class BrowserCookiesExtractor:
         cookies = []
 
         # Firefox profile目录
-        if sys.platform == "darwin":
-            firefox_path = os.path.expanduser("~/Library/Application Support/Firefox/Profiles")
-        elif sys.platform == "win32":
-            firefox_path = os.path.expanduser("~/AppData/Roaming/Mozilla/Firefox/Profiles")
-        else:  # Linux
-            firefox_path = os.path.expanduser("~/.mozilla/firefox")
+        firefox_path = self._firefox_profiles_path()
 
         if not os.path.exists(firefox_path):
             logger.warning("未找到Firefox profile目录")
@@ -394,23 +468,15 @@ class BrowserCookiesExtractor:
         """
         cookies = []
 
-        # 复制到临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".db") as temp_file:
-            shutil.copy2(cookies_file, temp_file.name)
-            temp_cookies_path = temp_file.name
-
         try:
-            conn = sqlite3.connect(temp_cookies_path)
-            cursor = conn.cursor()
-
-            query = """
-            SELECT name, value, host, path, expiry, isSecure, isHttpOnly
-            FROM moz_cookies 
-            WHERE host LIKE ? OR host LIKE ?
-            """
-
-            cursor.execute(query, (f"%{domain}%", f"%.{domain}"))
-            rows = cursor.fetchall()
+            with self._open_cookie_db(cookies_file) as conn:
+                # 精确匹配域名本身及其子域名（不再用 %domain% 误匹配无关域名）
+                query = """
+                SELECT name, value, host, path, expiry, isSecure, isHttpOnly
+                FROM moz_cookies
+                WHERE host IN (?, ?) OR host LIKE ?
+                """
+                rows = conn.execute(query, (domain, f".{domain}", f"%.{domain}")).fetchall()
 
             for row in rows:
                 name, value, host, path, expiry, is_secure, is_httponly = row
@@ -427,22 +493,12 @@ class BrowserCookiesExtractor:
                     }
                 )
 
-            conn.close()
-
         except (OSError, IOError, PermissionError) as e:
             logger.error(f"无法访问Firefox cookies文件: {e}")
         except sqlite3.Error as e:
             logger.error(f"Firefox数据库操作失败: {e}")
         except Exception as e:
             logger.error(f"读取Firefox cookies时发生未知错误: {e}", exc_info=True)
-        finally:
-            try:
-                os.unlink(temp_cookies_path)
-            except (OSError, FileNotFoundError):
-                # 文件可能已被删除或不存在，忽略错误
-                pass
-            except Exception as e:
-                logger.warning(f"清理Firefox临时文件失败: {e}")
 
         return cookies
 
@@ -497,19 +553,12 @@ class BrowserCookiesExtractor:
         Returns:
             List[Dict]: 从Edge提取的cookies列表。
         """
-        cookies = []
-
         # Edge cookies路径（与Chrome类似）
-        if sys.platform == "darwin":
-            edge_cookies_path = os.path.expanduser("~/Library/Application Support/Microsoft Edge/Default/Cookies")
-        elif sys.platform == "win32":
-            edge_cookies_path = os.path.expanduser("~/AppData/Local/Microsoft/Edge/User Data/Default/Cookies")
-        else:  # Linux
-            edge_cookies_path = os.path.expanduser("~/.config/microsoft-edge/Default/Cookies")
+        edge_cookies_path = self._chromium_cookies_path("edge")
 
         if not os.path.exists(edge_cookies_path):
             logger.warning("未找到Edge cookies数据库")
-            return cookies
+            return []
 
         # 使用与Chrome相同的方法
         return self._read_chromium_cookies(edge_cookies_path, domain)
@@ -524,70 +573,56 @@ class BrowserCookiesExtractor:
         Returns:
             List[Dict]: 从数据库读取的cookies列表。
         """
-        cookies = []
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".db") as temp_file:
-            shutil.copy2(cookies_path, temp_file.name)
-            temp_cookies_path = temp_file.name
-
         try:
-            conn = sqlite3.connect(temp_cookies_path)
-            cursor = conn.cursor()
-
-            query = """
-            SELECT name, value, host_key, path, expires_utc, is_secure, is_httponly
-            FROM cookies 
-            WHERE host_key LIKE ? OR host_key LIKE ?
-            """
-
-            cursor.execute(query, (f"%{domain}%", f"%.{domain}"))
-            rows = cursor.fetchall()
-
-            for row in rows:
-                name, value, host_key, path, expires_utc, is_secure, is_httponly = row
-
-                if expires_utc:
-                    expires = (expires_utc / 1000000) - 11644473600
-                else:
-                    expires = 0
-
-                cookies.append(
-                    {
-                        "name": name,
-                        "value": value,
-                        "domain": host_key,
-                        "path": path,
-                        "expires": int(expires),
-                        "secure": bool(is_secure),
-                        "httponly": bool(is_httponly),
-                    }
-                )
-
-            conn.close()
-
+            with self._open_cookie_db(cookies_path) as conn:
+                return self._query_chromium_cookies(conn, domain)
         except (OSError, IOError, PermissionError) as e:
             logger.error(f"无法访问Chromium cookies文件: {e}")
         except sqlite3.Error as e:
             logger.error(f"Chromium数据库操作失败: {e}")
         except Exception as e:
             logger.error(f"读取Chromium cookies时发生未知错误: {e}", exc_info=True)
-        finally:
-            try:
-                os.unlink(temp_cookies_path)
-            except (OSError, FileNotFoundError):
-                # 文件可能已被删除或不存在，忽略错误
-                pass
-            except Exception as e:
-                logger.warning(f"清理Chromium临时文件失败: {e}")
 
+        return []
+
+    def _query_chromium_cookies(self, conn: sqlite3.Connection, domain: str) -> List[Dict]:
+        """从Chromium cookies数据库查询域名及其子域名的cookies。"""
+        # 精确匹配域名本身及其子域名（不再用 %domain% 误匹配无关域名）
+        query = """
+        SELECT name, value, host_key, path, expires_utc, is_secure, is_httponly
+        FROM cookies
+        WHERE host_key IN (?, ?) OR host_key LIKE ?
+        """
+
+        cookies = []
+        for row in conn.execute(query, (domain, f".{domain}", f"%.{domain}")):
+            name, value, host_key, path, expires_utc, is_secure, is_httponly = row
+
+            # Chrome使用Windows epoch (1601年1月1日)
+            expires = (expires_utc / 1000000) - 11644473600 if expires_utc else 0
+
+            cookies.append(
+                {
+                    "name": name,
+                    "value": value,
+                    "domain": host_key,
+                    "path": path,
+                    "expires": int(expires),
+                    "secure": bool(is_secure),
+                    "httponly": bool(is_httponly),
+                }
+            )
         return cookies
 
-    def _save_cookies_to_file(self, cookies: List[Dict], domain: str) -> Optional[str]:
-        """保存cookies为Netscape格式文件。
+    def _save_cookies_to_file(
+        self, cookies: List[Dict], domain: str, source: Optional[Tuple[str, List[str], list]] = None
+    ) -> Optional[str]:
+        """原子地保存cookies为域名对应的Netscape格式文件。
 
         Args:
             cookies (List[Dict]): 要保存的cookies列表。
             domain (str): 目标域名。
+            source: (来源浏览器, 数据库路径, 数据库签名)，写入文件头部用于缓存校验。
 
         Returns:
             str: 保存的cookies文件路径，失败时返回None。
@@ -595,16 +630,29 @@ class BrowserCookiesExtractor:
         if not cookies:
             return None
 
-        cookies_file = "cookies.txt"
+        cookies_file = self.domain_cache_file(domain)
+        temp_path = None
         try:
-            with open(cookies_file, "w", encoding="utf-8") as f:
+            cookies_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=cookies_file.parent, prefix=f".{cookies_file.name}.")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
                 f.write("# Netscape HTTP Cookie File\n")
-                f.write("# This is a generated file! Do not edit.\n\n")
+                f.write("# This is a generated file! Do not edit.\n")
+                if source:
+                    browser, db_paths, signature = source
+                    header = {"browser": browser, "databases": db_paths, "signature": signature}
+                    f.write(f"{SIGNATURE_HEADER}{json.dumps(header, ensure_ascii=False)}\n")
+                f.write("\n")
                 for cookie in cookies:
                     f.write(self._format_cookie_as_netscape(cookie))
+            # 写入临时文件后替换，并发读取者不会看到写了一半的文件
+            os.replace(temp_path, cookies_file)
+            temp_path = None
 
+            if source:
+                _memory_cache[str(cookies_file)] = source
             logger.info(f"成功保存 {len(cookies)} 个cookies到 {cookies_file}")
-            return cookies_file
+            return str(cookies_file)
 
         except (OSError, IOError, PermissionError) as e:
             logger.error(f"无法写入cookies文件，权限不足或路径无效: {e}")
@@ -612,6 +660,12 @@ class BrowserCookiesExtractor:
             logger.error(f"cookies内容编码错误: {e}")
         except Exception as e:
             logger.error(f"保存cookies文件时发生未知错误: {e}", exc_info=True)
+        finally:
+            if temp_path:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
 
         return None
 
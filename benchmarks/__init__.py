@@ -0,0 +1,4 @@
+"""
+性能基准脚本
+每个脚本都可以单独运行: python -m benchmarks.<脚本名>
+"""
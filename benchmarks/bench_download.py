@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+端到端下载基准
+启动本地媒体源站（合成的渐进式MP4、DASH、HLS素材，可配置带宽和延迟），
+分别驱动 Downloader、/download-stream、/video-info（yt-dlp通用提取器）和Celery下载任务，
+按场景统计吞吐、延迟分位数、CPU时间和峰值RSS，结果保存为JSON以便对比不同版本。
+
+用法:
+    python -m benchmarks.bench_download [--scenarios downloader,stream,video-info,celery]
+        [--assets progressive,dash,hls] [--iterations 3] [--bandwidth-mbps 50] [--latency-ms 20]
+        [--output results.json] [--compare baseline.json]
+
+需要本机安装ffmpeg和yt-dlp，不访问外网。Web接口通过进程内的TestClient调用，
+源站位于本机，基准期间会放开Web层对本地地址的SSRF检查和域名白名单。
+Celery场景在进程内同步执行任务，需要可连接的Redis；不可用时该场景记为跳过。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+from unittest import mock
+
+import psutil
+
+from benchmarks.media_origin import ASSETS, MediaOrigin, generate_assets
+from config_manager import config
+
+SCENARIOS = ("downloader", "stream", "video-info", "celery")
+
+
+class ResourceSampler:
+    """后台采样本进程及其全部子进程（yt-dlp/ffmpeg）的RSS之和，记录峰值"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> int:
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self._sample())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "ResourceSampler":
+        self._cpu_start = os.times()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        end = os.times()
+        # 已退出子进程的CPU时间计入 children_*
+        self.cpu_seconds = sum(
+            getattr(end, field) - getattr(self._cpu_start, field)
+            for field in ("user", "system", "children_user", "children_system")
+        )
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """线性插值的分位数"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def run_scenario(func: Callable[[int], int], iterations: int) -> dict:
+    """
+    重复执行一个场景。
+
+    Args:
+        func: 接收迭代序号、返回本次传输字节数的函数
+        iterations: 迭代次数
+    """
+    latencies, total_bytes, errors = [], 0, []
+    with ResourceSampler() as sampler:
+        wall_start = time.perf_counter()
+        for i in range(iterations):
+            start = time.perf_counter()
+            try:
+                total_bytes += func(i)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+        wall = time.perf_counter() - wall_start
+
+    result = {
+        "iterations": iterations,
+        "succeeded": len(latencies),
+        "bytes": total_bytes,
+        "throughput_mbps": round(total_bytes * 8 / wall / 1_000_000, 2) if wall else None,
+        "cpu_seconds": round(sampler.cpu_seconds, 3),
+        "peak_rss_mb": round(sampler.peak_rss / (1024 * 1024), 1),
+    }
+    if latencies:
+        result["latency_seconds"] = {
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p90": round(percentile(latencies, 0.9), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(max(latencies), 3),
+        }
+    if errors:
+        result["errors"] = errors
+    return result
+
+
+def _downloader_scenario(url: str, work_dir: Path) -> Callable[[int], int]:
+    from downloader import Downloader
+
+    def run(i: int) -> int:
+        folder = work_dir / f"downloader_{i}"
+        try:
+            output = asyncio.run(
+                Downloader(download_folder=folder).download_with_smart_strategy(url, fallback_prefix=f"bench_{i}")
+            )
+            return output.stat().st_size
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    return run
+
+
+def _stream_scenario(client, url: str) -> Callable[[int], int]:
+    params = {"url": url, "download_type": "video", "format_id": "best", "resolution": "720p", "title": "bench"}
+
+    def run(i: int) -> int:
+        received = 0
+        with client.stream("GET", "/download-stream", params=params) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                received += len(chunk)
+        return received
+
+    return run
+
+
+def _video_info_scenario(client, url: str) -> Callable[[int], int]:
+    import web.main
+
+    def run(i: int) -> int:
+        # 每次都清空信息缓存，测量的是冷启动提取
+        web.main.video_info_cache.clear()
+        response = client.post("/video-info", json={"url": url, "download_type": "video"})
+        response.raise_for_status()
+        return len(response.content)
+
+    return run
+
+
+def _celery_scenario(url: str) -> Callable[[int], int]:
+    from web.tasks import download_video_task, redis_client
+
+    if redis_client is None:
+        raise RuntimeError("Redis客户端未初始化")
+    redis_client.ping()
+    bench_folder = Path(config.downloader.save_path).resolve() / "benchmark"
+
+    def run(i: int) -> int:
+        try:
+            result = download_video_task.apply(
+                kwargs={
+                    "video_url": url,
+                    "download_type": "video",
+                    "format_id": "best",
+                    "title": f"bench_{i}",
+                    "custom_path": "benchmark",
+                    "enqueued_at": time.time(),
+                },
+                throw=True,
+            )
+            return result.result["file_size"]
+        finally:
+            shutil.rmtree(bench_folder, ignore_errors=True)
+
+    return run
+
+
+def _environment() -> dict:
+    def version(cmd: list) -> str:
+        try:
+            output = subprocess.run(cmd, capture_output=True, text=True, timeout=10, check=True).stdout
+            return output.splitlines()[0].strip()
+        except (OSError, IndexError, subprocess.SubprocessError):
+            return "unavailable"
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "yt_dlp": version(["yt-dlp", "--version"]),
+        "ffmpeg": version(["ffmpeg", "-version"]),
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    from fastapi.testclient import TestClient
+
+    from web.main import app
+
+    assets_dir = args.assets_dir or Path(tempfile.mkdtemp(prefix="bench_assets_"))
+    assets = generate_assets(assets_dir, args.duration, args.resolution)
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_download_"))
+    results: Dict[str, dict] = {}
+
+    with ExitStack() as stack:
+        origin = stack.enter_context(MediaOrigin(assets_dir, args.bandwidth_mbps, args.latency_ms))
+        # 源站在本机：放开Web层的本地地址检查和域名白名单
+        stack.enter_context(mock.patch("web.main.validate_url_security", return_value=(True, "")))
+        stack.enter_context(mock.patch.object(config.security, "allowed_domains", []))
+        client = stack.enter_context(TestClient(app))
+
+        for scenario in args.scenarios:
+            for asset in args.assets:
+                url = origin.url(assets[asset])
+                name = f"{scenario}/{asset}"
+                try:
+                    func = {
+                        "downloader": lambda: _downloader_scenario(url, work_dir),
+                        "stream": lambda: _stream_scenario(client, url),
+                        "video-info": lambda: _video_info_scenario(client, url),
+                        "celery": lambda: _celery_scenario(url),
+                    }[scenario]()
+                except Exception as e:
+                    results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+                    print(f"跳过 {name}: {e}", file=sys.stderr)
+                    continue
+                print(f"运行 {name} ...", file=sys.stderr)
+                results[name] = run_scenario(func, args.iterations)
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if not args.assets_dir:
+        shutil.rmtree(assets_dir, ignore_errors=True)
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": _environment(),
+        "settings": {
+            "iterations": args.iterations,
+            "bandwidth_mbps": args.bandwidth_mbps,
+            "latency_ms": args.latency_ms,
+            "duration": args.duration,
+            "resolution": args.resolution,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """逐场景对比吞吐和p50延迟的变化（百分比）"""
+    lines = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "skipped" in result or "skipped" in base:
+            continue
+        changes = []
+        if result.get("throughput_mbps") and base.get("throughput_mbps"):
+            delta = (result["throughput_mbps"] / base["throughput_mbps"] - 1) * 100
+            changes.append(f"吞吐 {base['throughput_mbps']} -> {result['throughput_mbps']} Mbit/s ({delta:+.1f}%)")
+        if "latency_seconds" in result and "latency_seconds" in base:
+            old, new = base["latency_seconds"]["p50"], result["latency_seconds"]["p50"]
+            if old:
+                changes.append(f"p50 {old} -> {new}s ({(new / old - 1) * 100:+.1f}%)")
+        lines.append(f"{name}: {'; '.join(changes) or '无可比指标'}")
+    return lines
+
+
+def _csv(choices) -> Callable[[str], list]:
+    def parse(value: str) -> list:
+        items = [item.strip() for item in value.split(",") if item.strip()]
+        unknown = set(items) - set(choices)
+        if unknown:
+            raise argparse.ArgumentTypeError(f"未知选项: {', '.join(sorted(unknown))}")
+        return items
+
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端下载基准")
+    parser.add_argument("--scenarios", type=_csv(SCENARIOS), default=list(SCENARIOS), help="逗号分隔的场景")
+    parser.add_argument("--assets", type=_csv(ASSETS), default=list(ASSETS), help="逗号分隔的素材类型")
+    parser.add_argument("--iterations", type=int, default=3, help="每个场景的迭代次数")
+    parser.add_argument("--bandwidth-mbps", type=float, default=None, help="源站单连接带宽上限（Mbit/s）")
+    parser.add_argument("--latency-ms", type=float, default=0, help="源站首字节延迟（毫秒）")
+    parser.add_argument("--duration", type=int, default=30, help="合成素材时长（秒）")
+    parser.add_argument("--resolution", default="1280x720", help="合成素材分辨率")
+    parser.add_argument("--assets-dir", type=Path, default=None, help="素材缓存目录（默认每次生成到临时目录）")
+    parser.add_argument("--output", type=Path, default=None, help="结果JSON的保存路径")
+    parser.add_argument("--compare", type=Path, default=None, help="作为基线对比的历史结果JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text, encoding="utf-8")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        for line in compare(report, baseline):
+            print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
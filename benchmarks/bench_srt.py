@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+SRT解析/序列化基准
+在合成的超长字幕上对比旧版多次正则扫描与 core.srt 单遍解析在"翻译"和"双语合并"两个阶段的耗时。
+
+用法:
+    python -m benchmarks.bench_srt [--cues 50000] [--repeat 3]
+
+翻译阶段使用桩翻译器、不启用翻译记忆和限速，只衡量字幕读写本身的开销。
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from core.srt import Cue, format_timestamp, write_srt
+from subtitles import OfflineTranslator, SubtitleMerger, TranslationProcessor
+
+
+def _legacy_extract_text_blocks(content: str) -> list:
+    return [m.group(1).replace("\n", " ") for m in re.finditer(r"[\d:,\-\s>]+\n(.*?)(?=\n\d+|$)", content, re.DOTALL)]
+
+
+def _legacy_write_translated(content: str, translated_blocks: list) -> str:
+    parts = []
+    for i, match in enumerate(re.finditer(r"(\d+\n[\d:,\-\s>]+\n)(.*?)(?=\n\n|$)", content, re.DOTALL)):
+        parts.append(f"{match.group(1)}{translated_blocks[i].strip()}\n\n")
+    return "".join(parts)
+
+
+def _legacy_merge(en_content: str, zh_content: str) -> str:
+    en_subtitles = {m[1]: m[3].strip() for m in re.finditer(r"(\d+)\n(.*?)\n(.*?)\n\n", en_content, re.DOTALL)}
+    zh_subtitles = {m[1]: m[3].strip() for m in re.finditer(r"(\d+)\n(.*?)\n(.*?)\n\n", zh_content, re.DOTALL)}
+    timestamps = {m[1]: m[2].strip() for m in re.finditer(r"(\d+)\n(.*?)\n", en_content)}
+    return "".join(
+        f"{i}\n{timestamps[i]}\n{zh_subtitles.get(i, '')}\n{en_subtitles.get(i, '')}\n\n"
+        for i in sorted(timestamps, key=int)
+    )
+
+
+def _offline_translate(blocks: list) -> list:
+    translator = OfflineTranslator()
+    return [text for i in range(0, len(blocks), 100) for text in translator.translate_batch(blocks[i : i + 100])]
+
+
+def legacy_pipeline(en_srt: Path, zh_srt: Path, bi_srt: Path) -> None:
+    content = en_srt.read_text(encoding="utf-8")
+    translated = _offline_translate(_legacy_extract_text_blocks(content))
+    zh_srt.write_text(_legacy_write_translated(content, translated), encoding="utf-8")
+    merged = _legacy_merge(en_srt.read_text(encoding="utf-8"), zh_srt.read_text(encoding="utf-8"))
+    bi_srt.write_text(merged, encoding="utf-8")
+
+
+async def current_pipeline(processor: TranslationProcessor, en_srt: Path, zh_srt: Path) -> None:
+    # 与 SubtitleProcessor.process_item 相同: 解析一次，翻译和合并共用同一份字幕
+    cues = await processor._read_srt_file(en_srt)
+    translated = _offline_translate(processor._extract_text_blocks(cues))
+    zh_cues = await processor._write_translated_srt(cues, translated, zh_srt)
+    await SubtitleMerger().merge_subtitles(en_srt, zh_srt, cues, zh_cues)
+
+
+def _best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(cue_count: int, repeat: int) -> dict:
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_srt_"))
+    try:
+        en_srt = work_dir / "long.en.srt"
+        write_srt(
+            en_srt, (Cue(i, i * 2000, i * 2000 + 1500, f"line {i} of the talk\nsecond row") for i in range(cue_count))
+        )
+
+        processor = TranslationProcessor.__new__(TranslationProcessor)
+        processor.translator = OfflineTranslator()
+
+        legacy_s = _best_of(
+            repeat, lambda: legacy_pipeline(en_srt, work_dir / "legacy.zh.srt", work_dir / "legacy.bilingual.srt")
+        )
+        current_s = _best_of(repeat, lambda: asyncio.run(current_pipeline(processor, en_srt, work_dir / "long.zh.srt")))
+
+        bilingual = en_srt.with_suffix(".bilingual.srt").read_text(encoding="utf-8")
+        return {
+            "cues": cue_count,
+            "file_bytes": en_srt.stat().st_size,
+            "legacy_seconds": round(legacy_s, 3),
+            "single_pass_seconds": round(current_s, 3),
+            "speedup": round(legacy_s / current_s, 2) if current_s else None,
+            "last_cue_timing": format_timestamp((cue_count - 1) * 2000) in bilingual,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SRT解析/序列化基准")
+    parser.add_argument("--cues", type=int, default=50000, help="合成字幕条数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取最快一次）")
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.cues, args.repeat), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+流式下载传输基准
+子进程（代替yt-dlp）向stdout写入指定大小的数据，经 DisconnectAwareStreamingResponse 发送给
+只计数的ASGI send，对比旧版（默认64KB管道、固定64KB读取）与 web.stream_transport
+（扩大的管道、按消费速度合并数据块）每GB消耗的Web进程CPU时间和事件循环往返次数。
+
+用法:
+    python -m benchmarks.bench_stream [--size-mb 2048] [--repeat 3] [--client-mbps 0]
+        [--chunk-kb 1024] [--pipe-kb 1024]
+
+--client-mbps 大于0时模拟限速的客户端。CPU时间只统计Web进程本身，不含子进程。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from web.process_registry import DisconnectAwareStreamingResponse
+from web.stream_transport import coalesced_chunks, enlarge_stdout_pipe
+
+# 以1MB为单位写满stdout，数据来源不成为瓶颈
+_PRODUCER = (
+    "import sys\n"
+    "out = sys.stdout.buffer\n"
+    "block = bytes(1 << 20)\n"
+    "for _ in range(int(sys.argv[1])):\n"
+    "    out.write(block)\n"
+    "out.flush()\n"
+)
+
+
+async def _legacy_body(process):
+    while True:
+        chunk = await process.stdout.read(65536)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def _run_once(mode: str, size_mb: int, chunk_kb: int, pipe_kb: int, client_mbps: float) -> dict:
+    max_chunk = chunk_kb * 1024
+    kwargs = {"limit": max_chunk} if mode == "tuned" else {}
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", _PRODUCER, str(size_mb), stdout=asyncio.subprocess.PIPE, **kwargs
+    )
+    if mode == "tuned":
+        enlarge_stdout_pipe(process, pipe_kb * 1024)
+        body = coalesced_chunks(process.stdout, max_chunk)
+    else:
+        body = _legacy_body(process)
+
+    stats = {"bytes": 0, "sends": 0}
+    bytes_per_second = client_mbps * 1_000_000 / 8
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        chunk = message.get("body", b"")
+        if chunk:
+            stats["bytes"] += len(chunk)
+            stats["sends"] += 1
+        # 模拟套接字写入让出一次事件循环；限速客户端按字节数等待
+        await asyncio.sleep(len(chunk) / bytes_per_second if bytes_per_second else 0)
+
+    response = DisconnectAwareStreamingResponse(body)
+    cpu_start, wall_start = os.times(), time.perf_counter()
+    await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+    cpu_end, wall = os.times(), time.perf_counter() - wall_start
+    await process.wait()
+
+    cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    gigabytes = stats["bytes"] / (1 << 30)
+    return {
+        "cpu_seconds_per_gb": cpu / gigabytes,
+        "sends_per_gb": stats["sends"] / gigabytes,
+        "throughput_mbps": stats["bytes"] * 8 / wall / 1_000_000,
+        "bytes": stats["bytes"],
+    }
+
+
+def run(size_mb: int, repeat: int, chunk_kb: int, pipe_kb: int, client_mbps: float) -> dict:
+    results = {}
+    for mode in ("legacy", "tuned"):
+        runs = [asyncio.run(_run_once(mode, size_mb, chunk_kb, pipe_kb, client_mbps)) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["cpu_seconds_per_gb"])
+        assert best["bytes"] == size_mb << 20, f"{mode}: 传输了 {best['bytes']} 字节"
+        results[mode] = {
+            "cpu_seconds_per_gb": round(best["cpu_seconds_per_gb"], 3),
+            "sends_per_gb": round(best["sends_per_gb"]),
+            "throughput_mbps": round(best["throughput_mbps"], 1),
+        }
+    legacy, tuned = results["legacy"]["cpu_seconds_per_gb"], results["tuned"]["cpu_seconds_per_gb"]
+    return {
+        "size_mb": size_mb,
+        "client_mbps": client_mbps or None,
+        "chunk_kb": chunk_kb,
+        "pipe_kb": pipe_kb,
+        **results,
+        "cpu_reduction": round(1 - tuned / legacy, 3) if legacy else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式下载传输基准")
+    parser.add_argument("--size-mb", type=int, default=2048, help="每次传输的数据量（MB）")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取CPU时间最少的一次）")
+    parser.add_argument("--client-mbps", type=float, default=0, help="模拟客户端带宽（Mbps），0为不限速")
+    parser.add_argument("--chunk-kb", type=int, default=1024, help="数据块上限（KB），对应 stream_chunk_size_kb")
+    parser.add_argument("--pipe-kb", type=int, default=1024, help="管道容量（KB），对应 stream_pipe_size_kb")
+    args = parser.parse_args()
+
+    print(
+        json.dumps(
+            run(args.size_mb, args.repeat, args.chunk_kb, args.pipe_kb, args.client_mbps), ensure_ascii=False, indent=2
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
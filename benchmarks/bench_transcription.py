@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+分段并行转录基准
+在合成音频上对比"整段单进程转录"和"按静音切分并行转录"的耗时与首条字幕落盘时间。
+
+用法:
+    python -m benchmarks.bench_transcription [--duration 600] [--chunk-seconds 60] [--workers N] [--rtf 0.02]
+
+本机有whisper-cli和模型时使用真实转录；否则使用按实时率休眠的模拟whisper进程，
+此时结果反映的是切分、调度和拼接的开销与并行度，而不是模型本身的速度。
+"""
+
+import argparse
+import asyncio
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic_audio import write_synthetic_speech_wav
+from config_manager import config
+from core import ChunkedTranscriber, CommandBuilder
+from subtitles import TranscriptionProcessor
+
+# 模拟whisper: 按音频时长×实时率休眠，每5秒输出一条whisper格式的字幕
+FAKE_WHISPER = """
+import sys, time, wave
+rtf, audio = float(sys.argv[1]), sys.argv[-1]
+with wave.open(audio, "rb") as w:
+    duration = w.getnframes() / w.getframerate()
+time.sleep(duration * rtf)
+t = 0.0
+while t < duration:
+    end = min(t + 5, duration)
+    fmt = lambda s: "%02d:%02d:%06.3f" % (s // 3600, s % 3600 // 60, s % 60)
+    print("[%s --> %s]  segment at %.1f" % (fmt(t), fmt(end), t))
+    t = end
+"""
+
+
+class SimulatedWhisperBuilder(CommandBuilder):
+    """把whisper-cli替换为模拟进程的命令构建器"""
+
+    def __init__(self, rtf: float):
+        super().__init__()
+        self.rtf = rtf
+
+    def build_whisper_cmd(self, model_path, source_language, audio_path, threads=None):
+        return [sys.executable, "-c", FAKE_WHISPER, str(self.rtf), str(audio_path)]
+
+
+async def _time_until_first_cue(coro, srt_path: Path) -> tuple:
+    """运行转录，同时记录SRT文件首次出现内容的时间。"""
+    start = time.perf_counter()
+    task = asyncio.create_task(coro)
+    first_cue = None
+    while not task.done():
+        if first_cue is None and srt_path.exists() and srt_path.stat().st_size > 0:
+            first_cue = time.perf_counter() - start
+        await asyncio.sleep(0.01)
+    cue_count = await task
+    total = time.perf_counter() - start
+    return total, first_cue if first_cue is not None else total, cue_count
+
+
+async def run(duration: float, chunk_seconds: int, workers: int, rtf: float) -> dict:
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_transcription_"))
+    try:
+        wav_path = work_dir / "synthetic.wav"
+        t0 = time.perf_counter()
+        write_synthetic_speech_wav(wav_path, duration)
+        generate_s = time.perf_counter() - t0
+
+        model_path = TranscriptionProcessor()._get_model_path()
+        real_whisper = shutil.which("whisper-cli") is not None and model_path and model_path.exists()
+        builder = CommandBuilder() if real_whisper else SimulatedWhisperBuilder(rtf)
+        language = config.ai_subtitles.source_language
+
+        chunked = ChunkedTranscriber(builder, workers)
+        chunked.chunk_ms = chunk_seconds * 1000
+        t0 = time.perf_counter()
+        chunks = chunked.split_audio(wav_path, work_dir)
+        split_s = time.perf_counter() - t0
+
+        # 基线: 单进程整段转录（一段，不切分）
+        single = ChunkedTranscriber(builder, workers=1)
+        single.chunk_ms = int(duration * 1000) + 1
+        single_srt = work_dir / "single.srt"
+        single_total, single_first, single_cues = await _time_until_first_cue(
+            single.transcribe(wav_path, model_path, language, single_srt), single_srt
+        )
+
+        chunked_srt = work_dir / "chunked.srt"
+        chunked_total, chunked_first, chunked_cues = await _time_until_first_cue(
+            chunked.transcribe(wav_path, model_path, language, chunked_srt), chunked_srt
+        )
+
+        return {
+            "mode": "whisper-cli" if real_whisper else f"simulated(rtf={rtf})",
+            "audio_seconds": duration,
+            "workers": chunked.workers,
+            "chunks": len(chunks),
+            "generate_seconds": round(generate_s, 3),
+            "vad_split_seconds": round(split_s, 3),
+            "single": {"total_seconds": round(single_total, 3), "first_cue_seconds": round(single_first, 3)},
+            "chunked": {"total_seconds": round(chunked_total, 3), "first_cue_seconds": round(chunked_first, 3)},
+            "speedup": round(single_total / chunked_total, 2) if chunked_total else None,
+            "cues": {"single": single_cues, "chunked": chunked_cues},
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分段并行转录基准")
+    parser.add_argument("--duration", type=float, default=600.0, help="合成音频时长（秒）")
+    parser.add_argument("--chunk-seconds", type=int, default=60, help="目标片段时长（秒）")
+    parser.add_argument("--workers", type=int, default=0, help="并行进程数，0为按CPU核数")
+    parser.add_argument("--rtf", type=float, default=0.02, help="模拟whisper的实时率（无whisper-cli时使用）")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.duration, args.chunk_seconds, args.workers or None, args.rtf))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
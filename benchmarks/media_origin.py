@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+本地媒体源站
+用ffmpeg生成合成的渐进式MP4、DASH和HLS素材，并通过本机HTTP服务提供，
+可配置带宽和首字节延迟，供下载基准在离线环境下复现真实站点的传输特征。
+
+用法（单独启动源站，便于手动调试）:
+    python -m benchmarks.media_origin [--assets-dir DIR] [--bandwidth-mbps 20] [--latency-ms 50]
+"""
+
+import argparse
+import mimetypes
+import re
+import shutil
+import subprocess
+import threading
+import time
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+
+# 素材名 -> 相对于素材目录的入口文件
+ASSETS = {
+    "progressive": "progressive/video.mp4",
+    "dash": "dash/manifest.mpd",
+    "hls": "hls/playlist.m3u8",
+}
+
+_MIME_TYPES = {
+    ".mpd": "application/dash+xml",
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".ts": "video/mp2t",
+    ".mp4": "video/mp4",
+}
+
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+_CHUNK_SIZE = 64 * 1024
+
+
+def _ffmpeg_source(duration: int, resolution: str) -> list:
+    """testsrc2画面 + 正弦音，编码参数固定以保证每次生成的素材一致"""
+    return [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={resolution}:rate=30:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:sample_rate=44100:duration={duration}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-pix_fmt",
+        "yuv420p",
+        "-g",
+        "60",
+        "-b:v",
+        "2M",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "128k",
+    ]
+
+
+def generate_assets(root: Path, duration: int = 30, resolution: str = "1280x720") -> Dict[str, Path]:
+    """
+    生成（或复用已生成的）基准素材。
+
+    Args:
+        root: 素材目录；同样参数的素材已存在时直接复用
+        duration: 素材时长（秒）
+        resolution: 视频分辨率
+
+    Returns:
+        {素材名: 入口文件路径}
+
+    Raises:
+        RuntimeError: 未安装ffmpeg
+    """
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("生成基准素材需要ffmpeg")
+
+    root = Path(root) / f"{resolution}_{duration}s"
+    source = _ffmpeg_source(duration, resolution)
+    outputs = {
+        "progressive": source + ["-movflags", "+faststart"],
+        "dash": source
+        + ["-f", "dash", "-seg_duration", "2", "-use_template", "1", "-use_timeline", "0", "-adaptation_sets"]
+        + ["id=0,streams=v id=1,streams=a"],
+        "hls": source
+        + ["-f", "hls", "-hls_time", "2", "-hls_playlist_type", "vod", "-hls_segment_filename"]
+        + [str(root / "hls" / "segment_%03d.ts")],
+    }
+
+    assets = {}
+    for name, cmd in outputs.items():
+        entry = root / ASSETS[name]
+        if not entry.exists():
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            subprocess.run(cmd + [str(entry)], check=True)
+        assets[name] = entry
+    return assets
+
+
+class _ThrottledHandler(SimpleHTTPRequestHandler):
+    """支持Range请求和keep-alive、按带宽限速的静态文件处理器"""
+
+    # 与真实CDN一样保持连接，客户端可以复用连接请求后续分片
+    protocol_version = "HTTP/1.1"
+
+    # 由 MediaOrigin 在子类上设置
+    bandwidth_bps: Optional[float] = None
+    latency_s: float = 0.0
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def guess_type(self, path):
+        return _MIME_TYPES.get(Path(path).suffix) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body: bool) -> None:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+        path = Path(self.translate_path(self.path))
+        if not path.is_file():
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        status = HTTPStatus.OK
+        range_header = self.headers.get("Range")
+        if range_header:
+            match = _RANGE_PATTERN.match(range_header.strip())
+            if not match or (not match.group(1) and not match.group(2)):
+                self.send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                return
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start > end:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = HTTPStatus.PARTIAL_CONTENT
+
+        self.send_response(status)
+        self.send_header("Content-Type", self.guess_type(str(path)))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if send_body:
+            self._send_range(path, start, end)
+
+    def _send_range(self, path: Path, start: int, end: int) -> None:
+        """按带宽上限分块发送：每块都等到限速曲线允许发送完这一块时才写出"""
+        remaining = end - start + 1
+        began = time.perf_counter()
+        sent = 0
+        with open(path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                sent += len(chunk)
+                remaining -= len(chunk)
+                if self.bandwidth_bps:
+                    ahead = sent / self.bandwidth_bps - (time.perf_counter() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+
+
+class _OriginServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+        self._connections_lock = threading.Lock()
+
+    def count_connection(self) -> None:
+        with self._connections_lock:
+            self.connections += 1
+
+
+class MediaOrigin:
+    """
+    在 127.0.0.1 的随机端口上提供素材目录的HTTP源站。
+
+    带宽限制按单个连接计算（与CDN对单连接限速的行为一致），
+    因此分片并发下载可以获得更高的总吞吐。
+    """
+
+    def __init__(self, root: Path, bandwidth_mbps: Optional[float] = None, latency_ms: float = 0):
+        """
+        Args:
+            root: 素材根目录
+            bandwidth_mbps: 每个连接的带宽上限（Mbit/s），None为不限速
+            latency_ms: 每个请求在发送响应头前的延迟（毫秒）
+        """
+        self.root = Path(root).resolve()
+        handler = type(
+            "OriginHandler",
+            (_ThrottledHandler,),
+            {
+                "bandwidth_bps": bandwidth_mbps * 1_000_000 / 8 if bandwidth_mbps else None,
+                "latency_s": latency_ms / 1000,
+            },
+        )
+        self._server = _OriginServer(("127.0.0.1", 0), lambda *args: handler(*args, directory=str(self.root)))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def connections(self) -> int:
+        """源站启动以来接受的TCP连接数"""
+        return self._server.connections
+
+    def url(self, path: Path) -> str:
+        """素材文件的访问URL"""
+        return f"{self.base_url}/{Path(path).resolve().relative_to(self.root).as_posix()}"
+
+    def start(self) -> "MediaOrigin":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="media-origin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "MediaOrigin":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地媒体源站")
+    parser.add_argument("--assets-dir", type=Path, default=Path("benchmarks/.assets"), help="素材目录")
+    parser.add_argument("--duration", type=int, default=30, help="素材时长（秒）")
+    parser.add_argument("--resolution", default="1280x720", help="素材分辨率")
+    parser.add_argument("--bandwidth-mbps", type=float, default=None, help="单连接带宽上限（Mbit/s）")
+    parser.add_argument("--latency-ms", type=float, default=0, help="首字节延迟（毫秒）")
+    args = parser.parse_args()
+
+    assets = generate_assets(args.assets_dir, args.duration, args.resolution)
+    with MediaOrigin(args.assets_dir, args.bandwidth_mbps, args.latency_ms) as origin:
+        for name, path in assets.items():
+            print(f"{name}: {origin.url(path)}")
+        print("按 Ctrl+C 停止")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
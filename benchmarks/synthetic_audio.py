@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+合成测试音频
+生成"语音段 + 静音段"交替的16kHz单声道WAV，用于转录相关的基准和测试，无需外部素材。
+"""
+
+import math
+import random
+import sys
+import wave
+from array import array
+from pathlib import Path
+from typing import List, Tuple
+
+SAMPLE_RATE = 16000
+
+
+def _tone(frequency: float, amplitude: float) -> array:
+    """生成1秒的正弦音，作为语音段的拼接素材。"""
+    return array(
+        "h",
+        (int(amplitude * 32767 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE)) for i in range(SAMPLE_RATE)),
+    )
+
+
+def write_synthetic_speech_wav(path: Path, duration_s: float = 600.0, seed: int = 42) -> List[Tuple[int, int]]:
+    """
+    写入一个合成的"说话"音频文件。
+
+    Args:
+        path: 输出WAV路径
+        duration_s: 总时长（秒）
+        seed: 随机种子，保证每次生成相同的音频
+
+    Returns:
+        [(静音开始毫秒, 静音结束毫秒), ...] 实际写入的静音区间
+    """
+    rng = random.Random(seed)
+    tones = [_tone(f, a) for f, a in ((220, 0.4), (330, 0.3), (440, 0.5), (550, 0.35))]
+    total = int(duration_s * SAMPLE_RATE)
+    samples = array("h")
+    silences = []
+
+    while len(samples) < total:
+        # 语音段: 2-8秒，由若干音调片段拼接
+        speech = int(rng.uniform(2, 8) * SAMPLE_RATE)
+        while speech > 0:
+            piece = tones[rng.randrange(len(tones))][: min(speech, rng.randint(SAMPLE_RATE // 5, SAMPLE_RATE))]
+            samples.extend(piece)
+            speech -= len(piece)
+        # 静音段: 0.6-1.5秒，带极小的底噪
+        start_ms = len(samples) * 1000 // SAMPLE_RATE
+        silence = int(rng.uniform(0.6, 1.5) * SAMPLE_RATE)
+        samples.extend(rng.randint(-50, 50) for _ in range(silence))
+        silences.append((start_ms, len(samples) * 1000 // SAMPLE_RATE))
+
+    del samples[total:]
+    if sys.byteorder == "big":
+        samples.byteswap()
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+    return [(s, e) for s, e in silences if e <= duration_s * 1000]
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+合成的YouTube格式列表
+按YouTube返回的格式结构（多语言配音音轨、avc1/vp9/av01各分辨率的视频流、
+HLS完整流、故事板）生成格式列表，供格式分析和过滤相关的基准使用，无需联网抓取。
+"""
+
+from typing import Any, Dict, List
+
+# (format_id, 高度, 宽度, 帧率) — DASH视频流
+_VIDEO_LADDER = [
+    (160, 144, 256, 30),
+    (133, 240, 426, 30),
+    (134, 360, 640, 30),
+    (135, 480, 854, 30),
+    (136, 720, 1280, 30),
+    (298, 720, 1280, 60),
+    (137, 1080, 1920, 30),
+    (299, 1080, 1920, 60),
+    (264, 1440, 2560, 30),
+    (266, 2160, 3840, 30),
+]
+# (扩展名, 编码, format_id偏移, 码率系数)
+_VIDEO_CODECS = [("mp4", "avc1.64002a", 0, 1.0), ("webm", "vp9", 100, 0.7), ("mp4", "av01.0.08M.08", 300, 0.55)]
+# (format_id, 扩展名, 编码, 码率kbps)
+_AUDIO_STREAMS = [("139", "m4a", "mp4a.40.5", 48), ("140", "m4a", "mp4a.40.2", 129), ("251", "webm", "opus", 135)]
+_LANGUAGES = ["en-US", "ja", "es", "pt", "fr", "de", "it", "ko", "hi", "id", "ru", "tr", "pl", "uk", "vi", "th"]
+
+
+def synthetic_youtube_formats(duration: int = 600, languages: int = 12) -> List[Dict[str, Any]]:
+    """
+    生成一个YouTube风格的格式列表。
+
+    Args:
+        duration: 视频时长（秒），用于推算各格式的文件大小
+        languages: 配音音轨的语言数（第一个为原始音轨）
+
+    Returns:
+        yt-dlp info_dict["formats"] 结构的列表
+    """
+    formats: List[Dict[str, Any]] = [
+        {
+            "format_id": f"sb{i}",
+            "format_note": "storyboard",
+            "ext": "mhtml",
+            "protocol": "mhtml",
+            "acodec": "none",
+            "vcodec": "none",
+            "width": 48 * 2**i,
+            "height": 27 * 2**i,
+            "resolution": f"{48 * 2**i}x{27 * 2**i}",
+        }
+        for i in range(4)
+    ]
+
+    for index, language in enumerate(_LANGUAGES[:languages]):
+        note = "original (default)" if index == 0 else "dubbed-auto"
+        for format_id, ext, acodec, kbps in _AUDIO_STREAMS:
+            formats.append(
+                {
+                    "format_id": f"{format_id}-{index}",
+                    "format_note": f"{language}, {note}, medium",
+                    "ext": ext,
+                    "protocol": "https",
+                    "acodec": acodec,
+                    "vcodec": "none",
+                    "abr": kbps + index * 0.001,
+                    "tbr": kbps,
+                    "language": language,
+                    "filesize": kbps * 125 * duration,
+                    "resolution": "audio only",
+                    "url": f"https://rr1---sn.example.com/videoplayback?itag={format_id}&xtags=lang%3D{language}",
+                }
+            )
+
+    for base_id, height, width, fps in _VIDEO_LADDER:
+        for ext, vcodec, offset, factor in _VIDEO_CODECS:
+            kbps = int(height * 4.2 * factor * (1.5 if fps > 30 else 1))
+            formats.append(
+                {
+                    "format_id": str(base_id + offset),
+                    "format_note": f"{height}p{fps if fps > 30 else ''}",
+                    "ext": ext,
+                    "protocol": "https",
+                    "acodec": "none",
+                    "vcodec": vcodec,
+                    "width": width,
+                    "height": height,
+                    "fps": fps,
+                    "vbr": kbps,
+                    "tbr": kbps,
+                    "dynamic_range": "SDR",
+                    "filesize": kbps * 125 * duration if offset != 300 else None,
+                    "filesize_approx": kbps * 125 * duration,
+                    "resolution": f"{width}x{height}",
+                    "url": f"https://rr1---sn.example.com/videoplayback?itag={base_id + offset}",
+                }
+            )
+
+    # HLS完整流（音视频合一，无文件大小）和经典的18号渐进式格式
+    for format_id, height, width in ((91, 144, 256), (92, 240, 426), (93, 360, 640), (94, 480, 854), (95, 720, 1280)):
+        formats.append(
+            {
+                "format_id": str(format_id),
+                "ext": "mp4",
+                "protocol": "m3u8_native",
+                "acodec": "mp4a.40.5",
+                "vcodec": "avc1.4d401e",
+                "width": width,
+                "height": height,
+                "tbr": height * 3.1,
+                "resolution": f"{width}x{height}",
+                "url": f"https://manifest.example.com/api/manifest/hls_playlist/itag/{format_id}/index.m3u8",
+            }
+        )
+    formats.append(
+        {
+            "format_id": "18",
+            "format_note": "360p",
+            "ext": "mp4",
+            "protocol": "https",
+            "acodec": "mp4a.40.2",
+            "vcodec": "avc1.42001E",
+            "width": 640,
+            "height": 360,
+            "tbr": 500,
+            "filesize": 500 * 125 * duration,
+            "resolution": "640x360",
+            "url": "https://rr1---sn.example.com/videoplayback?itag=18",
+        }
+    )
+    return formats
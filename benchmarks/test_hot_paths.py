@@ -0,0 +1,213 @@
+# benchmarks/test_hot_paths.py
+"""
+解析与规划热路径的微基准
+覆盖yt-dlp进度行解析、格式分析与下载计划、/video-info的格式过滤、URL安全校验、
+文件名清理和字幕解析。进度输入来自真实yt-dlp输出录制的fixture，格式列表按YouTube结构合成。
+
+每个基准都有一个宽松的绝对耗时上限（约为开发机实测均值的10倍），用于发现数量级的退化；
+细粒度的回归检测通过 pytest-benchmark 与保存的基线对比完成。
+
+用法:
+    pytest benchmarks/ --benchmark-autosave                                      # 记录基线
+    pytest benchmarks/ --benchmark-compare --benchmark-compare-fail=mean:20%     # 与最近的基线对比
+    pytest benchmarks/ --benchmark-disable                                       # 只跑一遍验证正确性
+"""
+
+import asyncio
+import gzip
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from rich.progress import Progress  # noqa: E402
+
+from benchmarks.synthetic_formats import synthetic_youtube_formats  # noqa: E402
+from core.format_analyzer import FormatAnalyzer  # noqa: E402
+from core.srt import parse_srt, serialize_cues  # noqa: E402
+from core.subprocess_progress_handler import SubprocessProgressHandler  # noqa: E402
+from core.transcription import parse_whisper_output  # noqa: E402
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+# 每次调用的平均耗时上限（秒）
+BUDGETS = {
+    "progress_json": 0.12,
+    "progress_text": 0.12,
+    "parse_size": 6e-5,
+    "parse_eta": 3e-5,
+    "best_plan": 3e-3,
+    "targeted_plan": 1e-2,
+    "video_info_filter": 2e-2,
+    "validate_request_cold": 1e-4,
+    "validate_request_cached": 2e-5,
+    "sanitize_filename": 5e-4,
+    "parse_srt": 0.4,
+    "parse_whisper": 0.2,
+}
+
+
+def _load_lines(name: str) -> list:
+    with gzip.open(FIXTURES / name, "rt", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def _check_budget(benchmark, key: str) -> None:
+    """--benchmark-disable 时没有统计数据，只验证结果"""
+    if benchmark.stats is not None:
+        mean = benchmark.stats.stats.mean
+        assert mean < BUDGETS[key], f"{key} 平均耗时 {mean * 1000:.3f}ms 超过上限 {BUDGETS[key] * 1000:.3f}ms"
+
+
+@pytest.fixture(scope="module")
+def progress_handler():
+    with Progress(disable=True) as progress:
+        yield SubprocessProgressHandler(), progress, progress.add_task("bench", total=100)
+
+
+@pytest.fixture(scope="module")
+def youtube_info():
+    return {
+        "title": "Example Video",
+        "duration": 600,
+        "uploader": "Example Channel",
+        "thumbnail": "https://i.example.com/vi/example/maxresdefault.jpg",
+        "formats": synthetic_youtube_formats(),
+    }
+
+
+def test_process_json_progress_lines(benchmark, progress_handler):
+    """--progress-template 输出的JSON进度行"""
+    handler, progress, task_id = progress_handler
+    lines = _load_lines("ytdlp_progress_json.txt.gz")
+
+    handled = benchmark(lambda: sum(handler._process_line(line, progress, task_id) for line in lines))
+
+    assert handled >= len(lines) * 0.9
+    _check_budget(benchmark, "progress_json")
+
+
+def test_process_text_progress_lines(benchmark, progress_handler):
+    """yt-dlp默认的文本进度行（未使用进度模板时的回退路径）"""
+    handler, progress, task_id = progress_handler
+    lines = _load_lines("ytdlp_progress_text.txt.gz")
+
+    handled = benchmark(lambda: sum(handler._process_line(line, progress, task_id) for line in lines))
+
+    assert handled >= len(lines) * 0.9
+    _check_budget(benchmark, "progress_text")
+
+
+def test_parse_size_to_bytes(benchmark):
+    handler = SubprocessProgressHandler()
+    assert benchmark(handler._parse_size_to_bytes, "~ 1.23GiB") == int(1.23 * 1024**3)
+    _check_budget(benchmark, "parse_size")
+
+
+def test_parse_eta_to_seconds(benchmark):
+    handler = SubprocessProgressHandler()
+    assert benchmark(handler._parse_eta_to_seconds, "01:02:03") == 3723
+    _check_budget(benchmark, "parse_eta")
+
+
+def test_find_best_download_plan(benchmark, youtube_info):
+    analyzer = FormatAnalyzer()
+    plan = benchmark(analyzer.find_best_download_plan, youtube_info["formats"])
+    assert plan.primary_format is not None
+    _check_budget(benchmark, "best_plan")
+
+
+def test_find_targeted_download_plan(benchmark, youtube_info):
+    """指定视频格式时需要为其匹配音频流"""
+    analyzer = FormatAnalyzer()
+    plan = benchmark(analyzer.find_best_download_plan, youtube_info["formats"], "299")
+    assert plan.primary_format.format_id == "299" and plan.secondary_format is not None
+    _check_budget(benchmark, "targeted_plan")
+
+
+def test_video_info_format_filtering(benchmark, youtube_info):
+    """/video-info 命中缓存时的耗时即为格式过滤与响应构建的耗时"""
+    from web.main import VideoInfoRequest, get_video_info
+
+    request = VideoInfoRequest(url="https://www.youtube.com/watch?v=dQw4w9WgXcQ", download_type="video")
+    loop = asyncio.new_event_loop()
+    try:
+        with mock.patch("web.main.get_cached_video_info", return_value=youtube_info):
+            result = benchmark(lambda: loop.run_until_complete(get_video_info(request)))
+    finally:
+        loop.close()
+
+    assert result.formats
+    _check_budget(benchmark, "video_info_filter")
+
+
+VALIDATION_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG&index=7"
+
+
+def _validate_request(check_url, is_playlist):
+    """一次 /download-stream 请求的全部参数校验（URL、格式ID、播放列表识别）"""
+    from web.validation import validate_format_id
+
+    return check_url(VALIDATION_URL), validate_format_id("299+140-0"), is_playlist(VALIDATION_URL)
+
+
+def test_validate_request_cold(benchmark):
+    """首次出现的URL：绕过结论缓存，测量预编译模式本身的开销"""
+    from web.validation import _check_url, is_playlist_url
+
+    result = benchmark(_validate_request, _check_url.__wrapped__, is_playlist_url.__wrapped__)
+    assert result == ((True, ""), (True, ""), True)
+    _check_budget(benchmark, "validate_request_cold")
+
+
+def test_validate_request_cached(benchmark):
+    """同一视频的重复请求命中结论缓存"""
+    from web.validation import is_playlist_url, validate_url_security
+
+    result = benchmark(_validate_request, validate_url_security, is_playlist_url)
+    assert result == ((True, ""), (True, ""), True)
+    _check_budget(benchmark, "validate_request_cached")
+
+
+def test_sanitize_filenames(benchmark):
+    from web.main import create_safe_filenames, sanitize_filename
+
+    title = '【4K HDR】Example Video: Part 1/2 — "Live" at <Venue> | 官方 MV 🎵 #shorts?'
+
+    def run():
+        filename = sanitize_filename(title, "video")
+        return create_safe_filenames(filename, "video", "1920x1080")
+
+    safe_name, _ = benchmark(run)
+    assert "/" not in safe_name and "<" not in safe_name
+    _check_budget(benchmark, "sanitize_filename")
+
+
+def test_parse_srt(benchmark):
+    """两小时视频规模的字幕文件"""
+    srt = serialize_cues(
+        parse_whisper_output(
+            "".join(
+                f"[{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}.000 --> "
+                f"{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}.900]   第{i}句字幕 subtitle line {i}\n"
+                for i in range(7200)
+            )
+        )
+    )
+
+    cues = benchmark(parse_srt, srt)
+    assert len(cues) == 7200
+    _check_budget(benchmark, "parse_srt")
+
+
+def test_parse_whisper_output(benchmark):
+    raw = "".join(
+        f"[00:{i // 60:02d}:{i % 60:02d}.000 --> 00:{i // 60:02d}:{i % 60:02d}.800]   segment {i} 的转录文本\n"
+        for i in range(3600)
+    )
+
+    cues = benchmark(parse_whisper_output, raw, 60_000)
+    assert len(cues) == 3600 and cues[0].start_ms == 60_000
+    _check_budget(benchmark, "parse_whisper")
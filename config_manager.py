@@ -8,7 +8,7 @@
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 import yaml
 from pydantic import (
@@ -59,7 +59,8 @@ class DownloaderConfig(BaseConfig):
 
     save_path: str = Field(default="downloads", description="下载文件的保存目录")
     temp_path: str = Field(default="downloads/temp", description="下载流的临时文件目录")
-    max_retries: int = Field(default=3, ge=0, le=10, description="最大重试次数")
+    max_retries: int = Field(default=3, ge=0, le=10, description="单个任务的最大重试次数(所有重试层共享)")
+    retry_budget_seconds: int = Field(default=600, ge=0, description="单个任务的重试总耗时上限(秒)，0为不限")
     base_delay: float = Field(default=10.0, ge=0, description="基础延迟时间(秒)")
     max_delay: float = Field(default=300.0, ge=0, description="最大延迟时间(秒)")
     backoff_factor: float = Field(default=2.0, ge=1.0, description="退避因子")
@@ -68,6 +69,7 @@ class DownloaderConfig(BaseConfig):
     stall_detection_time: int = Field(default=30, gt=0, description="停滞检测时间(秒)")
     stall_check_interval: int = Field(default=5, gt=0, description="停滞检查间隔(秒)")
     stall_threshold_count: int = Field(default=6, ge=0, description="停滞阈值计数")
+    stall_min_speed: int = Field(default=20480, ge=0, description="停滞判定的吞吐下限(字节/秒)")
 
     proxy_retry_base_delay: int = Field(default=30, ge=0, description="代理重试基础延迟(秒)")
     proxy_retry_increment: int = Field(default=10, ge=0, description="代理重试递增延迟(秒)")
@@ -81,6 +83,24 @@ class DownloaderConfig(BaseConfig):
     ytdlp_audio_format: str = Field(default="bestaudio", description="yt-dlp音频格式选择")
     ytdlp_combined_format: str = Field(default="bestvideo+bestaudio/best", description="yt-dlp合并格式选择")
     ytdlp_merge_output_format: str = Field(default="mp4", description="yt-dlp合并输出格式")
+    concurrent_fragments: int = Field(default=4, ge=1, le=64, description="分片格式的初始并发数")
+    max_concurrent_fragments: int = Field(default=16, ge=1, le=64, description="单个下载的最大分片并发数")
+    transfer_connection_budget: int = Field(default=32, ge=0, description="所有下载共享的分片连接总数，0为不限")
+    http_chunk_size_mb: int = Field(default=10, ge=0, description="单文件格式按块下载的块大小(MB)，0为不分块")
+    adaptive_transfer: bool = Field(default=True, description="根据站点的实际吞吐调整分片并发数")
+    resumable_downloads: bool = Field(
+        default=True, description="后台任务在独立工作目录中下载，重试和重新投递时从断点续传"
+    )
+    streaming_merge: bool = Field(default=True, description="分离流下载时边下载边合并(管道复用为分片MP4)")
+    native_segment_download: bool = Field(
+        default=False, description="HLS/DASH完整流在进程内直接下载分片(复用连接池)，不适用时回退到yt-dlp"
+    )
+    stream_chunk_size_kb: int = Field(
+        default=1024, ge=64, le=16384, description="流式下载单次发送给客户端的最大数据块(KB)"
+    )
+    stream_pipe_size_kb: int = Field(
+        default=1024, ge=0, description="流式下载子进程stdout管道的容量(KB，仅Linux)，0为使用系统默认"
+    )
 
     retry_patterns: List[str] = Field(
         default=[
@@ -156,12 +176,23 @@ class AISubtitlesConfig(BaseConfig):
 
     source_language: str = Field(default="auto", description="源语言")
     translate_to_chinese: bool = Field(default=True, description="是否翻译为中文")
-    translator_service: str = Field(default="google", description="翻译服务")
+    translator_service: str = Field(default="google", description="翻译服务 (google, mymemory, baidu, offline)")
 
     translation_batch_size: int = Field(default=50, ge=1, le=200, description="翻译批次大小")
-    translation_delay: float = Field(default=0.5, ge=0, description="翻译延迟(秒)")
+    translation_delay: float = Field(default=0.5, ge=0, description="翻译重试基础延迟(秒)")
     translation_max_retries: int = Field(default=3, ge=1, le=10, description="翻译最大重试次数")
     translation_timeout: int = Field(default=30, ge=5, le=120, description="翻译超时时间(秒)")
+    translation_concurrency: int = Field(default=4, ge=1, le=32, description="并发翻译批次数")
+    translation_rate_per_second: float = Field(default=2.0, ge=0, description="翻译请求速率(次/秒)，0为不限速")
+    translation_burst: int = Field(default=4, ge=1, description="翻译请求允许的突发次数")
+    translation_memory_path: Optional[str] = Field(
+        default="translation_memory.db", description="翻译记忆SQLite文件路径（相对路径按项目目录解析），为空则禁用"
+    )
+
+    transcription_chunk_seconds: int = Field(default=300, ge=0, description="分段转录目标片段时长(秒)，0为不分段")
+    transcription_workers: int = Field(default=0, ge=0, description="并行转录进程数，0为按模型和可用内存自动选择")
+    vad_silence_threshold: float = Field(default=0.02, gt=0, lt=1, description="静音检测峰值阈值(相对满幅)")
+    vad_min_silence_ms: int = Field(default=500, ge=50, description="可作为切分点的最短静音(毫秒)")
 
     subtitle_formats: List[str] = Field(default=["srt", "vtt"], description="字幕格式")
 
@@ -206,8 +237,10 @@ class CookiesConfig(BaseConfig):
 
     # 缓存设置
     cache_enabled: bool = Field(default=True, description="是否启用cookies缓存")
-    cache_file: str = Field(default="cookies.cache.txt", description="缓存文件路径")
-    cache_duration_hours: int = Field(default=24, ge=1, le=168, description="缓存有效期（小时）")
+    cache_file: str = Field(default="cookies.cache.txt", description="缓存文件路径模板（按域名派生）")
+    cache_duration_hours: int = Field(
+        default=24, ge=1, le=168, description="无法检测浏览器数据库变化时的缓存有效期（小时）"
+    )
     cache_check_interval: int = Field(default=1, ge=1, le=24, description="缓存检查间隔（小时）")
 
     @field_validator("mode")
@@ -225,10 +258,19 @@ class CookiesConfig(BaseConfig):
         return v
 
 
+class YtdlpProfileConfig(BaseConfig):
+    """按站点的yt-dlp参数档案"""
+
+    domains: List[str] = Field(default=[], description="适用的站点域名(包含子域名)")
+    args: List[str] = Field(default=[], description="追加到该站点所有yt-dlp命令的参数")
+    max_concurrent_fragments: Optional[int] = Field(default=None, ge=1, le=64, description="该站点的分片并发数上限")
+
+
 class AdvancedConfig(BaseConfig):
     """高级配置"""
 
-    ytdlp_extra_args: List[str] = Field(default=[], description="yt-dlp额外参数")
+    ytdlp_extra_args: List[str] = Field(default=[], description="追加到所有yt-dlp命令的额外参数")
+    ytdlp_profiles: Dict[str, YtdlpProfileConfig] = Field(default={}, description="按站点的yt-dlp参数档案")
 
     connectivity_test_host: str = Field(default="8.8.8.8", description="连接测试主机")
     connectivity_test_port: int = Field(default=53, gt=0, le=65535, description="连接测试端口")
@@ -244,6 +286,9 @@ class FileManagementConfig(BaseConfig):
     redis_expiry_seconds: int = Field(default=3600, gt=0, le=86400, description="Redis记录过期时间（秒）")
     orphan_cleanup_seconds: int = Field(default=5400, gt=0, le=86400, description="孤立文件清理时间（秒）")
     cleanup_interval_seconds: int = Field(default=1800, gt=0, le=86400, description="定时清理频率（秒）")
+    storage_quota_mb: int = Field(default=0, ge=0, description="下载目录和临时目录的总容量配额（MB），0表示不限制")
+    min_free_space_mb: int = Field(default=1024, ge=0, description="磁盘至少保留的剩余空间（MB）")
+    default_reservation_mb: int = Field(default=500, gt=0, description="无法预估文件大小时为下载预留的空间（MB）")
 
     @field_validator("orphan_cleanup_seconds")
     def validate_orphan_cleanup_time(cls, v: int, info: ValidationInfo) -> int:
@@ -268,6 +313,30 @@ class CeleryConfig(BaseConfig):
     result_backend: str = Field(default="redis://localhost:6379/0", description="Celery结果后端URL")
 
 
+class WebConfig(BaseConfig):
+    """Web服务配置"""
+
+    workers: int = Field(default=1, ge=1, le=64, description="Web服务的工作进程数，大于1时不启用自动重载")
+    shared_state: bool = Field(
+        default=True, description="缓存和子进程登记通过Redis在工作进程间共享，Redis不可用时退回到进程内"
+    )
+    drain_timeout_seconds: int = Field(
+        default=300, ge=0, description="工作进程停止或滚动重启时等待进行中的流式下载结束的时间(秒)"
+    )
+    heartbeat_seconds: int = Field(default=5, gt=0, le=60, description="工作进程向Redis上报子进程列表的间隔(秒)")
+
+
+class MonitoringConfig(BaseConfig):
+    """监控配置"""
+
+    metrics_enabled: bool = Field(default=True, description="是否导出Prometheus指标")
+    worker_metrics_port: int = Field(default=9808, gt=0, le=65535, description="Celery worker指标导出端口")
+    tracing_enabled: bool = Field(default=True, description="是否记录下载各阶段耗时")
+    trace_file: str = Field(default="", description="OTLP/JSON追踪的本地输出文件（每行一条），为空则不写文件")
+    otlp_endpoint: str = Field(default="", description="OpenTelemetry collector的OTLP/HTTP地址，为空则不发送")
+    slow_download_seconds: float = Field(default=300, gt=0, description="超过该耗时的下载记录完整span和命令行")
+
+
 class AppConfig(BaseConfig):
     """应用完整配置"""
 
@@ -282,6 +351,8 @@ class AppConfig(BaseConfig):
     file_management: FileManagementConfig = Field(default_factory=FileManagementConfig)
     security: SecurityConfig = Field(default_factory=SecurityConfig)
     celery: CeleryConfig = Field(default_factory=CeleryConfig)
+    web: WebConfig = Field(default_factory=WebConfig)
+    monitoring: MonitoringConfig = Field(default_factory=MonitoringConfig)
 
 
 # ==================== 配置管理器 ====================
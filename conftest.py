@@ -1,3 +1,6 @@
+import contextlib
+import fnmatch
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -17,3 +20,138 @@ def client():
     """
     with TestClient(app) as c:
         yield c
+
+
+# --- 内存Redis ---
+# 供文件索引、配额管理等直接操作Redis的组件在测试中使用。
+
+
+class FakeRedis:
+    """只实现文件索引和配额管理用到的命令的内存Redis，并记录调用次数。"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.calls = 0
+        self.published = []
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def _count(self):
+        self.calls += 1
+
+    def zadd(self, key, mapping, nx=False):
+        self._count()
+        zset = self.data.setdefault(key, {})
+        for member, score in mapping.items():
+            if not (nx and member in zset):
+                zset[member] = score
+
+    def zrem(self, key, member):
+        self._count()
+        self.data.get(key, {}).pop(member, None)
+
+    def zmscore(self, key, members):
+        self._count()
+        return [self.data.get(key, {}).get(m) for m in members]
+
+    def zrangebyscore(self, key, low, high, start=0, num=None):
+        self._count()
+        items = sorted((score, m) for m, score in self.data.get(key, {}).items() if score <= high)
+        return [m for _, m in items][start : start + num if num else None]
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        self._count()
+        self.data.setdefault(key, {}).update({k: str(v) for k, v in (mapping or {field: value}).items()})
+
+    def hget(self, key, field):
+        self._count()
+        return self.data.get(key, {}).get(field)
+
+    def hmget(self, key, fields):
+        self._count()
+        return [self.data.get(key, {}).get(f) for f in fields]
+
+    def hgetall(self, key):
+        self._count()
+        return dict(self.data.get(key, {}))
+
+    def hdel(self, key, *fields):
+        self._count()
+        for field in fields:
+            self.data.get(key, {}).pop(field, None)
+
+    def zrange(self, key, start, end):
+        self._count()
+        items = sorted((score, m) for m, score in self.data.get(key, {}).items())
+        return [m for _, m in items][start : None if end == -1 else end + 1]
+
+    def zcard(self, key):
+        self._count()
+        return len(self.data.get(key, {}))
+
+    def delete(self, *keys):
+        self._count()
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        return contextlib.nullcontext()
+
+    def ttl(self, key):
+        self._count()
+        return self.ttls.get(key, -1) if key in self.data else -2
+
+    def get(self, key):
+        self._count()
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        self._count()
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        if ex is not None:
+            self.ttls[key] = ex
+        return True
+
+    def hincrby(self, key, field, amount=1):
+        self._count()
+        hash_ = self.data.setdefault(key, {})
+        hash_[field] = str(int(hash_.get(field, 0)) + amount)
+        return int(hash_[field])
+
+    def expire(self, key, seconds):
+        self._count()
+        if key in self.data:
+            self.ttls[key] = seconds
+        return key in self.data
+
+    def scan_iter(self, match):
+        return [k for k in list(self.data) if fnmatch.fnmatch(k, match)]
+
+    def publish(self, channel, message):
+        self._count()
+        self.published.append((channel, message))
+        return 0
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.ops.append((name, args, kwargs))
+
+    def execute(self):
+        self.redis.calls += 1
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.ops]
+
+
+@pytest.fixture
+def fake_redis():
+    """
+    提供一个空的内存Redis。
+    """
+    return FakeRedis()
@@ -1,25 +1,35 @@
 # core/__init__.py
 
+from .circuit_breaker import CircuitBreaker
 from .command_builder import CommandBuilder
 from .error_handler import ErrorHandler
 from .exceptions import (
     AuthenticationException,
     CircuitBreakerState,
+    CircuitOpenException,
     DownloaderException,
     DownloadStalledException,
     FFmpegException,
+    InsufficientStorageException,
     MaxRetriesExceededException,
     NetworkException,
     NonRecoverableErrorException,
     ProxyException,
+    UnsupportedSegmentsException,
 )
 from .file_processor import FileProcessor
-from .retry_manager import RetryManager, with_retries
+from .metadata_context import MetadataContext
+from .retry_manager import RetryBudget, RetryManager, retry_budget, with_retries
+from .segment_downloader import SegmentDownloader
+from .stream_merger import StreamMerger
 from .subprocess_manager import SubprocessManager
 from .subprocess_progress_handler import SubprocessProgressHandler
+from .transcription import ChunkedTranscriber
 
 __all__ = [
     "CircuitBreakerState",
+    "CircuitOpenException",
+    "CircuitBreaker",
     "DownloaderException",
     "MaxRetriesExceededException",
     "NetworkException",
@@ -27,12 +37,20 @@ __all__ = [
     "DownloadStalledException",
     "NonRecoverableErrorException",
     "FFmpegException",
+    "InsufficientStorageException",
     "AuthenticationException",
+    "UnsupportedSegmentsException",
     "RetryManager",
+    "RetryBudget",
+    "retry_budget",
     "with_retries",
     "CommandBuilder",
     "SubprocessProgressHandler",
     "ErrorHandler",
     "SubprocessManager",
     "FileProcessor",
+    "StreamMerger",
+    "SegmentDownloader",
+    "ChunkedTranscriber",
+    "MetadataContext",
 ]
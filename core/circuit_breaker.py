@@ -0,0 +1,207 @@
+# core/circuit_breaker.py
+"""
+按站点的熔断器
+以提取域名（和代理）为键，把熔断状态保存在Redis中，所有Web进程和Celery worker共享同一视图。
+某站点连续返回429/403达到阈值后熔断打开，冷却期内的请求直接拒绝，不再启动yt-dlp；
+冷却期结束后只放行一个探测请求（半开），探测成功则关闭，仍被限流则重新打开。
+
+Redis不可用时熔断器不生效（放行所有请求），不会因为熔断器本身的故障影响下载。
+方法都是同步的Redis调用，异步接口中使用 async_guard 或通过 asyncio.to_thread 调用。
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+from urllib.parse import urlparse
+
+from config_manager import config
+
+from .error_handler import ErrorHandler
+from .exceptions import CircuitBreakerState, CircuitOpenException
+from .metrics import url_domain
+
+log = logging.getLogger(__name__)
+
+_CLOSED = CircuitBreakerState.CLOSED.value
+_OPEN = CircuitBreakerState.OPEN.value
+_HALF_OPEN = CircuitBreakerState.HALF_OPEN.value
+
+
+class CircuitBreaker:
+    """基于Redis哈希的按站点熔断器"""
+
+    def __init__(
+        self,
+        redis_client,
+        failure_threshold: int,
+        timeout: int,
+        probe_timeout: int = 60,
+        prefix: str = "circuit",
+    ):
+        """
+        Args:
+            redis_client: Redis客户端（decode_responses=True）；None时熔断器不生效
+            failure_threshold: 连续限流失败多少次后打开
+            timeout: 打开后的冷却时间（秒）
+            probe_timeout: 半开探测的占用时间（秒），探测请求未报告结果时过期后允许下一次探测
+            prefix: Redis键前缀
+        """
+        self.redis = redis_client
+        self.failure_threshold = failure_threshold
+        self.timeout = timeout
+        self.probe_timeout = probe_timeout
+        self.prefix = prefix
+        self.error_handler = ErrorHandler()
+
+    @classmethod
+    def from_config(cls, redis_client) -> "CircuitBreaker":
+        settings = config.downloader
+        return cls(redis_client, settings.circuit_breaker_failure_threshold, settings.circuit_breaker_timeout)
+
+    @staticmethod
+    def key_for(url: str, proxy: Optional[str] = None) -> str:
+        """熔断键: 站点域名，经代理访问时附加代理地址（不含用户名密码）"""
+        domain = url_domain(url)
+        if not proxy:
+            return domain
+        parsed = urlparse(proxy if "://" in proxy else f"http://{proxy}")
+        host = f"{parsed.hostname}:{parsed.port}" if parsed.port else parsed.hostname
+        return f"{domain}@{host}"
+
+    def _state_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _probe_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}:probe"
+
+    def state(self, key: str) -> CircuitBreakerState:
+        """当前状态；冷却期已过但尚未探测的熔断器仍报告为OPEN"""
+        if self.redis is None:
+            return CircuitBreakerState.CLOSED
+        return CircuitBreakerState(self.redis.hget(self._state_key(key), "state") or _CLOSED)
+
+    def allow(self, key: str) -> bool:
+        """
+        请求前检查熔断状态。
+
+        Returns:
+            本次请求是否为半开状态下的探测请求
+
+        Raises:
+            CircuitOpenException: 熔断打开（或已有探测请求在进行）
+        """
+        if self.redis is None:
+            return False
+        try:
+            data = self.redis.hgetall(self._state_key(key))
+            if not data or data.get("state", _CLOSED) == _CLOSED:
+                return False
+
+            remaining = float(data.get("open_until", 0)) - time.time()
+            if remaining > 0:
+                raise CircuitOpenException(f"站点 {key} 正在限流，熔断中（{remaining:.0f}s后重试）", remaining)
+
+            # 冷却期已过：只放行一个探测请求
+            if self.redis.set(self._probe_key(key), "1", nx=True, ex=self.probe_timeout):
+                self.redis.hset(self._state_key(key), "state", _HALF_OPEN)
+                log.info(f"熔断器半开，放行探测请求: {key}")
+                return True
+            raise CircuitOpenException(f"站点 {key} 正在进行熔断探测，请稍后重试", self.probe_timeout)
+        except CircuitOpenException:
+            raise
+        except Exception as e:
+            log.warning(f"读取熔断状态失败，放行请求: {e}")
+            return False
+
+    def record_success(self, key: str) -> None:
+        """请求成功：清除失败计数，半开状态下关闭熔断器"""
+        if self.redis is None:
+            return
+        try:
+            if self.redis.delete(self._state_key(key), self._probe_key(key)):
+                log.debug(f"熔断器重置: {key}")
+        except Exception as e:
+            log.warning(f"更新熔断状态失败: {e}")
+
+    def record_failure(self, key: str) -> None:
+        """请求被限流：累计失败次数，达到阈值或探测失败时打开熔断器"""
+        if self.redis is None:
+            return
+        state_key = self._state_key(key)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hincrby(state_key, "failures", 1)
+            pipe.hget(state_key, "state")
+            # 长时间没有新的失败时计数自然过期，只统计近期的连续失败
+            pipe.expire(state_key, self.timeout * 2)
+            failures, state, _ = pipe.execute()
+
+            if state == _HALF_OPEN or (state != _OPEN and int(failures) >= self.failure_threshold):
+                pipe = self.redis.pipeline()
+                pipe.hset(state_key, mapping={"state": _OPEN, "open_until": time.time() + self.timeout})
+                pipe.expire(state_key, self.timeout * 2)
+                pipe.delete(self._probe_key(key))
+                pipe.execute()
+                log.warning(f"站点 {key} 连续被限流 {failures} 次，熔断 {self.timeout}s")
+        except Exception as e:
+            log.warning(f"更新熔断状态失败: {e}")
+
+    def record_outcome(self, key: str, error: Optional[str], probe: bool = False) -> None:
+        """
+        按请求结果更新熔断状态。
+
+        Args:
+            error: 错误信息，None表示成功
+            probe: 本次请求是否为探测请求；非限流的失败不影响计数，但会释放探测名额
+        """
+        if error is None:
+            self.record_success(key)
+        elif self.error_handler.is_rate_limited(error):
+            self.record_failure(key)
+        elif probe:
+            self.release_probe(key)
+
+    def release_probe(self, key: str) -> None:
+        """探测请求没有得到结果（客户端断开、未能发出请求）时释放探测名额，下一个请求可以重新探测"""
+        if self.redis is None:
+            return
+        try:
+            self.redis.delete(self._probe_key(key))
+        except Exception as e:
+            log.warning(f"更新熔断状态失败: {e}")
+
+    @contextmanager
+    def guard(self, url: str, proxy: Optional[str] = None):
+        """
+        包裹一次对站点的访问：打开时抛出 CircuitOpenException，结束后按结果更新状态。
+        """
+        key = self.key_for(url, proxy)
+        with self.track(key, self.allow(key)):
+            yield key
+
+    @asynccontextmanager
+    async def async_guard(self, url: str, proxy: Optional[str] = None):
+        """guard 的异步版本，熔断状态的读写在线程中执行，不阻塞事件循环"""
+        key = self.key_for(url, proxy)
+        probe = await asyncio.to_thread(self.allow, key)
+        try:
+            yield key
+        except Exception as e:
+            await asyncio.to_thread(self.record_outcome, key, str(e), probe)
+            raise
+        await asyncio.to_thread(self.record_outcome, key, None, probe)
+
+    @contextmanager
+    def track(self, key: str, probe: bool = False):
+        """
+        在已通过 allow 检查的访问结束后按结果更新状态。
+        调用方需要在检查熔断状态和访问站点之间做其他准备工作时使用。
+        """
+        try:
+            yield key
+        except Exception as e:
+            self.record_outcome(key, str(e), probe)
+            raise
+        self.record_outcome(key, None, probe)
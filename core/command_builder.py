@@ -6,7 +6,9 @@ from typing import Any, Dict, List, Optional, Tuple
 
 from config_manager import config
 
+from .command_profiles import CommandProfile, CommandProfiles
 from .format_analyzer import DownloadStrategy, FormatAnalyzer
+from .transfer_tuner import TransferPlan, TransferTuner
 
 log = logging.getLogger(__name__)
 
@@ -14,10 +16,88 @@ log = logging.getLogger(__name__)
 class CommandBuilder:
     """负责构建各种命令行命令"""
 
-    def __init__(self, proxy: Optional[str] = None, cookies_file: Optional[str] = None):
+    def __init__(
+        self,
+        proxy: Optional[str] = None,
+        cookies_file: Optional[str] = None,
+        resumable: bool = False,
+        transfer_tuner: Optional[TransferTuner] = None,
+        profiles: Optional[CommandProfiles] = None,
+    ):
+        """
+        Args:
+            resumable: 续传模式，在任务独立的工作目录中下载时使用；
+                以 --continue 代替 --force-overwrites，并保留 .part 文件，重试时从断点继续
+            transfer_tuner: 按格式和站点选择传输参数，None时使用配置的默认并发数
+            profiles: 按站点追加的yt-dlp参数，None时使用配置中的档案
+        """
         self.proxy = proxy
         self.cookies_file = cookies_file
+        self.resumable = resumable
+        self.transfer_tuner = transfer_tuner or TransferTuner.from_config()
+        self.profiles = profiles or CommandProfiles.from_config()
         self.format_analyzer = FormatAnalyzer()
+        # (命令类型, 档案名) -> 参数模板
+        self._templates: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+
+    def _overwrite_args(self) -> List[str]:
+        return ["--continue"] if self.resumable else ["--force-overwrites"]
+
+    def _auth_args(self) -> List[str]:
+        args = []
+        if self.proxy:
+            args.extend(["--proxy", self.proxy])
+        if self.cookies_file and Path(self.cookies_file).exists():
+            args.extend(["--cookies", str(Path(self.cookies_file).resolve())])
+        return args
+
+    def _build_template(self, kind: str, profile: CommandProfile) -> List[str]:
+        """
+        构建一类yt-dlp命令的公共参数：
+
+        - progress: 下载命令，输出JSON进度
+        - no_progress: 下载命令，不输出进度，用于捕获输出
+        - stdout: 把内容写到stdout的直流命令，临时目录由调用方指定
+        - info: 信息提取命令
+        """
+        if kind == "info":
+            cmd = ["yt-dlp", "--socket-timeout", "30", "--retries", "3", "--no-call-home", "--no-check-certificate"]
+            return cmd + self._auth_args() + list(profile.args) + list(self.profiles.extra_args)
+
+        overwrite = ["--force-overwrites"] if kind == "stdout" else self._overwrite_args()
+        cmd = ["yt-dlp", "--ignore-config", "--no-warnings", "--no-color", *overwrite, "--force-ipv4"]
+        if kind == "stdout":
+            cmd.append("--no-progress")
+        else:
+            # 统一临时文件路径管理
+            temp_path = config.downloader.temp_path
+            if temp_path:
+                Path(temp_path).mkdir(parents=True, exist_ok=True)
+                cmd.extend(["--paths", f"temp:{temp_path}"])
+
+        cmd.extend(self._auth_args())
+        if kind == "progress":
+            cmd.extend(["--progress", "--progress-template", "%(progress)j"])
+        cmd.extend(["--fragment-retries", "infinite", "--retry-sleep", "fragment:exp=1:30"])
+        cmd.extend(["--no-check-certificate", "--prefer-insecure"])
+        # 保留 .part 文件（不使用 --no-part），停滞重启时可以从断点续传，见 build_resume_cmd
+        if kind == "stdout" or (kind == "no_progress" and not self.resumable):
+            cmd.append("--no-part")
+        cmd.append("--no-mtime")
+        return cmd + list(profile.args) + list(self.profiles.extra_args)
+
+    def _template(self, kind: str, url: Optional[str]) -> Tuple[List[str], CommandProfile]:
+        """URL所在站点的参数模板；代理、cookies和临时目录只在第一次构建时检查"""
+        profile = self.profiles.resolve(url)
+        key = (kind, profile.name)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = tuple(self._build_template(kind, profile))
+        return list(template), profile
+
+    def profile_args(self, url: Optional[str]) -> List[str]:
+        """URL所在站点的档案参数和额外参数，供不经过本类构建的yt-dlp命令使用"""
+        return list(self.profiles.args(url))
 
     def update_cookies_file(self, new_cookies_file: str) -> None:
         """
@@ -27,91 +107,63 @@ class CommandBuilder:
             new_cookies_file: 新的cookies文件路径
         """
         self.cookies_file = new_cookies_file
+        self._templates.clear()
         log.debug(f"已更新cookies文件路径: {new_cookies_file}")
 
-    def build_yt_dlp_base_cmd(self) -> List[str]:
-        """构建基础的yt-dlp命令"""
-        cmd = [
-            "yt-dlp",
-            "--ignore-config",
-            "--no-warnings",
-            "--no-color",
-            "--force-overwrites",
-            "--force-ipv4",
-        ]
-
-        # 统一临时文件路径管理
-        temp_path = config.downloader.temp_path
-        if temp_path:
-            Path(temp_path).mkdir(parents=True, exist_ok=True)
-            cmd.extend(["--paths", f"temp:{temp_path}"])
+    @staticmethod
+    def build_source_args(url: str, info_json_path: Optional[Path] = None) -> List[str]:
+        """
+        构建命令末尾的下载来源参数。
 
-        if self.proxy:
-            cmd.extend(["--proxy", self.proxy])
+        提供info.json时使用 --load-info-json 复用已提取的元数据（yt-dlp会忽略URL），
+        否则按URL重新提取。
+        """
+        if info_json_path and Path(info_json_path).exists():
+            return ["--load-info-json", str(info_json_path)]
+        return ["--", url]
 
-        if self.cookies_file and Path(self.cookies_file).exists():
-            cmd.extend(["--cookies", str(Path(self.cookies_file).resolve())])
+    def build_yt_dlp_base_cmd(self, transfer: Optional[TransferPlan] = None, url: Optional[str] = None) -> List[str]:
+        """
+        构建基础的yt-dlp命令
 
-        cmd.extend(["--progress", "--progress-template", "%(progress)j"])
-        cmd.extend(["--fragment-retries", "infinite", "--retry-sleep", "fragment:exp=1:30"])
-        cmd.extend(
-            [
-                "--no-check-certificate",
-                "--prefer-insecure",
-                "--no-part",
-                "--no-mtime",
-                "--concurrent-fragments",
-                "4",
-            ]
-        )
+        Args:
+            transfer: 传输参数（分片并发数、分块大小），None时使用默认值
+            url: 视频URL（可选），用于选择站点档案
+        """
+        cmd, profile = self._template("progress", url)
+        cmd.extend(profile.limit(transfer or self.transfer_tuner.default_plan()).args())
         return cmd
 
-    def build_yt_dlp_base_cmd_no_progress(self) -> List[str]:
-        """构建一个没有进度条的基础yt-dlp命令，用于捕获输出"""
-        cmd = [
-            "yt-dlp",
-            "--ignore-config",
-            "--no-warnings",
-            "--no-color",
-            "--force-overwrites",
-            "--force-ipv4",
-        ]
-
-        # 统一临时文件路径管理
-        temp_path = config.downloader.temp_path
-        if temp_path:
-            Path(temp_path).mkdir(parents=True, exist_ok=True)
-            cmd.extend(["--paths", f"temp:{temp_path}"])
-
-        if self.proxy:
-            cmd.extend(["--proxy", self.proxy])
+    @staticmethod
+    def build_resume_cmd(cmd: List[str]) -> List[str]:
+        """
+        停滞后重启用的命令：去掉 --force-overwrites（它隐含 --no-continue），改为 --continue，
+        让yt-dlp从上次留下的 .part 文件和分片状态继续下载。
 
-        if self.cookies_file and Path(self.cookies_file).exists():
-            cmd.extend(["--cookies", str(Path(self.cookies_file).resolve())])
+        不写 .part 文件（--no-part）或不是yt-dlp下载命令时原样返回。
+        """
+        if "--force-overwrites" not in cmd or "--no-part" in cmd:
+            return list(cmd)
+        resumed = [arg for arg in cmd if arg != "--force-overwrites"]
+        resumed.insert(1, "--continue")
+        return resumed
 
-        cmd.extend(["--fragment-retries", "infinite", "--retry-sleep", "fragment:exp=1:30"])
-        cmd.extend(
-            [
-                "--no-check-certificate",
-                "--prefer-insecure",
-                "--no-part",
-                "--no-mtime",
-                "--concurrent-fragments",
-                "4",
-            ]
-        )
+    def build_yt_dlp_base_cmd_no_progress(self, url: Optional[str] = None) -> List[str]:
+        """构建一个没有进度条的基础yt-dlp命令，用于捕获输出"""
+        cmd, profile = self._template("no_progress", url)
+        cmd.extend(profile.limit(self.transfer_tuner.default_plan()).args())
         return cmd
 
     def build_video_download_cmd(self, output_path: str, url: str) -> List[str]:
         """构建视频下载命令"""
-        cmd = self.build_yt_dlp_base_cmd()
+        cmd = self.build_yt_dlp_base_cmd(url=url)
         video_format = config.downloader.ytdlp_video_format
         cmd.extend(["-f", video_format, "--newline", "-o", output_path, url])
         return cmd
 
     def build_audio_download_cmd(self, url: str, output_template: str, audio_format: str = "mp3") -> List[str]:
         """构建音频下载命令"""
-        cmd = self.build_yt_dlp_base_cmd_no_progress()
+        cmd = self.build_yt_dlp_base_cmd_no_progress(url)
         cmd.extend(["--extract-audio"])
         if audio_format == "best_original_audio":
             cmd.extend(["-f", "bestaudio[ext=m4a]/bestaudio[ext=mp4]/bestaudio/best"])
@@ -124,7 +176,7 @@ class CommandBuilder:
 
     def build_streaming_download_cmd(self, output_path: str, url: str, format_spec: str = "best") -> List[str]:
         """构建浏览器直流下载命令（后台元数据嵌入模式）"""
-        cmd = self.build_yt_dlp_base_cmd_no_progress()  # 依赖基础命令
+        cmd = self.build_yt_dlp_base_cmd_no_progress(url)  # 依赖基础命令
         from utils import create_simplified_identifier
 
         simplified_source = create_simplified_identifier(url)
@@ -154,15 +206,7 @@ class CommandBuilder:
         temp_dir_path: Optional[str] = None,
     ) -> List[str]:
         """构建浏览器直流下载命令，将内容输出到stdout，支持范围请求和自定义临时目录"""
-        cmd = [
-            "yt-dlp",
-            "--ignore-config",
-            "--no-warnings",
-            "--no-color",
-            "--force-overwrites",
-            "--force-ipv4",
-            "--no-progress",
-        ]
+        cmd, profile = self._template("stdout", url)
 
         # 直流模式使用专用的、每次都清理的临时目录
         if temp_dir_path:
@@ -174,23 +218,7 @@ class CommandBuilder:
                 Path(temp_path).mkdir(parents=True, exist_ok=True)
                 cmd.extend(["--paths", f"temp:{temp_path}"])
 
-        if self.proxy:
-            cmd.extend(["--proxy", self.proxy])
-
-        if self.cookies_file and Path(self.cookies_file).exists():
-            cmd.extend(["--cookies", str(Path(self.cookies_file).resolve())])
-
-        cmd.extend(["--fragment-retries", "infinite", "--retry-sleep", "fragment:exp=1:30"])
-        cmd.extend(
-            [
-                "--no-check-certificate",
-                "--prefer-insecure",
-                "--no-part",
-                "--no-mtime",
-                "--concurrent-fragments",
-                "4",
-            ]
-        )
+        cmd.extend(profile.limit(self.transfer_tuner.default_plan()).args())
 
         if byte_range:
             start, end = byte_range
@@ -220,7 +248,7 @@ class CommandBuilder:
         Returns:
             list: 命令列表
         """
-        cmd = self.build_yt_dlp_base_cmd()
+        cmd = self.build_yt_dlp_base_cmd(url=url)
         # 使用可预测的文件名模板
         output_template = Path(output_path) / f"{file_prefix}.video.%(ext)s"
 
@@ -241,13 +269,34 @@ class CommandBuilder:
         Returns:
             list: 命令列表
         """
-        cmd = self.build_yt_dlp_base_cmd()
+        cmd = self.build_yt_dlp_base_cmd(url=url)
         # 使用可预测的文件名模板
         output_template = Path(output_path) / f"{file_prefix}.audio.%(ext)s"
         audio_format = "bestaudio[ext=m4a]/bestaudio"
         cmd.extend(["-f", audio_format, "--newline", "-o", str(output_template), "--", url])
         return cmd
 
+    def build_stream_to_stdout_cmd(
+        self, url: str, format_spec: str, info_json_path: Optional[Path] = None
+    ) -> List[str]:
+        """
+        构建把单个流直接写到stdout的下载命令，供边下边合并的管道使用。
+
+        输出到stdout时yt-dlp会把进度和日志都写到stderr。
+
+        Args:
+            url: 视频URL
+            format_spec: 单个流的格式选择器（不能包含'+'）
+            info_json_path: 已提取的info.json（可选，提供时不再重新提取）
+
+        Returns:
+            list: 命令列表
+        """
+        cmd = self.build_yt_dlp_base_cmd(url=url)
+        cmd.extend(["-f", format_spec, "--newline", "--no-playlist", "-o", "-"])
+        cmd.extend(self.build_source_args(url, info_json_path))
+        return cmd
+
     def build_combined_download_cmd(
         self,
         output_path: str,
@@ -269,7 +318,7 @@ class CommandBuilder:
         Returns:
             tuple: (命令列表, 使用的格式, 确切的输出文件路径)
         """
-        cmd = self.build_yt_dlp_base_cmd()
+        cmd = self.build_yt_dlp_base_cmd(url=url)
 
         # 确保下载目录存在
         output_dir = Path(output_path).resolve()
@@ -320,6 +369,7 @@ class CommandBuilder:
         formats: List[Dict[str, Any]],
         format_id: str = None,
         resolution: str = None,
+        info_json_path: Optional[Path] = None,
     ) -> Tuple[List[str], str, Path, DownloadStrategy]:
         """
         构建智能下载命令 - 自动判断使用完整流还是分离流策略
@@ -331,6 +381,7 @@ class CommandBuilder:
             formats: 从yt-dlp获取的格式列表
             format_id: 要下载的特定视频格式ID (可选)
             resolution: 视频分辨率 (可选，例如: '720p60')
+            info_json_path: 已提取的info.json（可选，提供时不再重新提取）
 
         Returns:
             tuple: (命令列表, 使用的格式, 确切的输出文件路径, 下载策略)
@@ -345,6 +396,14 @@ class CommandBuilder:
             output_dir = Path(output_path).resolve()
             output_dir.mkdir(parents=True, exist_ok=True)
             exact_output_path = output_dir / f"{file_prefix}.mp4"
+            # 按选中格式的传输方式（单文件/HLS/DASH）和站点选择分片并发数和分块大小
+            transfer = self.transfer_tuner.plan(
+                [
+                    download_plan.primary_format.raw_format,
+                    download_plan.secondary_format.raw_format if download_plan.secondary_format else None,
+                ],
+                url,
+            )
 
             if download_plan.strategy == DownloadStrategy.DIRECT:
                 # 直接下载完整流
@@ -353,6 +412,8 @@ class CommandBuilder:
                     exact_output_path,
                     download_plan.primary_format.format_id,
                     download_plan.strategy,
+                    info_json_path,
+                    transfer,
                 )
 
             elif download_plan.strategy == DownloadStrategy.MERGE:
@@ -366,7 +427,9 @@ class CommandBuilder:
                 # 输出视频音频组合信息
                 log.info(f"🎬 视频音频组合: {combined_format}")
 
-                return self._build_merge_download_cmd(url, exact_output_path, combined_format, download_plan.strategy)
+                return self._build_merge_download_cmd(
+                    url, exact_output_path, combined_format, download_plan.strategy, info_json_path, transfer
+                )
 
         except Exception as e:
             log.warning(f"智能格式分析失败: {e}，降级到传统方法")
@@ -377,10 +440,16 @@ class CommandBuilder:
             return cmd, format_str, path, DownloadStrategy.DIRECT
 
     def _build_direct_download_cmd(
-        self, url: str, output_path: Path, format_id: str, strategy: DownloadStrategy
+        self,
+        url: str,
+        output_path: Path,
+        format_id: str,
+        strategy: DownloadStrategy,
+        info_json_path: Optional[Path] = None,
+        transfer: Optional[TransferPlan] = None,
     ) -> Tuple[List[str], str, Path, DownloadStrategy]:
         """构建直接下载完整流的命令"""
-        cmd = self.build_yt_dlp_base_cmd()
+        cmd = self.build_yt_dlp_base_cmd(transfer, url)
 
         cmd.extend(
             [
@@ -395,10 +464,9 @@ class CommandBuilder:
                 "--hls-prefer-native",
                 "-o",
                 str(output_path),
-                "--",
-                url,
             ]
         )
+        cmd.extend(self.build_source_args(url, info_json_path))
 
         log.info(f"构建直接下载命令: 格式={format_id}")
         return cmd, format_id, output_path, strategy
@@ -409,9 +477,11 @@ class CommandBuilder:
         output_path: Path,
         combined_format: str,
         strategy: DownloadStrategy,
+        info_json_path: Optional[Path] = None,
+        transfer: Optional[TransferPlan] = None,
     ) -> Tuple[List[str], str, Path, DownloadStrategy]:
         """构建合并下载命令"""
-        cmd = self.build_yt_dlp_base_cmd()
+        cmd = self.build_yt_dlp_base_cmd(transfer, url)
 
         # 记录合并下载的格式组合
         log.info(f"构建合并下载命令: 格式组合={combined_format}")
@@ -429,17 +499,18 @@ class CommandBuilder:
                 "--hls-prefer-native",
                 "-o",
                 str(output_path),
-                "--",
-                url,
             ]
         )
+        cmd.extend(self.build_source_args(url, info_json_path))
 
         log.info(f"构建合并下载命令: 格式={combined_format}")
         return cmd, combined_format, output_path, strategy
 
-    def build_metadata_download_cmd(self, output_path: str, url: str) -> List[str]:
-        """构建元数据下载命令"""
-        cmd = self.build_yt_dlp_base_cmd()
+    def build_metadata_download_cmd(
+        self, output_path: str, url: str, info_json_path: Optional[Path] = None
+    ) -> List[str]:
+        """构建元数据（缩略图）下载命令，提供info.json时不再重新提取"""
+        cmd = self.build_yt_dlp_base_cmd(url=url)
 
         output_template = f"{output_path}/%(title)s.%(ext)s"
 
@@ -451,41 +522,20 @@ class CommandBuilder:
                 "png",
                 "-o",
                 output_template,
-                url,
             ]
         )
+        cmd.extend(self.build_source_args(url, info_json_path))
         return cmd
 
-    def build_yt_dlp_info_cmd(self) -> List[str]:
+    def build_yt_dlp_info_cmd(self, url: Optional[str] = None) -> List[str]:
         """构建用于获取视频信息的yt-dlp基础命令（不跳过任何清单以获取完整格式列表）"""
-        cmd = ["yt-dlp"]
-
-        # 基础网络配置
-        cmd.extend(
-            [
-                "--socket-timeout",
-                "30",
-                "--retries",
-                "3",
-                "--no-call-home",
-                "--no-check-certificate",
-            ]
-        )
-
-        # 添加代理配置（如果有）
-        if self.proxy:
-            cmd.extend(["--proxy", self.proxy])
-
-        # 添加cookies配置（如果有）
-        if self.cookies_file and Path(self.cookies_file).exists():
-            cmd.extend(["--cookies", str(Path(self.cookies_file).resolve())])
-
+        cmd, _ = self._template("info", url)
         return cmd
 
     def build_playlist_info_cmd(self, url: str) -> List[str]:
         """构建播放列表信息获取命令"""
         # 使用专门的信息获取命令，不跳过HLS/DASH清单
-        cmd = self.build_yt_dlp_info_cmd()
+        cmd = self.build_yt_dlp_info_cmd(url)
         cmd.extend(["--dump-json", "--no-download", "--no-playlist", url])
         return cmd
 
@@ -503,6 +553,54 @@ class CommandBuilder:
             str(Path(output_path).resolve()),
         ]
 
+    def build_ffmpeg_remux_cmd(self, input_path: str, output_path: str) -> List[str]:
+        """构建FFmpeg重新封装命令（不转码，如把HLS的MPEG-TS分片封装为MP4）"""
+        return [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            str(Path(input_path).resolve()),
+            "-map",
+            "0",
+            "-c",
+            "copy",
+            "-bsf:a",
+            "aac_adtstoasc",
+            str(Path(output_path).resolve()),
+        ]
+
+    def build_ffmpeg_pipe_merge_cmd(self, video_fd: int, audio_fd: int, output_path: str) -> List[str]:
+        """
+        构建从两个管道读取视频/音频并复用为分片MP4的FFmpeg命令。
+
+        分片MP4（empty_moov）不需要回写moov，输出可以边读边写一次完成。
+        """
+        return [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            f"pipe:{video_fd}",
+            "-i",
+            f"pipe:{audio_fd}",
+            "-map",
+            "0:v:0",
+            "-map",
+            "1:a:0",
+            "-c",
+            "copy",
+            "-movflags",
+            "+frag_keyframe+empty_moov+default_base_moof",
+            "-f",
+            "mp4",
+            str(Path(output_path).resolve()),
+        ]
+
     def build_ffmpeg_extract_audio_cmd(self, video_path: str, audio_path: str) -> List[str]:
         """构建FFmpeg音频提取命令"""
         return [
@@ -531,13 +629,18 @@ class CommandBuilder:
             str(Path(output_path).resolve()),
         ]
 
-    def build_whisper_cmd(self, model_path: str, source_language: str, audio_path: str) -> List[str]:
+    def build_whisper_cmd(
+        self, model_path: str, source_language: str, audio_path: str, threads: Optional[int] = None
+    ) -> List[str]:
         """构建Whisper转录命令"""
-        return [
+        cmd = [
             "whisper-cli",
             "-m",
             str(Path(model_path).resolve()),
             "-l",
             source_language,
-            str(Path(audio_path).resolve()),
         ]
+        if threads:
+            cmd.extend(["-t", str(threads)])
+        cmd.append(str(Path(audio_path).resolve()))
+        return cmd
@@ -0,0 +1,93 @@
+# core/command_profiles.py
+"""
+yt-dlp命令参数档案
+按站点域名选择一组追加的yt-dlp参数（如YouTube的player_client、限速规避、socket超时、
+缓冲区大小）和分片并发数上限，配置在 advanced.ytdlp_profiles 中；advanced.ytdlp_extra_args
+追加到所有命令。调整某个站点的下载参数只需修改配置，不需要改代码。
+
+CommandBuilder 把公共参数、档案参数和额外参数合并成按（命令类型, 档案）缓存的参数模板，
+所有yt-dlp命令都从模板构建。
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from config_manager import config
+
+from .metrics import url_domain
+from .transfer_tuner import TransferPlan
+
+log = logging.getLogger(__name__)
+
+# 传输参数由 TransferTuner 按格式选择，写在档案参数里会被覆盖
+_TRANSFER_OPTIONS = ("--concurrent-fragments", "--http-chunk-size", "--buffer-size")
+
+
+@dataclass(frozen=True)
+class CommandProfile:
+    """一个站点档案"""
+
+    name: str
+    domains: Tuple[str, ...] = ()
+    args: Tuple[str, ...] = ()
+    max_concurrent_fragments: Optional[int] = None
+
+    def matches(self, domain: str) -> int:
+        """匹配的域名长度（越长越具体），不匹配返回0"""
+        return max((len(d) for d in self.domains if domain == d or domain.endswith("." + d)), default=0)
+
+    def limit(self, plan: TransferPlan) -> TransferPlan:
+        """按站点的并发上限调整传输参数"""
+        if self.max_concurrent_fragments and plan.concurrent_fragments > self.max_concurrent_fragments:
+            return TransferPlan(self.max_concurrent_fragments, plan.http_chunk_size, plan.buffer_size)
+        return plan
+
+
+DEFAULT_PROFILE = CommandProfile("default")
+
+
+class CommandProfiles:
+    """按URL选择站点档案"""
+
+    def __init__(self, profiles: Iterable[CommandProfile] = (), extra_args: Iterable[str] = ()):
+        """
+        Args:
+            profiles: 站点档案
+            extra_args: 追加到所有yt-dlp命令的参数
+        """
+        self.profiles = tuple(profiles)
+        self.extra_args = tuple(extra_args)
+        self._by_domain: Dict[str, CommandProfile] = {}
+
+        for profile in self.profiles:
+            overridden = [arg for arg in profile.args if arg in _TRANSFER_OPTIONS]
+            if overridden:
+                log.warning(f"档案 {profile.name} 中的 {', '.join(overridden)} 会被按格式选择的传输参数覆盖")
+
+    @classmethod
+    def from_config(cls) -> "CommandProfiles":
+        advanced = config.advanced
+        return cls(
+            (
+                CommandProfile(name, tuple(p.domains), tuple(p.args), p.max_concurrent_fragments)
+                for name, p in advanced.ytdlp_profiles.items()
+            ),
+            advanced.ytdlp_extra_args,
+        )
+
+    def resolve(self, url: Optional[str]) -> CommandProfile:
+        """URL对应的档案：域名匹配最具体的一个，都不匹配时使用默认档案"""
+        if not url or not self.profiles:
+            return DEFAULT_PROFILE
+        domain = url_domain(url)
+        profile = self._by_domain.get(domain)
+        if profile is None:
+            best = max(self.profiles, key=lambda p: p.matches(domain))
+            profile = best if best.matches(domain) else DEFAULT_PROFILE
+            self._by_domain[domain] = profile
+        return profile
+
+    def args(self, url: Optional[str]) -> Tuple[str, ...]:
+        """URL对应的档案参数和额外参数"""
+        return self.resolve(url).args + self.extra_args
@@ -2,7 +2,9 @@
 
 import logging
 import os
-from typing import Optional
+import threading
+import time
+from typing import Dict, Optional
 from urllib.parse import urlparse
 
 from auto_cookies import auto_extract_cookies_for_url
@@ -23,6 +25,9 @@ class CookiesManager:
         """
         self.cookies_file = cookies_file
         self.auto_refresh_enabled = True
+        # 刷新串行化，并记录每个域名最近一次刷新成功的时间
+        self._refresh_lock = threading.Lock()
+        self._last_refreshed: Dict[str, float] = {}
 
     def should_refresh_cookies(self, error: Exception) -> bool:
         """
@@ -40,6 +45,9 @@ class CookiesManager:
         """
         为指定URL刷新cookies
 
+        并发的认证失败只触发一次提取：等待锁期间若已有其他请求为同一域名
+        刷新成功，直接复用其结果。
+
         Args:
             url: 目标URL
             browser: 浏览器类型 ('auto', 'chrome', 'firefox', etc.)
@@ -47,13 +55,27 @@ class CookiesManager:
         Returns:
             str: 新的cookies文件路径，失败时返回None
         """
-        log.info("🍪 检测到认证错误，正在自动从浏览器更新cookies...")
+        domain = self.get_domain_from_url(url)
+        requested_at = time.monotonic()
+
+        with self._refresh_lock:
+            if self._last_refreshed.get(domain, 0) >= requested_at:
+                log.info("🍪 其他任务刚刚刷新过该域名的cookies，直接复用")
+                return self.cookies_file
+
+            log.info("🍪 检测到认证错误，正在自动从浏览器更新cookies...")
+            new_cookies_file = self._refresh_from_browser(url, browser)
+            if new_cookies_file:
+                self._last_refreshed[domain] = time.monotonic()
+            return new_cookies_file
 
+    def _refresh_from_browser(self, url: str, browser: str) -> Optional[str]:
+        """从浏览器提取cookies并更新主cookies文件，失败时恢复备份。"""
         try:
             # 备份当前cookies文件
             self._backup_current_cookies()
 
-            # 从浏览器获取新cookies
+            # 从浏览器获取新cookies（按域名缓存，浏览器数据库未变化时直接命中）
             new_cookies_file = auto_extract_cookies_for_url(
                 url=url,
                 browser=browser,
@@ -114,7 +136,10 @@ class CookiesManager:
             if new_cookies_file != self.cookies_file:
                 import shutil
 
-                shutil.copy2(new_cookies_file, self.cookies_file)
+                # 先复制到临时文件再替换，正在读取主cookies文件的yt-dlp进程不会读到半个文件
+                temp_file = f"{self.cookies_file}.tmp"
+                shutil.copy2(new_cookies_file, temp_file)
+                os.replace(temp_file, self.cookies_file)
                 log.debug(f"已更新主cookies文件: {self.cookies_file}")
         except Exception as e:
             log.error(f"更新主cookies文件失败: {e}")
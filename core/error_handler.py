@@ -10,6 +10,7 @@ from .exceptions import (
     AuthenticationException,
     DownloaderException,
     NetworkException,
+    NonRecoverableErrorException,
     ProxyException,
 )
 
@@ -55,6 +56,25 @@ class ErrorHandler:
         else:
             return "other"
 
+    def classify_exception(self, error: BaseException) -> str:
+        """
+        按异常类型和错误信息分类，用于决定重试策略
+
+        Returns:
+            str: 错误类型 ('proxy', 'network', 'auth', 'other')
+        """
+        if isinstance(error, AuthenticationException):
+            return "auth"
+        if isinstance(error, ProxyException):
+            return "proxy"
+        if isinstance(error, NonRecoverableErrorException):
+            return "other"
+        error_type = self.classify_error(str(error))
+        # 停滞、超时等异常的信息中不一定包含可识别的错误输出
+        if error_type == "other" and isinstance(error, (NetworkException, ConnectionError, TimeoutError)):
+            return "network"
+        return error_type
+
     def is_auth_error(self, error_output: str) -> bool:
         """判断是否是认证/验证错误"""
         if not error_output:
@@ -75,6 +95,22 @@ class ErrorHandler:
         ]
         return any(pattern in error_lower for pattern in auth_patterns)
 
+    def is_rate_limited(self, error_output: str) -> bool:
+        """判断是否是站点限流或封禁（HTTP 429/403），用于熔断器计数"""
+        if not error_output:
+            return False
+
+        error_lower = error_output.lower()
+        rate_limit_patterns = [
+            "http error 429",
+            "too many requests",
+            "http error 403",
+            "403: forbidden",
+            "rate limit",
+            "rate-limit",
+        ]
+        return any(pattern in error_lower for pattern in rate_limit_patterns)
+
     def create_appropriate_exception(self, error_output: str, command: str) -> Exception:
         """
         根据错误输出创建合适的异常
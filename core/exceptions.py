@@ -43,6 +43,22 @@ class NonRecoverableErrorException(DownloaderException):
         self.details = details
 
 
+class InsufficientStorageException(DownloaderException):
+    """当磁盘配额或剩余空间不足以容纳新的下载时抛出。"""
+
+
+class CircuitOpenException(DownloaderException):
+    """当目标站点的熔断器处于打开状态、请求被快速拒绝时抛出。"""
+
+    def __init__(self, message, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UnsupportedSegmentsException(DownloaderException):
+    """当格式不适合原生分片下载（加密、直播、主播放列表等）、应交给yt-dlp处理时抛出。"""
+
+
 class FFmpegException(DownloaderException):
     """当 ffmpeg 处理文件失败时抛出。"""
 
@@ -15,6 +15,7 @@ from config_manager import config
 
 from .command_builder import CommandBuilder
 from .exceptions import DownloaderException, FFmpegException
+from .metrics import FFMPEG_SECONDS, timed
 from .subprocess_manager import SubprocessManager
 
 log = logging.getLogger(__name__)
@@ -79,10 +80,11 @@ class FileProcessor:
             merge_cmd = self.command_builder.build_ffmpeg_merge_cmd(str(video_part), str(audio_part), str(output_file))
 
             # 执行合并命令
-            return_code, stdout, stderr = await self.subprocess_manager.execute_simple(
-                merge_cmd,
-                timeout=300,  # 5分钟超时
-            )
+            with timed(FFMPEG_SECONDS, "merge"):
+                return_code, stdout, stderr = await self.subprocess_manager.execute_simple(
+                    merge_cmd,
+                    timeout=300,  # 5分钟超时
+                )
 
             # 检查输出文件是否生成
             if not output_file.exists():
@@ -140,10 +142,11 @@ class FileProcessor:
             extract_cmd = self.command_builder.build_ffmpeg_extract_audio_cmd(str(video_file), str(output_file))
 
             # 执行提取命令
-            return_code, stdout, stderr = await self.subprocess_manager.execute_simple(
-                extract_cmd,
-                timeout=300,  # 5分钟超时
-            )
+            with timed(FFMPEG_SECONDS, "extract_audio"):
+                return_code, stdout, stderr = await self.subprocess_manager.execute_simple(
+                    extract_cmd,
+                    timeout=300,  # 5分钟超时
+                )
 
             # 检查输出文件是否生成
             if not output_file.exists():
@@ -197,10 +200,11 @@ class FileProcessor:
             convert_cmd = self.command_builder.build_ffmpeg_extract_audio_cmd(str(input_file), str(output_file))
 
             # 执行转换命令
-            return_code, stdout, stderr = await self.subprocess_manager.execute_simple(
-                convert_cmd,
-                timeout=300,  # 5分钟超时
-            )
+            with timed(FFMPEG_SECONDS, "convert"):
+                return_code, stdout, stderr = await self.subprocess_manager.execute_simple(
+                    convert_cmd,
+                    timeout=300,  # 5分钟超时
+                )
 
             if not output_file.exists() or output_file.stat().st_size == 0:
                 raise FFmpegException(f"音频转换失败，输出文件未生成或为空: {output_file}")
@@ -217,6 +221,39 @@ class FileProcessor:
         except Exception as e:
             raise FFmpegException(f"音频转换过程中发生错误: {e}") from e
 
+    async def remux(self, input_file: Path, output_file: Path, cleanup_original: bool = True) -> Path:
+        """
+        不转码地把文件重新封装为输出路径扩展名对应的容器（如MPEG-TS -> MP4）。
+
+        Args:
+            input_file: 输入文件路径
+            output_file: 输出文件路径
+            cleanup_original: 是否清理原始文件
+
+        Returns:
+            Path: 输出文件路径
+
+        Raises:
+            FFmpegException: FFmpeg操作失败
+        """
+        try:
+            remux_cmd = self.command_builder.build_ffmpeg_remux_cmd(str(input_file), str(output_file))
+            with timed(FFMPEG_SECONDS, "remux"):
+                await self.subprocess_manager.execute_simple(remux_cmd, timeout=300)
+
+            if not output_file.exists() or output_file.stat().st_size == 0:
+                raise FFmpegException(f"重新封装失败，输出文件未生成或为空: {output_file}")
+
+            log.info(f"重新封装成功: {input_file.name} -> {output_file.name}")
+            if cleanup_original:
+                await self._cleanup_temp_files([input_file])
+            return output_file
+
+        except FFmpegException:
+            raise
+        except Exception as e:
+            raise FFmpegException(f"重新封装过程中发生错误: {e}") from e
+
     async def cleanup_temp_files(self, file_prefix: str, extensions: List[str] = None):
         """
         清理指定前缀的临时文件。
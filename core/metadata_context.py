@@ -0,0 +1,59 @@
+# core/metadata_context.py
+
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class MetadataContext:
+    """
+    单个下载项目的元数据上下文。
+
+    由第一次提取（--dump-json）得到的信息字典创建，随项目贯穿
+    元数据、信息文件和下载各阶段，避免每个阶段各自重新调用提取器。
+    写出的info.json可通过yt-dlp的 --load-info-json 直接复用。
+    """
+
+    url: str
+    info: Dict[str, Any] = field(default_factory=dict)
+    info_json_path: Optional[Path] = None
+
+    @property
+    def has_info(self) -> bool:
+        """是否持有完整的提取结果（而不只是URL占位）"""
+        return bool(self.info.get("id") or self.info.get("formats"))
+
+    @property
+    def formats(self) -> List[Dict[str, Any]]:
+        return self.info.get("formats") or []
+
+    def write_info_json(self, directory: Path, prefix: str) -> Optional[Path]:
+        """
+        把信息字典写为yt-dlp可加载的info.json（同步，异步代码中应通过 asyncio.to_thread 调用）。
+
+        Returns:
+            info.json路径；没有提取结果时返回None
+        """
+        if not self.has_info:
+            return None
+        if self.info_json_path and self.info_json_path.exists():
+            return self.info_json_path
+
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{prefix}.info.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.info, f, ensure_ascii=False)
+        self.info_json_path = path
+        log.debug(f"已写入元数据缓存: {path}")
+        return path
+
+    def cleanup(self) -> None:
+        """删除写出的info.json"""
+        if self.info_json_path:
+            self.info_json_path.unlink(missing_ok=True)
+            self.info_json_path = None
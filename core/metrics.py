@@ -0,0 +1,190 @@
+# core/metrics.py
+"""
+Prometheus指标
+覆盖整个下载流水线：信息提取、缓存命中、排队等待、下载吞吐、策略选择与降级、
+ffmpeg处理、流式传输、原生分片下载、子进程数量和进度写入频率。
+
+未安装 prometheus_client 时所有指标都是空操作。Celery prefork 等多进程部署需在
+启动前设置 PROMETHEUS_MULTIPROC_DIR，由 MultiProcessCollector 汇总各子进程的数据。
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+        start_http_server,
+    )
+
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _NoopMetric:
+    """未安装 prometheus_client 时的占位指标"""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+def _metric(kind: str, name: str, documentation: str, labelnames=(), **kwargs):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    metric_class = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}[kind]
+    return metric_class(name, documentation, labelnames, **kwargs)
+
+
+# 秒级耗时分桶：从亚秒级的缓存命中到十几分钟的大文件下载
+_DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 900)
+# 吞吐分桶（字节/秒）：100KB/s 到 100MB/s
+_THROUGHPUT_BUCKETS = tuple(100 * 1024 * 2**i for i in range(11))
+
+EXTRACTION_SECONDS = _metric(
+    "histogram", "smartdownloader_extraction_seconds", "视频信息提取耗时", ["domain"], buckets=_DURATION_BUCKETS
+)
+CACHE_REQUESTS = _metric("counter", "smartdownloader_cache_requests_total", "缓存查询次数", ["cache", "result"])
+QUEUE_WAIT_SECONDS = _metric(
+    "histogram", "smartdownloader_queue_wait_seconds", "任务从提交到开始执行的等待时间", buckets=_DURATION_BUCKETS
+)
+DOWNLOAD_BYTES = _metric("counter", "smartdownloader_download_bytes_total", "已完成下载的字节数", ["download_type"])
+DOWNLOAD_SECONDS = _metric(
+    "histogram", "smartdownloader_download_seconds", "下载任务耗时", ["download_type"], buckets=_DURATION_BUCKETS
+)
+DOWNLOAD_THROUGHPUT = _metric(
+    "histogram",
+    "smartdownloader_download_throughput_bytes_per_second",
+    "下载任务的平均吞吐",
+    ["download_type"],
+    buckets=_THROUGHPUT_BUCKETS,
+)
+DOWNLOAD_STRATEGY = _metric("counter", "smartdownloader_download_strategy_total", "智能下载选择的策略", ["strategy"])
+DOWNLOAD_FALLBACKS = _metric("counter", "smartdownloader_download_fallback_total", "下载策略降级次数", ["stage"])
+FFMPEG_SECONDS = _metric(
+    "histogram", "smartdownloader_ffmpeg_seconds", "ffmpeg合并/转换耗时", ["operation"], buckets=_DURATION_BUCKETS
+)
+STREAM_BYTES = _metric("counter", "smartdownloader_stream_bytes_total", "流式下载接口发送给客户端的字节数")
+ACTIVE_SUBPROCESSES = _metric(
+    "gauge", "smartdownloader_active_subprocesses", "运行中的yt-dlp/ffmpeg子进程数", multiprocess_mode="livesum"
+)
+FRAGMENT_CONNECTIONS = _metric(
+    "gauge", "smartdownloader_fragment_connections", "下载占用的分片连接数", multiprocess_mode="livesum"
+)
+# 单个分片耗时分桶：几十毫秒到半分钟
+_SEGMENT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+SEGMENT_SECONDS = _metric(
+    "histogram",
+    "smartdownloader_segment_seconds",
+    "原生分片下载中单个分片的耗时",
+    ["protocol"],
+    buckets=_SEGMENT_BUCKETS,
+)
+SEGMENT_BYTES = _metric("counter", "smartdownloader_segment_bytes_total", "原生分片下载的字节数", ["protocol"])
+SEGMENT_REQUESTS = _metric(
+    "counter",
+    "smartdownloader_segment_requests_total",
+    "原生分片下载的请求数",
+    ["protocol", "http_version", "result"],
+)
+DOWNLOAD_STALLS = _metric("counter", "smartdownloader_download_stalls_total", "检测到的下载停滞次数", ["reason"])
+RETRY_ATTEMPTS = _metric(
+    "counter", "smartdownloader_retry_attempts_total", "按重试层和错误类型统计的重试次数", ["layer", "error_type"]
+)
+RETRY_BUDGET_EXHAUSTED = _metric(
+    "counter", "smartdownloader_retry_budget_exhausted_total", "任务重试预算用尽的次数", ["reason"]
+)
+DOWNLOAD_RESTARTS = _metric("counter", "smartdownloader_download_restarts_total", "停滞后以断点续传方式重启下载的次数")
+CIRCUIT_REJECTIONS = _metric(
+    "counter", "smartdownloader_circuit_rejections_total", "因站点熔断而被快速拒绝的请求数", ["domain", "entrypoint"]
+)
+PROGRESS_UPDATES = _metric("counter", "smartdownloader_progress_updates_total", "进度状态写入次数", ["sink"])
+
+
+def url_domain(url: str) -> str:
+    """指标用的域名标签（去掉www前缀）；无法解析时为unknown"""
+    domain = urlparse(url).netloc.lower()
+    return domain[4:] if domain.startswith("www.") else domain or "unknown"
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """记录一次缓存查询，命中率 = hit / (hit + miss)"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+@contextmanager
+def timed(histogram, *labels):
+    """把代码块的耗时记录到直方图"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric = histogram.labels(*labels) if labels else histogram
+        metric.observe(time.perf_counter() - start)
+
+
+def _collection_registry():
+    """多进程模式下汇总各进程写出的数据，否则使用默认注册表"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """生成Prometheus文本格式的指标数据和对应的Content-Type"""
+    if not PROMETHEUS_AVAILABLE:
+        return b"# prometheus_client not installed\n", CONTENT_TYPE_LATEST
+    return generate_latest(_collection_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int, addr: str = "0.0.0.0") -> Optional[int]:
+    """
+    启动独立的指标HTTP服务（供Celery worker使用）。
+
+    Returns:
+        实际监听的端口；未安装 prometheus_client 或端口被占用时返回None
+    """
+    if not PROMETHEUS_AVAILABLE:
+        log.warning("未安装 prometheus_client，跳过worker指标导出")
+        return None
+    try:
+        start_http_server(port, addr=addr, registry=_collection_registry())
+    except OSError as e:
+        log.warning(f"worker指标服务启动失败（端口 {port}）: {e}")
+        return None
+    log.info(f"worker指标已在 :{port}/metrics 导出")
+    return port
+
+
+def mark_process_dead(pid: int) -> None:
+    """多进程模式下清理已退出子进程的实时指标（如子进程数）"""
+    if PROMETHEUS_AVAILABLE and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
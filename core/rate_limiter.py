@@ -0,0 +1,34 @@
+# core/rate_limiter.py
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    异步令牌桶限速器。
+
+    以rate个/秒的速度补充令牌，最多积攒capacity个，允许短时突发。
+    rate<=0 表示不限速。
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 1) -> None:
+        """获取令牌，不足时等待补充。"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
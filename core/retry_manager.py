@@ -1,12 +1,211 @@
+"""
+重试管理
+一个下载任务的失败可能在多层被重试：yt-dlp自身、子进程执行、带认证刷新的命令执行、
+下载策略降级和Celery任务重试。各层共享同一个任务级的重试预算（次数和总耗时），
+按错误类型决定是否重试以及退避时间，预算用尽后所有层都不再重试。
+"""
+
 import asyncio
 import functools
 import logging
-from typing import Any, Callable, Optional, Tuple, Type
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from config_manager import config
 
+from .error_handler import ErrorHandler
 from .exceptions import UnhandledException
+from .metrics import RETRY_ATTEMPTS, RETRY_BUDGET_EXHAUSTED
 
 log = logging.getLogger(__name__)
 
+_current_budget: ContextVar[Optional["RetryBudget"]] = ContextVar("retry_budget", default=None)
+
+# 不重试的错误类型：认证错误由刷新cookies的一层处理，其他错误重试也不会成功
+_NOT_RETRYABLE = ("auth", "other")
+
+
+class RetryBudget:
+    """
+    一个下载任务的重试预算，在所有重试层之间共享。
+
+    网络错误按 base_delay * backoff_factor^n 指数退避（不超过 max_delay）；
+    代理错误按 proxy_retry_base_delay + proxy_retry_increment * n 线性退避（不超过 proxy_retry_max_delay）。
+    退避时间加入随机抖动，避免同一站点的多个任务同时重试。
+    """
+
+    def __init__(
+        self,
+        max_attempts: int,
+        max_seconds: Optional[float] = None,
+        base_delay: float = 10.0,
+        backoff_factor: float = 2.0,
+        max_delay: float = 300.0,
+        proxy_base_delay: float = 30.0,
+        proxy_increment: float = 10.0,
+        proxy_max_delay: float = 120.0,
+        started_at: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            max_attempts: 整个任务最多重试多少次
+            max_seconds: 整个任务的重试总耗时上限（秒，从任务开始计），None表示不限
+            started_at: 任务开始时间；任务在Celery重试后继续使用之前的预算时传入
+            clock: 时钟，测试时可替换
+        """
+        self.max_attempts = max_attempts
+        self.max_seconds = max_seconds
+        self.base_delay = base_delay
+        self.backoff_factor = backoff_factor
+        self.max_delay = max_delay
+        self.proxy_base_delay = proxy_base_delay
+        self.proxy_increment = proxy_increment
+        self.proxy_max_delay = proxy_max_delay
+        self._clock = clock
+        self.started_at = clock() if started_at is None else started_at
+
+        self.retries: List[Dict[str, Any]] = []
+        self.fallbacks: List[str] = []
+        self.exhausted: Optional[str] = None
+        self.error_handler = ErrorHandler()
+
+    @classmethod
+    def from_config(cls, state: Optional[Dict[str, Any]] = None) -> "RetryBudget":
+        """
+        按配置创建任务级预算。
+
+        Args:
+            state: 之前 report() 的结果，Celery重试任务时用来延续已花费的预算
+        """
+        settings = config.downloader
+        budget = cls(
+            settings.max_retries,
+            settings.retry_budget_seconds or None,
+            settings.base_delay,
+            settings.backoff_factor,
+            settings.max_delay,
+            settings.proxy_retry_base_delay,
+            settings.proxy_retry_increment,
+            settings.proxy_retry_max_delay,
+            started_at=state.get("started_at") if state else None,
+        )
+        if state:
+            budget.retries = list(state.get("retries", []))
+            budget.fallbacks = list(state.get("fallbacks", []))
+        return budget
+
+    @property
+    def elapsed(self) -> float:
+        return self._clock() - self.started_at
+
+    def _delay_for(self, error_type: str, attempt: int) -> float:
+        """第 attempt 次（从1开始）同类重试前的退避时间，加入50%的随机抖动"""
+        if error_type == "proxy":
+            delay = min(self.proxy_base_delay + self.proxy_increment * (attempt - 1), self.proxy_max_delay)
+        else:
+            delay = min(self.base_delay * self.backoff_factor ** (attempt - 1), self.max_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _exhaust(self, reason: str) -> None:
+        if self.exhausted is None:
+            self.exhausted = reason
+            RETRY_BUDGET_EXHAUSTED.labels(reason).inc()
+            log.warning(f"重试预算已用尽 ({reason}): 已重试 {len(self.retries)} 次，耗时 {self.elapsed:.0f}s")
+
+    def acquire(self, layer: str, error: BaseException) -> Optional[float]:
+        """
+        某一层的操作失败后申请一次重试。
+
+        Args:
+            layer: 发起重试的层，用于统计预算的花费
+            error: 导致失败的异常
+
+        Returns:
+            允许重试时返回重试前应等待的秒数；错误不可重试或预算已用尽时返回None
+        """
+        error_type = self.error_handler.classify_exception(error)
+        if error_type in _NOT_RETRYABLE:
+            log.debug(f"{layer}: {error_type} 类错误不重试")
+            return None
+        if self.exhausted:
+            return None
+        if len(self.retries) >= self.max_attempts:
+            self._exhaust("attempts")
+            return None
+
+        attempt = sum(1 for r in self.retries if r["error_type"] == error_type) + 1
+        delay = self._delay_for(error_type, attempt)
+        if self.max_seconds is not None and self.elapsed + delay > self.max_seconds:
+            self._exhaust("time")
+            return None
+
+        self.retries.append(
+            {"layer": layer, "error_type": error_type, "delay": round(delay, 2), "error": str(error)[:200]}
+        )
+        RETRY_ATTEMPTS.labels(layer, error_type).inc()
+        return delay
+
+    def allow_fallback(self, stage: str) -> bool:
+        """切换到备用下载策略前检查预算；预算用尽时不再降级，直接失败"""
+        if self.exhausted or (self.max_seconds is not None and self.elapsed >= self.max_seconds):
+            self._exhaust(self.exhausted or "time")
+            log.warning(f"重试预算已用尽，跳过备用策略: {stage}")
+            return False
+        self.fallbacks.append(stage)
+        return True
+
+    def report(self) -> Dict[str, Any]:
+        """预算花费情况，附到任务结果中，也用于Celery重试时延续预算"""
+        return {
+            "started_at": self.started_at,
+            "elapsed_s": round(self.elapsed, 1),
+            "max_attempts": self.max_attempts,
+            "max_seconds": self.max_seconds,
+            "retries": self.retries,
+            "fallbacks": self.fallbacks,
+            "exhausted": self.exhausted,
+        }
+
+
+def current_budget() -> Optional[RetryBudget]:
+    return _current_budget.get()
+
+
+@contextmanager
+def retry_budget(budget: Optional[RetryBudget] = None):
+    """
+    在任务级重试预算中执行。已有预算时（如Celery任务中调用下载器）沿用外层预算。
+
+    Yields:
+        当前的RetryBudget
+    """
+    current = _current_budget.get()
+    if current is not None:
+        yield current
+        return
+    budget = budget or RetryBudget.from_config()
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def with_retry_budget(func: Callable) -> Callable:
+    """下载入口方法的装饰器：整个调用共享一个重试预算，预算保存到实例的 last_retry_budget 属性"""
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        with retry_budget() as budget:
+            self.last_retry_budget = budget
+            return await func(self, *args, **kwargs)
+
+    return wrapper
+
 
 def with_retries(
     max_retries: int = 3,
@@ -50,7 +249,8 @@ def with_retries(
 
 class RetryManager:
     """
-    管理具有指数退避策略的重试逻辑。
+    管理单层的重试逻辑。是否重试以及退避时间由当前任务的重试预算决定，
+    max_retries 只限制本层自身的尝试次数。
     """
 
     def __init__(
@@ -92,6 +292,12 @@ class RetryManager:
         Raises:
             Exception: 如果所有重试都失败，则重新引发最后的异常。
         """
+        # 不在任务级预算中时（单独使用时），按本层的次数和退避参数使用独立预算
+        budget = current_budget() or RetryBudget(
+            self.max_retries - 1, base_delay=self.initial_delay, backoff_factor=self.backoff
+        )
+        layer = getattr(operation, "__qualname__", "operation")
+
         while self.attempts < self.max_retries:
             self.attempts += 1
             try:
@@ -100,11 +306,9 @@ class RetryManager:
                     log.info(f"操作在第 {self.attempts} 次尝试时成功。")
                 return result
             except self.retry_on as e:
-                if self.attempts >= self.max_retries:
-                    log.error(
-                        f"操作失败，已达到最大重试次数 ({self.max_retries})。最后一次错误: {e}",
-                        exc_info=True,
-                    )
+                self.delay = budget.acquire(layer, e) if self.attempts < self.max_retries else None
+                if self.delay is None:
+                    log.error(f"操作失败，不再重试 (尝试 {self.attempts}/{self.max_retries})。最后一次错误: {e}")
                     raise e
 
                 log.warning(
@@ -113,9 +317,6 @@ class RetryManager:
 
                 # 在重试前执行异步延迟
                 await asyncio.sleep(self.delay)
-
-                # 更新下一次重试的延迟
-                self.delay *= self.backoff
             except Exception as e:
                 # 捕获不应重试的异常
                 log.warning(f"捕获到未处理的异常，将立即失败: {e}", exc_info=False)
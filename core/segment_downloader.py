@@ -0,0 +1,350 @@
+# core/segment_downloader.py
+"""
+原生分片下载
+对yt-dlp已解析出的HLS/DASH格式，在进程内用asyncio直接下载分片，代替yt-dlp内部的分片循环：
+- 同一个下载器的所有请求共用一个连接池，按源站复用keep-alive连接（安装h2时使用HTTP/2多路复用）；
+- 按滑动窗口预先发出后续分片的请求，分片按顺序直接写入输出文件，不落盘临时分片；
+- 每个分片的耗时、字节数和请求结果记录为Prometheus指标；
+- 已写入的分片数记录在临时文件旁，重试时从断点继续。
+
+只处理不加密、已结束（VOD）的HLS媒体播放列表和带分片列表的DASH格式，其余情况抛出
+UnsupportedSegmentsException，由调用方回退到yt-dlp。未安装httpx时不可用。
+"""
+
+import asyncio
+import importlib.util
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass
+from http.cookiejar import MozillaCookieJar
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from rich.progress import Progress, TaskID
+
+from .exceptions import NetworkException, NonRecoverableErrorException, UnsupportedSegmentsException
+from .metrics import SEGMENT_BYTES, SEGMENT_REQUESTS, SEGMENT_SECONDS
+
+log = logging.getLogger(__name__)
+
+try:
+    import httpx
+
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+HTTP2_AVAILABLE = HTTPX_AVAILABLE and importlib.util.find_spec("h2") is not None
+
+_HLS_ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+@dataclass
+class Segment:
+    """一个分片；byte_range 为 [start, end) 字节区间，None表示整个资源"""
+
+    url: str
+    byte_range: Optional[Tuple[int, int]] = None
+
+    def headers(self) -> Dict[str, str]:
+        if not self.byte_range:
+            return {}
+        start, end = self.byte_range
+        return {"Range": f"bytes={start}-{end - 1}"}
+
+
+@dataclass
+class SegmentPlan:
+    """一个格式的全部分片"""
+
+    protocol: str  # "hls" | "dash"
+    segments: List[Segment]
+    # HLS没有初始化分片时输出为MPEG-TS，需要再封装为目标容器
+    container: str = "fmp4"
+
+
+def _hls_attributes(value: str) -> Dict[str, str]:
+    return {key: val.strip('"') for key, val in _HLS_ATTRIBUTE.findall(value)}
+
+
+def _hls_byte_range(value: str, previous_end: int) -> Tuple[int, int]:
+    """解析 "长度[@偏移]"；省略偏移时紧接上一个区间"""
+    length, _, offset = value.partition("@")
+    start = int(offset) if offset else previous_end
+    return start, start + int(length)
+
+
+def parse_hls_playlist(text: str, playlist_url: str) -> SegmentPlan:
+    """
+    解析HLS媒体播放列表。
+
+    Raises:
+        UnsupportedSegmentsException: 主播放列表、加密、直播或包含多个初始化分片
+    """
+    if not text.lstrip().startswith("#EXTM3U"):
+        raise UnsupportedSegmentsException("不是有效的HLS播放列表")
+
+    segments: List[Segment] = []
+    init_segment: Optional[Segment] = None
+    byte_range: Optional[str] = None
+    range_end = 0
+    ended = False
+
+    for line in (line.strip() for line in text.splitlines()):
+        if not line:
+            continue
+        if line.startswith("#EXT-X-STREAM-INF"):
+            raise UnsupportedSegmentsException("主播放列表需要由yt-dlp选择码率")
+        if line.startswith("#EXT-X-KEY:"):
+            if _hls_attributes(line[len("#EXT-X-KEY:") :]).get("METHOD", "NONE") != "NONE":
+                raise UnsupportedSegmentsException("加密的HLS分片由yt-dlp解密")
+        elif line.startswith("#EXT-X-MAP:"):
+            attributes = _hls_attributes(line[len("#EXT-X-MAP:") :])
+            segment = Segment(urljoin(playlist_url, attributes["URI"]))
+            if "BYTERANGE" in attributes:
+                segment.byte_range = _hls_byte_range(attributes["BYTERANGE"], 0)
+            if init_segment and init_segment != segment:
+                raise UnsupportedSegmentsException("播放列表中途切换了初始化分片")
+            init_segment = segment
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            byte_range = line[len("#EXT-X-BYTERANGE:") :]
+        elif line.startswith("#EXT-X-ENDLIST"):
+            ended = True
+        elif not line.startswith("#"):
+            segment = Segment(urljoin(playlist_url, line))
+            if byte_range:
+                segment.byte_range = _hls_byte_range(byte_range, range_end)
+                range_end = segment.byte_range[1]
+                byte_range = None
+            segments.append(segment)
+
+    if not ended:
+        raise UnsupportedSegmentsException("直播流没有固定的分片列表")
+    if not segments:
+        raise UnsupportedSegmentsException("播放列表中没有分片")
+    if init_segment:
+        return SegmentPlan("hls", [init_segment] + segments, "fmp4")
+    return SegmentPlan("hls", segments, "mpegts")
+
+
+def dash_segments(fmt: Dict[str, Any]) -> SegmentPlan:
+    """yt-dlp解析出的DASH分片列表（第一个分片为初始化分片）"""
+    base_url = fmt.get("fragment_base_url") or fmt.get("url") or ""
+    segments = []
+    for fragment in fmt["fragments"]:
+        url = fragment.get("url") or urljoin(base_url, fragment["path"])
+        byte_range = fragment.get("byte_range")
+        segments.append(Segment(url, (byte_range["start"], byte_range["end"]) if byte_range else None))
+    return SegmentPlan("dash", segments)
+
+
+class SegmentDownloader:
+    """基于httpx连接池的HLS/DASH分片下载器"""
+
+    def __init__(
+        self,
+        proxy: Optional[str] = None,
+        cookies_file: Optional[str] = None,
+        timeout: float = 30,
+        segment_retries: int = 3,
+        http2: Optional[bool] = None,
+    ):
+        """
+        Args:
+            proxy: 代理服务器地址(可选)
+            cookies_file: Netscape格式的cookies文件(可选)
+            timeout: 单个请求的超时时间（秒）
+            segment_retries: 单个分片的网络错误重试次数
+            http2: 是否使用HTTP/2，None表示安装了h2时使用
+        """
+        self.proxy = proxy
+        self.cookies_file = cookies_file
+        self.timeout = timeout
+        self.segment_retries = segment_retries
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @staticmethod
+    def supports(fmt: Optional[Dict[str, Any]]) -> bool:
+        """格式是否可能由原生分片下载处理（HLS还需要解析播放列表后才能确定）"""
+        if not HTTPX_AVAILABLE or not fmt:
+            return False
+        protocol = str(fmt.get("protocol") or "")
+        if protocol == "m3u8_native":
+            return bool(fmt.get("url"))
+        return protocol == "http_dash_segments" and bool(fmt.get("fragments"))
+
+    # --- 连接池 ---
+
+    def _load_cookies(self) -> Optional[MozillaCookieJar]:
+        if not self.cookies_file or not Path(self.cookies_file).exists():
+            return None
+        jar = MozillaCookieJar(self.cookies_file)
+        try:
+            jar.load(ignore_discard=True, ignore_expires=True)
+        except OSError as e:
+            log.warning(f"加载cookies文件失败，原生分片下载不带cookies: {e}")
+            return None
+        return jar
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        """连接池与事件循环绑定；换了事件循环（如每个Celery任务各自 asyncio.run）时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                proxy=self.proxy,
+                cookies=self._load_cookies(),
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=30),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        if self._client is not None and not self._client.is_closed:
+            try:
+                await self._client.aclose()
+            except RuntimeError:
+                pass  # 创建连接池的事件循环已关闭
+        self._client = None
+        self._client_loop = None
+
+    # --- 分片列表 ---
+
+    async def resolve(self, fmt: Dict[str, Any]) -> SegmentPlan:
+        """获取格式的分片列表"""
+        if fmt.get("protocol") == "http_dash_segments":
+            return dash_segments(fmt)
+        response = await self._get_client().get(fmt["url"], headers=fmt.get("http_headers") or {})
+        response.raise_for_status()
+        return parse_hls_playlist(response.text, str(response.url))
+
+    # --- 下载 ---
+
+    async def _fetch(self, segment: Segment, headers: Dict[str, str], protocol: str) -> bytes:
+        client = self._get_client()
+        for attempt in range(self.segment_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = await client.get(segment.url, headers={**headers, **segment.headers()})
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                SEGMENT_REQUESTS.labels(protocol, e.response.http_version, "error").inc()
+                if e.response.status_code in (401, 403, 404, 410):
+                    raise NonRecoverableErrorException(f"分片请求失败: HTTP {e.response.status_code}", segment.url)
+                error = e
+            except httpx.TransportError as e:
+                SEGMENT_REQUESTS.labels(protocol, "", "error").inc()
+                error = e
+            else:
+                SEGMENT_REQUESTS.labels(protocol, response.http_version, "ok").inc()
+                SEGMENT_SECONDS.labels(protocol).observe(time.perf_counter() - started)
+                SEGMENT_BYTES.labels(protocol).inc(len(response.content))
+                return response.content
+            if attempt < self.segment_retries:
+                log.debug(f"分片下载失败，第{attempt + 1}次重试: {segment.url}: {error}")
+                await asyncio.sleep(min(2**attempt, 10))
+        raise NetworkException(f"分片下载失败: {error}")
+
+    @staticmethod
+    def _part_files(output_file: Path) -> Tuple[Path, Path]:
+        """临时输出文件和断点状态文件；与yt-dlp的 .part 文件区分，回退到yt-dlp时不会被误当作断点"""
+        return (
+            output_file.with_name(output_file.name + ".native.part"),
+            output_file.with_name(output_file.name + ".native.json"),
+        )
+
+    @classmethod
+    def discard(cls, output_file: Path) -> None:
+        """删除未完成下载的临时文件"""
+        for path in cls._part_files(output_file):
+            path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _resume_point(part_file: Path, state_file: Path, total: int) -> Tuple[int, int]:
+        """上次写入完成的分片数和字节数；分片总数不一致时从头下载"""
+        try:
+            state = json.loads(state_file.read_text(encoding="utf-8"))
+            if state["total"] == total and part_file.stat().st_size >= state["bytes"]:
+                return state["done"], state["bytes"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return 0, 0
+
+    async def download(
+        self,
+        fmt: Dict[str, Any],
+        output_file: Path,
+        concurrency: int = 4,
+        progress: Optional[Progress] = None,
+        task_id: Optional[TaskID] = None,
+    ) -> Tuple[Path, SegmentPlan]:
+        """
+        下载格式的全部分片并按顺序写入输出文件。
+
+        Args:
+            fmt: yt-dlp格式信息
+            output_file: 输出文件路径
+            concurrency: 同时在途的分片请求数
+            progress: Rich进度条实例（可选）
+            task_id: 进度任务ID
+
+        Returns:
+            (输出文件, 分片列表)；分片列表的 container 为 "mpegts" 时输出需要再封装
+
+        Raises:
+            UnsupportedSegmentsException: 格式不适合原生下载
+            NonRecoverableErrorException: 分片返回401/403/404/410
+            NetworkException: 分片重试后仍然失败
+        """
+        plan = await self.resolve(fmt)
+        headers = fmt.get("http_headers") or {}
+        segments = plan.segments
+        part_file, state_file = self._part_files(output_file)
+        done, written = self._resume_point(part_file, state_file, len(segments))
+        if done:
+            log.info(f"原生分片下载从第{done + 1}/{len(segments)}个分片继续")
+
+        log.info(
+            f"原生分片下载: {len(segments)}个{plan.protocol.upper()}分片，并发{concurrency}"
+            f"{'，HTTP/2' if self.http2 else ''}"
+        )
+        pending: Dict[int, asyncio.Task] = {}
+        next_index = done
+        try:
+            with open(part_file, "r+b" if done else "wb") as f:
+                f.truncate(written)
+                f.seek(written)
+                while done < len(segments):
+                    # 窗口内的后续分片请求提前发出，当前分片写入时它们已在传输
+                    while next_index < len(segments) and len(pending) < max(1, concurrency):
+                        pending[next_index] = asyncio.create_task(
+                            self._fetch(segments[next_index], headers, plan.protocol)
+                        )
+                        next_index += 1
+                    data = await pending.pop(done)
+                    f.write(data)
+                    written += len(data)
+                    done += 1
+                    f.flush()
+                    state_file.write_text(
+                        json.dumps({"total": len(segments), "done": done, "bytes": written}), encoding="utf-8"
+                    )
+                    if progress is not None and task_id is not None:
+                        progress.update(task_id, completed=done * 100 / len(segments))
+        finally:
+            for task in pending.values():
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending.values(), return_exceptions=True)
+
+        part_file.replace(output_file)
+        state_file.unlink(missing_ok=True)
+        return output_file, plan
@@ -0,0 +1,136 @@
+# core/srt.py
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+# 一条字幕: 可选序号行 + 时间轴行 + 若干非空文本行，整段内容只需一次finditer
+CUE_PATTERN = re.compile(
+    r"^(?:(\d+)[ \t]*\n[ \t]*)?"
+    r"(\d+):(\d{2}):(\d{2})[,.](\d{3})[ \t]*-->[ \t]*(\d+):(\d{2}):(\d{2})[,.](\d{3})[^\n]*"
+    r"((?:\n[ \t]*\S[^\n]*)*)",
+    re.MULTILINE,
+)
+
+# 单条字幕的序列化模板，一次格式化完成序号、时间轴和文本
+_CUE_TEMPLATE = "%d\n%02d:%02d:%02d,%03d --> %02d:%02d:%02d,%03d\n%s\n\n"
+
+# 流式读取时每次读入的字符数
+_READ_CHUNK = 1 << 20
+# 序列化时每次写盘的字幕条数，避免逐条写入
+_WRITE_BATCH = 2000
+
+
+@dataclass(slots=True)
+class Cue:
+    """一条字幕"""
+
+    index: int
+    start_ms: int
+    end_ms: int
+    text: str
+
+
+def format_timestamp(ms: int) -> str:
+    """毫秒转换为SRT时间戳 (HH:MM:SS,mmm)。"""
+    return "%02d:%02d:%02d,%03d" % (ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000)
+
+
+def iter_cues(content: str, last_index: int = 0) -> Iterator[Cue]:
+    """
+    单遍解析SRT文本，逐条产出字幕。
+
+    兼容CRLF换行、缺失序号（按上一条序号+1补齐）和空文本的字幕条目。
+
+    Args:
+        content: SRT文本
+        last_index: 上一条字幕的序号，用于分块解析时延续自动编号
+    """
+    if "\r" in content:
+        content = content.replace("\r\n", "\n")
+    for match in CUE_PATTERN.finditer(content):
+        index, h1, m1, s1, ms1, h2, m2, s2, ms2, text = match.groups()
+        last_index = int(index) if index else last_index + 1
+        yield Cue(
+            last_index,
+            ((int(h1) * 60 + int(m1)) * 60 + int(s1)) * 1000 + int(ms1),
+            ((int(h2) * 60 + int(m2)) * 60 + int(s2)) * 1000 + int(ms2),
+            text.strip(),
+        )
+
+
+def parse_srt(content: str) -> List[Cue]:
+    """解析SRT文本内容。"""
+    return list(iter_cues(content))
+
+
+def iter_srt_file(path: Path) -> Iterator[Cue]:
+    """
+    流式读取SRT文件（同步）。
+
+    按块读入，在最后一个空行处切开，只解析完整的字幕条目，
+    内存占用与文件大小无关，可处理超大字幕。
+    """
+    last_index = 0
+    buffer = ""
+    # 文本模式的通用换行会把CRLF转换为LF，跨块的CRLF也不会被拆开
+    with open(path, "r", encoding="utf-8-sig") as f:
+        while chunk := f.read(_READ_CHUNK):
+            buffer += chunk
+            cut = buffer.rfind("\n\n")
+            if cut < 0:
+                continue
+            for cue in iter_cues(buffer[:cut], last_index):
+                last_index = cue.index
+                yield cue
+            buffer = buffer[cut + 2 :]
+    yield from iter_cues(buffer, last_index)
+
+
+def read_srt(path: Path) -> List[Cue]:
+    """读取整个SRT文件。"""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return parse_srt(f.read())
+
+
+def format_cue(cue: Cue, index: int) -> str:
+    """把一条字幕序列化为SRT文本块（含结尾空行）。"""
+    start, end = cue.start_ms, cue.end_ms
+    return _CUE_TEMPLATE % (
+        index,
+        start // 3600000,
+        start // 60000 % 60,
+        start // 1000 % 60,
+        start % 1000,
+        end // 3600000,
+        end // 60000 % 60,
+        end // 1000 % 60,
+        end % 1000,
+        cue.text,
+    )
+
+
+def serialize_cues(cues: Iterable[Cue], start_index: int = 1) -> str:
+    """把字幕序列化为SRT文本，序号从start_index开始连续编号。"""
+    return "".join(format_cue(cue, index) for index, cue in enumerate(cues, start_index))
+
+
+def write_srt(path: Path, cues: Iterable[Cue]) -> int:
+    """
+    缓冲写入SRT文件（同步，异步代码中应通过 asyncio.to_thread 调用）。
+
+    Returns:
+        int: 写入的字幕条数
+    """
+    count = 0
+    batch: List[str] = []
+    with open(path, "w", encoding="utf-8") as f:
+        for cue in cues:
+            count += 1
+            batch.append(format_cue(cue, count))
+            if len(batch) >= _WRITE_BATCH:
+                f.write("".join(batch))
+                batch.clear()
+        f.write("".join(batch))
+    return count
@@ -0,0 +1,128 @@
+# core/stall_detector.py
+"""
+基于吞吐的下载停滞检测
+按进度输出中的已下载字节数，在滑动时间窗口内计算平均吞吐；连续多次检查都低于下限时判定为停滞。
+只靠"是否有输出"判断会漏掉两类情况：以几KB/s缓慢传输的连接，以及不断打印分片重试信息却没有进展的下载。
+检测从第一条进度开始，之前的信息提取阶段不算停滞。
+"""
+
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from config_manager import config
+
+
+class StallDetector:
+    """滑动窗口吞吐检测器，一个实例只用于一个子进程"""
+
+    def __init__(
+        self,
+        window_seconds: float,
+        check_interval: float,
+        threshold_count: int,
+        min_bytes_per_second: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            window_seconds: 计算平均吞吐的时间窗口（秒）
+            check_interval: 两次检查之间的间隔（秒）
+            threshold_count: 连续多少次检查低于下限判定为停滞
+            min_bytes_per_second: 吞吐下限（字节/秒）
+            clock: 单调时钟，测试时可替换
+        """
+        self.window_seconds = window_seconds
+        self.check_interval = check_interval
+        self.threshold_count = threshold_count
+        self.min_bytes_per_second = min_bytes_per_second
+        self._clock = clock
+
+        self.total_bytes = 0
+        self.low_checks = 0
+        self._last_bytes: Dict[str, int] = {}
+        self._samples: Deque[Tuple[float, int]] = deque()
+        # 第一条进度到来之前yt-dlp还在提取信息（签名解析、Cookie认证等），不计入吞吐；
+        # 始终没有输出的进程由 network_timeout 的无输出检测处理
+        self.active = False
+        self._started = 0.0
+        self._next_check = clock() + check_interval
+
+    @classmethod
+    def from_config(cls) -> Optional["StallDetector"]:
+        """按配置创建；stall_threshold_count 为0时关闭吞吐检测"""
+        settings = config.downloader
+        if settings.stall_threshold_count <= 0:
+            return None
+        return cls(
+            settings.stall_detection_time,
+            settings.stall_check_interval,
+            settings.stall_threshold_count,
+            settings.stall_min_speed,
+        )
+
+    def _activate(self, now: float) -> None:
+        self.active = True
+        self.low_checks = 0
+        self._started = now
+        self._next_check = now + self.check_interval
+        self._samples.clear()
+        self._samples.append((now, self.total_bytes))
+
+    def record(self, stream: str, downloaded_bytes: int, total_bytes: Optional[int] = None) -> None:
+        """
+        记录一条进度。
+
+        Args:
+            stream: 流标识（文件名），音视频分别下载时各自累计
+            downloaded_bytes: 该流当前已下载的字节数
+            total_bytes: 该流的总字节数（已知时）；下载完成后暂停检测，避免把合并等后处理误判为停滞
+        """
+        now = self._clock()
+        previous = self._last_bytes.get(stream)
+        # 续传时第一条进度从断点开始，只作为基线，不计入吞吐
+        if previous is not None:
+            self.total_bytes += downloaded_bytes - previous if downloaded_bytes >= previous else downloaded_bytes
+        self._last_bytes[stream] = downloaded_bytes
+
+        if not self.active:
+            self._activate(now)
+        self._samples.append((now, self.total_bytes))
+
+        if total_bytes and downloaded_bytes >= total_bytes:
+            self.pause()
+
+    def pause(self) -> None:
+        """当前流已下载完成，在下一条进度到来前不做检测"""
+        self.active = False
+        self.low_checks = 0
+
+    def throughput(self, now: Optional[float] = None) -> float:
+        """最近一个窗口内的平均吞吐（字节/秒）"""
+        now = self._clock() if now is None else now
+        cutoff = now - self.window_seconds
+        # 保留窗口起点之前的最后一个样本作为基线
+        while len(self._samples) > 1 and self._samples[1][0] <= cutoff:
+            self._samples.popleft()
+        start, start_bytes = self._samples[0]
+        elapsed = now - start
+        return (self.total_bytes - start_bytes) / elapsed if elapsed > 0 else 0.0
+
+    def check(self) -> Optional[float]:
+        """
+        到检查时间时计算一次吞吐。
+
+        Returns:
+            判定为停滞时返回窗口内的平均吞吐，否则为None
+        """
+        now = self._clock()
+        if now < self._next_check:
+            return None
+        self._next_check = now + self.check_interval
+        # 刚开始（或刚恢复）不足一个窗口时不判定
+        if not self.active or now - self._started < self.window_seconds:
+            return None
+
+        rate = self.throughput(now)
+        self.low_checks = self.low_checks + 1 if rate < self.min_bytes_per_second else 0
+        return rate if self.low_checks >= self.threshold_count else None
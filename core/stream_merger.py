@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+流式合并模块
+两个yt-dlp进程把视频流和音频流写入管道，由同一个ffmpeg进程边下载边复用为分片MP4。
+相比"先分别落盘再合并"，输出文件只写一次，合并阶段与下载阶段重叠。
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import ExitStack
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from rich.progress import Progress, TaskID
+
+from .command_builder import CommandBuilder
+from .exceptions import DownloaderException, DownloadStalledException, FFmpegException
+from .subprocess_manager import SubprocessManager
+from .subprocess_progress_handler import SubprocessProgressHandler
+from .tracing import ProcessSpans, span
+
+log = logging.getLogger(__name__)
+
+
+class StreamMerger:
+    """
+    管道化的音视频合并器。
+
+    进程拓扑: yt-dlp(video) ─┐
+                             ├─> ffmpeg(pipe:N, pipe:M) ─> output.mp4
+              yt-dlp(audio) ─┘
+    """
+
+    def __init__(
+        self,
+        command_builder: Optional[CommandBuilder] = None,
+        subprocess_manager: Optional[SubprocessManager] = None,
+    ):
+        """
+        初始化流式合并器。
+
+        Args:
+            command_builder: 命令构建器实例，None则创建默认实例
+            subprocess_manager: 子进程管理器实例，用于登记进程以便统一清理
+        """
+        self.command_builder = command_builder or CommandBuilder()
+        self.subprocess_manager = subprocess_manager or SubprocessManager()
+
+    async def merge(
+        self,
+        url: str,
+        video_format: str,
+        audio_format: str,
+        output_file: Path,
+        progress: Optional[Progress] = None,
+        video_task_id: Optional[TaskID] = None,
+        audio_task_id: Optional[TaskID] = None,
+        info_json_path: Optional[Path] = None,
+    ) -> Path:
+        """
+        边下载边合并视频流和音频流。
+
+        Args:
+            url: 视频URL
+            video_format: 视频流格式选择器
+            audio_format: 音频流格式选择器
+            output_file: 输出MP4路径
+            progress: Rich进度条实例（可选）
+            video_task_id: 视频流的进度任务ID
+            audio_task_id: 音频流的进度任务ID
+            info_json_path: 已提取的info.json（可选，两个流都不再重新提取）
+
+        Returns:
+            Path: 合并后的输出文件
+
+        Raises:
+            DownloaderException: 任一yt-dlp进程失败
+            DownloadStalledException: 任一下载流停滞
+            FFmpegException: ffmpeg复用失败或输出无效
+        """
+        processes: List[asyncio.subprocess.Process] = []
+        # 两个yt-dlp进程各占一份全局连接预算的租约，直到合并结束
+        leases = ExitStack()
+        video_r, video_w = os.pipe()
+        audio_r, audio_w = os.pipe()
+        try:
+            try:
+                # 读端只交给ffmpeg，写端分别作为两个yt-dlp的stdout
+                ffmpeg_cmd = self.command_builder.build_ffmpeg_pipe_merge_cmd(video_r, audio_r, str(output_file))
+                ffmpeg, _ = await self._spawn(
+                    ffmpeg_cmd,
+                    processes,
+                    expect_output=False,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    pass_fds=(video_r, audio_r),
+                )
+
+                video_cmd = self._lease(
+                    leases, self.command_builder.build_stream_to_stdout_cmd(url, video_format, info_json_path)
+                )
+                video_proc, video_spans = await self._spawn(video_cmd, processes, stdout=video_w)
+
+                audio_cmd = self._lease(
+                    leases, self.command_builder.build_stream_to_stdout_cmd(url, audio_format, info_json_path)
+                )
+                audio_proc, audio_spans = await self._spawn(audio_cmd, processes, stdout=audio_w)
+            finally:
+                # 父进程必须关闭自己持有的管道端，否则ffmpeg永远等不到EOF
+                for fd in (video_r, video_w, audio_r, audio_w):
+                    os.close(fd)
+
+            log.info(f"流式合并开始: video={video_format}, audio={audio_format} -> {output_file.name}")
+            tasks = [
+                asyncio.create_task(self._pump_stream("视频", video_proc, progress, video_task_id, video_spans)),
+                asyncio.create_task(self._pump_stream("音频", audio_proc, progress, audio_task_id, audio_spans)),
+                asyncio.create_task(ffmpeg.stderr.read()),
+            ]
+            try:
+                _, _, ffmpeg_stderr = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            # 两个流都已读完，剩下的是ffmpeg写完尾部数据的收尾时间
+            with span("postprocess", operation="streaming_merge"):
+                await ffmpeg.wait()
+
+            if ffmpeg.returncode != 0:
+                raise FFmpegException(f"流式合并失败: {ffmpeg_stderr.decode('utf-8', errors='ignore').strip()}")
+            if not output_file.exists() or output_file.stat().st_size == 0:
+                raise FFmpegException(f"流式合并后输出文件未生成或为空: {output_file}")
+
+            log.info(f"流式合并成功: {output_file.name} ({output_file.stat().st_size / (1024 * 1024):.1f} MB)")
+            return output_file
+        finally:
+            # 任一环节失败时连带终止其余进程（已结束的进程会被直接跳过）
+            await asyncio.gather(
+                *(self.subprocess_manager._cleanup_process(p) for p in processes), return_exceptions=True
+            )
+            leases.close()
+
+    def _lease(self, leases: ExitStack, cmd: List[str]) -> List[str]:
+        """在全局连接预算内取得租约，返回按分到的连接数调整后的命令"""
+        leased_cmd, _ = leases.enter_context(self.command_builder.transfer_tuner.lease(cmd))
+        return leased_cmd
+
+    async def _spawn(
+        self, cmd: List[str], processes: list, expect_output: bool = True, **kwargs
+    ) -> Tuple[asyncio.subprocess.Process, ProcessSpans]:
+        """启动子进程并登记到子进程管理器，同时返回该进程的阶段计时。"""
+        log.debug(f"启动流式合并子进程: {' '.join(cmd)}")
+        process_spans = ProcessSpans(cmd)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE, **kwargs
+            )
+        except OSError as e:
+            process_spans.finished(e)
+            raise DownloaderException(f"进程创建失败: {e}") from e
+        process_spans.spawned(process.pid, expect_output)
+        processes.append(process)
+        self.subprocess_manager.register(process)
+        return process, process_spans
+
+    async def _pump_stream(
+        self,
+        label: str,
+        process: asyncio.subprocess.Process,
+        progress: Optional[Progress],
+        task_id: Optional[TaskID],
+        process_spans: Optional[ProcessSpans] = None,
+    ) -> None:
+        """读取yt-dlp的stderr，更新进度，并在进程失败时抛出异常。"""
+        handler = SubprocessProgressHandler()
+        process_spans = process_spans or ProcessSpans([])
+        error_output = ""
+        try:
+            while True:
+                try:
+                    line_bytes = await asyncio.wait_for(process.stderr.readline(), handler.network_timeout)
+                except asyncio.TimeoutError:
+                    raise DownloadStalledException(f"{label}流下载超时 ({handler.network_timeout}s 无进度更新)")
+                if not line_bytes:
+                    break
+
+                line = line_bytes.decode("utf-8", errors="ignore")
+                if "error" in line.lower():
+                    error_output += line
+                if progress is not None and task_id is not None:
+                    if handler._process_line(line, progress, task_id):
+                        process_spans.first_output()
+
+            await process.wait()
+        finally:
+            process_spans.finished()
+        if process.returncode != 0:
+            raise DownloaderException(f"{label}流下载失败 (code {process.returncode}): {error_output.strip()}")
+        if progress is not None and task_id is not None:
+            handler._finalize_progress(process, progress, task_id)
@@ -5,6 +5,7 @@
 """
 
 import asyncio
+import copy
 import logging
 import os
 from typing import List, Optional, Tuple
@@ -12,10 +13,13 @@ from typing import List, Optional, Tuple
 from rich.console import Console
 from rich.progress import Progress, TaskID
 
+from .command_builder import CommandBuilder
 from .error_handler import ErrorHandler
 from .exceptions import DownloaderException, DownloadStalledException, NetworkException
+from .metrics import ACTIVE_SUBPROCESSES, DOWNLOAD_RESTARTS
 from .retry_manager import RetryManager, with_retries
 from .subprocess_progress_handler import SubprocessProgressHandler
+from .tracing import ProcessSpans, redact_command, span
 
 log = logging.getLogger(__name__)
 console = Console()
@@ -73,9 +77,22 @@ class SubprocessManager:
             MaxRetriesExceededException: 重试次数超限
         """
 
+        resume = False
+
         @with_retries()
         async def _execute():
-            return await self._run_subprocess_with_progress(cmd, progress, task_id, timeout)
+            nonlocal resume
+            run_cmd = cmd
+            if resume:
+                # 停滞的下载被终止后，从已下载的部分继续，而不是从头开始
+                run_cmd = CommandBuilder.build_resume_cmd(cmd)
+                DOWNLOAD_RESTARTS.inc()
+                log.info("下载停滞后重启，从断点续传")
+            try:
+                return await self._run_subprocess_with_progress(run_cmd, progress, task_id, timeout)
+            except DownloadStalledException:
+                resume = True
+                raise
 
         return await _execute()
 
@@ -103,7 +120,8 @@ class SubprocessManager:
 
         @with_retries()
         async def _execute():
-            return await self._run_subprocess_simple(cmd, timeout, check_returncode)
+            with span("subprocess", command=redact_command(cmd)):
+                return await self._run_subprocess_simple(cmd, timeout, check_returncode)
 
         return await _execute()
 
@@ -131,6 +149,7 @@ class SubprocessManager:
             DownloadStalledException: 下载停滞
         """
         process = None
+        process_spans = ProcessSpans(cmd)
         try:
             log.debug(f"执行带进度的命令: {' '.join(cmd)}")
 
@@ -152,12 +171,16 @@ class SubprocessManager:
                 stderr=asyncio.subprocess.PIPE,
                 env=env,
             )
+            process_spans.spawned(process.pid)
 
             # 添加到运行进程列表
-            self._running_processes.append(process)
+            self.register(process)
 
-            # 使用进度处理器监控进程
-            error_output = await self.progress_handler.handle_subprocess_with_progress(process, progress, task_id)
+            # 使用进度处理器监控进程；并发执行时每个进程使用独立的进度状态
+            progress_handler = copy.copy(self.progress_handler)
+            error_output = await progress_handler.handle_subprocess_with_progress(
+                process, progress, task_id, on_first_progress=process_spans.first_output
+            )
 
             # 获取返回码和输出
             return_code = process.returncode
@@ -191,6 +214,7 @@ class SubprocessManager:
         except OSError as e:
             raise DownloaderException(f"进程创建失败: {e}") from e
         finally:
+            process_spans.finished()
             # 确保进程被正确清理
             if process:
                 await self._cleanup_process(process)
@@ -238,7 +262,7 @@ class SubprocessManager:
             )
 
             # 添加到运行进程列表
-            self._running_processes.append(process)
+            self.register(process)
 
             # 等待进程完成
             try:
@@ -271,6 +295,16 @@ class SubprocessManager:
             if process:
                 await self._cleanup_process(process)
 
+    def register(self, process: asyncio.subprocess.Process) -> None:
+        """
+        登记由调用方自行启动的进程，统一计入子进程数指标，并由 _cleanup_process 清理。
+
+        Args:
+            process: 已启动的进程
+        """
+        self._running_processes.append(process)
+        ACTIVE_SUBPROCESSES.inc()
+
     async def _cleanup_process(self, process: asyncio.subprocess.Process):
         """
         清理单个进程。
@@ -282,6 +316,7 @@ class SubprocessManager:
             # 从运行进程列表中移除
             if process in self._running_processes:
                 self._running_processes.remove(process)
+                ACTIVE_SUBPROCESSES.dec()
 
             # 如果进程仍在运行，尝试优雅终止
             if process.returncode is None:
@@ -319,6 +354,7 @@ class SubprocessManager:
         if cleanup_tasks:
             await asyncio.gather(*cleanup_tasks, return_exceptions=True)
 
+        ACTIVE_SUBPROCESSES.dec(len(self._running_processes))
         self._running_processes.clear()
         log.info("所有进程清理完成")
 
@@ -4,12 +4,16 @@ import asyncio
 import json
 import logging
 import re
+import time
+from typing import Callable, Optional
 
 from rich.progress import Progress, TaskID
 
 from config_manager import config
 
 from .exceptions import DownloadStalledException
+from .metrics import DOWNLOAD_STALLS
+from .stall_detector import StallDetector
 
 log = logging.getLogger(__name__)
 
@@ -19,6 +23,8 @@ class SubprocessProgressHandler:
 
     def __init__(self):
         self.network_timeout = config.downloader.network_timeout
+        # 每个子进程在 handle_subprocess_with_progress 中创建独立的检测器
+        self.stall_detector: Optional[StallDetector] = None
         # 用于跟踪组合下载的进度
         self.combined_download_state = {
             "video_total": 0,
@@ -123,6 +129,11 @@ class SubprocessProgressHandler:
             downloaded_bytes = progress_data.get("downloaded_bytes")
             filename = progress_data.get("filename", "")
 
+            if self.stall_detector is not None and downloaded_bytes is not None:
+                self.stall_detector.record(
+                    filename, downloaded_bytes, total_bytes or progress_data.get("total_bytes_estimate")
+                )
+
             if percentage is not None and total_bytes is not None and downloaded_bytes is not None:
                 # 检测是否是组合下载（文件名包含不同格式）
                 self._detect_combined_download(filename, total_bytes, downloaded_bytes)
@@ -146,6 +157,8 @@ class SubprocessProgressHandler:
         elif progress_data.get("status") == "finished":
             filename = progress_data.get("filename", "")
             self._mark_file_finished(filename)
+            if self.stall_detector is not None:
+                self.stall_detector.pause()
 
             # 确保任务可见后再更新进度
             if not progress.tasks[task_id].visible:
@@ -343,6 +356,8 @@ class SubprocessProgressHandler:
 
             total_bytes = self._parse_size_to_bytes(total_size_str)
             completed_bytes = int(total_bytes * (percentage / 100.0))
+            if self.stall_detector is not None:
+                self.stall_detector.record("", completed_bytes, total_bytes)
 
             # 解析ETA为秒数
             eta_seconds = self._parse_eta_to_seconds(eta_str)
@@ -400,24 +415,41 @@ class SubprocessProgressHandler:
             return self._handle_text_progress_data(line, progress, task_id)
 
     async def _read_process_output(
-        self, process: asyncio.subprocess.Process, progress: Progress, task_id: TaskID
+        self,
+        process: asyncio.subprocess.Process,
+        progress: Progress,
+        task_id: TaskID,
+        on_first_progress: Optional[Callable[[], None]] = None,
     ) -> str:
         """
         读取并处理进程输出
 
+        Args:
+            on_first_progress: 解析到第一条进度数据时调用（用于首字节计时）
+
         Returns:
             str: 累积的错误输出
         """
         error_output = ""
+        detector = self.stall_detector
+        # 有吞吐检测时按检查间隔醒来，即使子进程一直没有输出也能按时检查
+        read_timeout = min(self.network_timeout, detector.check_interval) if detector else self.network_timeout
+        last_output = time.monotonic()
 
         while True:
             if process.stdout is None:
                 break
 
             try:
-                line_bytes = await asyncio.wait_for(process.stdout.readline(), self.network_timeout)
+                line_bytes = await asyncio.wait_for(process.stdout.readline(), read_timeout)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_output >= self.network_timeout:
+                    DOWNLOAD_STALLS.labels("no_output").inc()
+                    raise DownloadStalledException(f"下载超时 ({self.network_timeout}s 无进度更新)")
+            else:
                 if not line_bytes:
                     break
+                last_output = time.monotonic()
 
                 line = line_bytes.decode("utf-8", errors="ignore")
 
@@ -426,10 +458,18 @@ class SubprocessProgressHandler:
                     error_output += line
 
                 # 处理这一行的进度数据
-                self._process_line(line, progress, task_id)
-
-            except asyncio.TimeoutError:
-                raise DownloadStalledException(f"下载超时 ({self.network_timeout}s 无进度更新)")
+                if self._process_line(line, progress, task_id) and on_first_progress:
+                    on_first_progress()
+                    on_first_progress = None
+
+            if detector is not None:
+                rate = detector.check()
+                if rate is not None:
+                    DOWNLOAD_STALLS.labels("low_throughput").inc()
+                    raise DownloadStalledException(
+                        f"下载停滞 (最近{detector.window_seconds}s 平均 {rate / 1024:.1f}KB/s，"
+                        f"低于 {detector.min_bytes_per_second / 1024:.1f}KB/s)"
+                    )
 
         return error_output
 
@@ -461,7 +501,11 @@ class SubprocessProgressHandler:
                     progress.update(task_id, completed=100, total=100)
 
     async def handle_subprocess_with_progress(
-        self, process: asyncio.subprocess.Process, progress: Progress, task_id: TaskID
+        self,
+        process: asyncio.subprocess.Process,
+        progress: Progress,
+        task_id: TaskID,
+        on_first_progress: Optional[Callable[[], None]] = None,
     ) -> str:
         """
         处理带进度显示的子进程
@@ -470,12 +514,13 @@ class SubprocessProgressHandler:
             process: 子进程对象
             progress: Rich进度条对象
             task_id: 任务ID
+            on_first_progress: 解析到第一条进度数据时调用（可选）
 
         Returns:
             str: 累积的错误输出
 
         Raises:
-            DownloadStalledException: 当下载超时时
+            DownloadStalledException: 长时间无输出，或吞吐持续低于下限时
         """
         # 重置组合下载状态
         self.combined_download_state = {
@@ -486,8 +531,9 @@ class SubprocessProgressHandler:
             "current_file_type": None,
             "is_combined_download": False,
         }
+        self.stall_detector = StallDetector.from_config()
 
-        error_output = await self._read_process_output(process, progress, task_id)
+        error_output = await self._read_process_output(process, progress, task_id, on_first_progress)
 
         # 等待进程完成
         await process.wait()
@@ -0,0 +1,348 @@
+# core/tracing.py
+"""
+下载阶段耗时追踪
+把一次下载拆成 prepare / extract / plan / spawn / first-byte / transfer / postprocess / verify
+等阶段记录为span，汇总后附到任务结果中，并按 OTLP/JSON 格式导出到本地文件或
+OpenTelemetry collector（/v1/traces）。
+
+普通任务只导出阶段级span；总耗时超过阈值的慢任务导出全部span，
+包括每个yt-dlp/ffmpeg子进程的命令行，并把阶段耗时写入警告日志。
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config_manager import config
+
+log = logging.getLogger(__name__)
+
+PHASES = ("prepare", "extract", "plan", "spawn", "first-byte", "transfer", "postprocess", "verify")
+
+_current_trace: ContextVar[Optional["DownloadTrace"]] = ContextVar("download_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("download_span", default=None)
+_export_lock = threading.Lock()
+
+# 代理等URL中的用户名密码不写入追踪数据
+_CREDENTIALS_PATTERN = re.compile(r"(\w+://)[^/@\s]+@")
+
+
+@dataclass
+class Span:
+    """一段计时区间"""
+
+    name: str
+    span_id: str = ""
+    parent_id: Optional[str] = None
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+        if error is not None and self.error is None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class DownloadTrace:
+    """一次下载的全部span"""
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self.slow = False
+        self.root = self.start_span(name, parent=None, **attributes)
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        span = Span(name, secrets.token_hex(8), parent.span_id if parent else None, attributes=attributes)
+        self.spans.append(span)
+        return span
+
+    def finish(self, error: Optional[BaseException] = None, slow_threshold: Optional[float] = None) -> None:
+        """结束所有未结束的span，并按阈值标记慢任务"""
+        for span in self.spans:
+            span.end(error if span is self.root else None)
+        if slow_threshold is not None:
+            self.slow = self.duration_seconds >= slow_threshold
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.root.duration_ms / 1000
+
+    def phase_timings(self) -> Dict[str, float]:
+        """
+        各阶段的墙钟耗时（毫秒）。并发的同名span（如音视频流同时下载）按时间区间合并，
+        不会重复计算；嵌套的阶段（如prepare中的extract）各自计时。
+        """
+        timings = {}
+        for phase in PHASES:
+            intervals = sorted((s.start_ns, s.end_ns) for s in self.spans if s.name == phase and s.end_ns)
+            if not intervals:
+                continue
+            total = 0
+            current_start, current_end = intervals[0]
+            for start, end in intervals[1:]:
+                if start > current_end:
+                    total += current_end - current_start
+                    current_start, current_end = start, end
+                else:
+                    current_end = max(current_end, end)
+            total += current_end - current_start
+            timings[phase] = round(total / 1e6, 1)
+        return timings
+
+    def commands(self) -> List[str]:
+        """本次下载启动过的所有子进程命令行"""
+        return [" ".join(s.attributes["command"]) for s in self.spans if "command" in s.attributes]
+
+    def summary(self) -> Dict[str, Any]:
+        """附到任务结果中的耗时摘要"""
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round(self.root.duration_ms, 1),
+            "phases": self.phase_timings(),
+            "slow": self.slow,
+        }
+
+    def to_otlp(self, full: bool = False) -> Dict[str, Any]:
+        """
+        转为 OTLP/JSON 的 ExportTraceServiceRequest。
+
+        Args:
+            full: 是否包含全部span和命令行；否则只保留根span和阶段span
+        """
+        spans = [s for s in self.spans if full or s is self.root or s.name in PHASES]
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes({"service.name": "smartdownloader"})},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [self._otlp_span(s, full) for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def _otlp_span(self, span: Span, full: bool) -> Dict[str, Any]:
+        attributes = span.attributes if full else {k: v for k, v in span.attributes.items() if k != "command"}
+        data = {
+            "traceId": self.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": _otlp_attributes(attributes),
+            "status": {"code": 2, "message": span.error} if span.error else {},
+        }
+        if span.parent_id:
+            data["parentSpanId"] = span.parent_id
+        if span is self.root:
+            data["attributes"] += _otlp_attributes({"download.slow": self.slow})
+        return data
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def redact_command(cmd: List[str]) -> List[str]:
+    """去掉命令行参数中URL携带的用户名密码"""
+    return [_CREDENTIALS_PATTERN.sub(r"\1***@", str(arg)) for arg in cmd]
+
+
+def current_trace() -> Optional[DownloadTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    在当前追踪中记录一个子span。不在追踪中时返回不登记的span，调用方可照常设置属性。
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield Span(name, attributes=attributes)
+        return
+    current = trace.start_span(name, parent=_current_span.get(), **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced_span(name: str) -> Callable:
+    """把整个异步方法记为一个span的装饰器"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ProcessSpans:
+    """
+    单个子进程的 spawn -> first-byte -> transfer 三段计时。
+    first-byte 从进程启动完成到第一条进度输出，transfer 从第一条进度输出到进程结束。
+    """
+
+    def __init__(self, cmd: List[str]):
+        self.trace = _current_trace.get()
+        self.parent = _current_span.get()
+        self._open: Optional[Span] = None
+        if self.trace is not None:
+            self._open = self.trace.start_span("spawn", parent=self.parent, command=redact_command(cmd))
+
+    def _advance(self, name: str, **attributes) -> None:
+        if self._open is None:
+            return
+        self._open.end()
+        self._open = self.trace.start_span(name, parent=self.parent, **attributes)
+
+    def spawned(self, pid: Optional[int] = None, expect_output: bool = True) -> None:
+        """
+        Args:
+            expect_output: 是否继续计时首字节和传输；ffmpeg等不输出进度的进程只记录启动耗时
+        """
+        if self._open is not None and self._open.name == "spawn":
+            self._open.attributes["process.pid"] = pid
+            if expect_output:
+                self._advance("first-byte")
+            else:
+                self.finished()
+
+    def first_output(self) -> None:
+        if self._open is not None and self._open.name == "first-byte":
+            self._advance("transfer")
+
+    def finished(self, error: Optional[BaseException] = None) -> None:
+        if self._open is not None:
+            self._open.end(error)
+            self._open = None
+
+
+def export_trace(trace: DownloadTrace) -> None:
+    """把追踪写入配置的文件和/或collector；慢任务额外记录警告日志"""
+    settings = config.monitoring
+    if trace.slow:
+        phases = ", ".join(f"{name}={ms / 1000:.1f}s" for name, ms in trace.phase_timings().items())
+        log.warning(f"慢下载 ({trace.duration_seconds:.1f}s, trace={trace.trace_id}): {phases}")
+        for command in trace.commands():
+            log.warning(f"慢下载命令: {command}")
+
+    if not settings.trace_file and not settings.otlp_endpoint:
+        return
+    payload = json.dumps(trace.to_otlp(full=trace.slow), ensure_ascii=False)
+
+    if settings.trace_file:
+        try:
+            trace_file = Path(settings.trace_file)
+            trace_file.parent.mkdir(parents=True, exist_ok=True)
+            with _export_lock, open(trace_file, "a", encoding="utf-8") as f:
+                f.write(payload + "\n")
+        except OSError as e:
+            log.warning(f"写入追踪文件失败: {e}")
+
+    if settings.otlp_endpoint:
+        request = urllib.request.Request(
+            settings.otlp_endpoint,
+            data=payload.encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+        except (OSError, ValueError) as e:
+            log.warning(f"发送追踪到collector失败: {e}")
+
+
+@asynccontextmanager
+async def trace_download(name: str, **attributes):
+    """
+    开始一次下载追踪，结束时导出。已在追踪中（如降级到其他下载方法）时只记为子span。
+
+    Yields:
+        当前的DownloadTrace；追踪未启用时为None
+    """
+    trace = _current_trace.get()
+    if trace is not None or not config.monitoring.tracing_enabled:
+        with span(name, **attributes):
+            yield trace
+        return
+
+    trace = DownloadTrace(name, **attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    error = None
+    try:
+        yield trace
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        trace.finish(error, config.monitoring.slow_download_seconds)
+        await asyncio.to_thread(export_trace, trace)
+
+
+def traced_download(name: str) -> Callable:
+    """
+    下载入口方法的装饰器：整个调用记为一次追踪，追踪对象保存到实例的 last_trace 属性。
+    被装饰方法的第一个参数须为视频URL。
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, video_url: str, *args, **kwargs):
+            async with trace_download(name, **{"url.full": video_url}) as trace:
+                if trace is not None:
+                    self.last_trace = trace
+                return await func(self, video_url, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
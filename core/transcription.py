@@ -0,0 +1,267 @@
+# core/transcription.py
+
+import asyncio
+import logging
+import os
+import re
+import sys
+import tempfile
+import wave
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import aiofiles
+import psutil
+
+from config_manager import config
+
+from .command_builder import CommandBuilder
+from .exceptions import DownloaderException
+from .srt import Cue, serialize_cues
+
+log = logging.getLogger(__name__)
+
+WHISPER_LINE_PATTERN = re.compile(r"\[(\d+):(\d+):(\d+)\.(\d+)\s*-->\s*(\d+):(\d+):(\d+)\.(\d+)\]\s+(.*)")
+
+# 自动选择时的并行whisper进程数上限；每个进程都完整加载一份模型
+MAX_AUTO_WORKERS = 4
+# 每个whisper进程除模型本身外的内存开销（计算缓冲区等）
+_WORKER_OVERHEAD_BYTES = 512 * 1024 * 1024
+
+
+@dataclass
+class AudioChunk:
+    """按静音切分后的音频片段"""
+
+    index: int
+    start_ms: int
+    end_ms: int
+    path: Path
+
+
+def find_silences(
+    wav_path: Path, threshold: float = 0.02, min_silence_ms: int = 500, frame_ms: int = 30
+) -> Tuple[int, List[Tuple[int, int]]]:
+    """
+    基于峰值能量的简易VAD，找出WAV文件中的静音区间。
+
+    Args:
+        wav_path: 16位PCM WAV文件
+        threshold: 静音阈值（相对满幅的峰值比例）
+        min_silence_ms: 最短静音时长（毫秒）
+        frame_ms: 分析帧长度（毫秒）
+
+    Returns:
+        (音频总时长毫秒, [(静音开始毫秒, 静音结束毫秒), ...])
+
+    Raises:
+        ValueError: 不是16位PCM WAV
+    """
+    with wave.open(str(wav_path), "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"仅支持16位PCM WAV: {wav_path}")
+        rate = wav.getframerate()
+        channels = wav.getnchannels()
+        samples_per_frame = max(1, rate * frame_ms // 1000) * channels
+        limit = int(32767 * threshold)
+
+        silences = []
+        silence_start = None
+        position_ms = 0
+        consumed = 0
+        while True:
+            # 一次读取约1秒，再按分析帧切片；max/min在C层完成，长音频也很快
+            data = wav.readframes(rate)
+            if not data:
+                break
+            samples = array("h")
+            samples.frombytes(data)
+            if sys.byteorder == "big":
+                samples.byteswap()
+
+            for offset in range(0, len(samples), samples_per_frame):
+                frame = samples[offset : offset + samples_per_frame]
+                quiet = max(frame) <= limit and min(frame) >= -limit
+                if quiet and silence_start is None:
+                    silence_start = position_ms
+                elif not quiet and silence_start is not None:
+                    if position_ms - silence_start >= min_silence_ms:
+                        silences.append((silence_start, position_ms))
+                    silence_start = None
+                consumed += len(frame)
+                position_ms = consumed * 1000 // (rate * channels)
+
+        if silence_start is not None and position_ms - silence_start >= min_silence_ms:
+            silences.append((silence_start, position_ms))
+
+    return position_ms, silences
+
+
+def plan_chunks(
+    duration_ms: int, silences: List[Tuple[int, int]], target_ms: int, max_ms: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """
+    在静音中点处切分，使每段尽量接近target_ms；没有静音时在max_ms处强制切分。
+
+    Returns:
+        [(片段开始毫秒, 片段结束毫秒), ...]
+    """
+    max_ms = max_ms or target_ms * 2
+    bounds = []
+    start = 0
+    for cut in [(s + e) // 2 for s, e in silences] + [duration_ms]:
+        while cut - start > max_ms:
+            bounds.append((start, start + max_ms))
+            start += max_ms
+        if cut > start and (cut - start >= target_ms or cut == duration_ms):
+            bounds.append((start, cut))
+            start = cut
+    return bounds
+
+
+def split_wav(wav_path: Path, bounds: List[Tuple[int, int]], output_dir: Path) -> List[AudioChunk]:
+    """按计划把WAV切成多个片段文件（仅复制PCM数据，不重新编码）。"""
+    chunks = []
+    with wave.open(str(wav_path), "rb") as wav:
+        params = wav.getparams()
+        rate = wav.getframerate()
+        for index, (start_ms, end_ms) in enumerate(bounds):
+            wav.setpos(start_ms * rate // 1000)
+            data = wav.readframes((end_ms - start_ms) * rate // 1000)
+            chunk_path = output_dir / f"chunk_{index:04d}.wav"
+            with wave.open(str(chunk_path), "wb") as out:
+                out.setparams(params)
+                out.writeframes(data)
+            chunks.append(AudioChunk(index, start_ms, end_ms, chunk_path))
+    return chunks
+
+
+def parse_whisper_output(raw_output: str, offset_ms: int = 0) -> List[Cue]:
+    """解析whisper-cli的标准输出，并把时间戳偏移到整段音频的时间轴上。"""
+    cues = []
+    for index, match in enumerate(WHISPER_LINE_PATTERN.finditer(raw_output), 1):
+        h1, m1, s1, ms1, h2, m2, s2, ms2, text = match.groups()
+        start = ((int(h1) * 60 + int(m1)) * 60 + int(s1)) * 1000 + int(ms1)
+        end = ((int(h2) * 60 + int(m2)) * 60 + int(s2)) * 1000 + int(ms2)
+        cues.append(Cue(index, start + offset_ms, end + offset_ms, text.strip()))
+    return cues
+
+
+class ChunkedTranscriber:
+    """
+    分段并行转录器。
+
+    按静音切分音频，多个whisper-cli进程并行转录各片段，
+    时间戳偏移后拼接为一个SRT，并按顺序把已完成的片段流式写入磁盘。
+    """
+
+    def __init__(self, command_builder: Optional[CommandBuilder] = None, workers: Optional[int] = None):
+        """
+        初始化分段转录器。
+
+        Args:
+            command_builder: 命令构建器实例，None则创建默认实例
+            workers: 并行whisper进程数，None则读取配置（0表示按模型大小和可用内存自动选择）
+        """
+        ai_config = config.ai_subtitles
+        self.command_builder = command_builder or CommandBuilder()
+        self.workers = workers or ai_config.transcription_workers or None
+        self.threads_per_worker = 1
+        self.chunk_ms = ai_config.transcription_chunk_seconds * 1000
+        self.silence_threshold = ai_config.vad_silence_threshold
+        self.min_silence_ms = ai_config.vad_min_silence_ms
+
+    @staticmethod
+    def auto_workers(model_path: Path) -> int:
+        """
+        按模型大小和可用内存选择并行进程数：每个whisper进程都加载完整模型，
+        进程数不超过可用内存能容纳的份数、CPU核数和 MAX_AUTO_WORKERS。
+        """
+        try:
+            model_bytes = model_path.stat().st_size
+        except OSError:
+            model_bytes = 0
+        by_memory = psutil.virtual_memory().available // (model_bytes + _WORKER_OVERHEAD_BYTES)
+        return max(1, min(MAX_AUTO_WORKERS, os.cpu_count() or 1, by_memory))
+
+    def split_audio(self, wav_path: Path, output_dir: Path) -> List[AudioChunk]:
+        """检测静音并切分音频（同步方法，CPU/IO密集，调用方应放到线程中执行）。"""
+        duration_ms, silences = find_silences(wav_path, self.silence_threshold, self.min_silence_ms)
+        bounds = plan_chunks(duration_ms, silences, self.chunk_ms)
+        log.info(f"音频时长 {duration_ms / 1000:.1f}s，检测到 {len(silences)} 处静音，切分为 {len(bounds)} 段")
+        return split_wav(wav_path, bounds, output_dir)
+
+    async def transcribe(self, wav_path: Path, model_path: Path, language: str, srt_path: Path) -> int:
+        """
+        分段并行转录WAV文件并写入SRT。
+
+        Args:
+            wav_path: 16位PCM WAV文件
+            model_path: Whisper模型路径
+            language: 源语言
+            srt_path: 输出SRT路径
+
+        Returns:
+            int: 写入的字幕条数
+
+        Raises:
+            DownloaderException: 任一片段转录失败
+        """
+        workers = self.workers or self.auto_workers(model_path)
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+        with tempfile.TemporaryDirectory(prefix="whisper_chunks_", dir=srt_path.parent) as tmp_dir:
+            chunks = await asyncio.to_thread(self.split_audio, wav_path, Path(tmp_dir))
+            log.info(f"并行转录: {workers} 个whisper进程，每个 {self.threads_per_worker} 线程")
+            semaphore = asyncio.Semaphore(workers)
+            tasks = [
+                asyncio.create_task(self._transcribe_chunk(chunk, model_path, language, semaphore)) for chunk in chunks
+            ]
+
+            cue_count = 0
+            try:
+                async with aiofiles.open(srt_path, "w", encoding="utf-8") as f:
+                    # 按片段顺序等待：前面的片段一完成就写盘，后面的片段仍在并行转录
+                    for task in tasks:
+                        cues = await task
+                        await f.write(serialize_cues(cues, cue_count + 1))
+                        await f.flush()
+                        cue_count += len(cues)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+        return cue_count
+
+    async def _transcribe_chunk(
+        self, chunk: AudioChunk, model_path: Path, language: str, semaphore: asyncio.Semaphore
+    ) -> List[Cue]:
+        """转录单个片段，返回偏移后的字幕条目。"""
+        cmd = self.command_builder.build_whisper_cmd(
+            str(model_path), language, str(chunk.path), threads=self.threads_per_worker
+        )
+        async with semaphore:
+            log.debug(f"转录片段 {chunk.index}: {chunk.start_ms}ms - {chunk.end_ms}ms")
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                # 等待进程退出后再返回，避免留下僵尸进程，也避免片段临时目录在进程退出前被删除
+                if process.returncode is None:
+                    try:
+                        process.kill()
+                        await process.wait()
+                    except ProcessLookupError:
+                        pass
+                raise
+
+        if process.returncode != 0:
+            raise DownloaderException(
+                f"片段 {chunk.index} 转录失败 (code {process.returncode}): {stderr.decode(errors='ignore').strip()}"
+            )
+        return parse_whisper_output(stdout.decode(errors="ignore"), chunk.start_ms)
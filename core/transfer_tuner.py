@@ -0,0 +1,330 @@
+# core/transfer_tuner.py
+"""
+传输参数调优
+按格式的传输方式为yt-dlp选择分片并发数、HTTP分块大小和缓冲区大小：
+- 单文件（progressive）格式没有分片，并发数不起作用，改为按块请求（--http-chunk-size），
+  避免服务端对长连接限速；
+- HLS/DASH 分片格式按分片数和站点选择并发数，站点的并发数根据实际吞吐逐步调整；
+- 所有任务共享一个全局连接预算，并发任务多时每个任务分到的连接数相应减少，不会超额。
+
+提供Redis客户端时站点吞吐和连接预算在所有worker间共享，否则只在当前进程内生效。
+站点统计在一段时间没有新的下载后过期，重新从默认并发数开始学习。
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from config_manager import config
+
+from .metrics import FRAGMENT_CONNECTIONS, url_domain
+
+log = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# 哈希: 租约ID -> "连接数:过期时间戳"
+LEASES_KEY = "transfer:leases"
+LOCK_KEY = "transfer:lock"
+DOMAIN_KEY_PREFIX = "transfer:domain:"
+
+_FRAGMENTED_PROTOCOLS = ("m3u8", "m3u8_native", "http_dash_segments", "dash", "ism", "f4m")
+_TRANSFER_OPTIONS = ("--concurrent-fragments", "--http-chunk-size", "--buffer-size")
+
+# 吞吐比均值高出10%时继续增加并发，低于80%时减半
+_GROW_RATIO = 1.1
+_SHRINK_RATIO = 0.8
+_EWMA_WEIGHT = 0.3
+# 小于该大小的下载耗时主要在握手上，不用于学习
+_MIN_SAMPLE_BYTES = 4 * MB
+
+
+def existing_bytes(output_path: Path) -> int:
+    """
+    输出文件及其临时文件（.part、分离流的 .fNNN 文件、原生分片的 .native.part）已有的字节数。
+    下载前后各取一次，差值才是本次实际传输的字节数，断点续传时之前下载的部分不计入吞吐。
+    """
+    output_path = Path(output_path)
+    total = 0
+    try:
+        with os.scandir(output_path.parent) as entries:
+            for entry in entries:
+                if entry.name == output_path.name or entry.name.startswith(f"{output_path.stem}."):
+                    try:
+                        total += entry.stat().st_size
+                    except OSError:
+                        continue
+    except OSError:
+        return 0
+    return total
+
+
+@dataclass
+class TransferPlan:
+    """一次下载的传输参数"""
+
+    concurrent_fragments: int
+    http_chunk_size: Optional[int] = None
+    buffer_size: Optional[int] = None
+
+    def args(self) -> List[str]:
+        args = ["--concurrent-fragments", str(self.concurrent_fragments)]
+        if self.http_chunk_size:
+            args.extend(["--http-chunk-size", str(self.http_chunk_size)])
+        if self.buffer_size:
+            args.extend(["--buffer-size", str(self.buffer_size)])
+        return args
+
+    def apply(self, cmd: List[str]) -> List[str]:
+        """把yt-dlp命令中的传输参数替换为本计划的参数"""
+        applied = []
+        skip = False
+        for arg in cmd:
+            if skip:
+                skip = False
+                continue
+            if arg in _TRANSFER_OPTIONS:
+                skip = True
+                continue
+            applied.append(arg)
+        return applied[:1] + self.args() + applied[1:]
+
+    @classmethod
+    def from_cmd(cls, cmd: List[str]) -> "TransferPlan":
+        """从yt-dlp命令中读出传输参数"""
+        values = {option: cmd[i + 1] for i, option in enumerate(cmd[:-1]) if option in _TRANSFER_OPTIONS}
+        return cls(
+            int(values.get("--concurrent-fragments", 1)),
+            int(values["--http-chunk-size"]) if "--http-chunk-size" in values else None,
+            int(values["--buffer-size"]) if "--buffer-size" in values else None,
+        )
+
+
+class TransferTuner:
+    """按格式和站点选择传输参数，并在任务间分配连接预算"""
+
+    def __init__(
+        self,
+        redis_client=None,
+        default_fragments: int = 4,
+        max_fragments: int = 16,
+        connection_budget: int = 32,
+        http_chunk_size: int = 10 * MB,
+        adaptive: bool = True,
+        lease_ttl: int = 3600,
+        stats_ttl: int = 7 * 24 * 3600,
+    ):
+        """
+        Args:
+            redis_client: Redis客户端（decode_responses=True）；None时只在当前进程内共享
+            default_fragments: 分片格式的初始并发数
+            max_fragments: 单个下载的最大并发数
+            connection_budget: 所有下载共享的分片连接总数，0表示不限
+            http_chunk_size: 单文件格式的分块大小（字节），0表示不分块
+            adaptive: 是否根据站点吞吐调整并发数
+            lease_ttl: 连接租约的最长有效期（秒），防止崩溃的任务永久占用预算
+            stats_ttl: 站点统计的有效期（秒），期间没有新的下载时过期
+        """
+        self.redis = redis_client
+        self.default_fragments = default_fragments
+        self.max_fragments = max_fragments
+        self.connection_budget = connection_budget
+        self.http_chunk_size = http_chunk_size
+        self.adaptive = adaptive
+        self.lease_ttl = lease_ttl
+        self.stats_ttl = stats_ttl
+
+        self._lock = threading.Lock()
+        self._leases: Dict[str, int] = {}
+        self._domains: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def from_config(cls, redis_client=None) -> "TransferTuner":
+        settings = config.downloader
+        return cls(
+            redis_client,
+            settings.concurrent_fragments,
+            settings.max_concurrent_fragments,
+            settings.transfer_connection_budget,
+            settings.http_chunk_size_mb * MB,
+            settings.adaptive_transfer,
+        )
+
+    def default_plan(self) -> TransferPlan:
+        """不知道格式信息时使用的参数"""
+        return TransferPlan(self.default_fragments)
+
+    # --- 按格式选择 ---
+
+    @staticmethod
+    def _is_fragmented(fmt: Dict[str, Any]) -> bool:
+        protocol = str(fmt.get("protocol") or "")
+        return bool(fmt.get("fragments")) or any(p in protocol.split("+") for p in _FRAGMENTED_PROTOCOLS)
+
+    def plan(self, formats: Iterable[Optional[Dict[str, Any]]], url: str) -> TransferPlan:
+        """
+        为将要下载的格式（分离流时为视频和音频格式）选择传输参数。
+
+        Args:
+            formats: yt-dlp格式信息，None项会被忽略
+            url: 视频URL，用于按站点调整并发数
+        """
+        formats = [fmt for fmt in formats if fmt]
+        fragmented = [fmt for fmt in formats if self._is_fragmented(fmt)]
+        progressive = [fmt for fmt in formats if not self._is_fragmented(fmt)]
+
+        concurrency = 1
+        if fragmented:
+            concurrency = self._domain_concurrency(url_domain(url))
+            # 分片数比并发数还少时多开的连接没有用处
+            fragment_counts = [len(fmt["fragments"]) for fmt in fragmented if fmt.get("fragments")]
+            if fragment_counts:
+                concurrency = min(concurrency, max(fragment_counts))
+
+        chunk_size = None
+        buffer_size = None
+        if progressive and self.http_chunk_size:
+            sizes = [fmt.get("filesize") or fmt.get("filesize_approx") or 0 for fmt in progressive]
+            # 已知大小且不超过一个分块的文件不用分块
+            if any(size == 0 or size > self.http_chunk_size for size in sizes):
+                chunk_size = self.http_chunk_size
+                # 大块传输时使用较大的初始缓冲区，减少读写次数
+                buffer_size = 1 * MB
+
+        return TransferPlan(max(1, concurrency), chunk_size, buffer_size)
+
+    # --- 站点学习 ---
+
+    def _domain_stats(self, domain: str) -> Dict[str, float]:
+        if self.redis is None:
+            stats = dict(self._domains.get(domain, {}))
+            if stats and time.time() - stats.pop("updated_at") > self.stats_ttl:
+                return {}
+            return stats
+        try:
+            return {k: float(v) for k, v in self.redis.hgetall(DOMAIN_KEY_PREFIX + domain).items()}
+        except Exception as e:
+            log.debug(f"读取站点传输统计失败: {e}")
+            return {}
+
+    def _domain_concurrency(self, domain: str) -> int:
+        if not self.adaptive:
+            return self.default_fragments
+        stats = self._domain_stats(domain)
+        return min(int(stats.get("concurrency", self.default_fragments)), self.max_fragments)
+
+    def record(self, url: str, plan: TransferPlan, downloaded_bytes: int, seconds: float) -> None:
+        """
+        记录一次下载的实际吞吐，调整该站点下次使用的并发数：
+        吞吐明显高于均值时并发翻倍（不超过上限），明显下降（如被CDN限速）时减半。
+
+        只有按站点当前并发数执行的下载才用于学习。连接预算不足、分片数少于并发数而少开了连接的下载，
+        以及不分片的单文件下载（站点并发数大于1时），吞吐不能说明站点并发数是否合适，不会让站点
+        并发数下降。站点并发数已降到1时单连接的下载正是它的样本，吞吐回升后并发数可以重新增加。
+
+        Args:
+            downloaded_bytes: 本次实际传输的字节数，不含断点续传之前已下载的部分
+        """
+        if not self.adaptive or seconds <= 0 or downloaded_bytes < _MIN_SAMPLE_BYTES:
+            return
+
+        domain = url_domain(url)
+        stats = self._domain_stats(domain)
+        used = plan.concurrent_fragments
+        current = min(int(stats.get("concurrency", self.default_fragments)), self.max_fragments)
+        if used != current:
+            log.debug(f"{domain}: 本次使用 {used}并发，与站点并发数 {current} 不同，不用于学习")
+            return
+        throughput = downloaded_bytes / seconds
+        average = stats.get("throughput")
+
+        if average is None or throughput >= average * _GROW_RATIO:
+            concurrency = min(used * 2, self.max_fragments)
+        elif throughput < average * _SHRINK_RATIO:
+            concurrency = max(1, used // 2)
+        else:
+            concurrency = used
+        average = throughput if average is None else average * (1 - _EWMA_WEIGHT) + throughput * _EWMA_WEIGHT
+
+        updated = {"concurrency": concurrency, "throughput": average}
+        if self.redis is None:
+            self._domains[domain] = dict(updated, updated_at=time.time())
+        else:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.hset(DOMAIN_KEY_PREFIX + domain, mapping=updated)
+                pipe.expire(DOMAIN_KEY_PREFIX + domain, self.stats_ttl)
+                pipe.execute()
+            except Exception as e:
+                log.debug(f"保存站点传输统计失败: {e}")
+        log.debug(
+            f"{domain}: {used}并发 {throughput / MB:.2f}MB/s (均值 {average / MB:.2f}MB/s)，下次使用 {concurrency}并发"
+        )
+
+    # --- 全局连接预算 ---
+
+    def _acquire(self, lease_id: str, requested: int) -> int:
+        if not self.connection_budget:
+            return requested
+        if self.redis is None:
+            with self._lock:
+                available = self.connection_budget - sum(self._leases.values())
+                granted = max(1, min(requested, available))
+                self._leases[lease_id] = granted
+            return granted
+        try:
+            with self.redis.lock(LOCK_KEY, timeout=10, blocking_timeout=5):
+                now = time.time()
+                used = 0
+                expired = []
+                for key, value in self.redis.hgetall(LEASES_KEY).items():
+                    count, expires_at = value.split(":")
+                    if float(expires_at) < now:
+                        expired.append(key)
+                    else:
+                        used += int(count)
+                if expired:
+                    self.redis.hdel(LEASES_KEY, *expired)
+                granted = max(1, min(requested, self.connection_budget - used))
+                self.redis.hset(LEASES_KEY, lease_id, f"{granted}:{now + self.lease_ttl}")
+            return granted
+        except Exception as e:
+            log.warning(f"分配连接预算失败，使用请求的并发数: {e}")
+            return requested
+
+    def _release(self, lease_id: str) -> None:
+        if self.redis is None:
+            with self._lock:
+                self._leases.pop(lease_id, None)
+            return
+        try:
+            self.redis.hdel(LEASES_KEY, lease_id)
+        except Exception as e:
+            log.debug(f"释放连接租约失败: {e}")
+
+    @contextmanager
+    def lease(self, cmd: List[str]):
+        """
+        在全局连接预算内执行一条yt-dlp命令。预算不足时降低命令的并发数（至少1个连接）。
+
+        Yields:
+            (调整后的命令, 实际使用的传输参数)
+        """
+        plan = TransferPlan.from_cmd(cmd)
+        lease_id = uuid.uuid4().hex
+        requested = plan.concurrent_fragments
+        plan.concurrent_fragments = self._acquire(lease_id, requested)
+        if plan.concurrent_fragments < requested:
+            log.info(f"连接预算不足，分片并发数 {requested} -> {plan.concurrent_fragments}")
+        FRAGMENT_CONNECTIONS.inc(plan.concurrent_fragments)
+        try:
+            yield plan.apply(cmd), plan
+        finally:
+            FRAGMENT_CONNECTIONS.dec(plan.concurrent_fragments)
+            self._release(lease_id)
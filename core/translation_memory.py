@@ -0,0 +1,82 @@
+# core/translation_memory.py
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable
+
+log = logging.getLogger(__name__)
+
+# SQLite单条语句的参数上限较保守的取值
+_QUERY_CHUNK = 500
+
+
+class TranslationMemory:
+    """
+    持久化翻译记忆（SQLite）。
+
+    以(翻译服务, 源语言, 目标语言, 规范化原文)为键缓存译文，
+    重复运行同一文件或重复出现的台词无需再次请求翻译服务。
+    方法均为同步阻塞调用，异步代码中应通过 asyncio.to_thread 使用。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS translations (
+                    service TEXT NOT NULL,
+                    source_lang TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    source_text TEXT NOT NULL,
+                    translated_text TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (service, source_lang, target_lang, source_text)
+                ) WITHOUT ROWID
+                """
+            )
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """规范化原文：合并空白，使仅有换行/空格差异的台词命中同一条记忆。"""
+        return " ".join(text.split())
+
+    def lookup_many(self, service: str, source_lang: str, target_lang: str, texts: Iterable[str]) -> Dict[str, str]:
+        """批量查询已规范化的原文，返回命中的 {原文: 译文}。"""
+        texts = list(dict.fromkeys(texts))
+        found = {}
+        with self._lock:
+            for i in range(0, len(texts), _QUERY_CHUNK):
+                chunk = texts[i : i + _QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    "SELECT source_text, translated_text FROM translations "
+                    f"WHERE service = ? AND source_lang = ? AND target_lang = ? AND source_text IN ({placeholders})",
+                    (service, source_lang, target_lang, *chunk),
+                )
+                found.update(rows)
+        return found
+
+    def store_many(self, service: str, source_lang: str, target_lang: str, pairs: Dict[str, str]) -> None:
+        """批量写入 {规范化原文: 译文}。"""
+        if not pairs:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                ((service, source_lang, target_lang, src, dst, now) for src, dst in pairs.items()),
+            )
+        log.debug(f"翻译记忆新增 {len(pairs)} 条")
+
+    def close(self) -> None:
+        """关闭数据库连接。"""
+        with self._lock:
+            self._conn.close()
@@ -5,12 +5,14 @@
 """
 
 import asyncio
+import glob
 import json
 import logging
 import re
 import sys
+import time
 from pathlib import Path
-from typing import Any, AsyncGenerator, Dict, Optional
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
 
 from rich.console import Console
 from rich.progress import (
@@ -31,12 +33,21 @@ from core import (
     AuthenticationException,
     CommandBuilder,
     DownloaderException,
+    FFmpegException,
     FileProcessor,
+    MetadataContext,
+    SegmentDownloader,
+    StreamMerger,
     SubprocessManager,
+    UnsupportedSegmentsException,
     with_retries,
 )
 from core.cookies_manager import CookiesManager
 from core.format_analyzer import DownloadStrategy
+from core.metrics import DOWNLOAD_FALLBACKS, DOWNLOAD_STRATEGY, EXTRACTION_SECONDS, record_cache, timed, url_domain
+from core.retry_manager import RetryBudget, current_budget, with_retry_budget
+from core.tracing import DownloadTrace, span, traced_download, traced_span
+from core.transfer_tuner import TransferTuner, existing_bytes
 
 log = logging.getLogger(__name__)
 # 明确创建写入 stdout 的控制台，以避免 rich 将进度条自动发送到 stderr，
@@ -47,6 +58,15 @@ console = Console(file=sys.stdout)
 _progress_semaphore = asyncio.Semaphore(1)
 
 
+# yt-dlp合并前各格式的单独文件，如 .f137.mp4
+_FORMAT_STREAM = re.compile(r"\.f[^.]+\.")
+
+
+def _is_partial_file(name: str) -> bool:
+    """yt-dlp（.part、.part-FragN、.ytdl）和原生分片下载（.native.*）未完成时留下的临时文件"""
+    return name.endswith((".part", ".ytdl")) or ".part-Frag" in name or ".native." in name
+
+
 class SpeedOrFinishMarkColumn(ProgressColumn):
     """下载时显示速度,完成后显示标记"""
 
@@ -75,6 +95,8 @@ class Downloader:
         cookies_file: Optional[str] = None,
         proxy: Optional[str] = None,
         progress_callback: Optional[callable] = None,
+        resumable: bool = False,
+        transfer_tuner: Optional[TransferTuner] = None,
     ):
         """
         初始化下载器.
@@ -84,16 +106,27 @@ class Downloader:
             cookies_file: cookies文件路径(可选)
             proxy: 代理服务器地址(可选)
             progress_callback: 进度回调函数(可选)
+            resumable: 续传模式(可选)，download_folder 为任务独立的工作目录时使用，
+                重试时从已下载的部分继续；流式合并的输出无法续传，此模式下只在首次尝试时使用
+            transfer_tuner: 传输参数调优器(可选)，多个下载器共享时连接预算和站点吞吐统计也共享
         """
         self.download_folder = Path(download_folder)
         self.cookies_file = cookies_file
         self.proxy = proxy
         self.progress_callback = progress_callback
+        self.resumable = resumable
+        # 最近一次下载的阶段耗时追踪
+        self.last_trace: Optional[DownloadTrace] = None
+        # 最近一次下载的重试预算花费
+        self.last_retry_budget: Optional[RetryBudget] = None
 
         # 组合各种专门的处理器
-        self.command_builder = CommandBuilder(proxy, cookies_file)
+        self.transfer_tuner = transfer_tuner or TransferTuner.from_config()
+        self.command_builder = CommandBuilder(proxy, cookies_file, resumable, self.transfer_tuner)
         self.subprocess_manager = SubprocessManager()
         self.file_processor = FileProcessor(self.subprocess_manager, self.command_builder)
+        self.stream_merger = StreamMerger(self.command_builder, self.subprocess_manager)
+        self.segment_downloader = SegmentDownloader(proxy, cookies_file)
 
         # 初始化cookies管理器
         if cookies_file:
@@ -191,7 +224,7 @@ class Downloader:
             raise e
 
         log.warning(f"🍪 获取视频信息认证错误,尝试第 {attempt} 次自动刷新cookies...")
-        new_cookies_file = self.cookies_manager.refresh_cookies_for_url(url)
+        new_cookies_file = await asyncio.to_thread(self.cookies_manager.refresh_cookies_for_url, url)
 
         if not new_cookies_file:
             log.error("❌ 无法自动更新cookies,获取视频信息失败")
@@ -244,6 +277,55 @@ class Downloader:
         except Exception as e:
             raise DownloaderException(f"获取播放列表信息失败: {e}") from e
 
+    async def _get_video_info(self, video_url: str, metadata: Optional[MetadataContext] = None) -> Dict[str, Any]:
+        """获取视频信息：优先复用元数据上下文中已提取的结果，否则调用提取器。"""
+        reused = bool(metadata and metadata.has_info)
+        record_cache("metadata", reused)
+        if reused:
+            log.debug(f"复用已提取的元数据: {metadata.info.get('id', video_url)}")
+            return metadata.info
+        with timed(EXTRACTION_SECONDS, url_domain(video_url)), span("extract"):
+            video_info_gen = self.stream_playlist_info(video_url)
+            return await video_info_gen.__anext__()
+
+    def _info_json_dir(self) -> Path:
+        """info.json缓存目录：优先使用临时目录"""
+        temp_path = config.downloader.temp_path
+        return Path(temp_path) if temp_path else self.download_folder
+
+    async def download_metadata(
+        self, video_url: str, file_prefix: str, metadata: Optional[MetadataContext] = None
+    ) -> Optional[MetadataContext]:
+        """
+        元数据阶段：写出info.json供后续阶段复用，并下载缩略图。
+
+        Args:
+            video_url: 视频URL
+            file_prefix: 文件前缀
+            metadata: 已提取的元数据上下文（可选，没有时会提取一次）
+
+        Returns:
+            带有info.json路径的元数据上下文；提取失败时返回None
+        """
+        if metadata is None or not metadata.has_info:
+            try:
+                info = await self._get_video_info(video_url)
+            except (StopAsyncIteration, DownloaderException) as e:
+                log.warning(f"无法获取视频信息: {e}")
+                return None
+            metadata = MetadataContext(video_url, info)
+
+        info_json_path = await asyncio.to_thread(metadata.write_info_json, self._info_json_dir(), file_prefix)
+
+        self.download_folder.mkdir(parents=True, exist_ok=True)
+        cmd = self.command_builder.build_metadata_download_cmd(str(self.download_folder), video_url, info_json_path)
+        try:
+            await self.subprocess_manager.execute_simple(cmd, timeout=120)
+        except Exception as e:
+            # 缩略图只是附加信息，失败不影响后续下载
+            log.warning(f"下载缩略图失败 '{file_prefix}': {e}")
+        return metadata
+
     @with_retries(max_retries=3)
     async def _execute_cmd_with_auth_retry(
         self,
@@ -254,10 +336,12 @@ class Downloader:
         progress: Optional[Progress] = None,
         task_id: Optional[TaskID] = None,
         timeout: int = 1800,
+        monitor_progress: bool = True,
     ):
         """
         执行命令,支持认证错误自动重试,并可选择性地处理进度.
         这是一个通用的执行器,可以处理带或不带进度条的命令.
+        monitor_progress为False时不向进度回调汇报（由调用方统一汇报合并进度）.
         """
         max_auth_retries = 1
         auth_retry_count = 0
@@ -266,7 +350,9 @@ class Downloader:
         while auth_retry_count <= max_auth_retries:
             try:
                 if progress and task_id is not None:
-                    return await self._execute_with_progress_monitoring(cmd, progress, task_id, timeout)
+                    return await self._execute_with_progress_monitoring(
+                        cmd, progress, task_id, timeout, monitor_progress
+                    )
                 else:
                     return await self.subprocess_manager.execute_simple(cmd, timeout=timeout)
             except AuthenticationException as e:
@@ -279,10 +365,12 @@ class Downloader:
 
         raise DownloaderException("命令执行失败,所有重试均已用尽.")
 
-    async def _execute_with_progress_monitoring(self, cmd: list, progress: Progress, task_id: TaskID, timeout: int):
+    async def _execute_with_progress_monitoring(
+        self, cmd: list, progress: Progress, task_id: TaskID, timeout: int, monitor_progress: bool = True
+    ):
         """执行命令并监控Rich进度条。"""
         progress_monitor_task = None
-        if self.progress_callback:
+        if self.progress_callback and monitor_progress:
             progress_monitor_task = asyncio.create_task(self._monitor_rich_progress(progress, task_id))
 
         try:
@@ -314,7 +402,7 @@ class Downloader:
             raise e
 
         log.warning(f"🍪 检测到认证错误,尝试第 {attempt} 次自动刷新cookies...")
-        new_cookies_file = self.cookies_manager.refresh_cookies_for_url(url)
+        new_cookies_file = await asyncio.to_thread(self.cookies_manager.refresh_cookies_for_url, url)
 
         if not new_cookies_file:
             log.error("❌ 无法自动更新cookies,命令执行失败.")
@@ -415,6 +503,12 @@ class Downloader:
                     return Path(found_path)
         return None
 
+    def _output_ready(self, output_path: Path) -> bool:
+        """检查命令构建时确定的输出文件是否已生成且非空。"""
+        with span("verify"):
+            return output_path.exists() and output_path.stat().st_size > 0
+
+    @traced_span("verify")
     async def _find_and_verify_output_file(self, prefix: str, preferred_extensions: tuple) -> Optional[Path]:
         """
         主动验证并查找输出文件。
@@ -445,8 +539,10 @@ class Downloader:
             log.error(f'搜索模式失败: 未找到任何以 "{prefix}" 开头的文件。')
             return None
 
-        # 过滤掉目录和空文件
-        valid_files = [f for f in matching_files if f.is_file() and f.stat().st_size > 0]
+        # 过滤掉目录、空文件和未完成的临时文件（续传时保留的 .part/.ytdl、原生分片下载的 .native.*）
+        valid_files = [
+            f for f in matching_files if f.is_file() and not _is_partial_file(f.name) and f.stat().st_size > 0
+        ]
 
         if not valid_files:
             log.error("搜索模式失败: 找到的文件均无效 (是目录或大小为0)。")
@@ -457,12 +553,15 @@ class Downloader:
         log.debug(f"✅ 搜索模式成功: 找到最新的匹配文件: {latest_file.name}")
         return latest_file
 
+    @traced_download("download_and_merge")
+    @with_retry_budget
     async def download_and_merge(
         self,
         video_url: str,
         format_id: str = None,
         resolution: str = "",
         fallback_prefix: Optional[str] = None,
+        metadata: Optional[MetadataContext] = None,
     ) -> Optional[Path]:
         """
         下载视频和音频并合并为MP4格式.
@@ -470,7 +569,7 @@ class Downloader:
         这是协调下载流程的主函数。
         """
         self._update_progress("正在下载中", 0)
-        file_prefix = await self._prepare_download_prefix(video_url, format_id, resolution, fallback_prefix)
+        file_prefix = await self._prepare_download_prefix(video_url, format_id, resolution, fallback_prefix, metadata)
         log.info(f"开始下载并合并: {file_prefix}")
         self.download_folder.mkdir(parents=True, exist_ok=True)
 
@@ -483,12 +582,14 @@ class Downloader:
 
         # --- 备用策略 ---
         log.warning("主策略失败。将尝试备用策略。")
-        self._update_progress("切换备用策略", 35)
-        fallback_result = await self._run_fallback_strategy(video_url, file_prefix, format_id)
-        if fallback_result:
-            self._update_progress("下载完成", 100)
-            log.info(f"✅ 备用策略成功: {fallback_result.name}")
-            return fallback_result
+        if self._allow_fallback("separate_streams"):
+            DOWNLOAD_FALLBACKS.labels("separate_streams").inc()
+            self._update_progress("切换备用策略", 35)
+            fallback_result = await self._run_fallback_strategy(video_url, file_prefix, format_id)
+            if fallback_result:
+                self._update_progress("下载完成", 100)
+                log.info(f"✅ 备用策略成功: {fallback_result.name}")
+                return fallback_result
 
         # --- 最终检查与失败 ---
         log.error("主策略和备用策略均失败。")
@@ -499,14 +600,19 @@ class Downloader:
 
         raise DownloaderException("下载和合并视频失败，所有策略均已尝试。")
 
+    @traced_span("prepare")
     async def _prepare_download_prefix(
-        self, video_url: str, format_id: str, resolution: str, fallback_prefix: Optional[str]
+        self,
+        video_url: str,
+        format_id: str,
+        resolution: str,
+        fallback_prefix: Optional[str],
+        metadata: Optional[MetadataContext] = None,
     ) -> str:
         """获取视频信息并准备文件名前缀。"""
         try:
             self._update_progress("正在获取视频信息", 5)
-            video_info_gen = self.stream_playlist_info(video_url)
-            video_info = await video_info_gen.__anext__()
+            video_info = await self._get_video_info(video_url, metadata)
             video_title = video_info.get("title", "video")
             self._update_progress("正在解析格式信息", 10)
 
@@ -541,14 +647,15 @@ class Downloader:
                 "format_id": format_id,
                 "resolution": resolution,
             }
-            cmd, _, exact_output_path = self.command_builder.build_combined_download_cmd(**cmd_args)
+            with span("plan"):
+                cmd, _, exact_output_path = self.command_builder.build_combined_download_cmd(**cmd_args)
 
             self._update_progress("开始下载", 20)
             await self._download_with_progress(
                 "Download/Merge", cmd, self.command_builder.build_combined_download_cmd, video_url, cmd_args
             )
 
-            if exact_output_path.exists() and exact_output_path.stat().st_size > 0:
+            if self._output_ready(exact_output_path):
                 return exact_output_path
             log.warning("主策略执行后未找到有效的输出文件。")
             return None
@@ -560,14 +667,19 @@ class Downloader:
             return None
 
     async def _run_fallback_strategy(self, video_url: str, file_prefix: str, format_id: str) -> Optional[Path]:
-        """执行备用策略（分步下载和合并）。"""
+        """执行备用策略（优先边下边合并，失败再分步下载和合并）。"""
+        streamed_file = await self._run_streaming_merge(
+            video_url, file_prefix, format_id or "bestvideo[ext=mp4]/bestvideo", "bestaudio[ext=m4a]/bestaudio"
+        )
+        if streamed_file:
+            return streamed_file
+
         try:
-            video_file = await self._download_separate_stream("video", video_url, file_prefix, format_id)
+            video_file, audio_file = await self._download_separate_streams(video_url, file_prefix, format_id)
             if not video_file:
                 raise DownloaderException("备用策略：视频部分下载后未找到文件。")
             log.info(f"✅ 视频部分下载成功: {video_file.name}")
 
-            audio_file = await self._download_separate_stream("audio", video_url, file_prefix)
             if not audio_file:
                 log.warning("备用策略：音频部分下载后未找到文件。将尝试无音频合并。")
 
@@ -576,13 +688,87 @@ class Downloader:
             log.error(f"备用策略执行失败: {e}", exc_info=True)
             return None
 
-    async def _download_separate_stream(
+    async def _download_separate_streams(
+        self, video_url: str, file_prefix: str, format_id: Optional[str] = None
+    ) -> Tuple[Optional[Path], Optional[Path]]:
+        """
+        并发下载视频流和音频流，进度按两者字节数合并统计。
+        任一下载失败或被取消时，另一个也会被取消。
+
+        Returns:
+            (视频文件, 音频文件)，未找到的文件为None
+        """
+        self._update_progress("并发下载音视频流", 40)
+        specs = {
+            stream_type: self._separate_stream_spec(stream_type, video_url, file_prefix, format_id)
+            for stream_type in ("video", "audio")
+        }
+
+        async with _progress_semaphore:
+            with self._create_progress() as progress:
+                total_task = progress.add_task("Video+Audio", total=100)
+                part_tasks = [progress.add_task(spec[0], total=100) for spec in specs.values()]
+                downloads = [
+                    asyncio.create_task(self._download_leased_stream(builder, cmd_args, video_url, progress, part_task))
+                    for (_, builder, cmd_args, _, _), part_task in zip(specs.values(), part_tasks)
+                ]
+                helpers = [asyncio.create_task(self._aggregate_stream_progress(progress, total_task, part_tasks))]
+                if self.progress_callback:
+                    helpers.append(asyncio.create_task(self._monitor_rich_progress(progress, total_task)))
+
+                try:
+                    await asyncio.gather(*downloads)
+                except BaseException:
+                    # 一个流失败（或整体被取消）时，另一个流的下载已没有意义
+                    for download in downloads:
+                        download.cancel()
+                    await asyncio.gather(*downloads, return_exceptions=True)
+                    raise
+                finally:
+                    for helper in helpers:
+                        helper.cancel()
+                    await asyncio.gather(*helpers, return_exceptions=True)
+
+        video_file = await self._find_and_verify_output_file(specs["video"][3], specs["video"][4])
+        audio_file = await self._find_and_verify_output_file(specs["audio"][3], specs["audio"][4])
+        return video_file, audio_file
+
+    async def _download_leased_stream(
+        self, builder, cmd_args: dict, video_url: str, progress: Progress, task_id: TaskID
+    ) -> None:
+        """在全局连接预算内下载单个分流，两个分流同时运行时各自占用一份租约。"""
+        with self.transfer_tuner.lease(builder(**cmd_args)) as (leased_cmd, _):
+            await self._execute_cmd_with_auth_retry(
+                initial_cmd=leased_cmd,
+                cmd_builder_func=builder,
+                url=video_url,
+                cmd_builder_args=cmd_args,
+                progress=progress,
+                task_id=task_id,
+                monitor_progress=False,
+            )
+
+    async def _aggregate_stream_progress(self, progress: Progress, total_task: TaskID, part_tasks: List[TaskID]):
+        """把多个分流任务的字节进度汇总到总任务上。"""
+        while True:
+            parts = [progress.tasks[task_id] for task_id in part_tasks]
+            progress.update(
+                total_task,
+                completed=sum(task.completed for task in parts),
+                total=sum(task.total or 0 for task in parts) or 100,
+            )
+            # 速度和ETA以视频流（体积最大的流）为准
+            progress.tasks[total_task].fields.update(
+                {key: parts[0].fields[key] for key in ("eta_seconds", "speed") if key in parts[0].fields}
+            )
+            await asyncio.sleep(0.5)
+
+    def _separate_stream_spec(
         self, stream_type: str, video_url: str, file_prefix: str, format_id: Optional[str] = None
-    ) -> Optional[Path]:
-        """为备用策略下载单个流（视频或音频）。"""
+    ) -> tuple:
+        """返回单个分流下载的(任务描述, 命令构建函数, 构建参数, 文件搜索前缀, 首选扩展名)。"""
         if stream_type == "video":
-            self._update_progress("下载视频流", 40)
-            task_desc, builder, cmd_args, search_prefix, exts = (
+            return (
                 "Downloading Video",
                 self.command_builder.build_separate_video_download_cmd,
                 {
@@ -594,20 +780,15 @@ class Downloader:
                 f"{file_prefix}.video",
                 (".mp4", ".webm", ".mkv"),
             )
-        else:
-            self._update_progress("下载音频流", 70)
-            task_desc, builder, cmd_args, search_prefix, exts = (
-                "Downloading Audio",
-                self.command_builder.build_separate_audio_download_cmd,
-                {"output_path": str(self.download_folder), "url": video_url, "file_prefix": file_prefix},
-                f"{file_prefix}.audio",
-                (".m4a", ".mp3", ".opus", ".aac"),
-            )
-
-        cmd = builder(**cmd_args)
-        await self._download_with_progress(task_desc, cmd, builder, video_url, cmd_args)
-        return await self._find_and_verify_output_file(search_prefix, exts)
+        return (
+            "Downloading Audio",
+            self.command_builder.build_separate_audio_download_cmd,
+            {"output_path": str(self.download_folder), "url": video_url, "file_prefix": file_prefix},
+            f"{file_prefix}.audio",
+            (".m4a", ".mp3", ".opus", ".aac"),
+        )
 
+    @traced_span("postprocess")
     async def _merge_or_finalize_fallback(
         self, video_file: Path, audio_file: Optional[Path], file_prefix: str
     ) -> Optional[Path]:
@@ -618,7 +799,7 @@ class Downloader:
             self._update_progress("合并音视频", 85)
             log.info(f"🔧 正在手动合并: {video_file.name} + {audio_file.name} -> {final_path.name}")
             await self.file_processor.merge_to_mp4(video_file, audio_file, final_path)
-            if final_path.exists() and final_path.stat().st_size > 0:
+            if self._output_ready(final_path):
                 return final_path
             raise DownloaderException("备用策略：手动合并后未生成有效文件。")
         else:
@@ -627,46 +808,210 @@ class Downloader:
             video_file.rename(final_path)
             return final_path
 
+    def _has_partial_download(self, file_prefix: str) -> bool:
+        """下载目录中是否已有本次下载留下的数据：临时文件、分离流（.video/.audio、yt-dlp的 .fNNN）"""
+        for path in self.download_folder.glob(f"{glob.escape(file_prefix)}.*"):
+            rest = path.name[len(file_prefix) :]
+            if _is_partial_file(path.name) or rest.startswith((".video.", ".audio.")) or _FORMAT_STREAM.match(rest):
+                return True
+        return False
+
+    async def _run_streaming_merge(
+        self,
+        video_url: str,
+        file_prefix: str,
+        video_format: str,
+        audio_format: str,
+        info_json_path: Optional[Path] = None,
+    ) -> Optional[Path]:
+        """
+        边下载边合并视频流和音频流，输出只写一次。
+        未启用或失败时返回None，由调用方回退到落盘后合并。
+
+        输出先写入 .streaming.part 临时文件，完成后再改名，中断留下的文件不会被当作下载结果。
+        续传模式下流式合并只用于首次尝试：工作目录中已有本次下载的文件（重试或重新投递）时
+        直接使用可续传的落盘合并。
+        """
+        if not config.downloader.streaming_merge:
+            return None
+        if self.resumable and self._has_partial_download(file_prefix):
+            log.info("工作目录中已有部分下载，使用可续传的落盘合并")
+            return None
+
+        output_file = self.download_folder / f"{file_prefix}.mp4"
+        staging_file = output_file.with_name(f"{output_file.name}.streaming.part")
+        log.info(f"尝试流式合并: {video_format} + {audio_format}")
+        try:
+            async with _progress_semaphore:
+                with self._create_progress() as progress:
+                    total_task = progress.add_task("Streaming Video+Audio", total=100)
+                    video_task = progress.add_task("Streaming Video", total=100)
+                    audio_task = progress.add_task("Streaming Audio", total=100)
+                    # 与分流下载相同，进度按视频流和音频流的字节数合并统计
+                    helpers = [
+                        asyncio.create_task(
+                            self._aggregate_stream_progress(progress, total_task, [video_task, audio_task])
+                        )
+                    ]
+                    if self.progress_callback:
+                        helpers.append(asyncio.create_task(self._monitor_rich_progress(progress, total_task)))
+                    try:
+                        await self.stream_merger.merge(
+                            video_url,
+                            video_format,
+                            audio_format,
+                            staging_file,
+                            progress,
+                            video_task,
+                            audio_task,
+                            info_json_path,
+                        )
+                    finally:
+                        for helper in helpers:
+                            helper.cancel()
+                        await asyncio.gather(*helpers, return_exceptions=True)
+            staging_file.replace(output_file)
+            return output_file
+        except asyncio.CancelledError:
+            log.warning("流式合并任务被取消")
+            staging_file.unlink(missing_ok=True)
+            raise
+        except Exception as e:
+            log.warning(f"流式合并失败: {e}，回退到落盘合并")
+            DOWNLOAD_FALLBACKS.labels("streaming_merge").inc()
+            staging_file.unlink(missing_ok=True)
+            return None
+
+    async def _run_native_segments(
+        self, video_url: str, format_id: str, formats: list, cmd: list, output_file: Path
+    ) -> Optional[Path]:
+        """
+        在进程内下载HLS/DASH格式的分片，并发数与yt-dlp命令一样占用全局连接预算。
+        未启用、格式不适用或失败时返回None，由调用方回退到yt-dlp。
+        """
+        if not config.downloader.native_segment_download:
+            return None
+        fmt = next((f for f in formats if str(f.get("format_id")) == str(format_id)), None)
+        if not SegmentDownloader.supports(fmt):
+            return None
+
+        try:
+            async with _progress_semaphore:
+                with self._create_progress() as progress, self.transfer_tuner.lease(cmd) as (_, transfer):
+                    task = progress.add_task("原生分片下载", total=100)
+                    progress_monitor_task = None
+                    if self.progress_callback:
+                        progress_monitor_task = asyncio.create_task(self._monitor_rich_progress(progress, task))
+                    resumed = existing_bytes(output_file)
+                    started = time.monotonic()
+                    try:
+                        _, plan = await self.segment_downloader.download(
+                            fmt, output_file, transfer.concurrent_fragments, progress, task
+                        )
+                    finally:
+                        if progress_monitor_task:
+                            progress_monitor_task.cancel()
+                            try:
+                                await progress_monitor_task
+                            except asyncio.CancelledError:
+                                pass  # 正常取消
+                    self.transfer_tuner.record(
+                        video_url, transfer, output_file.stat().st_size - resumed, time.monotonic() - started
+                    )
+        except UnsupportedSegmentsException as e:
+            log.info(f"原生分片下载不适用: {e}，使用yt-dlp下载")
+            return None
+        except asyncio.CancelledError:
+            log.warning("原生分片下载被取消")
+            if not self.resumable:
+                SegmentDownloader.discard(output_file)
+            raise
+        except Exception as e:
+            log.warning(f"原生分片下载失败: {e}，回退到yt-dlp")
+            DOWNLOAD_FALLBACKS.labels("native_segments").inc()
+            if not self.resumable:
+                SegmentDownloader.discard(output_file)
+            return None
+
+        # 没有初始化分片的HLS是MPEG-TS，与yt-dlp一样重新封装为目标容器
+        if plan.container == "mpegts" and output_file.suffix != ".ts":
+            ts_file = output_file.with_suffix(".ts")
+            output_file.replace(ts_file)
+            try:
+                await self.file_processor.remux(ts_file, output_file)
+            except FFmpegException as e:
+                log.warning(f"{e}，回退到yt-dlp")
+                DOWNLOAD_FALLBACKS.labels("native_segments").inc()
+                ts_file.unlink(missing_ok=True)
+                output_file.unlink(missing_ok=True)
+                return None
+        return output_file if self._output_ready(output_file) else None
+
+    def _create_progress(self) -> Progress:
+        """创建统一样式的Rich下载进度条。"""
+        return Progress(
+            SpinnerColumn(spinner_name="line"),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            DownloadColumn(),
+            "•",
+            TransferSpeedColumn(),
+            console=console,
+        )
+
     async def _download_with_progress(
-        self, task_desc: str, cmd: list, cmd_builder_func, url: str, cmd_builder_args: dict
+        self,
+        task_desc: str,
+        cmd: list,
+        cmd_builder_func,
+        url: str,
+        cmd_builder_args: dict,
+        output_path: Optional[Path] = None,
     ):
-        """辅助函数，在Rich进度条上下文中运行命令。"""
+        """
+        辅助函数，在Rich进度条上下文中运行命令。
+        命令在全局连接预算内执行；提供输出路径时按下载结果记录站点吞吐，用于调整之后的分片并发数。
+        """
         async with _progress_semaphore:
-            with Progress(
-                SpinnerColumn(spinner_name="line"),
-                TextColumn("[progress.description]{task.description}"),
-                BarColumn(),
-                DownloadColumn(),
-                "•",
-                TransferSpeedColumn(),
-                console=console,
-            ) as progress:
+            with self._create_progress() as progress, self.transfer_tuner.lease(cmd) as (leased_cmd, transfer):
                 task = progress.add_task(task_desc, total=100)
+                resumed = existing_bytes(output_path) if output_path else 0
+                started = time.monotonic()
                 await self._execute_cmd_with_auth_retry(
-                    initial_cmd=cmd,
+                    initial_cmd=leased_cmd,
                     cmd_builder_func=cmd_builder_func,
                     url=url,
                     cmd_builder_args=cmd_builder_args,
                     progress=progress,
                     task_id=task,
                 )
+                if output_path and self._output_ready(output_path):
+                    self.transfer_tuner.record(
+                        url, transfer, output_path.stat().st_size - resumed, time.monotonic() - started
+                    )
 
+    @traced_download("download_with_smart_strategy")
+    @with_retry_budget
     async def download_with_smart_strategy(
         self,
         video_url: str,
         format_id: str = None,
         resolution: str = "",
         fallback_prefix: Optional[str] = None,
+        metadata: Optional[MetadataContext] = None,
     ) -> Optional[Path]:
         """
         使用智能策略下载视频，自动判断完整流vs分离流。
         这是一个协调函数，负责准备、执行和处理下载降级。
+        提供元数据上下文时复用其中已提取的信息和info.json，不再重新调用提取器。
         """
         # 1. 准备下载所需信息
-        preparation_result = await self._prepare_smart_download(video_url, format_id, resolution, fallback_prefix)
+        preparation_result = await self._prepare_smart_download(
+            video_url, format_id, resolution, fallback_prefix, metadata
+        )
         if not preparation_result:
             log.warning("无法获取格式列表，降级到传统下载方法")
-            return await self.download_and_merge(video_url, format_id, resolution, fallback_prefix)
+            return await self._fallback_to_legacy(video_url, format_id, resolution, fallback_prefix, metadata)
 
         file_prefix, formats = preparation_result
         log.info(f"智能下载开始: {file_prefix}")
@@ -674,26 +1019,53 @@ class Downloader:
 
         # 2. 执行智能下载，并在失败时降级
         try:
-            result_path = await self._execute_smart_download(video_url, file_prefix, formats, format_id, resolution)
+            info_json_path = metadata.info_json_path if metadata else None
+            result_path = await self._execute_smart_download(
+                video_url, file_prefix, formats, format_id, resolution, info_json_path
+            )
             if result_path:
                 return result_path
             else:
                 log.warning("智能下载执行后未找到有效的输出文件，尝试传统方法")
-                return await self.download_and_merge(video_url, format_id, resolution, file_prefix)
+                return await self._fallback_to_legacy(video_url, format_id, resolution, file_prefix, metadata)
         except asyncio.CancelledError:
             log.warning("智能下载任务被取消")
             raise
         except Exception as e:
             log.warning(f"智能下载失败: {e}，降级到传统方法")
-            return await self.download_and_merge(video_url, format_id, resolution, file_prefix)
+            return await self._fallback_to_legacy(video_url, format_id, resolution, file_prefix, metadata)
+
+    def _allow_fallback(self, stage: str) -> bool:
+        """降级到备用策略前检查任务的重试预算。"""
+        budget = current_budget()
+        return budget is None or budget.allow_fallback(stage)
+
+    async def _fallback_to_legacy(
+        self,
+        video_url: str,
+        format_id: Optional[str],
+        resolution: str,
+        file_prefix: Optional[str],
+        metadata: Optional[MetadataContext],
+    ) -> Optional[Path]:
+        """智能下载失败时降级到传统的主/备策略下载。"""
+        if not self._allow_fallback("legacy"):
+            raise DownloaderException("智能下载失败，重试预算已用尽，不再降级到传统方法。")
+        DOWNLOAD_FALLBACKS.labels("legacy").inc()
+        return await self.download_and_merge(video_url, format_id, resolution, file_prefix, metadata)
 
+    @traced_span("prepare")
     async def _prepare_smart_download(
-        self, video_url: str, format_id: str, resolution: str, fallback_prefix: Optional[str]
+        self,
+        video_url: str,
+        format_id: str,
+        resolution: str,
+        fallback_prefix: Optional[str],
+        metadata: Optional[MetadataContext] = None,
     ) -> Optional[tuple]:
         """获取视频信息，准备文件前缀和格式列表。如果失败则返回None。"""
         try:
-            video_info_gen = self.stream_playlist_info(video_url)
-            video_info = await video_info_gen.__anext__()
+            video_info = await self._get_video_info(video_url, metadata)
             video_title = video_info.get("title", "video")
             formats = video_info.get("formats", [])
             if not formats:
@@ -719,7 +1091,13 @@ class Downloader:
             return None
 
     async def _execute_smart_download(
-        self, video_url: str, file_prefix: str, formats: list, format_id: str, resolution: str
+        self,
+        video_url: str,
+        file_prefix: str,
+        formats: list,
+        format_id: str,
+        resolution: str,
+        info_json_path: Optional[Path] = None,
     ) -> Optional[Path]:
         """执行智能下载的核心逻辑。"""
         cmd_builder_args = {
@@ -729,20 +1107,51 @@ class Downloader:
             "formats": formats,
             "format_id": format_id,
             "resolution": resolution,
+            "info_json_path": info_json_path,
         }
-        cmd, _, exact_output_path, strategy = self.command_builder.build_smart_download_cmd(**cmd_builder_args)
+        with span("plan") as plan_span:
+            cmd, selected_format, exact_output_path, strategy = self.command_builder.build_smart_download_cmd(
+                **cmd_builder_args
+            )
+            plan_span.attributes.update({"strategy": strategy.value, "format": selected_format})
+        DOWNLOAD_STRATEGY.labels(strategy.value).inc()
+
+        # 分离流优先走流式合并，省去yt-dlp落盘后再合并的额外读写
+        if strategy == DownloadStrategy.MERGE and "+" in selected_format:
+            video_format, audio_format = selected_format.split("+", 1)
+            streamed_file = await self._run_streaming_merge(
+                video_url, file_prefix, video_format, audio_format, info_json_path
+            )
+            if streamed_file:
+                log.info(f"✅ 智能下载成功(流式合并): {streamed_file.name}")
+                return streamed_file
+
+        # HLS/DASH完整流可在进程内直接下载分片，复用连接池
+        if strategy == DownloadStrategy.DIRECT:
+            native_file = await self._run_native_segments(video_url, selected_format, formats, cmd, exact_output_path)
+            if native_file:
+                log.info(f"✅ 智能下载成功(原生分片): {native_file.name}")
+                return native_file
+
         progress_desc = "智能下载(完整流)" if strategy == DownloadStrategy.DIRECT else "智能下载(合并流)"
 
         await self._download_with_progress(
-            progress_desc, cmd, self.command_builder.build_smart_download_cmd, video_url, cmd_builder_args
+            progress_desc,
+            cmd,
+            self.command_builder.build_smart_download_cmd,
+            video_url,
+            cmd_builder_args,
+            exact_output_path,
         )
 
-        if exact_output_path.exists() and exact_output_path.stat().st_size > 0:
+        if self._output_ready(exact_output_path):
             strategy_name = "完整流直下" if strategy == DownloadStrategy.DIRECT else "分离流合并"
             log.info(f"✅ 智能下载成功({strategy_name}): {exact_output_path.name}")
             return exact_output_path
         return None
 
+    @traced_download("download_audio")
+    @with_retry_budget
     async def download_audio(
         self,
         video_url: str,
@@ -773,12 +1182,14 @@ class Downloader:
             log.error(f"音频下载失败: {e}", exc_info=True)
             raise DownloaderException(f"音频下载失败: {e}") from e
 
+    @traced_span("prepare")
     async def _prepare_audio_download(self, video_url: str, fallback_prefix: Optional[str]) -> str:
         """获取视频信息并准备音频文件名前缀。"""
         try:
             self._update_progress("获取视频信息", 5)
-            video_info_gen = self.stream_playlist_info(video_url)
-            video_info = await video_info_gen.__anext__()
+            with timed(EXTRACTION_SECONDS, url_domain(video_url)), span("extract"):
+                video_info_gen = self.stream_playlist_info(video_url)
+                video_info = await video_info_gen.__anext__()
             video_title = video_info.get("title", "audio")
             self._update_progress("解析音频格式", 10)
         except (StopAsyncIteration, DownloaderException) as e:
@@ -798,13 +1209,14 @@ class Downloader:
         self._update_progress("开始音频下载", 20)
 
         cmd_args = {"url": video_url, "output_template": str(exact_output_path), "audio_format": audio_format}
-        cmd = self.command_builder.build_audio_download_cmd(**cmd_args)
+        with span("plan"):
+            cmd = self.command_builder.build_audio_download_cmd(**cmd_args)
 
         await self._download_with_progress(
             "Audio Download", cmd, self.command_builder.build_audio_download_cmd, video_url, cmd_args
         )
 
-        if exact_output_path.exists() and exact_output_path.stat().st_size > 0:
+        if self._output_ready(exact_output_path):
             self._update_progress("下载完成", 100)
             return exact_output_path
         raise DownloaderException(f"音频转换失败，预期的输出文件 '{exact_output_path}' 未找到或为空。")
@@ -816,7 +1228,8 @@ class Downloader:
 
         output_template = self.download_folder / f"{file_prefix}.%(ext)s"
         cmd_args = {"url": video_url, "output_template": str(output_template), "audio_format": audio_format}
-        cmd = self.command_builder.build_audio_download_cmd(**cmd_args)
+        with span("plan"):
+            cmd = self.command_builder.build_audio_download_cmd(**cmd_args)
 
         await self._download_with_progress(
             "Audio Stream", cmd, self.command_builder.build_audio_download_cmd, video_url, cmd_args
@@ -831,9 +1244,14 @@ class Downloader:
             return output_file
         raise DownloaderException("音频下载后未找到文件，所有策略均失败。")
 
+    async def cleanup_temp_files(self, file_prefix: str) -> None:
+        """清理下载目录中指定前缀的临时文件。"""
+        await self.file_processor.cleanup_temp_files(str(self.download_folder / file_prefix))
+
     async def cleanup(self):
         """
         清理所有正在运行的子进程.
         """
         await self.subprocess_manager.cleanup_all_processes()
+        await self.segment_downloader.aclose()
         log.info("下载器清理完成")
@@ -5,8 +5,10 @@
 """
 
 import argparse
+import asyncio
+import json
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 
 import aiofiles
 import aiofiles.os as aos
@@ -15,6 +17,7 @@ from core import (
     DownloaderException,
     FFmpegException,
     MaxRetriesExceededException,
+    MetadataContext,
     NonRecoverableErrorException,
 )
 from downloader import Downloader
@@ -56,44 +59,47 @@ async def process_local_file(sub_proc: SubtitleProcessor, file_path: str) -> Non
         log.error(f"处理本地文件 {media_path.name} 时发生未知错误: {e}", exc_info=True)
 
 
-async def save_info(folder: Path, prefix: str, url: str, dlr) -> None:
+async def _fetch_info(url: str, dlr) -> Optional[Dict[str, Any]]:
+    """单独调用yt-dlp获取视频信息（没有元数据上下文时的回退路径）。"""
+    info_cmd = [
+        "yt-dlp",
+        "--ignore-config",
+        "--no-warnings",
+        "--no-color",
+        "--dump-json",
+        "--no-download",
+    ]
+    if dlr.cookies_file:
+        info_cmd.extend(["--cookies", dlr.cookies_file])
+    info_cmd.extend(dlr.command_builder.profile_args(url))
+    info_cmd.append(url)
+
+    process = await asyncio.create_subprocess_exec(
+        *info_cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode == 0 and stdout:
+        return json.loads(stdout.decode())
+    return None
+
+
+async def save_info(folder: Path, prefix: str, url: str, dlr, metadata: Optional[MetadataContext] = None) -> None:
     """保存视频信息为文本文件。
 
-    直接从yt-dlp获取视频信息并生成可读的.txt文件，不依赖.info.json。
+    优先使用元数据上下文中已提取的信息；没有时才直接从yt-dlp获取，
+    生成可读的.txt文件，不依赖.info.json。
 
     Args:
         folder (Path): 保存文件夹路径。
         prefix (str): 文件前缀。
         url (str): 视频URL。
         dlr: 下载器实例。
+        metadata (Optional[MetadataContext]): 已提取的元数据上下文。
     """
     try:
-        # 构建获取信息的命令
-        info_cmd = [
-            "yt-dlp",
-            "--ignore-config",
-            "--no-warnings",
-            "--no-color",
-            "--dump-json",
-            "--no-download",
-        ]
-        if dlr.cookies_file:
-            info_cmd.extend(["--cookies", dlr.cookies_file])
-        info_cmd.append(url)
-
-        # 执行命令获取信息
-        import asyncio
-
-        process = await asyncio.create_subprocess_exec(
-            *info_cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-
-        if process.returncode == 0 and stdout:
-            import json
-
-            info = json.loads(stdout.decode())
+        info = metadata.info if metadata and metadata.has_info else await _fetch_info(url, dlr)
 
+        if info:
             # 生成.txt文件
             txt_path = folder / f"{prefix}.txt"
             async with aiofiles.open(txt_path, "w", encoding="utf-8") as f:
@@ -120,22 +126,30 @@ async def save_info(folder: Path, prefix: str, url: str, dlr) -> None:
         log.error(f"生成信息文件失败 '{prefix}': {e}", exc_info=True)
 
 
-async def process_metadata_phase(dlr: Downloader, url: str, prefix: str) -> None:
+async def process_metadata_phase(
+    dlr: Downloader, url: str, prefix: str, metadata: Optional[MetadataContext] = None
+) -> Optional[MetadataContext]:
     """处理元数据阶段。
 
-    下载视频元数据并生成信息文件。
+    下载视频元数据并生成信息文件。元数据上下文在此阶段写出info.json，
+    之后的信息文件和下载阶段都直接复用，不再重新提取。
 
     Args:
         dlr (Downloader): 下载器实例。
         url (str): 视频URL。
         prefix (str): 文件前缀。
+        metadata (Optional[MetadataContext]): 收集阶段已提取的元数据上下文。
+
+    Returns:
+        Optional[MetadataContext]: 供下载阶段复用的元数据上下文。
 
     Raises:
         Exception: 当元数据处理失败时。
     """
     try:
-        await dlr.download_metadata(url, prefix)
-        await save_info(dlr.download_folder, prefix, url, dlr)
+        metadata = await dlr.download_metadata(url, prefix, metadata) or metadata
+        await save_info(dlr.download_folder, prefix, url, dlr, metadata)
+        return metadata
     except (DownloaderException, IOError, OSError) as e:
         log.error(f"元数据处理阶段失败 '{prefix}': {e}")
         raise
@@ -150,6 +164,7 @@ async def process_download_phase(
     url: str,
     prefix: str,
     args: argparse.Namespace,
+    metadata: Optional[MetadataContext] = None,
 ) -> None:
     """处理下载阶段。
 
@@ -161,6 +176,7 @@ async def process_download_phase(
         url (str): 视频URL。
         prefix (str): 文件前缀。
         args (argparse.Namespace): 命令行参数。
+        metadata (Optional[MetadataContext]): 元数据上下文，下载时复用其info.json。
     """
     try:
         vid_path = None
@@ -171,10 +187,10 @@ async def process_download_phase(
             console.print(f"🎬 正在准备智能下载: {prefix}", style="bold blue")
             try:
                 # 尝试使用智能下载策略
-                vid_path = await dlr.download_with_smart_strategy(url, prefix)
+                vid_path = await dlr.download_with_smart_strategy(url, fallback_prefix=prefix, metadata=metadata)
             except Exception as e:
                 console.print(f"⚠️  智能下载失败，使用传统方法: {e}", style="yellow")
-                vid_path = await dlr.download_and_merge(url, prefix)
+                vid_path = await dlr.download_and_merge(url, fallback_prefix=prefix)
 
         # 处理纯音频下载
         if args.mode == "audio":
@@ -206,6 +222,8 @@ async def process_download_phase(
     except DownloaderException as e:
         log.error(f"❌ 处理项目 '{prefix}' 时发生未知下载错误: {e}")
     finally:
+        if metadata:
+            metadata.cleanup()
         await dlr.cleanup_temp_files(prefix)
 
 
@@ -230,7 +248,7 @@ async def process_item(
     log.info(f"▶️ (项目) 开始处理: {prefix}")
 
     # 元数据阶段
-    await process_metadata_phase(dlr, url, prefix)
+    metadata = await process_metadata_phase(dlr, url, prefix)
 
     # 下载阶段
-    await process_download_phase(dlr, sub_proc, url, prefix, args)
+    await process_download_phase(dlr, sub_proc, url, prefix, args, metadata)
@@ -14,6 +14,7 @@ from typing import List, Optional, Tuple
 from rich.console import Console
 
 from config_manager import config, config_manager
+from core import MetadataContext
 from downloader import Downloader
 from handlers import process_download_phase, process_local_file, process_metadata_phase
 from subtitles import SubtitleProcessor
@@ -140,9 +141,7 @@ def handle_cache_cookies(cookies_config, inputs: List[str], browser_type: str) -
     Returns:
         Optional[str]: cookies文件路径，如果成功则返回路径，否则返回None。
     """
-    cache_cookies_path = Path(cookies_config.cache_file)
-
-    if not (cookies_config.cache_enabled and cache_cookies_path.exists()):
+    if not (cookies_config.cache_enabled and inputs):
         return None
 
     try:
@@ -154,19 +153,25 @@ def handle_cache_cookies(cookies_config, inputs: List[str], browser_type: str) -
             cache_duration_hours=cookies_config.cache_duration_hours,
         )
 
-        if extractor._is_cache_valid():
-            cookies = str(cache_cookies_path.resolve())
+        # 缓存按域名保存，浏览器cookies数据库变化后自动失效
+        domain = extractor.get_domain_from_url(inputs[0])
+        cache_cookies_path = extractor.domain_cache_file(domain)
+        if not cache_cookies_path.exists():
+            return None
+
+        cached = extractor.get_cached_cookies(domain)
+        if cached:
+            cookies = str(Path(cached).resolve())
             console.print(f"🍪 使用有效的cookies缓存: {cookies}", style="green")
             return cookies
         else:
-            console.print("⚠️ cookies缓存已过期，尝试自动获取新cookies...", style="yellow")
-            if cookies_config.auto_extract_enabled and inputs:
-                first_url = inputs[0]
-                return try_auto_extract_cookies(first_url, browser_type, cookies_config)
+            console.print("⚠️ 浏览器cookies已变化，缓存失效，尝试自动获取新cookies...", style="yellow")
+            if cookies_config.auto_extract_enabled:
+                return try_auto_extract_cookies(inputs[0], browser_type, cookies_config)
             return None
     except ImportError as e:
-        console.print(f"⚠️ 自动cookies模块不可用，使用现有缓存文件: {e}", style="yellow")
-        return str(cache_cookies_path.resolve())
+        console.print(f"⚠️ 自动cookies模块不可用，请手动放置cookies.txt文件: {e}", style="yellow")
+        return None
     except Exception as e:
         console.print(f"⚠️ 检查cookies缓存时发生未知错误: {e}", style="yellow")
         return None
@@ -268,12 +273,15 @@ def process_x_com_urls(current_url_tasks: List[tuple], video_count: int, url: st
 async def collect_task_metadata(downloader: Downloader, inputs: List[str]) -> List[tuple]:
     """收集所有任务的元数据。
 
+    每个URL只调用一次提取器，提取结果封装为MetadataContext，
+    供元数据、信息文件和下载各阶段复用。
+
     Args:
         downloader (Downloader): 下载器实例。
         inputs (List[str]): 输入URL列表。
 
     Returns:
-        List[tuple]: 任务元数据列表。
+        List[tuple]: 任务元数据列表，每项为 (url, prefix, MetadataContext)。
     """
     task_metadata = []
     i = 0
@@ -298,7 +306,7 @@ async def collect_task_metadata(downloader: Downloader, inputs: List[str]) -> Li
             else:
                 prefix = f"{i:03d}_{sanitize(title)}"
 
-            current_url_tasks.append((url, prefix, meta))
+            current_url_tasks.append((url, prefix, MetadataContext(meta.get("url", url), meta)))
 
         # 处理X.com多视频链接情况
         processed_tasks = process_x_com_urls(current_url_tasks, video_count, url)
@@ -307,7 +315,7 @@ async def collect_task_metadata(downloader: Downloader, inputs: List[str]) -> Li
         if video_count == 0:  # Handle single video URL
             i += 1
             prefix = f"001_{sanitize('单项下载')}"
-            task_metadata.append((url, prefix, {"url": url}))
+            task_metadata.append((url, prefix, MetadataContext(url)))
 
     return task_metadata
 
@@ -353,14 +361,14 @@ async def process_download_tasks(
 
     # 阶段1：并发处理所有元数据
     metadata_tasks = []
-    for url, prefix, meta in task_metadata:
-        metadata_tasks.append(process_metadata_phase(downloader, meta.get("url", url), prefix))
+    for url, prefix, metadata in task_metadata:
+        metadata_tasks.append(process_metadata_phase(downloader, metadata.url, prefix, metadata))
 
     await asyncio.gather(*metadata_tasks)
 
     # 阶段2：顺序处理所有下载任务
-    for url, prefix, meta in task_metadata:
-        await process_download_phase(downloader, sub_processor, meta.get("url", url), prefix, args)
+    for url, prefix, metadata in task_metadata:
+        await process_download_phase(downloader, sub_processor, metadata.url, prefix, args, metadata)
 
 
 async def main() -> None:
@@ -10,8 +10,10 @@ Celery Worker和Beat启动脚本（带Redis连接检查）
 
 import logging
 import os
+import shutil
 import subprocess
 import sys
+import tempfile
 import threading
 import time
 from pathlib import Path
@@ -64,11 +66,20 @@ def start_celery_worker():
         "--pool=prefork",
     ]
 
+    # prefork子进程各自记录Prometheus指标，由主进程的导出服务汇总；每次启动清空旧数据
+    env = os.environ.copy()
+    metrics_dir = Path(
+        env.setdefault("PROMETHEUS_MULTIPROC_DIR", str(Path(tempfile.gettempdir()) / "smartdownloader-metrics"))
+    )
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+
     try:
         # 启动worker进程
         process = subprocess.Popen(
             cmd,
             cwd=project_root,
+            env=env,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             universal_newlines=True,
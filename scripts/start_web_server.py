@@ -1,56 +1,57 @@
 #!/usr/bin/env python3
 """
-Web服务器启动脚本 (简化版)
+Web服务器启动脚本
+
+用法:
+    python start_web_server.py                  # 开发模式：单进程，修改代码后自动重载
+    python start_web_server.py --workers 4      # 生产模式：4个工作进程共享同一端口
+    python start_web_server.py --restart        # 滚动重启正在运行的多进程服务
+
+工作进程数默认取 web.workers。多个工作进程时视频信息缓存和子进程登记通过Redis共享（web.shared_state），
+取消下载会通知所有工作进程。滚动重启逐个替换工作进程：新进程就绪后，旧进程停止接受连接，
+等待进行中的流式下载结束（最多 web.drain_timeout_seconds 秒）后退出。
 """
 
+import argparse
 import os
+import shutil
 import signal
 import subprocess
 import sys
+import tempfile
 from pathlib import Path
 
-# 全局变量来持有子进程
-uvicorn_process = None
-
-
-def signal_handler(sig, frame):
-    """
-    捕获 Ctrl+C 信号并优雅地终止子进程
-    """
-    global uvicorn_process
-    print("\n🛑 检测到 Ctrl+C, 正在停止服务器...")
-    if uvicorn_process:
-        # 终止整个进程组，以确保 reloader 也被关闭
-        os.killpg(os.getpgid(uvicorn_process.pid), signal.SIGTERM)
-    sys.exit(0)
-
+import psutil
 
-if __name__ == "__main__":
-    # 确保在项目根目录运行，以便Uvicorn能找到 'web.main:app'
-    project_root = Path(__file__).parent
-    os.chdir(project_root)
+from config_manager import config
 
-    print("🚀 启动SmartDownloader Web服务器 (开发模式)...")
-    print("   - 访问地址: http://0.0.0.0:8000")
-    print("   - 按 Ctrl+C 停止服务器")
+# 全局变量来持有子进程
+uvicorn_process = None
 
-    # 注册信号处理器
-    signal.signal(signal.SIGINT, signal_handler)
 
-    # 构建 uvicorn 命令
+def build_command(workers: int, host: str, port: int) -> list:
+    """构建 uvicorn 命令，单进程时启用自动重载"""
     command = [
         sys.executable,  # 使用当前Python解释器
         "-m",
         "uvicorn",
         "web.main:app",
         "--host",
-        "0.0.0.0",
+        host,
         "--port",
-        "8000",
-        "--reload",
+        str(port),
         "--log-level",
         "warning",  # 改为warning级别，减少冗余日志
         "--no-access-log",  # 禁用访问日志
+        # 停止或重启时等待进行中的流式下载结束，超时后中断并回收yt-dlp子进程
+        "--timeout-graceful-shutdown",
+        str(config.web.drain_timeout_seconds),
+    ]
+    if workers > 1:
+        # --reload 与 --workers 不能同时使用
+        return command + ["--workers", str(workers)]
+    return command + [
+        "--reload",
         "--reload-dir",
         "web",
         "--reload-dir",
@@ -65,9 +66,95 @@ if __name__ == "__main__":
         "tests/*",
     ]
 
+
+def find_supervisors() -> list:
+    """查找多进程模式下的 uvicorn 主进程（管理工作进程的那个）"""
+    supervisors = []
+    for proc in psutil.process_iter(["pid", "cmdline"]):
+        try:
+            cmdline = proc.info["cmdline"] or []
+            if "uvicorn" in cmdline and "web.main:app" in cmdline and "--workers" in cmdline:
+                supervisors.append(proc)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            continue
+    return supervisors
+
+
+def rolling_restart() -> int:
+    """通知 uvicorn 主进程逐个替换工作进程"""
+    if sys.platform == "win32":
+        print("❌ Windows 不支持滚动重启，请停止后重新启动")
+        return 1
+    supervisors = find_supervisors()
+    if not supervisors:
+        print("❌ 未找到多进程模式运行的Web服务器（单进程模式修改代码后会自动重载）")
+        return 1
+    for proc in supervisors:
+        proc.send_signal(signal.SIGHUP)
+        print(f"🔄 已通知 uvicorn 主进程 {proc.pid} 滚动重启工作进程")
+    print(f"   旧工作进程最多等待 {config.web.drain_timeout_seconds} 秒让进行中的流式下载结束")
+    return 0
+
+
+def signal_handler(sig, frame):
+    """
+    捕获 Ctrl+C 信号并优雅地终止子进程
+    """
+    global uvicorn_process
+    print("\n🛑 检测到 Ctrl+C, 正在停止服务器（等待进行中的流式下载结束）...")
+    if uvicorn_process:
+        # 终止整个进程组，以确保 reloader 也被关闭
+        os.killpg(os.getpgid(uvicorn_process.pid), signal.SIGTERM)
+        uvicorn_process.wait()
+    sys.exit(0)
+
+
+def forward_hup(sig, frame):
+    """把 SIGHUP 转给 uvicorn 主进程，触发滚动重启"""
+    if uvicorn_process:
+        os.kill(uvicorn_process.pid, signal.SIGHUP)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SmartDownloader Web服务器")
+    parser.add_argument("--workers", type=int, default=config.web.workers, help="工作进程数，大于1时不启用自动重载")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--restart", action="store_true", help="滚动重启正在运行的多进程服务后退出")
+    args = parser.parse_args()
+
+    if args.restart:
+        sys.exit(rolling_restart())
+
+    # 确保在项目根目录运行，以便Uvicorn能找到 'web.main:app'
+    project_root = Path(__file__).parent
+    os.chdir(project_root)
+
+    env = os.environ.copy()
+    if args.workers > 1:
+        print(f"🚀 启动SmartDownloader Web服务器 (生产模式, {args.workers} 个工作进程)...")
+        # 各工作进程分别记录Prometheus指标，/metrics 汇总；每次启动清空旧数据
+        metrics_dir = Path(
+            env.setdefault("PROMETHEUS_MULTIPROC_DIR", str(Path(tempfile.gettempdir()) / "smartdownloader-web-metrics"))
+        )
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        if not config.web.shared_state:
+            print("   ⚠️ web.shared_state 已关闭，缓存和取消下载只作用于收到请求的工作进程")
+    else:
+        print("🚀 启动SmartDownloader Web服务器 (开发模式)...")
+    print(f"   - 访问地址: http://{args.host}:{args.port}")
+    print("   - 按 Ctrl+C 停止服务器")
+
+    # 注册信号处理器
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, forward_hup)
+
     # 使用 subprocess.Popen 启动 uvicorn
     # preexec_fn=os.setsid 使得 uvicorn 成为新会话的领导者，便于我们终止整个进程组
-    uvicorn_process = subprocess.Popen(command, preexec_fn=os.setsid)
+    uvicorn_process = subprocess.Popen(build_command(args.workers, args.host, args.port), env=env, preexec_fn=os.setsid)
 
     # 等待子进程结束
     uvicorn_process.wait()
@@ -2082,7 +2082,9 @@ function pollTaskStatus(taskId, optionElement) {
                 download_type: currentVideoData.download_type,
                 format_id: formatId,
                 resolution: resolution,
-                title: currentVideoData.title || 'download'
+                title: currentVideoData.title || 'download',
+                // 所选格式的预估大小，后端据此预留存储空间
+                filesize: optionElement.dataset.filesize ? Number(optionElement.dataset.filesize) : null
             }),
         })
         .then(response => {
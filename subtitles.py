@@ -1,19 +1,25 @@
 # subtitles.py
 import asyncio
 import logging
-import re
 import sys
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-import aiofiles
 from rich.console import Console
 
 from config_manager import config
+from core import ChunkedTranscriber
+from core.rate_limiter import TokenBucket
+from core.srt import Cue, iter_srt_file, write_srt
+from core.transcription import parse_whisper_output
+from core.translation_memory import TranslationMemory
 
 log = logging.getLogger(__name__)
 console = Console(file=sys.stdout)
 
+# 翻译记忆等相对路径的基准目录
+_PROJECT_DIR = Path(__file__).resolve().parent
+
 try:
     from deep_translator import BaiduTranslator, GoogleTranslator, MyMemoryTranslator
 
@@ -78,6 +84,7 @@ class TranscriptionProcessor:
         self.whisper_model = config.ai_subtitles.whisper_model
         self.source_language = config.ai_subtitles.source_language
         self.whisper_model_path = config.ai_subtitles.whisper_model_path
+        self.chunk_seconds = config.ai_subtitles.transcription_chunk_seconds
 
     async def transcribe_audio(self, audio_path: Path, output_folder: Path) -> Optional[Path]:
         """使用Whisper转录音频文件"""
@@ -91,6 +98,12 @@ class TranscriptionProcessor:
             log.error(f"模型文件未找到: {model_path}")
             return None
 
+        if self._should_chunk(audio_path):
+            return await self._transcribe_in_chunks(audio_path, model_path, final_srt_path)
+        return await self._transcribe_single_pass(audio_path, model_path, final_srt_path)
+
+    async def _transcribe_single_pass(self, audio_path: Path, model_path: Path, final_srt_path: Path) -> Optional[Path]:
+        """整段转录，由一个whisper-cli进程处理整个音频"""
         cmd = [
             "whisper-cli",
             "-m",
@@ -121,6 +134,26 @@ class TranscriptionProcessor:
         console.print(f"✅ 英文字幕已生成: {final_srt_path.name}", style="bold green")
         return final_srt_path
 
+    def _should_chunk(self, audio_path: Path) -> bool:
+        """分段转录需要直接读取PCM数据，仅对WAV启用"""
+        return self.chunk_seconds > 0 and audio_path.suffix.lower() == ".wav"
+
+    async def _transcribe_in_chunks(self, audio_path: Path, model_path: Path, srt_path: Path) -> Optional[Path]:
+        """按静音切分并行转录，边转录边写入SRT"""
+        try:
+            cue_count = await ChunkedTranscriber().transcribe(audio_path, model_path, self.source_language, srt_path)
+        except Exception as e:
+            # 如非16位PCM的WAV无法切分，改用整段转录
+            log.warning(f"分段转录失败，改为整段转录: {e}")
+            return await self._transcribe_single_pass(audio_path, model_path, srt_path)
+
+        if cue_count == 0:
+            log.error("Whisper转录输出为空。")
+            return None
+
+        console.print(f"✅ 英文字幕已生成: {srt_path.name} ({cue_count} 条)", style="bold green")
+        return srt_path
+
     def _get_model_path(self) -> Optional[Path]:
         """获取Whisper模型路径"""
         model_filename = f"ggml-{self.whisper_model}.bin"
@@ -132,28 +165,52 @@ class TranscriptionProcessor:
 
     async def _write_srt_file(self, raw_output: str, srt_path: Path) -> None:
         """将Whisper输出写入SRT文件"""
-        async with aiofiles.open(srt_path, "w", encoding="utf-8") as f:
-            for i, m in enumerate(re.finditer(r"\[(.*?)\]\s+(.*)", raw_output), 1):
-                times, text = m.groups()
-                start, end = [t.strip().replace(".", ",") for t in times.split("-->")]
-                await f.write(f"{i}\n{start} --> {end}\n{text}\n\n")
+        await asyncio.to_thread(write_srt, srt_path, parse_whisper_output(raw_output))
+
+
+class OfflineTranslator:
+    """
+    离线翻译器（translator_service: offline）。
+    不访问网络，原文加上前缀作为译文返回。用于没有网络或不需要真实翻译时跑通转录、合并字幕的完整流程。
+    """
+
+    def __init__(self, prefix: str = "[zh] "):
+        self.prefix = prefix
+
+    def translate_batch(self, batch: List[str]) -> List[str]:
+        return [f"{self.prefix}{text}" for text in batch]
 
 
 class TranslationProcessor:
     """专门处理文本翻译的处理器"""
 
+    source_lang = "en"
+    target_lang = "zh-CN"
+
     def __init__(self, proxy: Optional[str] = None):
-        self.translate_to_chinese = config.ai_subtitles.translate_to_chinese
+        ai_config = config.ai_subtitles
+        self.translate_to_chinese = ai_config.translate_to_chinese
         self.translator = None
         self.fallback_translators = []
+        self.service_name = ai_config.translator_service.lower()
+        self.rate_limiter = TokenBucket(ai_config.translation_rate_per_second, ai_config.translation_burst)
+        # 翻译记忆（SQLite）在实际翻译时才打开，一次翻译结束后关闭；
+        # 相对路径按项目目录解析，不随CLI或Celery worker的启动目录变化
+        self.memory_path = ai_config.translation_memory_path
+        if self.memory_path and not Path(self.memory_path).is_absolute():
+            self.memory_path = str(_PROJECT_DIR / self.memory_path)
+        self.memory: Optional[TranslationMemory] = None
 
         if self.translate_to_chinese:
-            translator_service = config.ai_subtitles.translator_service.lower()
+            translator_service = self.service_name
             proxy_config = {"http": proxy, "https": proxy} if proxy else None
 
             # 设置主翻译器
             try:
-                if translator_service == "google":
+                if translator_service == "offline":
+                    self.translator = OfflineTranslator()
+                    return
+                elif translator_service == "google":
                     self.translator = GoogleTranslator(source="en", target="zh-CN", proxies=proxy_config)
                 elif translator_service == "mymemory":
                     self.translator = MyMemoryTranslator(source="en", target="zh-CN")
@@ -189,6 +246,16 @@ class TranslationProcessor:
 
     async def translate_subtitle(self, srt_path_in: Path) -> Optional[Path]:
         """翻译字幕文件"""
+        result = await self.translate_subtitle_cues(srt_path_in)
+        return result[0] if result else None
+
+    async def translate_subtitle_cues(self, srt_path_in: Path) -> Optional[Tuple[Path, List[Cue], List[Cue]]]:
+        """
+        翻译字幕文件，并返回解析好的原文和译文字幕，供后续合并直接复用而无需重新解析。
+
+        Returns:
+            (中文字幕路径, 原文字幕, 译文字幕)，失败返回None
+        """
         if not self.translate_to_chinese or not self.translator:
             return None
 
@@ -200,8 +267,8 @@ class TranslationProcessor:
             return None
 
         try:
-            content = await self._read_srt_file(srt_path_in)
-            text_blocks = self._extract_text_blocks(content)
+            cues = await self._read_srt_file(srt_path_in)
+            text_blocks = self._extract_text_blocks(cues)
 
             if not text_blocks:
                 log.warning(f"没有可翻译的文本块在 {srt_path_in.name} 中。")
@@ -212,46 +279,98 @@ class TranslationProcessor:
             if not translated_blocks:
                 return None
 
-            await self._write_translated_srt(content, translated_blocks, srt_path_out)
+            translated_cues = await self._write_translated_srt(cues, translated_blocks, srt_path_out)
             console.print(f"✅ 中文字幕已生成: {srt_path_out.name}", style="bold green")
-            return srt_path_out
+            return srt_path_out, cues, translated_cues
 
         except Exception as e:
             log.error(f"翻译失败: {e}")
             return None
-
-    async def _read_srt_file(self, srt_path: Path) -> str:
-        """读取SRT文件内容"""
-        async with aiofiles.open(srt_path, "r", encoding="utf-8") as f:
-            content = await f.read()
-        log.info(f"从 {srt_path.name} 读取到 {len(content)} 字节内容。")
-        return content
-
-    def _extract_text_blocks(self, content: str) -> List[str]:
-        """从SRT内容中提取文本块"""
-        text_blocks = [
-            m.group(1).replace("\n", " ") for m in re.finditer(r"[\d:,\-\s>]+\n(.*?)(?=\n\d+|$)", content, re.DOTALL)
-        ]
+        finally:
+            await asyncio.to_thread(self.close)
+
+    def _open_memory(self) -> Optional[TranslationMemory]:
+        """打开翻译记忆，未配置路径时返回None"""
+        if self.memory is None and self.memory_path:
+            self.memory = TranslationMemory(self.memory_path)
+        return self.memory
+
+    def close(self) -> None:
+        """关闭已打开的翻译记忆"""
+        if self.memory is not None:
+            self.memory.close()
+            self.memory = None
+
+    async def _read_srt_file(self, srt_path: Path) -> List[Cue]:
+        """
+        流式解析SRT文件，不把整个文件读入内存。
+        字幕条目仍需保存为列表：翻译要对全文去重分批，合并阶段还要复用这份解析结果。
+        """
+        cues = await asyncio.to_thread(lambda: list(iter_srt_file(srt_path)))
+        log.info(f"从 {srt_path.name} 读取到 {len(cues)} 条字幕。")
+        return cues
+
+    def _extract_text_blocks(self, cues: List[Cue]) -> List[str]:
+        """从字幕条目中提取文本块"""
+        text_blocks = [cue.text.replace("\n", " ") for cue in cues]
         log.info(f"提取到 {len(text_blocks)} 个文本块进行翻译。")
         return text_blocks
 
     async def _translate_text_blocks(self, text_blocks: List[str]) -> Optional[List[str]]:
-        """批量翻译文本块，带重试机制"""
-        all_translated_blocks = []
-        batch_size = config.ai_subtitles.translation_batch_size
-        delay = config.ai_subtitles.translation_delay
+        """
+        翻译文本块：先查翻译记忆，只把未命中的去重原文分批并发送给翻译服务。
+        并发批次数受 translation_concurrency 限制，请求速率由令牌桶控制。
+        """
+        ai_config = config.ai_subtitles
+        normalized_blocks = [TranslationMemory.normalize(text) for text in text_blocks]
+        unique_texts = [text for text in dict.fromkeys(normalized_blocks) if text]
+
+        memory = await asyncio.to_thread(self._open_memory)
+        translations = {}
+        if memory:
+            translations = await asyncio.to_thread(
+                memory.lookup_many, self.service_name, self.source_lang, self.target_lang, unique_texts
+            )
+        misses = [text for text in unique_texts if text not in translations]
+
+        batch_size = ai_config.translation_batch_size
+        batches = [misses[i : i + batch_size] for i in range(0, len(misses), batch_size)]
+        log.info(
+            f"准备翻译 {len(text_blocks)} 个文本块: 去重后 {len(unique_texts)} 条，"
+            f"记忆命中 {len(translations)} 条，需翻译 {len(misses)} 条 ({len(batches)} 批，"
+            f"并发 {ai_config.translation_concurrency})..."
+        )
 
-        log.info(f"准备翻译 {len(text_blocks)} 个文本块，分批大小: {batch_size}，批次间延迟: {delay}秒...")
+        semaphore = asyncio.Semaphore(ai_config.translation_concurrency)
+        results = await asyncio.gather(
+            *(self._translate_batch(batch, num, len(batches), semaphore) for num, batch in enumerate(batches, 1))
+        )
 
-        for i in range(0, len(text_blocks), batch_size):
-            batch = text_blocks[i : i + batch_size]
-            batch_num = i // batch_size + 1
-            total_batches = (len(text_blocks) + batch_size - 1) // batch_size
+        new_translations = {}
+        for batch, translated_batch in zip(batches, results):
+            if translated_batch is None:
+                # 翻译失败的批次使用原文代替，且不写入翻译记忆
+                translations.update(zip(batch, batch))
+            else:
+                new_translations.update(zip(batch, translated_batch))
+        translations.update(new_translations)
+
+        if memory and new_translations:
+            await asyncio.to_thread(
+                memory.store_many, self.service_name, self.source_lang, self.target_lang, new_translations
+            )
+
+        return [translations.get(text, text) for text in normalized_blocks]
+
+    async def _translate_batch(
+        self, batch: List[str], batch_num: int, total_batches: int, semaphore: asyncio.Semaphore
+    ) -> Optional[List[str]]:
+        """翻译单个批次，带重试和备用翻译器；全部失败时返回None。"""
+        delay = config.ai_subtitles.translation_delay
+        max_retries = config.ai_subtitles.translation_max_retries
 
+        async with semaphore:
             log.info(f"正在翻译批次 {batch_num}/{total_batches} (包含 {len(batch)} 个文本块)...")
-
-            # 重试机制
-            max_retries = config.ai_subtitles.translation_max_retries
             for retry in range(max_retries):
                 try:
                     if retry > 0:
@@ -259,82 +378,73 @@ class TranslationProcessor:
                         # 增加延迟时间，避免频繁请求
                         await asyncio.sleep(min(delay * (retry + 1), 10))
 
-                    translated_batch = await asyncio.to_thread(self.translator.translate_batch, batch)
-                    all_translated_blocks.extend(translated_batch)
+                    translated_batch = await self._call_translator(self.translator, batch)
                     log.info(f"批次 {batch_num} 翻译完成。")
-                    break  # 成功则跳出重试循环
+                    return translated_batch
 
                 except Exception as e:
                     error_msg = str(e)
-                    is_last_retry = retry == max_retries - 1
 
                     # 尝试使用备用翻译器
-                    fallback_success = False
                     if "No translation was found" in error_msg or "translator" in error_msg.lower():
                         for fallback_translator in self.fallback_translators:
                             try:
                                 log.info(f"尝试使用备用翻译器: {type(fallback_translator).__name__}")
-                                translated_batch = await asyncio.to_thread(fallback_translator.translate_batch, batch)
-                                all_translated_blocks.extend(translated_batch)
+                                translated_batch = await self._call_translator(fallback_translator, batch)
                                 log.info(f"批次 {batch_num} 使用备用翻译器翻译完成。")
-                                fallback_success = True
-                                break
+                                return translated_batch
                             except Exception as fallback_e:
                                 log.warning(f"备用翻译器失败: {fallback_e}")
-                                continue
-
-                    if fallback_success:
-                        break  # 备用翻译成功，跳出重试循环
 
                     if "SSL" in error_msg or "Connection" in error_msg or "HTTPSConnectionPool" in error_msg:
                         log.warning(f"网络连接错误 (批次 {batch_num}, 尝试 {retry + 1}/{max_retries}): {e}")
-                        if is_last_retry:
-                            log.error(f"批次 {batch_num} 网络连接重试失败，使用原文")
-                            all_translated_blocks.extend(batch)
-                            log.info(f"批次 {batch_num} 使用原文代替翻译")
-                            break
                     else:
                         log.error(f"deep_translator.translate_batch 调用失败 (批次 {batch_num}): {e}")
-                        if is_last_retry:
-                            # 对于其他错误，也使用原文代替
-                            all_translated_blocks.extend(batch)
-                            log.info(f"批次 {batch_num} 翻译失败，使用原文代替")
-                            break
-
-            # 批次间延迟
-            if i + batch_size < len(text_blocks):
-                await asyncio.sleep(delay)
-
-        if len(text_blocks) != len(all_translated_blocks):
-            log.error(f"翻译返回片段数与原文不匹配。原文: {len(text_blocks)}, 翻译: {len(all_translated_blocks)}")
-            return None
-
-        return all_translated_blocks
 
-    async def _write_translated_srt(
-        self, original_content: str, translated_blocks: List[str], output_path: Path
-    ) -> None:
-        """写入翻译后的SRT文件"""
-        new_content_parts = []
-        subtitle_blocks_iter = re.finditer(r"(\d+\n[\d:,\-\s>]+\n)(.*?)(?=\n\n|$)", original_content, re.DOTALL)
+        log.error(f"批次 {batch_num} 翻译重试失败，使用原文代替")
+        return None
 
-        for i, match in enumerate(subtitle_blocks_iter):
-            header = match.group(1)
-            translated_text = translated_blocks[i].strip()
-            new_content_parts.append(f"{header}{translated_text}\n\n")
-
-        new_content = "".join(new_content_parts)
+    async def _call_translator(self, translator, batch: List[str]) -> List[str]:
+        """在令牌桶限速下调用一次 translate_batch，并校验返回条数。"""
+        await self.rate_limiter.acquire()
+        translated_batch = await asyncio.wait_for(
+            asyncio.to_thread(translator.translate_batch, batch), config.ai_subtitles.translation_timeout
+        )
+        if len(translated_batch) != len(batch):
+            raise ValueError(f"translator 返回片段数与原文不匹配: {len(batch)} -> {len(translated_batch)}")
+        return translated_batch
 
-        async with aiofiles.open(output_path, "w", encoding="utf-8") as f_out:
-            await f_out.write(new_content)
+    async def _write_translated_srt(
+        self, cues: List[Cue], translated_blocks: List[str], output_path: Path
+    ) -> List[Cue]:
+        """写入翻译后的SRT文件（沿用原字幕的时间轴），返回译文字幕"""
+        translated_cues = [
+            Cue(cue.index, cue.start_ms, cue.end_ms, text.strip()) for cue, text in zip(cues, translated_blocks)
+        ]
+        await asyncio.to_thread(write_srt, output_path, translated_cues)
         log.info(f"已将翻译内容写入: {output_path}")
+        return translated_cues
 
 
 class SubtitleMerger:
     """专门处理字幕合并的处理器"""
 
-    async def merge_subtitles(self, en_srt: Path, zh_srt: Path) -> Optional[Path]:
-        """合并英文和中文字幕为双语字幕"""
+    async def merge_subtitles(
+        self,
+        en_srt: Path,
+        zh_srt: Path,
+        en_cues: Optional[List[Cue]] = None,
+        zh_cues: Optional[List[Cue]] = None,
+    ) -> Optional[Path]:
+        """
+        合并英文和中文字幕为双语字幕。
+
+        Args:
+            en_srt: 英文字幕路径
+            zh_srt: 中文字幕路径
+            en_cues: 已解析的英文字幕，提供时不再重新读取文件
+            zh_cues: 已解析的中文字幕，提供时不再重新读取文件
+        """
         console.print("🤝 正在合并字幕...", style="bold magenta")
         bi_srt = en_srt.with_suffix(".bilingual.srt")
 
@@ -345,41 +455,27 @@ class SubtitleMerger:
             return None
 
         try:
-            en_content, zh_content = await self._read_subtitle_files(en_srt, zh_srt)
-            merged_content = await self._create_merged_content(en_content, zh_content)
-
-            async with aiofiles.open(bi_srt, "w", encoding="utf-8") as f:
-                await f.write(merged_content)
+            if en_cues is None or zh_cues is None:
+                # 从文件合并时英文字幕边读边写，只有中文字幕的文本按序号保存在内存中
+                en_cues, zh_cues = iter_srt_file(en_srt), iter_srt_file(zh_srt)
+            await asyncio.to_thread(write_srt, bi_srt, self._create_merged_cues(en_cues, zh_cues))
 
             console.print(f"✅ 双语字幕已生成: {bi_srt.name}", style="bold green")
             return bi_srt
 
         except Exception as e:
             log.error(f"字幕合并失败: {e}")
+            # 边读边写时读取出错会留下不完整的双语字幕
+            bi_srt.unlink(missing_ok=True)
             return None
 
-    async def _read_subtitle_files(self, en_srt: Path, zh_srt: Path) -> Tuple[str, str]:
-        """读取英文和中文字幕文件"""
-        async with aiofiles.open(en_srt, "r", encoding="utf-8") as f:
-            en_content = await f.read()
-        async with aiofiles.open(zh_srt, "r", encoding="utf-8") as f:
-            zh_content = await f.read()
-        return en_content, zh_content
-
-    async def _create_merged_content(self, en_content: str, zh_content: str) -> str:
-        """创建合并的字幕内容"""
-        en_subtitles = {m[1]: m[3].strip() for m in re.finditer(r"(\d+)\n(.*?)\n(.*?)\n\n", en_content, re.DOTALL)}
-        zh_subtitles = {m[1]: m[3].strip() for m in re.finditer(r"(\d+)\n(.*?)\n(.*?)\n\n", zh_content, re.DOTALL)}
-        timestamps = {m[1]: m[2].strip() for m in re.finditer(r"(\d+)\n(.*?)\n", en_content)}
-
-        merged_parts = []
-        for i in sorted(timestamps.keys(), key=int):
-            zh_text = zh_subtitles.get(i, "")
-            en_text = en_subtitles.get(i, "")
-            timestamp = timestamps[i]
-            merged_parts.append(f"{i}\n{timestamp}\n{zh_text}\n{en_text}\n\n")
-
-        return "".join(merged_parts)
+    def _create_merged_cues(self, en_cues: Iterable[Cue], zh_cues: Iterable[Cue]) -> Iterator[Cue]:
+        """按序号对齐中英文字幕，中文在上、英文在下，时间轴以英文字幕为准"""
+        zh_texts = {cue.index: cue.text for cue in zh_cues}
+        for cue in en_cues:
+            zh_text = zh_texts.get(cue.index)
+            text = f"{zh_text}\n{cue.text}" if zh_text and cue.text else zh_text or cue.text
+            yield Cue(cue.index, cue.start_ms, cue.end_ms, text)
 
 
 class SubtitleProcessor:
@@ -429,15 +525,19 @@ class SubtitleProcessor:
 
         # 步骤3: 翻译字幕
         if self.translation_processor.translate_to_chinese:
-            zh_srt_path = await self.translation_processor.translate_subtitle(en_srt_path)
-            if zh_srt_path:
-                # 步骤4: 合并字幕
-                await self.subtitle_merger.merge_subtitles(en_srt_path, zh_srt_path)
+            translation = await self.translation_processor.translate_subtitle_cues(en_srt_path)
+            if translation:
+                # 步骤4: 合并字幕（直接复用翻译阶段解析好的字幕）
+                zh_srt_path, en_cues, zh_cues = translation
+                await self.subtitle_merger.merge_subtitles(en_srt_path, zh_srt_path, en_cues, zh_cues)
 
     async def _prepare_audio(self, audio_source_path: Path) -> Optional[Path]:
         """准备音频文件用于转录"""
         # whisper-cli (whisper.cpp) 支持的格式: flac, mp3, ogg, wav
         whisper_cli_formats = {".flac", ".mp3", ".ogg", ".wav"}
+        # 分段并行转录直接切分PCM数据，需要统一转换为WAV
+        if self.transcription_processor.chunk_seconds > 0:
+            whisper_cli_formats = {".wav"}
 
         if audio_source_path.suffix.lower() in whisper_cli_formats:
             log.info(f"使用原音频文件进行AI处理: {audio_source_path.name}")
@@ -0,0 +1,105 @@
+# tests/test_command_profiles.py
+
+import pytest
+
+from core.command_builder import CommandBuilder
+from core.command_profiles import DEFAULT_PROFILE, CommandProfile, CommandProfiles
+from core.transfer_tuner import TransferPlan
+
+YOUTUBE_ARGS = ("--extractor-args", "youtube:player_client=web_safari", "--socket-timeout", "15")
+
+
+@pytest.fixture
+def profiles():
+    return CommandProfiles(
+        [
+            CommandProfile("youtube", ("youtube.com", "youtu.be"), YOUTUBE_ARGS),
+            CommandProfile("music", ("music.youtube.com",), ("--socket-timeout", "5")),
+            CommandProfile("slow-cdn", ("slow.example.com",), ("--throttled-rate", "100K"), max_concurrent_fragments=2),
+        ],
+        extra_args=["--geo-bypass"],
+    )
+
+
+def test_most_specific_domain_wins(profiles):
+    """测试按域名（含子域名）选择档案，多个档案匹配时选择最具体的。"""
+    assert profiles.resolve("https://www.youtube.com/watch?v=abc").name == "youtube"
+    assert profiles.resolve("https://m.youtube.com/watch?v=abc").name == "youtube"
+    assert profiles.resolve("https://music.youtube.com/watch?v=abc").name == "music"
+    assert profiles.resolve("https://notyoutube.com/v").name == "default"
+    assert profiles.resolve(None) is DEFAULT_PROFILE
+    assert profiles.args("https://youtu.be/abc") == YOUTUBE_ARGS + ("--geo-bypass",)
+
+
+def test_all_builders_use_profile_and_extra_args(profiles):
+    """测试下载、直流和信息提取命令都追加档案参数和额外参数，且都位于URL之前。"""
+    # 1. 安排
+    builder = CommandBuilder(profiles=profiles)
+    url = "https://www.youtube.com/watch?v=abc"
+
+    # 2. 执行
+    commands = [
+        builder.build_video_download_cmd("/tmp/v.mp4", url),
+        builder.build_audio_download_cmd(url, "/tmp/a.%(ext)s"),
+        builder.build_streaming_download_cmd_to_stdout(url, "18"),
+        builder.build_playlist_info_cmd(url),
+        builder.build_stream_to_stdout_cmd(url, "137"),
+    ]
+    other = builder.build_video_download_cmd("/tmp/v.mp4", "https://vimeo.com/1")
+
+    # 3. 断言
+    for cmd in commands:
+        position = cmd.index("--extractor-args")
+        assert cmd[position : position + 4] == list(YOUTUBE_ARGS)
+        assert "--geo-bypass" in cmd
+        assert position < cmd.index(url)
+    assert "--extractor-args" not in other and "--geo-bypass" in other
+
+
+def test_templates_are_built_once_per_profile(profiles, mocker, tmp_path):
+    """测试同一站点的命令复用缓存的参数模板，更换cookies文件后重新构建。"""
+    # 1. 安排
+    builder = CommandBuilder(profiles=profiles)
+    build = mocker.spy(builder, "_build_template")
+    cookies = tmp_path / "cookies.txt"
+    cookies.write_text("# Netscape HTTP Cookie File\n")
+
+    # 2. 执行
+    first = builder.build_yt_dlp_base_cmd(url="https://www.youtube.com/watch?v=a")
+    second = builder.build_yt_dlp_base_cmd(url="https://youtu.be/b")
+    first.append("--mutated")
+    builder.build_yt_dlp_base_cmd(url="https://vimeo.com/1")
+    builder.update_cookies_file(str(cookies))
+    with_cookies = builder.build_yt_dlp_base_cmd(url="https://youtu.be/b")
+
+    # 3. 断言: youtube、default 各构建一次，更换cookies后youtube重新构建
+    assert build.call_count == 3
+    assert "--mutated" not in second
+    assert with_cookies[with_cookies.index("--cookies") + 1] == str(cookies.resolve())
+
+
+def test_profile_caps_fragment_concurrency(profiles):
+    """测试站点档案的并发上限作用于按格式选择的传输参数。"""
+    builder = CommandBuilder(profiles=profiles)
+
+    cmd = builder.build_yt_dlp_base_cmd(TransferPlan(8), url="https://slow.example.com/v")
+    uncapped = builder.build_yt_dlp_base_cmd(TransferPlan(8), url="https://vimeo.com/1")
+
+    assert TransferPlan.from_cmd(cmd).concurrent_fragments == 2
+    assert TransferPlan.from_cmd(uncapped).concurrent_fragments == 8
+
+
+def test_profiles_load_from_config(mocker):
+    """测试从 advanced.ytdlp_profiles 和 advanced.ytdlp_extra_args 加载档案。"""
+    from config_manager import YtdlpProfileConfig
+
+    mocker.patch(
+        "core.command_profiles.config.advanced.ytdlp_profiles",
+        {"vimeo": YtdlpProfileConfig(domains=["vimeo.com"], args=["--socket-timeout", "10"])},
+    )
+    mocker.patch("core.command_profiles.config.advanced.ytdlp_extra_args", ["--geo-bypass"])
+
+    loaded = CommandProfiles.from_config()
+
+    assert loaded.args("https://player.vimeo.com/video/1") == ("--socket-timeout", "10", "--geo-bypass")
+    assert loaded.args("https://example.com/v") == ("--geo-bypass",)
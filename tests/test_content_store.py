@@ -0,0 +1,71 @@
+# tests/test_content_store.py
+
+import os
+
+import pytest
+
+from web.content_store import CONTENT_KEY, ContentStore
+from web.storage_manager import StorageManager
+
+KEY = "Youtube:dQw4w9WgXcQ:video:best:1080p"
+
+
+@pytest.fixture
+def store(tmp_path, fake_redis):
+    """以临时目录为下载根目录的内容存储。"""
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    return ContentStore(fake_redis, tmp_path), fake_redis
+
+
+def test_content_key_identifies_video_without_network():
+    """测试同一视频的不同URL写法得到相同的内容键，无法识别的URL不参与去重。"""
+    watch = ContentStore.content_key("https://www.youtube.com/watch?v=dQw4w9WgXcQ", "video", "best", "1080p")
+    short = ContentStore.content_key("https://youtu.be/dQw4w9WgXcQ", "video", "", "1080p")
+
+    assert watch == short == KEY
+    assert ContentStore.content_key("https://example.com/video.mp4", "video") is None
+
+
+def test_repeat_request_links_stored_content(store, tmp_path):
+    """测试已存储的内容以各任务自己的文件名硬链接给新任务，重复下载的副本被替换为硬链接。"""
+    # 1. 安排
+    content_store, _ = store
+    first = tmp_path / "a" / "Video_1080p.mp4"
+    first.write_bytes(b"video" * 100)
+    content_store.ingest(KEY, first)
+
+    # 2. 执行
+    linked = content_store.checkout(KEY, tmp_path / "b", "task-2")
+    duplicate = tmp_path / "b" / "Video_1080p_copy.mp4"
+    duplicate.write_bytes(b"video" * 100)
+    content_store.ingest(KEY, duplicate)
+
+    # 3. 断言
+    assert linked == tmp_path / "b" / "Video_1080p_task-2.mp4"
+    assert os.path.samefile(linked, first) and os.path.samefile(duplicate, first)
+    assert first.stat().st_nlink == 4
+    third = content_store.checkout(KEY, tmp_path / "b", "task-3")
+    assert third.name == "Video_1080p_task-3.mp4"
+    assert os.path.samefile(third, first) and first.stat().st_nlink == 5
+    assert content_store.checkout(KEY, tmp_path / "b", "task-2") == linked
+
+
+def test_blob_collected_only_after_last_reference(store, tmp_path):
+    """测试内容块在最后一个用户文件删除后才被回收，配额统计只计一份。"""
+    content_store, redis = store
+    first = tmp_path / "a" / "Video.mp4"
+    first.write_bytes(b"x" * 4096)
+    content_store.ingest(KEY, first)
+    second = content_store.checkout(KEY, tmp_path / "b", "task-2")
+
+    assert StorageManager(redis, [tmp_path]).usage_bytes() == 4096
+
+    first.unlink()
+    assert content_store.collect() == 0
+    assert KEY in redis.data[CONTENT_KEY]
+
+    second.unlink()
+    assert content_store.collect() == 4096
+    assert KEY not in redis.data[CONTENT_KEY]
+    assert content_store.checkout(KEY, tmp_path / "b", "task-3") is None
@@ -0,0 +1,107 @@
+# tests/test_cookies_cache.py
+
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pytest
+
+import auto_cookies
+from auto_cookies import BrowserCookiesExtractor
+from core.cookies_manager import CookiesManager
+
+# Chrome时间戳从1601年起算（微秒）
+FAR_FUTURE = (2_000_000_000 + 11644473600) * 1_000_000
+
+
+def _add_cookie(db_path, host, name):
+    # 显式关闭连接：由GC关闭时触发的WAL检查点会在测试中途改变数据库签名
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.execute(
+            "INSERT INTO cookies VALUES (?, ?, ?, '/', ?, 1, 1)",
+            (name, f"{name}-value", host, FAR_FUTURE),
+        )
+
+
+@pytest.fixture
+def chrome_db(tmp_path, mocker):
+    """WAL模式的假Chrome cookies数据库。"""
+    db_path = tmp_path / "Cookies"
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE cookies (name TEXT, value TEXT, host_key TEXT, path TEXT,"
+            " expires_utc INTEGER, is_secure INTEGER, is_httponly INTEGER)"
+        )
+    _add_cookie(db_path, ".youtube.com", "SID")
+    _add_cookie(db_path, "notyoutube.com", "OTHER")
+    _add_cookie(db_path, ".bilibili.com", "SESSDATA")
+    mocker.patch.object(BrowserCookiesExtractor, "_chromium_cookies_path", return_value=str(db_path))
+    mocker.patch.dict(auto_cookies._memory_cache, clear=True)
+    return db_path
+
+
+def test_cache_is_per_domain_and_invalidated_by_browser_db(chrome_db, tmp_path, mocker):
+    """测试每个域名独立缓存，浏览器数据库不变时不再读取，写入新cookies后重新提取。"""
+    # 1. 安排
+    extractor = BrowserCookiesExtractor(cache_file=str(tmp_path / "cookies.cache.txt"))
+    query = mocker.spy(extractor, "_query_chromium_cookies")
+
+    # 2. 执行
+    youtube = extractor.extract_cookies_for_domain("youtube.com", "chrome")
+    bilibili = extractor.extract_cookies_for_domain("bilibili.com", "chrome")
+    again = extractor.extract_cookies_for_domain("youtube.com", "chrome")
+
+    # 3. 断言
+    assert youtube == again == str(tmp_path / "cookies.cache.youtube.com.txt")
+    assert bilibili == str(tmp_path / "cookies.cache.bilibili.com.txt")
+    content = open(youtube, encoding="utf-8").read()
+    assert "\tSID\t" in content and "OTHER" not in content and "SESSDATA" not in content
+    assert query.call_count == 2
+
+    _add_cookie(chrome_db, ".youtube.com", "LOGIN_INFO")
+    refreshed = extractor.extract_cookies_for_domain("youtube.com", "chrome")
+    assert query.call_count == 3
+    assert "\tLOGIN_INFO\t" in open(refreshed, encoding="utf-8").read()
+
+
+def test_cache_survives_new_process(chrome_db, tmp_path):
+    """测试缓存签名写在文件头部，新进程（清空内存缓存）仍能校验缓存。"""
+    cache_file = str(tmp_path / "cookies.cache.txt")
+    BrowserCookiesExtractor(cache_file=cache_file).extract_cookies_for_domain("youtube.com", "chrome")
+    auto_cookies._memory_cache.clear()
+
+    assert BrowserCookiesExtractor(cache_file=cache_file).get_cached_cookies("youtube.com")
+    assert BrowserCookiesExtractor(cache_file=cache_file).get_cached_cookies("vimeo.com") is None
+
+
+def test_concurrent_auth_failures_refresh_once(tmp_path, mocker):
+    """测试同一域名的一批并发认证失败只触发一次浏览器提取。"""
+    # 1. 安排
+    fresh = tmp_path / "fresh.txt"
+    fresh.write_text("# Netscape HTTP Cookie File\n", encoding="utf-8")
+
+    def slow_extract(**kwargs):
+        time.sleep(0.2)
+        return str(fresh)
+
+    extract = mocker.patch("core.cookies_manager.auto_extract_cookies_for_url", side_effect=slow_extract)
+    manager = CookiesManager(str(tmp_path / "cookies.txt"))
+    barrier = threading.Barrier(8)
+    results = []
+
+    def on_403():
+        barrier.wait()
+        results.append(manager.refresh_cookies_for_url("https://www.youtube.com/watch?v=abc"))
+
+    # 2. 执行
+    threads = [threading.Thread(target=on_403) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 3. 断言
+    assert extract.call_count == 1
+    assert results == [str(tmp_path / "cookies.txt")] * 8
@@ -1,9 +1,12 @@
 # tests/test_downloader.py
 
+import asyncio
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 
+from core import DownloaderException
+from core.transfer_tuner import TransferTuner
 from downloader import Downloader
 
 
@@ -174,3 +177,169 @@ async def test_download_audio_direct_download_success(mock_downloader):
             ".mp3",
         ),  # The correct list of extensions
     )
+
+
+@pytest.mark.asyncio
+async def test_separate_streams_download_concurrently(mock_downloader):
+    """
+    测试: 备用策略中视频流和音频流应同时下载，而不是先后下载。
+    """
+    # 1. 准备
+    downloader, mocks, download_folder = mock_downloader
+    both_started = asyncio.Event()
+    started = []
+
+    async def mock_execute(*args, **kwargs):
+        started.append(kwargs["task_id"])
+        if len(started) == 2:
+            both_started.set()
+        # 如果是顺序执行，第一个下载会在这里永远等待
+        await asyncio.wait_for(both_started.wait(), timeout=2)
+        return (0, "", "")
+
+    mocks["execute_cmd"].side_effect = mock_execute
+    video_file = download_folder / "clip.video.mp4"
+    audio_file = download_folder / "clip.audio.m4a"
+    mocks["find_file"].side_effect = [video_file, audio_file]
+
+    # 2. 执行
+    result = await downloader._download_separate_streams("https://example.com/video", "clip", "137")
+
+    # 3. 验证
+    assert result == (video_file, audio_file)
+    assert len(started) == 2
+    assert all(call.kwargs["monitor_progress"] is False for call in mocks["execute_cmd"].call_args_list)
+
+
+@pytest.mark.asyncio
+async def test_separate_streams_failure_cancels_other_stream(mock_downloader):
+    """
+    测试: 一个流下载失败时，另一个流的下载应被取消。
+    """
+    # 1. 准备
+    downloader, mocks, _ = mock_downloader
+    audio_cancelled = asyncio.Event()
+
+    async def mock_execute(*args, **kwargs):
+        if "video" in kwargs["cmd_builder_args"].get("format_id", ""):
+            await asyncio.sleep(0)
+            raise DownloaderException("video failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            audio_cancelled.set()
+            raise
+
+    mocks["execute_cmd"].side_effect = mock_execute
+
+    # 2. 执行 & 3. 验证
+    with pytest.raises(DownloaderException, match="video failed"):
+        await downloader._download_separate_streams("https://example.com/video", "clip", "video-137")
+    assert audio_cancelled.is_set()
+    mocks["find_file"].assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_find_output_file_skips_partial_downloads(tmp_path, mocker):
+    """
+    测试: 回退到前缀搜索时，不会把续传留下的 .part/.ytdl 或原生分片的 .native.* 当作输出文件。
+    """
+    # 1. 准备: 临时文件比输出文件更新
+    mocker.patch("downloader.CookiesManager")
+    downloader = Downloader(download_folder=tmp_path)
+    finished = tmp_path / "Video_abc.webm"
+    finished.write_bytes(b"done")
+    for name in ("Video_abc.f137.mp4.part", "Video_abc.f137.mp4.ytdl", "Video_abc.mp4.native.part"):
+        (tmp_path / name).write_bytes(b"partial")
+
+    # 2. 执行
+    found = await downloader._find_and_verify_output_file("Video_abc", (".mp4",))
+    finished.unlink()
+    missing = await downloader._find_and_verify_output_file("Video_abc", (".mp4",))
+
+    # 3. 断言
+    assert found == finished
+    assert missing is None
+
+
+@pytest.mark.asyncio
+async def test_resumable_streaming_merge_only_on_first_attempt(tmp_path, mocker):
+    """
+    测试: 续传模式下首次尝试仍使用流式合并（输出写完才改名）；工作目录中已有部分下载时改用落盘合并。
+    """
+    # 1. 准备
+    mocker.patch("downloader.CookiesManager")
+    downloader = Downloader(download_folder=tmp_path, resumable=True)
+
+    async def fake_merge(url, video, audio, output_file, *args):
+        output_file.write_bytes(b"merged")
+        return output_file
+
+    merge = mocker.patch.object(downloader.stream_merger, "merge", side_effect=fake_merge)
+    (tmp_path / "First.jpg").write_bytes(b"thumbnail")
+    (tmp_path / "Retry.f137.mp4.part").write_bytes(b"partial")
+
+    # 2. 执行
+    first = await downloader._run_streaming_merge("https://example.com/v", "First", "137", "140")
+    retry = await downloader._run_streaming_merge("https://example.com/v", "Retry", "137", "140")
+
+    # 3. 断言
+    assert first == tmp_path / "First.mp4" and first.read_bytes() == b"merged"
+    assert not (tmp_path / "First.mp4.streaming.part").exists()
+    assert retry is None
+    assert merge.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_streaming_merge_progress_combines_video_and_audio(tmp_path, mocker):
+    """
+    测试: 流式合并的进度按视频流和音频流的字节数合并，音频流的进度不会被忽略。
+    """
+    # 1. 准备
+    mocker.patch("downloader.CookiesManager")
+    updates = []
+    downloader = Downloader(
+        download_folder=tmp_path, progress_callback=lambda message, progress: updates.append(progress)
+    )
+
+    async def fake_merge(url, video, audio, output_file, progress, video_task, audio_task, *args):
+        # 音频流已下完，视频流尚未开始
+        progress.update(video_task, completed=0, total=1000)
+        progress.update(audio_task, completed=500, total=500)
+        await asyncio.sleep(0.7)
+        output_file.write_bytes(b"merged")
+        return output_file
+
+    mocker.patch.object(downloader.stream_merger, "merge", side_effect=fake_merge)
+
+    # 2. 执行
+    result = await downloader._run_streaming_merge("https://example.com/v", "Video", "137", "140")
+
+    # 3. 断言
+    assert result == tmp_path / "Video.mp4"
+    assert max(updates) == 33
+
+
+@pytest.mark.asyncio
+async def test_separate_streams_share_the_connection_budget(tmp_path, mocker):
+    """
+    测试: 并发下载的视频流和音频流都在全局连接预算内，合计分片并发数不超过预算。
+    """
+    # 1. 准备
+    mocker.patch("downloader.CookiesManager")
+    tuner = TransferTuner(default_fragments=4, connection_budget=6)
+    downloader = Downloader(download_folder=tmp_path, transfer_tuner=tuner)
+    granted = []
+
+    async def fake_execute(initial_cmd, **kwargs):
+        granted.append(int(initial_cmd[initial_cmd.index("--concurrent-fragments") + 1]))
+        await asyncio.sleep(0.05)
+
+    mocker.patch.object(downloader, "_execute_cmd_with_auth_retry", side_effect=fake_execute)
+
+    # 2. 执行
+    await downloader._download_separate_streams("https://example.com/v", "Video", "137")
+
+    # 3. 断言
+    assert sorted(granted) == [2, 4]
+    assert tuner._leases == {}
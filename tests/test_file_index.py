@@ -0,0 +1,95 @@
+# tests/test_file_index.py
+
+import os
+import time
+
+import pytest
+
+from web.file_index import INDEX_KEY, DownloadFileIndex
+
+
+def _touch(path, age_seconds=0):
+    path.write_bytes(b"x" * 1024)
+    mtime = time.time() - age_seconds
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def index(tmp_path, fake_redis):
+    """带有假Redis的文件索引，孤立文件保留1小时。"""
+    return DownloadFileIndex(fake_redis, tmp_path, orphan_seconds=3600), fake_redis
+
+
+def test_expired_credential_deletes_exact_file(index, tmp_path):
+    """测试凭证过期后删除其对应的文件，仍有效的凭证会按剩余TTL重新排期。"""
+    file_index, redis = index
+    expired = _touch(tmp_path / "expired.mp4")
+    renewed = _touch(tmp_path / "renewed.mp4")
+    file_index.register("t1", expired, expiry_seconds=60)
+    file_index.register("t2", renewed, expiry_seconds=60)
+    redis.data["download:t2"] = {"file_path": str(renewed)}
+    redis.ttls["download:t2"] = 300
+
+    stats = file_index.cleanup_due(now=time.time() + 120)
+
+    assert stats["expired_files_deleted"] == ["expired.mp4"]
+    assert not expired.exists() and renewed.exists()
+    assert redis.data[INDEX_KEY][str(renewed.resolve())] > time.time() + 120
+
+
+def test_orphans_are_indexed_once_and_deleted_when_due(index, tmp_path):
+    """测试未登记文件在目录变化时才被发现，超过孤立时间后删除。"""
+    file_index, redis = index
+    old_orphan = _touch(tmp_path / "old.part", age_seconds=7200)
+    fresh_orphan = _touch(tmp_path / "fresh.part")
+    registered = _touch(tmp_path / "video.mp4", age_seconds=7200)
+    file_index.register("t1", registered, expiry_seconds=600)
+    redis.data["download:t1"] = {"file_path": str(registered)}
+
+    stats = file_index.cleanup_due()
+
+    assert stats["orphaned_files_deleted"] == ["old.part"]
+    assert not old_orphan.exists() and fresh_orphan.exists() and registered.exists()
+
+    # 目录未变化的运行不再列目录，Redis调用数与文件数无关
+    os.utime(tmp_path, (1, 1))
+    file_index.cleanup_due()
+    redis.calls = 0
+    for i in range(50):
+        _touch(tmp_path / f"archive_{i}.mp4")
+    os.utime(tmp_path, (1, 1))
+    assert file_index.cleanup_due()["orphaned_files_deleted"] == []
+    assert redis.calls <= 3
+
+
+def test_orphan_still_being_written_is_rescheduled(index, tmp_path):
+    """测试孤立文件到期时重新检查mtime，发现后仍在写入的文件按新的mtime重新排期而不被删除。"""
+    # 1. 安排: 文件被发现时已很久未修改
+    file_index, redis = index
+    growing = _touch(tmp_path / "growing.part", age_seconds=600)
+    file_index.cleanup_due()
+    path = str(growing.resolve())
+    discovered_due = redis.data[INDEX_KEY][path]
+
+    # 2. 执行: 之后文件继续被写入，到期时再清理
+    _touch(growing)
+    stats = file_index.cleanup_due(now=discovered_due + 1)
+
+    # 3. 断言
+    assert stats["orphaned_files_deleted"] == []
+    assert growing.exists()
+    assert redis.data[INDEX_KEY][path] == pytest.approx(growing.stat().st_mtime + 3600)
+
+
+def test_first_run_backfills_existing_credentials(index, tmp_path):
+    """测试首次运行把索引上线前的有效凭证登记进来，其文件不会被当作孤立文件。"""
+    file_index, redis = index
+    legacy = _touch(tmp_path / "legacy.mp4", age_seconds=7200)
+    redis.data["download:old"] = {"file_path": str(legacy)}
+    redis.ttls["download:old"] = 100
+
+    stats = file_index.cleanup_due()
+
+    assert stats["orphaned_files_deleted"] == [] and legacy.exists()
+    assert str(legacy.resolve()) in redis.data[INDEX_KEY]
@@ -57,3 +57,34 @@ def test_get_video_info_rejects_non_whitelisted_domain(client):
     # 确保不再显示白名单列表
     assert "Only downloads from the following sites are permitted" not in json_response["detail"]
     print(f"✅ 成功捕获并验证了预期的 403 错误: {json_response['detail']}")
+
+
+def test_start_download_estimates_size_from_cached_video_info(client):
+    """
+    测试: 请求未携带 filesize 时, /downloads 从缓存的视频信息中查找所选格式的大小,
+    合并格式按各部分之和预留存储空间。
+    """
+    # 1. 准备 (Arrange)
+    video_info = {
+        "formats": [
+            {"format_id": "137", "filesize": 80_000_000},
+            {"format_id": "140", "filesize_approx": 5_000_000},
+        ]
+    }
+    with (
+        patch("web.main.get_cached_video_info", return_value=video_info),
+        patch("web.main.download_video_task.delay") as mock_delay,
+    ):
+        mock_delay.return_value.id = "task-size"
+
+        # 2. 执行 (Act)
+        merged = client.post("/downloads", json={"url": "https://www.youtube.com/watch?v=abc", "format_id": "137+140"})
+        explicit = client.post(
+            "/downloads",
+            json={"url": "https://www.youtube.com/watch?v=abc", "format_id": "137+140", "filesize": 1234},
+        )
+
+    # 3. 验证 (Assert)
+    assert merged.status_code == explicit.status_code == 202
+    assert mock_delay.call_args_list[0].kwargs["estimated_size"] == 85_000_000
+    assert mock_delay.call_args_list[1].kwargs["estimated_size"] == 1234
@@ -0,0 +1,48 @@
+# tests/test_media_origin.py
+
+import time
+import urllib.request
+
+import pytest
+
+from benchmarks.bench_download import percentile
+from benchmarks.media_origin import MediaOrigin
+
+
+@pytest.fixture
+def asset(tmp_path):
+    """256KB的假素材文件。"""
+    path = tmp_path / "progressive" / "video.mp4"
+    path.parent.mkdir()
+    path.write_bytes(bytes(range(256)) * 1024)
+    return path
+
+
+def test_origin_serves_byte_ranges(asset, tmp_path):
+    """测试源站支持Range请求（yt-dlp分片和断点续传依赖该行为）。"""
+    with MediaOrigin(tmp_path) as origin:
+        request = urllib.request.Request(origin.url(asset), headers={"Range": "bytes=256-511"})
+        with urllib.request.urlopen(request) as response:
+            body = response.read()
+            assert response.status == 206
+            assert response.headers["Content-Range"] == f"bytes 256-511/{asset.stat().st_size}"
+            assert response.headers["Content-Type"] == "video/mp4"
+
+    assert body == bytes(range(256))
+
+
+def test_origin_throttles_per_connection(asset, tmp_path):
+    """测试带宽上限生效：256KB按8Mbit/s（1MB/s）发送约需0.25秒。"""
+    with MediaOrigin(tmp_path, bandwidth_mbps=8, latency_ms=50) as origin:
+        start = time.perf_counter()
+        with urllib.request.urlopen(origin.url(asset)) as response:
+            assert len(response.read()) == asset.stat().st_size
+        elapsed = time.perf_counter() - start
+
+    assert 0.25 <= elapsed < 1.5
+
+
+def test_percentile_interpolates():
+    """测试延迟分位数按线性插值计算。"""
+    assert percentile([4, 1, 3, 2], 0.5) == 2.5
+    assert percentile([1.0], 0.99) == 1.0
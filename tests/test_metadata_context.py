@@ -0,0 +1,82 @@
+# tests/test_metadata_context.py
+
+import argparse
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from core import MetadataContext
+from downloader import Downloader
+from handlers import process_download_phase, process_metadata_phase
+from main import collect_task_metadata
+
+URL = "https://example.com/watch?v=abc12345"
+INFO = {
+    "id": "abc12345",
+    "title": "Demo",
+    "webpage_url": URL,
+    "formats": [
+        {"format_id": "18", "ext": "mp4", "vcodec": "avc1", "acodec": "mp4a", "width": 640, "height": 360},
+    ],
+}
+
+
+@pytest.fixture
+def downloader(tmp_path, mocker):
+    """所有yt-dlp调用都被记录、且不会真正执行的下载器。"""
+    mocker.patch("downloader.config.downloader.temp_path", str(tmp_path / "temp"))
+    mocker.patch("downloader.config.downloader.streaming_merge", False)
+    dlr = Downloader(tmp_path / "downloads")
+    commands = []
+
+    async def execute_simple(cmd, timeout=None, check_returncode=False):
+        commands.append(cmd)
+        return 0, json.dumps(INFO) if "--dump-json" in cmd else "", ""
+
+    async def download_with_progress(task_desc, cmd, cmd_builder_func, url, cmd_builder_args, output_path=None):
+        commands.append(cmd)
+        (dlr.download_folder / "Demo.mp4").write_bytes(b"video")
+
+    mocker.patch.object(dlr.subprocess_manager, "execute_simple", side_effect=execute_simple)
+    mocker.patch.object(dlr, "_download_with_progress", side_effect=download_with_progress)
+    return dlr, commands
+
+
+@pytest.mark.asyncio
+async def test_item_pipeline_extracts_metadata_once(downloader, mocker):
+    """测试一个项目从收集到下载只调用一次提取器，后续阶段都通过info.json复用。"""
+    # 1. 安排
+    dlr, commands = downloader
+    spawn = mocker.patch("handlers.asyncio.create_subprocess_exec", new_callable=AsyncMock)
+    args = argparse.Namespace(mode="video", ai_subs=False)
+
+    # 2. 执行
+    [(url, prefix, metadata)] = await collect_task_metadata(dlr, [URL])
+    metadata = await process_metadata_phase(dlr, metadata.url, prefix, metadata)
+    info_json_path = metadata.info_json_path
+    assert json.loads(info_json_path.read_text(encoding="utf-8"))["id"] == "abc12345"
+    await process_download_phase(dlr, None, metadata.url, prefix, args, metadata)
+
+    # 3. 断言
+    assert sum("--dump-json" in cmd for cmd in commands) == 1
+    spawn.assert_not_called()
+    metadata_cmd, download_cmd = commands[1], commands[2]
+    for cmd in (metadata_cmd, download_cmd):
+        assert cmd[-2:] == ["--load-info-json", str(info_json_path)]
+        assert URL not in cmd
+    assert (dlr.download_folder / f"{prefix}.txt").read_text(encoding="utf-8").startswith("视频标题: Demo")
+    assert not info_json_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_metadata_phase_extracts_when_no_context(downloader):
+    """测试没有上下文时元数据阶段自行提取一次，并返回可复用的上下文。"""
+    dlr, commands = downloader
+
+    metadata = await process_metadata_phase(dlr, URL, "001_Demo")
+
+    assert isinstance(metadata, MetadataContext) and metadata.has_info
+    assert sum("--dump-json" in cmd for cmd in commands) == 1
+    assert metadata.info_json_path.exists()
+    assert not MetadataContext(URL).has_info
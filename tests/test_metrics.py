@@ -0,0 +1,54 @@
+# tests/test_metrics.py
+
+import asyncio
+import sys
+
+import pytest
+from prometheus_client import REGISTRY
+
+from core import SubprocessManager
+from core.metrics import record_cache
+
+
+def _sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def test_metrics_endpoint_exposes_pipeline_series(client):
+    """测试 /metrics 以Prometheus文本格式导出下载流水线的指标。"""
+    # 1. 安排
+    record_cache("video_info", True)
+
+    # 2. 执行
+    response = client.get("/metrics")
+
+    # 3. 断言
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    for series in (
+        "smartdownloader_extraction_seconds",
+        "smartdownloader_download_strategy_total",
+        "smartdownloader_active_subprocesses",
+        "smartdownloader_stream_bytes_total",
+    ):
+        assert series in body
+    assert 'smartdownloader_cache_requests_total{cache="video_info",result="hit"}' in body
+
+
+@pytest.mark.asyncio
+async def test_active_subprocess_gauge_tracks_running_processes():
+    """测试子进程数指标在进程运行期间加一，结束清理后恢复。"""
+    # 1. 安排
+    manager = SubprocessManager()
+    before = _sample("smartdownloader_active_subprocesses")
+
+    # 2. 执行
+    running = asyncio.create_task(manager.execute_simple([sys.executable, "-c", "import time; time.sleep(0.3)"]))
+    await asyncio.sleep(0.15)
+    during = _sample("smartdownloader_active_subprocesses")
+    await running
+
+    # 3. 断言
+    assert during == before + 1
+    assert _sample("smartdownloader_active_subprocesses") == before
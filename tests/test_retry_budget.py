@@ -0,0 +1,142 @@
+# tests/test_retry_budget.py
+
+import pytest
+
+from core import AuthenticationException, DownloaderException, NetworkException, ProxyException, SubprocessManager
+from core.format_analyzer import DownloadStrategy
+from core.retry_manager import RetryBudget, retry_budget, with_retries
+from downloader import Downloader
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def no_sleep(mocker):
+    return mocker.patch("core.retry_manager.asyncio.sleep")
+
+
+@pytest.mark.asyncio
+async def test_nested_layers_share_one_budget(no_sleep):
+    """测试嵌套的重试层共享同一个预算，失败次数不再逐层相乘。"""
+    # 1. 安排
+    calls = []
+
+    @with_retries(max_retries=3)
+    async def inner():
+        calls.append(1)
+        raise NetworkException("HTTP Error 503: Service Unavailable")
+
+    @with_retries(max_retries=3)
+    async def outer():
+        await inner()
+
+    # 2. 执行
+    with retry_budget(RetryBudget(max_attempts=3, base_delay=1)) as budget:
+        with pytest.raises(NetworkException):
+            await outer()
+
+    # 3. 断言: 没有共享预算时会执行 3x3=9 次
+    assert len(calls) == 4
+    assert [r["error_type"] for r in budget.retries] == ["network"] * 3
+    assert budget.exhausted == "attempts"
+    assert no_sleep.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_error_classes_decide_retry_and_backoff(mocker, no_sleep):
+    """测试认证和不可恢复的错误不重试；代理错误按 proxy_retry_* 线性退避并带抖动。"""
+    # 1. 安排
+    mocker.patch("core.retry_manager.random.uniform", side_effect=lambda low, high: high)
+    budget = RetryBudget(max_attempts=5, proxy_base_delay=30, proxy_increment=10, proxy_max_delay=45)
+    operation = mocker.AsyncMock(
+        side_effect=[
+            ProxyException("代理连接失败"),
+            ProxyException("代理连接失败"),
+            ProxyException("代理连接失败"),
+            "ok",
+        ]
+    )
+
+    # 2. 执行
+    with retry_budget(budget):
+        result = await with_retries(max_retries=5)(operation)()
+        not_retried = [
+            budget.acquire("test", AuthenticationException("Sign in to confirm you're not a bot")),
+            budget.acquire("test", DownloaderException("ERROR: Video unavailable")),
+        ]
+
+    # 3. 断言
+    assert result == "ok"
+    assert [call.args[0] for call in no_sleep.await_args_list] == [30, 40, 45]
+    assert not_retried == [None, None]
+    assert budget.exhausted is None
+
+
+def test_wall_time_budget_stops_retries_and_fallbacks():
+    """测试总耗时超出预算后不再重试，也不再降级到备用策略。"""
+    # 1. 安排
+    clock = FakeClock()
+    budget = RetryBudget(max_attempts=10, max_seconds=60, base_delay=10, clock=clock)
+    error = NetworkException("Connection reset by peer")
+
+    # 2. 执行
+    first = budget.acquire("subprocess", error)
+    allowed = budget.allow_fallback("legacy")
+    clock.now += 55
+    second = budget.acquire("subprocess", error)
+
+    # 3. 断言
+    assert 5 <= first <= 10
+    assert allowed is True
+    assert second is None and budget.exhausted == "time"
+    assert budget.allow_fallback("separate_streams") is False
+    report = budget.report()
+    assert report["fallbacks"] == ["legacy"]
+    assert report["retries"][0]["layer"] == "subprocess"
+
+
+def test_budget_continues_across_celery_retries(mocker):
+    """测试Celery重试任务时从上次的报告恢复已花费的预算。"""
+    mocker.patch("core.retry_manager.config.downloader.max_retries", 2)
+    first = RetryBudget.from_config()
+    first.acquire("celery", ConnectionError("Connection refused"))
+
+    resumed = RetryBudget.from_config(first.report())
+    resumed.acquire("subprocess", NetworkException("HTTP Error 502"))
+
+    assert resumed.started_at == first.started_at
+    assert resumed.acquire("celery", ConnectionError("Connection refused")) is None
+    assert resumed.exhausted == "attempts"
+
+
+@pytest.mark.asyncio
+async def test_broken_url_fails_fast_without_strategy_cascade(mocker, tmp_path, no_sleep):
+    """测试下载始终失败时，预算用尽后不再降级到传统方法，子进程只运行 max_retries+1 次。"""
+    # 1. 安排
+    mocker.patch("core.retry_manager.config.downloader.max_retries", 2)
+    downloader = Downloader(download_folder=tmp_path)
+    mocker.patch.object(downloader, "_prepare_smart_download", return_value=("video", [{"format_id": "18"}]))
+    mocker.patch.object(
+        downloader.command_builder,
+        "build_smart_download_cmd",
+        return_value=(["yt-dlp", "https://example.com/v"], "18", tmp_path / "video.mp4", DownloadStrategy.DIRECT),
+    )
+    run = mocker.patch.object(
+        SubprocessManager, "_run_subprocess_with_progress", side_effect=NetworkException("HTTP Error 503")
+    )
+    legacy = mocker.patch.object(downloader, "download_and_merge")
+
+    # 2. 执行
+    with pytest.raises(DownloaderException, match="重试预算已用尽"):
+        await downloader.download_with_smart_strategy("https://example.com/v")
+
+    # 3. 断言
+    assert run.call_count == 3
+    legacy.assert_not_called()
+    assert downloader.last_retry_budget.report()["exhausted"] == "attempts"
@@ -0,0 +1,203 @@
+# tests/test_segment_downloader.py
+
+import os
+
+import pytest
+
+from benchmarks.media_origin import MediaOrigin
+from core import NonRecoverableErrorException, UnsupportedSegmentsException
+from core.format_analyzer import DownloadStrategy
+from core.segment_downloader import SegmentDownloader, SegmentPlan, parse_hls_playlist
+from downloader import Downloader
+
+SEGMENT_COUNT = 12
+
+
+@pytest.fixture
+def hls_origin(tmp_path):
+    """fMP4的HLS点播素材：一个初始化分片和12个64KB的媒体分片。"""
+    root = tmp_path / "origin" / "hls"
+    root.mkdir(parents=True)
+    (root / "init.mp4").write_bytes(b"init" * 256)
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-TARGETDURATION:2", '#EXT-X-MAP:URI="init.mp4"']
+    for i in range(SEGMENT_COUNT):
+        (root / f"segment_{i:03d}.m4s").write_bytes(os.urandom(64 * 1024))
+        lines += ["#EXTINF:2.0,", f"segment_{i:03d}.m4s"]
+    lines.append("#EXT-X-ENDLIST")
+    (root / "playlist.m3u8").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    with MediaOrigin(tmp_path / "origin") as origin:
+        yield origin, root
+
+
+def _expected(root):
+    return (root / "init.mp4").read_bytes() + b"".join(
+        (root / f"segment_{i:03d}.m4s").read_bytes() for i in range(SEGMENT_COUNT)
+    )
+
+
+@pytest.mark.asyncio
+async def test_hls_segments_reuse_pooled_connections(hls_origin, tmp_path):
+    """测试HLS分片按顺序写入输出文件，所有请求复用不超过并发数的keep-alive连接。"""
+    # 1. 安排
+    origin, root = hls_origin
+    fmt = {"format_id": "hls-720", "protocol": "m3u8_native", "url": origin.url(root / "playlist.m3u8")}
+    downloader = SegmentDownloader(http2=False)
+    output = tmp_path / "video.mp4"
+
+    # 2. 执行
+    try:
+        result, plan = await downloader.download(fmt, output, concurrency=3)
+    finally:
+        await downloader.aclose()
+
+    # 3. 断言: 14个请求（播放列表+初始化分片+12个分片）只建立了3个连接
+    assert result == output and output.read_bytes() == _expected(root)
+    assert plan.protocol == "hls" and plan.container == "fmp4" and len(plan.segments) == SEGMENT_COUNT + 1
+    assert origin.connections <= 3
+    assert not (tmp_path / "video.mp4.native.part").exists()
+    assert not (tmp_path / "video.mp4.native.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_interrupted_download_resumes_after_written_segments(hls_origin, tmp_path):
+    """测试重试时跳过已写入的分片，只请求剩余部分。"""
+    # 1. 安排: 已写入初始化分片和前4个分片，之后源站删除这些文件（重新请求会返回404）
+    origin, root = hls_origin
+    expected = _expected(root)
+    written = (root / "init.mp4").stat().st_size + 4 * 64 * 1024
+    output = tmp_path / "video.mp4"
+    (tmp_path / "video.mp4.native.part").write_bytes(expected[:written] + b"partial-segment")
+    (tmp_path / "video.mp4.native.json").write_text(
+        f'{{"total": {SEGMENT_COUNT + 1}, "done": 5, "bytes": {written}}}', encoding="utf-8"
+    )
+    for path in [root / "init.mp4"] + [root / f"segment_{i:03d}.m4s" for i in range(4)]:
+        path.unlink()
+    fmt = {"format_id": "hls-720", "protocol": "m3u8_native", "url": origin.url(root / "playlist.m3u8")}
+    downloader = SegmentDownloader(http2=False)
+
+    # 2. 执行
+    try:
+        await downloader.download(fmt, output, concurrency=4)
+    finally:
+        await downloader.aclose()
+
+    # 3. 断言: 写到一半的分片被截掉
+    assert output.read_bytes() == expected
+
+
+@pytest.mark.asyncio
+async def test_dash_fragments_with_byte_ranges(tmp_path):
+    """测试DASH分片按 fragment_base_url 解析相对路径，byte_range 转为Range请求。"""
+    # 1. 安排: 单个文件按字节区间切成初始化分片和3个媒体分片
+    media = tmp_path / "origin" / "dash" / "video.mp4"
+    media.parent.mkdir(parents=True)
+    media.write_bytes(os.urandom(4000))
+    bounds = [(0, 1000), (1000, 2000), (2000, 3000), (3000, 4000)]
+    downloader = SegmentDownloader(http2=False)
+
+    with MediaOrigin(tmp_path / "origin") as origin:
+        fmt = {
+            "format_id": "dash-v",
+            "protocol": "http_dash_segments",
+            "fragment_base_url": origin.url(media.parent) + "/",
+            "fragments": [{"path": "video.mp4", "byte_range": {"start": s, "end": e}} for s, e in bounds],
+        }
+
+        # 2. 执行
+        try:
+            output, plan = await downloader.download(fmt, tmp_path / "video.mp4", concurrency=2)
+        finally:
+            await downloader.aclose()
+
+    # 3. 断言
+    assert plan.protocol == "dash" and len(plan.segments) == 4
+    assert output.read_bytes() == media.read_bytes()
+
+
+def test_playlists_left_to_ytdlp():
+    """测试加密、直播和主播放列表交给yt-dlp；MPEG-TS分片的播放列表需要重新封装。"""
+    url = "https://cdn.example.com/hls/index.m3u8"
+    vod = "#EXTM3U\n#EXTINF:2,\nseg0.ts\n#EXT-X-BYTERANGE:500@0\n#EXTINF:2,\nall.ts\n#EXT-X-BYTERANGE:300\n#EXTINF:2,\nall.ts\n#EXT-X-ENDLIST\n"
+    unsupported = [
+        '#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI="key"\n#EXTINF:2,\nseg0.ts\n#EXT-X-ENDLIST\n',
+        "#EXTM3U\n#EXTINF:2,\nseg0.ts\n",
+        "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000\n720p.m3u8\n",
+    ]
+
+    plan = parse_hls_playlist(vod, url)
+
+    assert plan == SegmentPlan("hls", plan.segments, "mpegts")
+    assert [s.url for s in plan.segments] == ["https://cdn.example.com/hls/seg0.ts"] + [
+        "https://cdn.example.com/hls/all.ts"
+    ] * 2
+    assert [s.byte_range for s in plan.segments] == [None, (0, 500), (500, 800)]
+    assert plan.segments[2].headers() == {"Range": "bytes=500-799"}
+    for text in unsupported:
+        with pytest.raises(UnsupportedSegmentsException):
+            parse_hls_playlist(text, url)
+    assert not SegmentDownloader.supports({"protocol": "https", "url": url})
+
+
+@pytest.fixture
+def native_downloader(mocker, tmp_path):
+    """启用原生分片下载、选中HLS完整流的下载器。"""
+    mocker.patch("downloader.config.downloader.native_segment_download", True)
+    dlr = Downloader(download_folder=tmp_path)
+    output = tmp_path / "video.mp4"
+    formats = [{"format_id": "hls-720", "protocol": "m3u8_native", "url": "https://cdn.example.com/index.m3u8"}]
+    mocker.patch.object(
+        dlr.command_builder,
+        "build_smart_download_cmd",
+        return_value=(
+            ["yt-dlp", "--concurrent-fragments", "4", "--", "url"],
+            "hls-720",
+            output,
+            DownloadStrategy.DIRECT,
+        ),
+    )
+    ytdlp = mocker.patch.object(dlr, "_download_with_progress", side_effect=lambda *a, **k: output.write_bytes(b"yt"))
+    return dlr, formats, output, ytdlp
+
+
+@pytest.mark.asyncio
+async def test_downloader_uses_native_segments_for_hls(native_downloader, mocker):
+    """测试HLS完整流由原生分片下载完成，不启动yt-dlp，并发数来自连接预算。"""
+    # 1. 安排
+    dlr, formats, output, ytdlp = native_downloader
+
+    async def download(fmt, output_file, concurrency, progress=None, task_id=None):
+        output_file.write_bytes(b"native")
+        return output_file, SegmentPlan("hls", [], "fmp4")
+
+    native = mocker.patch.object(dlr.segment_downloader, "download", side_effect=download)
+
+    # 2. 执行
+    result = await dlr._execute_smart_download("https://cdn.example.com/v", "video", formats, "hls-720", None)
+
+    # 3. 断言
+    assert result == output and output.read_bytes() == b"native"
+    assert native.call_args.args[2] == 4
+    ytdlp.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_downloader_falls_back_to_ytdlp_when_native_fails(native_downloader, mocker):
+    """测试原生分片下载失败时删除临时文件并回退到yt-dlp。"""
+    # 1. 安排
+    dlr, formats, output, ytdlp = native_downloader
+    part = output.with_name("video.mp4.native.part")
+
+    async def download(fmt, output_file, concurrency, progress=None, task_id=None):
+        part.write_bytes(b"half")
+        raise NonRecoverableErrorException("分片请求失败: HTTP 403")
+
+    mocker.patch.object(dlr.segment_downloader, "download", side_effect=download)
+
+    # 2. 执行
+    result = await dlr._execute_smart_download("https://cdn.example.com/v", "video", formats, "hls-720", None)
+
+    # 3. 断言
+    assert result == output and output.read_bytes() == b"yt"
+    ytdlp.assert_called_once()
+    assert not part.exists()
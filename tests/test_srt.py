@@ -0,0 +1,81 @@
+# tests/test_srt.py
+
+import pytest
+
+from core.srt import Cue, iter_srt_file, parse_srt, read_srt, serialize_cues, write_srt
+from subtitles import SubtitleMerger
+
+SAMPLE = "1\n00:00:01,000 --> 00:00:02,500\nHello\n\n2\n00:00:03,000 --> 00:00:04,000\nTwo\nlines\n\n"
+
+
+def test_parse_and_serialize_round_trip():
+    """测试解析后再序列化得到相同的SRT文本。"""
+    cues = parse_srt(SAMPLE)
+
+    assert cues == [Cue(1, 1000, 2500, "Hello"), Cue(2, 3000, 4000, "Two\nlines")]
+    assert serialize_cues(cues) == SAMPLE
+
+
+def test_parse_tolerates_crlf_missing_index_and_empty_text():
+    """测试CRLF换行、缺失序号、空文本和无结尾空行的字幕都能解析。"""
+    content = (
+        "1\r\n00:00:01,000 --> 00:00:02,000\r\nA\r\n\r\n"
+        "00:00:03.000 --> 00:00:04,000\r\nB\r\n\r\n"
+        "7\r\n00:00:05,000 --> 00:00:06,000\r\n\r\n"
+        "8\r\n00:00:07,000 --> 00:00:08,000\r\nC"
+    )
+
+    cues = parse_srt(content)
+
+    assert [(c.index, c.start_ms, c.text) for c in cues] == [
+        (1, 1000, "A"),
+        (2, 3000, "B"),
+        (7, 5000, ""),
+        (8, 7000, "C"),
+    ]
+
+
+def test_write_srt_renumbers_and_streams_back(tmp_path):
+    """测试写入时连续编号，且可按行流式读回（含BOM）。"""
+    path = tmp_path / "out.srt"
+    cues = [Cue(i * 10, i * 1000, i * 1000 + 500, f"line {i}") for i in range(5000)]
+
+    assert write_srt(path, cues) == 5000
+
+    streamed = iter_srt_file(path)
+    assert next(streamed) == Cue(1, 0, 500, "line 0")
+    assert [c.index for c in read_srt(path)] == list(range(1, 5001))
+
+    path.write_bytes(b"\xef\xbb\xbf" + SAMPLE.encode())
+    assert read_srt(path)[0] == Cue(1, 1000, 2500, "Hello")
+
+
+@pytest.mark.asyncio
+async def test_merger_aligns_by_index_and_keeps_english_timing(tmp_path):
+    """测试双语合并按序号对齐，缺失的中文不会产生空行。"""
+    en_srt = tmp_path / "v.en.srt"
+    zh_srt = tmp_path / "v.zh.srt"
+    en_srt.write_text(SAMPLE, encoding="utf-8")
+    zh_srt.write_text("1\n00:00:09,000 --> 00:00:09,500\n你好\n\n", encoding="utf-8")
+
+    bi_srt = await SubtitleMerger().merge_subtitles(en_srt, zh_srt)
+
+    assert read_srt(bi_srt) == [Cue(1, 1000, 2500, "你好\nHello"), Cue(2, 3000, 4000, "Two\nlines")]
+
+
+@pytest.mark.asyncio
+async def test_merger_streams_files_and_leaves_no_partial_output(tmp_path):
+    """测试从文件合并时逐条读取英文字幕；读取出错时不留下不完整的双语字幕。"""
+    en_srt = tmp_path / "v.en.srt"
+    zh_srt = tmp_path / "v.zh.srt"
+    write_srt(en_srt, [Cue(i, i * 1000, i * 1000 + 500, f"line {i}") for i in range(1, 3001)])
+    zh_srt.write_text("2\n00:00:02,000 --> 00:00:02,500\n第二行\n\n", encoding="utf-8")
+
+    bi_srt = await SubtitleMerger().merge_subtitles(en_srt, zh_srt)
+    merged = read_srt(bi_srt)
+    en_srt.write_bytes(b"1\n00:00:01,000 --> 00:00:01,500\n\xff\xfe\n\n")
+    failed = await SubtitleMerger().merge_subtitles(en_srt, zh_srt)
+
+    assert len(merged) == 3000 and merged[1].text == "第二行\nline 2"
+    assert failed is None
+    assert not bi_srt.exists()
@@ -0,0 +1,150 @@
+# tests/test_stall_detector.py
+
+import json
+import sys
+
+import pytest
+from rich.progress import Progress
+
+from core import SubprocessManager
+from core.command_builder import CommandBuilder
+from core.exceptions import DownloadStalledException
+from core.stall_detector import StallDetector
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _detector(clock):
+    # 10秒窗口，每2秒检查一次，连续3次低于 10KB/s 判定停滞
+    return StallDetector(10, 2, 3, 10 * 1024, clock=clock)
+
+
+def _feed(detector, clock, seconds, bytes_per_second, stream="video.mp4", total=None):
+    """每秒上报一次进度，并在每次上报后做检查；返回判定停滞时的吞吐"""
+    downloaded = detector._last_bytes.get(stream, 0)
+    for _ in range(seconds):
+        clock.now += 1
+        downloaded += bytes_per_second
+        detector.record(stream, downloaded, total)
+        rate = detector.check()
+        if rate is not None:
+            return rate
+    return None
+
+
+def test_trickling_download_is_stalled_after_consecutive_low_checks():
+    """测试以几KB/s缓慢传输的下载在一个窗口后、连续低于下限的次数达到阈值时判定停滞。"""
+    # 1. 安排
+    clock = FakeClock()
+    detector = _detector(clock)
+
+    # 2. 执行: 先正常下载，再降到 5KB/s
+    healthy = _feed(detector, clock, 20, 1024 * 1024)
+    stalled = _feed(detector, clock, 30, 5 * 1024)
+
+    # 3. 断言: 窗口内平均吞吐需要先降到下限以下，再连续检查3次
+    assert healthy is None
+    assert stalled is not None and stalled < 10 * 1024
+    assert 30 < clock.now <= 40
+
+
+def test_no_progress_output_and_post_processing():
+    """测试开始下载后只有重试输出没有进度时判定停滞；文件下载完成后的后处理不算停滞。"""
+    # 1. 安排
+    clock = FakeClock()
+    retrying, finished = _detector(clock), _detector(clock)
+
+    # 2. 执行
+    retrying.record("video.mp4", 0)
+    finished.record("video.mp4", 0)
+    finished.record("video.mp4", 100, 100)
+    results = []
+    for _ in range(30):
+        clock.now += 1
+        results.append((retrying.check(), finished.check()))
+
+    # 3. 断言
+    assert any(stalled is not None for stalled, _ in results)
+    assert all(paused is None for _, paused in results)
+
+
+def test_extraction_before_first_progress_is_not_stalled():
+    """测试第一条进度之前（yt-dlp提取信息阶段）不判定停滞，检测从第一条进度开始。"""
+    # 1. 安排
+    clock = FakeClock()
+    detector = _detector(clock)
+
+    # 2. 执行: 60秒没有任何进度，之后开始正常下载
+    extracting = []
+    for _ in range(60):
+        clock.now += 1
+        extracting.append(detector.check())
+    downloading = _feed(detector, clock, 20, 1024 * 1024)
+
+    # 3. 断言
+    assert all(rate is None for rate in extracting)
+    assert downloading is None
+
+
+def test_resumed_download_offset_is_not_counted_as_throughput():
+    """测试续传时第一条进度（断点位置）只作为基线。"""
+    clock = FakeClock()
+    detector = _detector(clock)
+
+    detector.record("video.mp4", 500 * 1024 * 1024)
+    clock.now += 10
+
+    assert detector.throughput() == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_subprocess_raises_stalled(mocker):
+    """测试子进程持续输出进度但吞吐低于下限时被判定停滞。"""
+    # 1. 安排
+    detector = StallDetector(0.3, 0.05, 2, 1024 * 1024)
+    mocker.patch.object(StallDetector, "from_config", return_value=detector)
+    line = {"status": "downloading", "_percent": 1.0, "total_bytes": 10**9, "filename": "v.mp4"}
+    script = (
+        "import json, time\n"
+        "for i in range(200):\n"
+        f"    print(json.dumps(dict({json.dumps(line)}, downloaded_bytes=i * 100)), flush=True)\n"
+        "    time.sleep(0.02)\n"
+    )
+    manager = SubprocessManager()
+
+    # 2. 执行 & 3. 断言
+    with Progress(disable=True) as progress:
+        task_id = progress.add_task("test", total=100)
+        with pytest.raises(DownloadStalledException, match="下载停滞"):
+            await manager._run_subprocess_with_progress([sys.executable, "-c", script], progress, task_id)
+    assert manager.get_running_process_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_stalled_download_restarts_with_continue(mocker):
+    """测试停滞后的重试改用 --continue 从 .part 文件续传。"""
+    # 1. 安排
+    mocker.patch("core.retry_manager.asyncio.sleep")
+    manager = SubprocessManager()
+    run = mocker.patch.object(
+        manager,
+        "_run_subprocess_with_progress",
+        side_effect=[DownloadStalledException("下载停滞"), (0, "", "")],
+    )
+    cmd = CommandBuilder().build_video_download_cmd("/tmp/out.mp4", "https://example.com/v")
+
+    # 2. 执行
+    with Progress(disable=True) as progress:
+        await manager.execute_with_progress(cmd, progress, progress.add_task("test"))
+
+    # 3. 断言
+    first, second = (call.args[0] for call in run.call_args_list)
+    assert "--force-overwrites" in first and "--no-part" not in first
+    assert "--force-overwrites" not in second and second[1] == "--continue"
+    assert second[2:] == [arg for arg in first[1:] if arg != "--force-overwrites"]
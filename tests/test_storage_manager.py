@@ -0,0 +1,107 @@
+# tests/test_storage_manager.py
+
+import time
+
+import pytest
+
+from core import InsufficientStorageException
+from web.file_index import INDEX_KEY, OWNER_KEY, DownloadFileIndex
+from web.storage_manager import ACCESS_KEY, MB, RESERVATIONS_KEY, StorageManager
+
+
+def _write(path, size_mb):
+    path.write_bytes(b"x" * (size_mb * MB))
+    return path
+
+
+@pytest.fixture
+def storage(tmp_path, fake_redis):
+    """配额10MB、不检查磁盘剩余空间的配额管理器。"""
+    return StorageManager(fake_redis, [tmp_path], quota_bytes=10 * MB), fake_redis
+
+
+def test_reserve_evicts_least_recently_used_files(storage, tmp_path):
+    """测试预留超出配额时按访问时间从旧到新淘汰文件，并作废其下载凭证。"""
+    # 1. 安排
+    manager, redis = storage
+    oldest = _write(tmp_path / "oldest.mp4", 3)
+    older = _write(tmp_path / "older.mp4", 3)
+    recent = _write(tmp_path / "recent.mp4", 3)
+    for i, path in enumerate((oldest, recent, older)):
+        redis.zadd(ACCESS_KEY, {str(path.resolve()): 1000 + i})
+    DownloadFileIndex(redis, tmp_path, 3600).register("t1", oldest, 600)
+    redis.data["download:t1"] = {"file_path": str(oldest)}
+    # recent 在 older 之后被用户取走，访问时间更新
+    manager.record_access(recent)
+
+    # 2. 执行
+    manager.reserve("new", 5 * MB)
+
+    # 3. 断言
+    assert not oldest.exists() and not older.exists() and recent.exists()
+    assert "download:t1" not in redis.data
+    assert str(oldest.resolve()) not in redis.data[INDEX_KEY]
+    assert str(oldest.resolve()) not in redis.data[OWNER_KEY]
+    assert list(redis.data[ACCESS_KEY]) == [str(recent.resolve())]
+    assert redis.data[RESERVATIONS_KEY]["new"].startswith(f"{5 * MB}:")
+
+
+def test_reserve_raises_when_eviction_cannot_free_enough(storage, tmp_path):
+    """测试淘汰所有可淘汰文件后仍不足时抛出异常，且不写入预留。"""
+    manager, redis = storage
+    _write(tmp_path / "in_progress.part", 4)
+    manager.record_access(_write(tmp_path / "done.mp4", 2))
+
+    with pytest.raises(InsufficientStorageException):
+        manager.reserve("big", 9 * MB)
+
+    assert (tmp_path / "in_progress.part").exists()
+    assert RESERVATIONS_KEY not in redis.data or "big" not in redis.data[RESERVATIONS_KEY]
+
+
+def test_reservations_count_until_released_or_expired(storage, tmp_path):
+    """测试并发任务的预留会计入配额，释放或过期后不再占用。"""
+    manager, redis = storage
+    manager.reserve("a", 6 * MB)
+
+    with pytest.raises(InsufficientStorageException):
+        manager.reserve("b", 6 * MB)
+
+    manager.release("a")
+    manager.reserve("b", 6 * MB)
+    redis.data[RESERVATIONS_KEY]["b"] = f"{6 * MB}:{time.time() - 1}"
+    assert manager.reserved_bytes() == 0
+    assert "b" not in redis.data[RESERVATIONS_KEY]
+
+
+def test_shrink_releases_written_part_of_reservation(storage, tmp_path):
+    """测试下载过程中按已写入的部分缩减预留，正在下载的文件不会被重复计算而导致淘汰。"""
+    # 1. 安排
+    manager, redis = storage
+    finished = _write(tmp_path / "finished.mp4", 3)
+    manager.record_access(finished)
+    manager.reserve("a", 6 * MB)
+    expires_at = redis.data[RESERVATIONS_KEY]["a"].split(":")[1]
+
+    # 2. 执行: 已写入4MB，预留缩减到剩余的2MB
+    _write(tmp_path / "a.mp4.part", 4)
+    manager.shrink("a", 2 * MB)
+    manager.shrink("a", 5 * MB)
+    manager.reserve("b", 1 * MB)
+
+    # 3. 断言
+    assert redis.data[RESERVATIONS_KEY]["a"] == f"{2 * MB}:{expires_at}"
+    assert finished.exists()
+
+
+def test_report_includes_usage_and_reservations(storage, tmp_path):
+    """测试配额报告包含已用、预留和利用率。"""
+    manager, _ = storage
+    manager.record_access(_write(tmp_path / "video.mp4", 2))
+    manager.reserve("a", 3 * MB)
+
+    report = manager.report()
+
+    assert report["used_mb"] == 2 and report["reserved_mb"] == 3
+    assert report["quota_mb"] == 10 and report["utilization_percent"] == 50.0
+    assert report["tracked_files"] == 1 and report["disk_free_mb"] > 0
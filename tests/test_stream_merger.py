@@ -0,0 +1,131 @@
+# tests/test_stream_merger.py
+
+import sys
+
+import pytest
+from prometheus_client import REGISTRY
+
+from core import CommandBuilder, DownloaderException, StreamMerger
+from core.transfer_tuner import TransferTuner
+
+# 假的yt-dlp: 往stdout写入媒体数据，往stderr写一行JSON进度，并记录分到的分片并发数
+FAKE_YTDLP = """
+import sys, json
+fragments = sys.argv[sys.argv.index("--concurrent-fragments") + 1]
+format_spec, exit_code, log_path = sys.argv[-3:]
+with open(log_path, "a") as log:
+    log.write(f"{format_spec}={fragments}\\n")
+data = format_spec.encode() * 1000
+sys.stderr.write(json.dumps({"status": "downloading", "_percent": 50.0, "total_bytes": len(data),
+    "downloaded_bytes": len(data) // 2, "filename": "-"}) + "\\n")
+sys.stderr.flush()
+sys.stdout.buffer.write(data)
+sys.exit(int(exit_code))
+"""
+
+# 假的ffmpeg: 从两个继承的管道fd读取数据并写入输出文件
+FAKE_FFMPEG = (
+    "import os, sys;"
+    "fds = [int(a.split(':')[1]) for a in sys.argv[1:3]];"
+    "chunks = [os.fdopen(fd, 'rb').read() for fd in fds];"
+    "open(sys.argv[3], 'wb').write(b'|'.join(chunks))"
+)
+
+
+@pytest.fixture
+def fake_merger(mocker, tmp_path):
+    """把yt-dlp/ffmpeg替换为本地python脚本的StreamMerger，分片并发数写入 fragments.log。"""
+    builder = CommandBuilder(transfer_tuner=TransferTuner(default_fragments=4, connection_budget=0))
+    exit_codes = {"V": 0, "A": 0}
+    # yt-dlp命令的传输参数插在第一个参数之后，假脚本需要能作为可执行文件直接运行
+    script = tmp_path / "fake-yt-dlp"
+    script.write_text(f"#!{sys.executable}\n{FAKE_YTDLP}")
+    script.chmod(0o755)
+    fragments_log = tmp_path / "fragments.log"
+
+    def stdout_cmd(url, format_spec, info_json_path=None):
+        return [
+            str(script),
+            "--concurrent-fragments",
+            "4",
+            format_spec,
+            str(exit_codes[format_spec]),
+            str(fragments_log),
+        ]
+
+    def merge_cmd(video_fd, audio_fd, output_path):
+        return [sys.executable, "-c", FAKE_FFMPEG, f"pipe:{video_fd}", f"pipe:{audio_fd}", output_path]
+
+    mocker.patch.object(builder, "build_stream_to_stdout_cmd", side_effect=stdout_cmd)
+    mocker.patch.object(builder, "build_ffmpeg_pipe_merge_cmd", side_effect=merge_cmd)
+    return StreamMerger(builder), exit_codes
+
+
+def test_build_pipe_commands():
+    """测试流式合并相关命令的关键参数。"""
+    builder = CommandBuilder()
+
+    stdout_cmd = builder.build_stream_to_stdout_cmd("https://example.com/v", "137")
+    assert stdout_cmd[-4:] == ["-o", "-", "--", "https://example.com/v"]
+    assert stdout_cmd[stdout_cmd.index("-f") + 1] == "137"
+
+    ffmpeg_cmd = builder.build_ffmpeg_pipe_merge_cmd(5, 7, "out.mp4")
+    assert "pipe:5" in ffmpeg_cmd and "pipe:7" in ffmpeg_cmd
+    assert "+frag_keyframe+empty_moov+default_base_moof" in ffmpeg_cmd
+    assert ffmpeg_cmd[ffmpeg_cmd.index("-c") + 1] == "copy"
+
+
+@pytest.mark.asyncio
+async def test_merge_pipes_both_streams_into_single_output(fake_merger, tmp_path):
+    """测试两个流通过管道一次性写入输出文件。"""
+    merger, _ = fake_merger
+    output_file = tmp_path / "out.mp4"
+
+    result = await merger.merge("https://example.com/v", "V", "A", output_file)
+
+    assert result == output_file
+    assert output_file.read_bytes() == b"V" * 1000 + b"|" + b"A" * 1000
+    assert merger.subprocess_manager.get_running_process_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_merge_fails_when_one_stream_fails(fake_merger, tmp_path):
+    """测试任一流下载失败时抛出异常并清理所有进程。"""
+    merger, exit_codes = fake_merger
+    exit_codes["A"] = 1
+
+    with pytest.raises(DownloaderException, match="音频流下载失败"):
+        await merger.merge("https://example.com/v", "V", "A", tmp_path / "out.mp4")
+
+    assert merger.subprocess_manager.get_running_process_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_merge_restores_active_subprocess_gauge(fake_merger, tmp_path):
+    """测试流式合并的三个子进程计入子进程数指标，结束后指标恢复原值。"""
+    # 1. 安排
+    merger, _ = fake_merger
+    before = REGISTRY.get_sample_value("smartdownloader_active_subprocesses") or 0.0
+
+    # 2. 执行
+    await merger.merge("https://example.com/v", "V", "A", tmp_path / "out.mp4")
+
+    # 3. 断言
+    assert (REGISTRY.get_sample_value("smartdownloader_active_subprocesses") or 0.0) == before
+
+
+@pytest.mark.asyncio
+async def test_both_streams_share_the_connection_budget(fake_merger, tmp_path):
+    """测试两个yt-dlp进程都在连接预算内运行，合计连接数不超过预算，结束后租约释放。"""
+    # 1. 安排
+    merger, _ = fake_merger
+    tuner = merger.command_builder.transfer_tuner
+    tuner.connection_budget = 6
+
+    # 2. 执行
+    await merger.merge("https://example.com/v", "V", "A", tmp_path / "out.mp4")
+
+    # 3. 断言
+    fragments = dict(line.split("=") for line in (tmp_path / "fragments.log").read_text().split())
+    assert fragments == {"V": "4", "A": "2"}
+    assert tuner._leases == {}
@@ -0,0 +1,90 @@
+# tests/test_stream_transport.py
+
+import asyncio
+import sys
+
+import pytest
+
+from web import main
+from web.stream_transport import MIN_CHUNK_SIZE, coalesced_chunks, enlarge_stdout_pipe
+
+KB = 1024
+
+
+async def _take(chunks, count):
+    return [len(await chunks.__anext__()) for _ in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_chunks_grow_for_slow_client_and_shrink_when_source_is_slow():
+    """测试缓冲区积满时数据块逐步加倍到上限，数据来得慢时缩小回下限。"""
+    # 1. 安排: 客户端消费前数据源已经写入了约3MB
+    reader = asyncio.StreamReader(limit=1024 * KB)
+    reader.feed_data(bytes(3008 * KB))
+    chunks = coalesced_chunks(reader, max_chunk=1024 * KB)
+
+    # 2. 执行
+    growing = await _take(chunks, 6)
+    trickle = []
+    for _ in range(5):
+        reader.feed_data(bytes(4 * KB))
+        trickle += await _take(chunks, 1)
+    reader.feed_data(bytes(4 * MIN_CHUNK_SIZE))
+    after = await _take(chunks, 2)
+    reader.feed_eof()
+
+    # 3. 断言: 64K、128K、256K、512K、1M后保持1M；之后每次只有4K，块大小逐步减半到64K
+    assert growing == [64 * KB, 128 * KB, 256 * KB, 512 * KB, 1024 * KB, 1024 * KB]
+    assert trickle == [4 * KB] * 5
+    assert after == [MIN_CHUNK_SIZE, 2 * MIN_CHUNK_SIZE]
+    assert [len(chunk) async for chunk in chunks] == [MIN_CHUNK_SIZE]
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform != "linux", reason="F_SETPIPE_SZ 仅Linux支持")
+async def test_stdout_pipe_is_enlarged():
+    """测试扩大子进程stdout管道，超过系统上限时取上限。"""
+    import fcntl
+
+    process = await asyncio.create_subprocess_exec("sleep", "5", stdout=asyncio.subprocess.PIPE)
+    try:
+        capacity = enlarge_stdout_pipe(process, 512 * KB)
+        huge = enlarge_stdout_pipe(process, 1 << 40)
+        fd = process._transport.get_pipe_transport(1).get_extra_info("pipe").fileno()
+        actual = fcntl.fcntl(fd, fcntl.F_GETPIPE_SZ)
+    finally:
+        process.kill()
+        await process.wait()
+
+    assert capacity == 512 * KB
+    assert huge == actual >= 512 * KB
+    assert enlarge_stdout_pipe(process, 0) is None
+
+
+def test_download_stream_sends_whole_output(client, mocker):
+    """测试 /download-stream 按合并后的数据块发送完整输出，正常结束计入熔断状态。"""
+    # 1. 安排
+    size = 3 * 1024 * KB + 123
+    mocker.patch.object(
+        main.command_builder,
+        "build_streaming_download_cmd_to_stdout",
+        return_value=["head", "-c", str(size), "/dev/zero"],
+    )
+    breaker = mocker.patch("web.main.circuit_breaker")
+    breaker.allow.return_value = False
+    params = {
+        "url": "https://www.youtube.com/watch?v=abc",
+        "download_type": "video",
+        "format_id": "18",
+        "resolution": "360p",
+        "title": "test",
+    }
+
+    # 2. 执行
+    response = client.get("/download-stream", params=params)
+
+    # 3. 断言
+    assert response.status_code == 200
+    assert len(response.content) == size
+    breaker.record_outcome.assert_called_once_with(mocker.ANY, None, False)
+    assert main.process_registry.snapshot() == []
@@ -0,0 +1,161 @@
+# tests/test_transcription.py
+
+import asyncio
+import sys
+
+import pytest
+
+from benchmarks.synthetic_audio import write_synthetic_speech_wav
+from core import ChunkedTranscriber, CommandBuilder
+from core.srt import Cue, format_timestamp
+from core.transcription import MAX_AUTO_WORKERS, AudioChunk, find_silences, parse_whisper_output, plan_chunks
+
+# 假的whisper-cli: 每个片段输出两条以片段内时间计的字幕
+FAKE_WHISPER = (
+    "import sys, wave;"
+    "w = wave.open(sys.argv[-1], 'rb'); d = int(w.getnframes() * 1000 / w.getframerate());"
+    "print('[00:00:00.000 --> 00:00:01.000]  first');"
+    "print('[00:00:01.000 --> 00:00:%02d.%03d]  last' % (d // 1000, d % 1000))"
+)
+
+
+@pytest.fixture
+def synthetic_wav(tmp_path):
+    """30秒的合成语音音频及其真实静音区间。"""
+    wav_path = tmp_path / "speech.wav"
+    silences = write_synthetic_speech_wav(wav_path, duration_s=30)
+    return wav_path, silences
+
+
+def test_find_silences_matches_synthetic_gaps(synthetic_wav):
+    """测试VAD找到的静音区间与合成音频中的静音段一致。"""
+    wav_path, expected = synthetic_wav
+
+    duration_ms, silences = find_silences(wav_path, min_silence_ms=500)
+
+    assert duration_ms == 30000
+    assert len(silences) == len(expected)
+    for (start, end), (exp_start, exp_end) in zip(silences, expected):
+        assert abs(start - exp_start) <= 30
+        assert abs(end - exp_end) <= 30
+
+
+def test_plan_chunks_cuts_at_silence_and_forces_long_segments():
+    """测试切分点落在达到目标时长后的第一个静音中点，且无静音的长段会被强制切分。"""
+    silences = [(9000, 10000), (15000, 16000), (19000, 20000)]
+
+    assert plan_chunks(60000, silences, target_ms=10000, max_ms=20000) == [
+        (0, 15500),
+        (15500, 35500),
+        (35500, 55500),
+        (55500, 60000),
+    ]
+
+
+def test_parse_whisper_output_applies_offset():
+    """测试whisper输出解析和时间戳偏移。"""
+    raw = "[00:00:01.500 --> 00:00:03.250]   Hello there\nnoise line\n[00:01:00.000 --> 00:01:02.000]  Bye\n"
+
+    cues = parse_whisper_output(raw, offset_ms=60000)
+
+    assert cues == [Cue(1, 61500, 63250, "Hello there"), Cue(2, 120000, 122000, "Bye")]
+    assert format_timestamp(3723004) == "01:02:03,004"
+
+
+@pytest.mark.asyncio
+async def test_chunked_transcriber_stitches_segments_in_order(synthetic_wav, tmp_path, mocker):
+    """测试并行转录后字幕按时间顺序拼接、编号连续、时间戳已偏移。"""
+    # 1. 安排
+    wav_path, _ = synthetic_wav
+    builder = CommandBuilder()
+    mocker.patch.object(
+        builder,
+        "build_whisper_cmd",
+        side_effect=lambda model, lang, audio, threads=None: [sys.executable, "-c", FAKE_WHISPER, audio],
+    )
+    transcriber = ChunkedTranscriber(builder, workers=3)
+    transcriber.chunk_ms = 8000
+    srt_path = tmp_path / "speech.en.srt"
+
+    # 2. 执行
+    cue_count = await transcriber.transcribe(wav_path, tmp_path / "model.bin", "en", srt_path)
+
+    # 3. 断言
+    blocks = srt_path.read_text(encoding="utf-8").strip().split("\n\n")
+    assert cue_count == len(blocks) >= 4
+    assert [int(block.split("\n")[0]) for block in blocks] == list(range(1, cue_count + 1))
+    starts = [block.split("\n")[1].split(" --> ")[0] for block in blocks]
+    assert starts == sorted(starts)
+    assert blocks[-1].split("\n")[1].endswith("00:00:30,000")
+    assert not list(tmp_path.glob("whisper_chunks_*"))
+
+
+@pytest.mark.asyncio
+async def test_cancelled_chunk_reaps_whisper_process(tmp_path, mocker):
+    """测试片段转录被取消时先结束并回收whisper进程，再向上抛出取消。"""
+    # 1. 安排
+    builder = CommandBuilder()
+    mocker.patch.object(
+        builder,
+        "build_whisper_cmd",
+        side_effect=lambda model, lang, audio, threads=None: [sys.executable, "-c", "import time; time.sleep(30)"],
+    )
+    spawn = mocker.spy(asyncio, "create_subprocess_exec")
+    transcriber = ChunkedTranscriber(builder, workers=1)
+    chunk = AudioChunk(0, 0, 1000, tmp_path / "chunk_0.wav")
+
+    # 2. 执行
+    task = asyncio.create_task(transcriber._transcribe_chunk(chunk, tmp_path / "model.bin", "en", asyncio.Semaphore(1)))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # 3. 断言
+    process = spawn.spy_return
+    assert process.returncode is not None
+
+
+def test_auto_workers_limited_by_model_size_and_memory(tmp_path, mocker):
+    """测试自动选择的并行进程数按每个进程加载一份模型估算内存，且不超过上限。"""
+    # 1. 安排: 可用内存4GB，模型约1.5GB
+    model = tmp_path / "ggml-medium.bin"
+    with open(model, "wb") as f:
+        f.truncate(1536 * 1024 * 1024)
+    mocker.patch("core.transcription.psutil.virtual_memory").return_value.available = 4 * 1024**3
+    mocker.patch("core.transcription.os.cpu_count", return_value=32)
+
+    # 2. 执行
+    workers = ChunkedTranscriber.auto_workers(model)
+    tiny_workers = ChunkedTranscriber.auto_workers(tmp_path / "missing.bin")
+
+    # 3. 断言
+    assert workers == 2
+    assert tiny_workers == MAX_AUTO_WORKERS
+
+
+@pytest.mark.asyncio
+async def test_unsupported_wav_falls_back_to_single_pass(tmp_path, mocker):
+    """测试WAV无法切分（非16位PCM）时改用整段转录。"""
+    # 1. 安排
+    import wave
+
+    from subtitles import TranscriptionProcessor
+
+    wav_path = tmp_path / "speech.wav"
+    with wave.open(str(wav_path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(4)
+        wav.setframerate(16000)
+        wav.writeframes(b"\0" * 64000)
+    processor = TranscriptionProcessor()
+    processor.chunk_seconds = 300
+    srt_path = tmp_path / "speech.en.srt"
+    single_pass = mocker.patch.object(processor, "_transcribe_single_pass", return_value=srt_path)
+
+    # 2. 执行
+    result = await processor._transcribe_in_chunks(wav_path, tmp_path / "model.bin", srt_path)
+
+    # 3. 断言
+    assert result == srt_path
+    single_pass.assert_awaited_once_with(wav_path, tmp_path / "model.bin", srt_path)
@@ -0,0 +1,144 @@
+# tests/test_transfer_tuner.py
+
+import pytest
+
+from core.command_builder import CommandBuilder
+from core.transfer_tuner import LEASES_KEY, MB, TransferPlan, TransferTuner, existing_bytes
+
+URL = "https://cdn.example.com/watch?v=abc"
+
+PROGRESSIVE = {"format_id": "18", "ext": "mp4", "vcodec": "avc1.42001E", "acodec": "mp4a.40.2", "height": 360,
+               "width": 640, "filesize": 50 * MB, "protocol": "https", "tbr": 500}  # fmt: skip
+HLS = {"format_id": "hls-1080", "ext": "mp4", "vcodec": "avc1.640028", "acodec": "mp4a.40.2", "height": 1080,
+       "width": 1920, "protocol": "m3u8_native", "tbr": 5000}  # fmt: skip
+
+
+@pytest.fixture
+def tuner():
+    return TransferTuner(default_fragments=4, max_fragments=16, connection_budget=32, http_chunk_size=10 * MB)
+
+
+def test_plan_depends_on_stream_type(tuner):
+    """测试单文件格式按块下载不开并发；HLS使用站点并发数；DASH分片少时并发数不超过分片数。"""
+    # 1. 安排
+    dash = {"format_id": "dash-v", "protocol": "http_dash_segments", "fragments": [{"url": "a"}, {"url": "b"}]}
+    small = dict(PROGRESSIVE, filesize=2 * MB)
+
+    # 2. 执行
+    progressive_plan = tuner.plan([PROGRESSIVE], URL)
+    hls_plan = tuner.plan([HLS], URL)
+    dash_plan = tuner.plan([dash, None], URL)
+    small_plan = tuner.plan([small], URL)
+
+    # 3. 断言
+    assert progressive_plan == TransferPlan(1, 10 * MB, MB)
+    assert hls_plan == TransferPlan(4)
+    assert dash_plan == TransferPlan(2)
+    assert small_plan == TransferPlan(1)
+
+
+def test_domain_concurrency_grows_and_backs_off_when_throttled(tuner):
+    """测试吞吐随并发提升时站点并发数翻倍，被限速（吞吐明显下降）时减半。"""
+    # 1. 安排
+    seen = []
+
+    # 2. 执行: 前两次吞吐上升，第三次被CDN限速
+    for throughput in (4 * MB, 8 * MB, 2 * MB):
+        plan = tuner.plan([HLS], URL)
+        seen.append(plan.concurrent_fragments)
+        tuner.record(URL, plan, 100 * MB, 100 * MB / throughput)
+
+    # 3. 断言
+    assert seen == [4, 8, 16]
+    assert tuner.plan([HLS], URL).concurrent_fragments == 8
+    assert tuner.plan([HLS], "https://other.example.org/v").concurrent_fragments == 4
+
+
+def test_small_or_single_connection_downloads_are_not_learned(tuner):
+    """测试过小的下载和单连接下载不影响站点统计。"""
+    tuner.record(URL, TransferPlan(4), 1 * MB, 0.1)
+    tuner.record(URL, TransferPlan(1, 10 * MB), 100 * MB, 1)
+
+    assert tuner.plan([HLS], URL).concurrent_fragments == 4
+
+
+def test_budget_limited_runs_do_not_shrink_and_single_connection_recovers(fake_redis):
+    """测试连接预算不足时的慢速下载不降低站点并发数；降到1后吞吐回升时并发数重新增加；统计带过期时间。"""
+    # 1. 安排
+    tuner = TransferTuner(fake_redis, default_fragments=4, max_fragments=16)
+    tuner.record(URL, TransferPlan(4), 100 * MB, 100 / 8)
+
+    # 2. 执行: 预算只给了2个连接的下载很慢
+    tuner.record(URL, TransferPlan(2), 100 * MB, 100 / 1)
+    after_budget_cut = tuner.plan([HLS], URL).concurrent_fragments
+    # 站点真的被限速，并发数一路降到1
+    for _ in range(4):
+        tuner.record(URL, tuner.plan([HLS], URL), 100 * MB, 100 / 1)
+    throttled = tuner.plan([HLS], URL).concurrent_fragments
+    tuner.record(URL, tuner.plan([HLS], URL), 100 * MB, 100 / 8)
+
+    # 3. 断言
+    assert after_budget_cut == 8
+    assert throttled == 1
+    assert tuner.plan([HLS], URL).concurrent_fragments == 2
+    assert fake_redis.ttls["transfer:domain:cdn.example.com"] == tuner.stats_ttl
+
+
+def test_existing_bytes_counts_resumed_partial_files(tmp_path):
+    """测试下载前已有的临时文件字节数被计入，断点续传的部分不算作本次传输。"""
+    # 1. 安排
+    output = tmp_path / "Video_abc.mp4"
+    (tmp_path / "Video_abc.f137.mp4.part").write_bytes(b"v" * 300)
+    (tmp_path / "Video_abc.f140.m4a").write_bytes(b"a" * 100)
+    (tmp_path / "Video_abc.mp4.native.part").write_bytes(b"n" * 50)
+    (tmp_path / "Other.mp4.part").write_bytes(b"o" * 1000)
+
+    # 2. 执行
+    resumed = existing_bytes(output)
+
+    # 3. 断言
+    assert resumed == 450
+    assert existing_bytes(tmp_path / "missing" / "Video.mp4") == 0
+
+
+def test_connection_budget_is_shared_between_workers(fake_redis):
+    """测试多个worker的下载共享连接预算，预算不足时降低并发数，结束后归还。"""
+    # 1. 安排: 两个worker各自的调优器共享同一个Redis
+    first_worker = TransferTuner(fake_redis, connection_budget=10)
+    second_worker = TransferTuner(fake_redis, connection_budget=10)
+    cmd = ["yt-dlp", "--concurrent-fragments", "8", "-f", "hls-1080", "--", URL]
+
+    # 2. 执行
+    with first_worker.lease(cmd) as (first_cmd, first_plan):
+        with second_worker.lease(cmd) as (second_cmd, second_plan):
+            with first_worker.lease(cmd) as (_, third_plan):
+                leases_while_running = len(fake_redis.hgetall(LEASES_KEY))
+
+    # 3. 断言
+    assert first_plan.concurrent_fragments == 8 and first_cmd == cmd
+    assert second_plan.concurrent_fragments == 2
+    assert second_cmd[:3] == ["yt-dlp", "--concurrent-fragments", "2"] and second_cmd[3:] == cmd[3:]
+    assert third_plan.concurrent_fragments == 1
+    assert leases_while_running == 3
+    assert fake_redis.hgetall(LEASES_KEY) == {}
+
+
+def test_plan_round_trips_through_command():
+    """测试传输参数替换后命令中只保留一组传输参数。"""
+    plan = TransferPlan(1, 10 * MB, MB)
+    cmd = plan.apply(["yt-dlp", "--concurrent-fragments", "4", "-o", "out.mp4", "--", URL])
+
+    assert cmd.count("--concurrent-fragments") == 1
+    assert TransferPlan.from_cmd(cmd) == plan
+    assert cmd[-4:] == ["-o", "out.mp4", "--", URL]
+
+
+def test_smart_command_uses_format_specific_transfer_options(tuner):
+    """测试智能下载命令按所选格式的传输方式设置参数。"""
+    builder = CommandBuilder(transfer_tuner=tuner)
+
+    progressive_cmd, *_ = builder.build_smart_download_cmd("/tmp", URL, "v", [PROGRESSIVE, HLS], format_id="18")
+    hls_cmd, *_ = builder.build_smart_download_cmd("/tmp", URL, "v", [PROGRESSIVE, HLS], format_id="hls-1080")
+
+    assert TransferPlan.from_cmd(progressive_cmd) == TransferPlan(1, 10 * MB, MB)
+    assert TransferPlan.from_cmd(hls_cmd) == TransferPlan(4)
@@ -0,0 +1,147 @@
+# tests/test_translation.py
+
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+import subtitles
+from core.rate_limiter import TokenBucket
+from core.translation_memory import TranslationMemory
+from subtitles import OfflineTranslator, TranslationProcessor
+
+
+class RecordingTranslator(OfflineTranslator):
+    """记录每次发送给翻译服务的批次。"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def translate_batch(self, batch):
+        self.calls.append(list(batch))
+        return super().translate_batch(batch)
+
+
+@pytest.fixture
+def processor(tmp_path, mocker):
+    """使用离线翻译器和临时翻译记忆的翻译处理器。"""
+    mocker.patch("subtitles.config.ai_subtitles.translation_memory_path", str(tmp_path / "tm.db"))
+    mocker.patch("subtitles.config.ai_subtitles.translator_service", "offline")
+    mocker.patch("subtitles.config.ai_subtitles.translation_rate_per_second", 0)
+    mocker.patch("subtitles.config.ai_subtitles.translation_batch_size", 2)
+    processor = TranslationProcessor()
+    processor.translator = RecordingTranslator()
+    return processor
+
+
+@pytest.mark.asyncio
+async def test_only_cache_misses_are_sent_to_translator(processor):
+    """测试重复台词去重，且第二次运行完全命中翻译记忆。"""
+    # 1. 安排
+    blocks = ["Hello", "[Music]", "Hello", "How are\nyou", "[Music]", ""]
+
+    # 2. 执行
+    first = await processor._translate_text_blocks(blocks)
+
+    # 3. 断言
+    assert first == ["[zh] Hello", "[zh] [Music]", "[zh] Hello", "[zh] How are you", "[zh] [Music]", ""]
+    sent = [text for batch in processor.translator.calls for text in batch]
+    assert sorted(sent) == ["Hello", "How are you", "[Music]"]
+
+    # 新的处理器实例（模拟重新运行）应完全命中持久化记忆
+    rerun = TranslationProcessor()
+    rerun.translator = RecordingTranslator()
+    assert await rerun._translate_text_blocks(blocks) == first
+    assert rerun.translator.calls == []
+
+
+@pytest.mark.asyncio
+async def test_batches_run_concurrently(processor, mocker):
+    """测试多个批次并发翻译，而不是逐批串行。"""
+    mocker.patch("subtitles.config.ai_subtitles.translation_concurrency", 3)
+    in_flight = []
+    peak = []
+
+    class SlowTranslator(OfflineTranslator):
+        def translate_batch(self, batch):
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            time.sleep(0.05)
+            in_flight.pop()
+            return super().translate_batch(batch)
+
+    processor.translator = SlowTranslator()
+
+    result = await processor._translate_text_blocks([f"line {i}" for i in range(6)])
+
+    assert result == [f"[zh] line {i}" for i in range(6)]
+    assert max(peak) > 1
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_falls_back_to_source_and_is_not_cached(processor, mocker):
+    """测试翻译失败时使用原文，且失败结果不写入翻译记忆。"""
+    mocker.patch("subtitles.config.ai_subtitles.translation_max_retries", 1)
+    mocker.patch.object(processor.translator, "translate_batch", side_effect=RuntimeError("boom"))
+
+    assert await processor._translate_text_blocks(["Hi"]) == ["Hi"]
+    assert processor.memory.lookup_many("offline", "en", "zh-CN", ["Hi"]) == {}
+
+
+@pytest.mark.asyncio
+async def test_memory_is_opened_only_while_translating(processor, tmp_path):
+    """测试翻译记忆在构造时不打开，翻译完成后关闭。"""
+    # 1. 安排
+    srt_path = tmp_path / "video.srt"
+    srt_path.write_text("1\n00:00:01,000 --> 00:00:02,000\nHello\n\n", encoding="utf-8")
+    assert processor.memory is None
+    assert not (tmp_path / "tm.db").exists()
+
+    # 2. 执行
+    result = await processor.translate_subtitle_cues(srt_path)
+
+    # 3. 断言
+    assert result is not None
+    assert processor.memory is None
+    assert TranslationMemory(str(tmp_path / "tm.db")).lookup_many("offline", "en", "zh-CN", ["Hello"]) == {
+        "Hello": "[zh] Hello"
+    }
+
+
+def test_relative_memory_path_resolves_against_project_dir(mocker, tmp_path, monkeypatch):
+    """测试翻译记忆的相对路径按项目目录解析，与启动目录无关。"""
+    # 1. 安排
+    mocker.patch("subtitles.config.ai_subtitles.translation_memory_path", "translation_memory.db")
+    monkeypatch.chdir(tmp_path)
+
+    # 2. 执行
+    processor = TranslationProcessor()
+
+    # 3. 断言
+    assert processor.memory_path == str(Path(subtitles.__file__).resolve().parent / "translation_memory.db")
+
+
+def test_translation_memory_is_keyed_by_service_and_language(tmp_path):
+    """测试翻译记忆按服务和语言对隔离。"""
+    memory = TranslationMemory(str(tmp_path / "tm.db"))
+    memory.store_many("google", "en", "zh-CN", {"Hello": "你好"})
+
+    assert memory.lookup_many("google", "en", "zh-CN", ["Hello", "Bye"]) == {"Hello": "你好"}
+    assert memory.lookup_many("baidu", "en", "zh-CN", ["Hello"]) == {}
+    assert memory.lookup_many("google", "en", "ja", ["Hello"]) == {}
+    assert TranslationMemory.normalize("  How  are\nyou ") == "How are you"
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate_after_burst():
+    """测试令牌桶允许突发，之后按速率放行。"""
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = asyncio.get_running_loop().time()
+
+    for _ in range(4):
+        await bucket.acquire()
+
+    # 前2个为突发，后2个各需等待约1/20秒
+    assert asyncio.get_running_loop().time() - start >= 0.09
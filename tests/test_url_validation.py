@@ -0,0 +1,61 @@
+# tests/test_url_validation.py
+
+import pytest
+
+from web.validation import _check_url, is_playlist_url, validate_url_security
+
+
+@pytest.mark.parametrize(
+    "url, expected_error",
+    [
+        ("", "URL cannot be empty"),
+        ("https://example.com/" + "a" * 2048, "URL too long (max 2048 characters)"),
+        ("JavaScript:alert(1)", "Dangerous protocol not allowed: javascript:"),
+        ("chrome-extension://abc/page.html", "Dangerous protocol not allowed: chrome-extension:"),
+        ("https://example.com/<ScRiPt src=x>", "URL contains dangerous characters or tags"),
+        ("https://example.com/?x=1 onload = alert(1)", "URL contains dangerous characters or tags"),
+        ("https://example.com/\nHost: evil", "URL contains dangerous characters or tags"),
+        ("gopher://example.com/", "Only HTTP and HTTPS protocols are allowed"),
+        ("http://LOCALHOST:8000/", "Access to local addresses is not allowed"),
+        ("http://10.0.0.5/video.mp4", "Access to private network addresses is not allowed"),
+        ("http://[fe80::1]/video.mp4", "Access to private network addresses is not allowed"),
+        ("https://example.com:6379/", "Access to port 6379 is not allowed"),
+    ],
+)
+def test_rejected_urls_keep_their_error_messages(url, expected_error):
+    """测试各类不安全URL被拒绝，错误信息与原校验一致。"""
+    assert validate_url_security(url) == (False, expected_error)
+
+
+def test_valid_urls_and_verdict_cache():
+    """测试正常URL放行；首尾空白不同的同一URL复用缓存的结论。"""
+    # 1. 安排
+    _check_url.cache_clear()
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+    # 2. 执行
+    verdicts = [validate_url_security(url), validate_url_security(f"  {url}\n"), validate_url_security(url)]
+
+    # 3. 断言
+    assert verdicts == [(True, "")] * 3
+    assert validate_url_security("https://1.1.1.1:8443/v.mp4") == (True, "")
+    info = _check_url.cache_info()
+    assert info.hits == 2 and info.misses == 2
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://www.youtube.com/watch?v=abc&list=PL123", True),
+        ("https://www.youtube.com/playlist?list=PL123", True),
+        ("https://www.youtube.com/watch?v=abc", False),
+        ("https://www.bilibili.com/video/BV1xx411c7mD?p=2", True),
+        ("https://space.bilibili.com/1/favlist/2", True),
+        ("https://www.bilibili.com/video/BV1xx411c7mD", False),
+        ("https://vimeo.com/channels/staffpicks", True),
+        ("https://example.com/media/clip.mp4", False),
+    ],
+)
+def test_is_playlist_url(url, expected):
+    """测试各平台的播放列表识别。"""
+    assert is_playlist_url(url) is expected
@@ -0,0 +1,121 @@
+# tests/test_work_dirs.py
+
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+
+from benchmarks.media_origin import MediaOrigin
+from core.command_builder import CommandBuilder
+from web.work_dirs import TaskWorkDirs
+
+
+@pytest.fixture
+def work_dirs(tmp_path):
+    return TaskWorkDirs(tmp_path / "work", expiry_seconds=3600)
+
+
+def test_resumable_commands_continue_instead_of_overwriting():
+    """测试续传模式的命令以 --continue 代替 --force-overwrites，并保留 .part 文件。"""
+    builder = CommandBuilder(resumable=True)
+
+    video_cmd = builder.build_video_download_cmd("/work/v.mp4", "https://example.com/v")
+    audio_cmd = builder.build_audio_download_cmd("https://example.com/v", "/work/a.%(ext)s", "mp3")
+
+    for cmd in (video_cmd, audio_cmd):
+        assert "--continue" in cmd
+        assert "--force-overwrites" not in cmd and "--no-part" not in cmd
+    assert CommandBuilder.build_resume_cmd(video_cmd) == video_cmd
+    assert "--no-part" in CommandBuilder().build_audio_download_cmd("https://example.com/v", "/a.%(ext)s")
+
+
+def test_retries_reuse_the_same_work_dir(work_dirs, tmp_path):
+    """测试同一任务同一格式重试时回到同一工作目录；完成后文件移到下载目录，工作目录被删除。"""
+    # 1. 安排
+    first = work_dirs.acquire("task-1", "video", "137+140", "1080p")
+    (first / "video.mp4.part").write_bytes(b"x" * 1000)
+
+    # 2. 执行
+    retried = work_dirs.acquire("task-1", "video", "137+140", "1080p")
+    other_format = work_dirs.acquire("task-1", "video", "18", "360p")
+    (retried / "video.mp4").write_bytes(b"done")
+    final = work_dirs.promote(retried, retried / "video.mp4", tmp_path / "downloads", "task-1")
+
+    # 3. 断言
+    assert retried == first and other_format != first
+    assert TaskWorkDirs.size(other_format) == 0
+    assert final == tmp_path / "downloads" / "video.mp4" and final.read_bytes() == b"done"
+    assert not first.exists()
+
+
+def test_promote_does_not_overwrite_other_tasks_file(work_dirs, tmp_path):
+    """测试下载目录中已有其他任务的同名文件时，移入的文件改用带任务ID的文件名。"""
+    # 1. 安排
+    downloads = tmp_path / "downloads"
+    downloads.mkdir()
+    (downloads / "video.mp4").write_bytes(b"other task")
+    workdir = work_dirs.acquire("task-2345678901", "video", "18")
+    (workdir / "video.mp4").write_bytes(b"mine")
+
+    # 2. 执行
+    final = work_dirs.promote(workdir, workdir / "video.mp4", downloads, "task-2345678901")
+
+    # 3. 断言
+    assert final == downloads / "video_task-234.mp4" and final.read_bytes() == b"mine"
+    assert (downloads / "video.mp4").read_bytes() == b"other task"
+
+
+def test_discard_and_collect_abandoned_work_dirs(work_dirs):
+    """测试取消的任务直接删除工作目录；超过有效期无变化的目录被回收，下载中的目录保留。"""
+    # 1. 安排
+    cancelled = work_dirs.acquire("task-cancelled", "audio", "mp3")
+    (cancelled / "a.part").write_bytes(b"x" * 10)
+    abandoned = work_dirs.acquire("task-crashed", "video", "best")
+    (abandoned / "v.part").write_bytes(b"x" * 100)
+    active = work_dirs.acquire("task-running", "video", "best")
+    (active / "v.part").write_bytes(b"x" * 100)
+    old = time.time() - 7200
+    for path in (abandoned, abandoned / "v.part", active):
+        os.utime(path, (old, old))
+
+    # 2. 执行
+    freed = work_dirs.discard("task-cancelled")
+    stats = work_dirs.collect()
+
+    # 3. 断言
+    assert freed == 10 and not cancelled.exists()
+    assert stats == {"removed": [abandoned.name], "freed_bytes": 100}
+    assert active.exists()
+
+
+@pytest.mark.skipif(shutil.which("yt-dlp") is None, reason="需要yt-dlp")
+def test_interrupted_download_resumes_from_partial(work_dirs, tmp_path):
+    """测试在工作目录中被中断的下载重新执行时从 .part 文件续传，结果与源文件一致。"""
+    # 1. 安排: 2MB素材，限速16Mbit/s，下载约需1秒
+    asset = tmp_path / "origin" / "video.mp4"
+    asset.parent.mkdir()
+    asset.write_bytes(os.urandom(2 * 1024 * 1024))
+    workdir = work_dirs.acquire("task-1", "video", "best")
+    output = workdir / "video.mp4"
+
+    with MediaOrigin(tmp_path / "origin", bandwidth_mbps=16) as origin:
+        cmd = CommandBuilder(resumable=True).build_yt_dlp_base_cmd() + ["-o", str(output), origin.url(asset)]
+
+        # 2. 执行: 下载一部分后杀掉进程（模拟worker崩溃），再重新执行同一命令
+        process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        part = workdir / "video.mp4.part"
+        deadline = time.time() + 10
+        while time.time() < deadline and (not part.exists() or part.stat().st_size < 256 * 1024):
+            time.sleep(0.02)
+        process.kill()
+        process.wait()
+        partial_size = part.stat().st_size
+        resumed = subprocess.run(cmd, check=False, capture_output=True, text=True, timeout=30)
+
+    # 3. 断言
+    assert 0 < partial_size < asset.stat().st_size
+    assert resumed.returncode == 0
+    assert "Resuming download" in resumed.stdout
+    assert output.read_bytes() == asset.read_bytes()
@@ -0,0 +1,167 @@
+# tests/test_worker_control.py
+
+import asyncio
+import json
+import threading
+
+import pytest
+from cachetools import cached
+
+from web.process_registry import ProcessRegistry
+from web.shared_cache import SharedTTLCache
+from web.worker_control import CONTROL_CHANNEL, WORKER_KEY_PREFIX, WorkerControl
+
+
+def test_cache_is_shared_between_workers(fake_redis):
+    """测试一个工作进程缓存的视频信息另一个进程直接命中，清空时一并清除。"""
+    # 1. 安排: 两个工作进程各自的缓存对象
+    first = SharedTTLCache(fake_redis, "video_info", maxsize=8, ttl=3600)
+    second = SharedTTLCache(fake_redis, "video_info", maxsize=8, ttl=3600)
+    calls = []
+
+    @cached(second, key=lambda url: url)
+    def fetch(url):
+        calls.append(url)
+        return {"title": "视频"}
+
+    # 2. 执行
+    first["https://youtu.be/a:all"] = {"title": "视频", "formats": [{"format_id": "18"}]}
+    fetch("https://youtu.be/b")
+    cached_by_first = first.get("https://youtu.be/b")
+    fetch("https://youtu.be/b")
+
+    # 3. 断言
+    assert second["https://youtu.be/a:all"]["formats"] == [{"format_id": "18"}]
+    assert cached_by_first == {"title": "视频"} and calls == ["https://youtu.be/b"]
+    assert fake_redis.ttls["webcache:video_info:https://youtu.be/b"] == 3600
+    assert sorted(second) == ["https://youtu.be/a:all", "https://youtu.be/b"]
+    second.clear()
+    assert "https://youtu.be/a:all" not in first and len(first) == 0
+
+
+def test_cache_falls_back_to_local_when_redis_fails(mocker):
+    """测试Redis出错时改用进程内缓存，请求不受影响。"""
+    redis_client = mocker.Mock()
+    redis_client.get.side_effect = ConnectionError("redis down")
+    cache = SharedTTLCache(redis_client, "video_info", maxsize=8, ttl=3600)
+
+    assert cache.get("url:all") is None
+    cache["url:all"] = {"title": "t"}
+
+    assert cache["url:all"] == {"title": "t"}
+    redis_client.set.assert_not_called()
+
+
+async def _sleepers():
+    """登记了两个子进程的登记表"""
+    registry = ProcessRegistry(terminate_timeout=2)
+    records = [await registry.spawn(["sleep", "60"], owner="download-stream") for _ in range(2)]
+    return registry, records
+
+
+@pytest.mark.asyncio
+async def test_reap_command_targets_worker_and_pid(fake_redis):
+    """测试回收指令只作用于指定的工作进程和子进程，并广播给其他工作进程。"""
+    # 1. 安排
+    registry, (first, second) = await _sleepers()
+    control = WorkerControl(fake_redis, registry)
+    control._listener = object()  # 视为已订阅控制频道
+
+    # 2. 执行
+    try:
+        ignored = await control.handle({"action": "reap", "worker": "other-host:1"})
+        reaped = await control.reap(pid=first.pid)
+        remaining = [record.pid for record in registry.records()]
+    finally:
+        await registry.reap_all()
+
+    # 3. 断言
+    assert ignored == 0 and reaped == 1
+    assert remaining == [second.pid]
+    channel, message = fake_redis.published[0]
+    assert channel == CONTROL_CHANNEL
+    assert json.loads(message) == {
+        "action": "reap",
+        "worker": None,
+        "pid": first.pid,
+        "owner": None,
+        "origin": control.worker_id,
+    }
+
+
+@pytest.mark.asyncio
+async def test_commands_from_other_workers_run_on_event_loop(fake_redis):
+    """测试订阅线程收到其他进程的指令后在事件循环中回收，忽略本进程发出的指令。"""
+    # 1. 安排
+    registry, records = await _sleepers()
+    control = WorkerControl(fake_redis, registry)
+    control._loop = asyncio.get_running_loop()
+    own = {"data": json.dumps({"action": "reap", "origin": control.worker_id})}
+    remote = {"data": json.dumps({"action": "reap", "owner": "download-stream", "origin": "other-host:1"})}
+
+    # 2. 执行: 与 redis-py 的订阅线程一样在其他线程中回调
+    thread = threading.Thread(target=lambda: [control._on_message(m) for m in (own, {"data": "garbage"}, remote)])
+    thread.start()
+    await asyncio.to_thread(thread.join)
+    try:
+        for _ in range(100):
+            if not registry.records():
+                break
+            await asyncio.sleep(0.02)
+        remaining = registry.records()
+    finally:
+        await registry.reap_all()
+
+    # 3. 断言
+    assert remaining == []
+    assert all(record.process.returncode is not None for record in records)
+
+
+@pytest.mark.asyncio
+async def test_admin_endpoint_lists_processes_of_all_workers(client, fake_redis, mocker):
+    """测试 /admin/processes 汇总本进程和其他工作进程上报的子进程。"""
+    # 1. 安排
+    registry, records = await _sleepers()
+    control = WorkerControl(fake_redis, registry, heartbeat_seconds=5)
+    control._listener = object()
+    remote = {"worker": "other-host:1", "pid": 1, "processes": [{"pid": 4242, "worker": "other-host:1"}]}
+    fake_redis.set(WORKER_KEY_PREFIX + "other-host:1", json.dumps(remote))
+    control._report()
+    mocker.patch("web.main.worker_control", control)
+
+    # 2. 执行
+    try:
+        body = client.get("/admin/processes").json()
+    finally:
+        await registry.reap_all()
+
+    # 3. 断言
+    assert body["count"] == 3
+    assert sorted(p["pid"] for p in body["processes"]) == sorted([4242] + [r.pid for r in records])
+    assert {w["worker"] for w in body["workers"]} == {"other-host:1", control.worker_id}
+    assert fake_redis.ttls[WORKER_KEY_PREFIX + control.worker_id] == 15
+
+
+@pytest.mark.asyncio
+async def test_admin_cancel_requires_worker(client, fake_redis, mocker):
+    """测试结束子进程必须指定工作进程：不同主机上的PID可能相同，不按裸PID广播。"""
+    # 1. 安排
+    registry, records = await _sleepers()
+    control = WorkerControl(fake_redis, registry, heartbeat_seconds=5)
+    control._listener = object()
+    mocker.patch("web.main.worker_control", control)
+    pid = records[0].pid
+
+    # 2. 执行
+    try:
+        missing = client.delete(f"/admin/processes/{pid}")
+        remote = client.delete(f"/admin/processes/{pid}", params={"worker": "other-host:1"})
+        local = client.delete(f"/admin/processes/{pid}", params={"worker": control.worker_id})
+    finally:
+        await registry.reap_all()
+
+    # 3. 断言
+    assert missing.status_code == 422
+    assert remote.json()["reaped_locally"] == 0
+    assert [json.loads(message)["worker"] for _, message in fake_redis.published] == ["other-host:1"]
+    assert local.json() == {"pid": pid, "worker": control.worker_id, "reaped_locally": 1}
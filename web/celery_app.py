@@ -3,9 +3,10 @@ import logging
 import os
 
 from celery import Celery
-from celery.signals import worker_process_init, worker_ready, worker_shutdown
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready, worker_shutdown
 
 from config_manager import config, config_manager
+from core.metrics import mark_process_dead, start_metrics_server
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -171,6 +172,10 @@ def worker_ready_handler(sender=None, **kwargs):
     log.info("Celery worker已启动并准备接收任务")
     if not check_redis_connection():
         log.warning("Redis连接不可用，worker可能无法正常工作")
+    if config.monitoring.metrics_enabled:
+        if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            log.warning("未设置 PROMETHEUS_MULTIPROC_DIR，多进程worker只能导出主进程的指标")
+        start_metrics_server(config.monitoring.worker_metrics_port)
 
 
 @worker_shutdown.connect
@@ -185,3 +190,9 @@ def worker_process_init_handler(sender=None, **kwargs):
     log.debug("Worker进程已初始化，正在加载配置文件...")
     config_manager.reload_config()
     log.debug("配置文件加载完成。")
+
+
+@worker_process_shutdown.connect
+def worker_process_shutdown_handler(pid=None, **kwargs):
+    """Worker子进程退出时清理其实时指标"""
+    mark_process_dead(pid or os.getpid())
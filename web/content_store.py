@@ -0,0 +1,160 @@
+# web/content_store.py
+"""
+内容寻址的下载存储
+已完成的文件按 (提取器, 视频ID, 下载类型, 格式) 存为一个内容块，
+每个任务面向用户的文件都是该内容块的硬链接。同一内容再次被请求时直接从
+内容块链接出来，无需重新下载；硬链接计数即引用计数，最后一个用户文件
+被清理后内容块才会被回收。
+"""
+
+import hashlib
+import json
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple
+
+from config_manager import config
+
+log = logging.getLogger(__name__)
+
+# 哈希: 内容键 -> {"blob": 内容块路径, "filename": 首次下载时的文件名}
+CONTENT_KEY = "content:blobs"
+# 内容块目录名（位于下载根目录下，以点开头，不会被当作孤立文件）
+STORE_DIRNAME = ".content"
+
+
+def task_file_name(filename: str, task_id: str) -> str:
+    """任务专属的文件名：在扩展名前加上任务ID的前8位，避免不同任务的文件同名"""
+    name = Path(filename)
+    return f"{name.stem}_{task_id[:8]}{name.suffix}"
+
+
+@lru_cache(maxsize=1024)
+def identify_video(url: str) -> Optional[Tuple[str, str]]:
+    """
+    不访问网络，用yt-dlp的提取器URL规则识别 (提取器, 视频ID)。
+
+    Returns:
+        无法识别（通用提取器或yt-dlp不可用）时返回None
+    """
+    try:
+        from yt_dlp.extractor import gen_extractor_classes
+    except ImportError:
+        return None
+
+    for ie in gen_extractor_classes():
+        if ie.ie_key() == "Generic" or not ie.suitable(url):
+            continue
+        video_id = ie.get_temp_id(url)
+        return (ie.ie_key(), video_id) if video_id else None
+    return None
+
+
+class ContentStore:
+    """基于硬链接引用计数的内容寻址存储"""
+
+    def __init__(self, redis_client, root: Path):
+        """
+        Args:
+            redis_client: Redis客户端（decode_responses=True）
+            root: 下载根目录，内容块存放在其下的 .content 目录
+        """
+        self.redis = redis_client
+        self.store_dir = Path(root).resolve() / STORE_DIRNAME
+
+    @classmethod
+    def from_config(cls, redis_client) -> "ContentStore":
+        return cls(redis_client, Path(config.downloader.save_path))
+
+    @staticmethod
+    def content_key(url: str, download_type: str, format_id: str = "", resolution: str = "") -> Optional[str]:
+        """由URL和请求的格式生成内容键；无法识别视频时返回None（不参与去重）"""
+        identity = identify_video(url)
+        if not identity:
+            return None
+        extractor, video_id = identity
+        return f"{extractor}:{video_id}:{download_type}:{format_id or 'best'}:{resolution}"
+
+    def checkout(self, key: str, download_folder: Path, task_id: str) -> Optional[Path]:
+        """
+        已存储的内容直接硬链接到下载目录，文件名后加任务ID的前8位。
+
+        Returns:
+            面向用户的文件路径；内容未存储或内容块已被回收时返回None
+        """
+        entry = self.redis.hget(CONTENT_KEY, key)
+        if not entry:
+            return None
+        entry = json.loads(entry)
+        blob = Path(entry["blob"])
+        if not blob.exists():
+            self.redis.hdel(CONTENT_KEY, key)
+            return None
+
+        # 每个任务链接到自己的文件名：同名文件可能属于其他任务，共用一个文件时
+        # 任一任务被删除或过期都会带走另一个任务的文件
+        target = Path(download_folder) / task_file_name(entry["filename"], task_id)
+        try:
+            if not (target.exists() and os.path.samefile(target, blob)):
+                staging = target.with_name(f".{target.name}.link")
+                os.link(blob, staging)
+                os.replace(staging, target)
+        except OSError as e:
+            log.warning(f"从内容存储链接文件失败，改为重新下载: {e}")
+            return None
+        log.info(f"内容已存储，直接复用: {target.name} ({key})")
+        return target
+
+    def ingest(self, key: str, file_path: Path) -> None:
+        """
+        把刚下载完成的文件登记为内容块。内容已被其他任务存储时，
+        用指向已有内容块的硬链接替换本次下载的副本。
+        """
+        file_path = Path(file_path)
+        blob = self.store_dir / f"{hashlib.sha256(key.encode()).hexdigest()[:32]}{file_path.suffix}"
+        try:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+            if blob.exists():
+                if not os.path.samefile(blob, file_path):
+                    staging = file_path.with_name(f".{file_path.name}.link")
+                    os.link(blob, staging)
+                    os.replace(staging, file_path)
+            else:
+                os.link(file_path, blob)
+        except OSError as e:
+            # 跨文件系统等不支持硬链接的情况，保持原文件，不参与去重
+            log.debug(f"文件未加入内容存储: {file_path.name} - {e}")
+            return
+        if not self.redis.hget(CONTENT_KEY, key):
+            self.redis.hset(CONTENT_KEY, key, json.dumps({"blob": str(blob), "filename": file_path.name}))
+
+    def collect(self) -> int:
+        """
+        回收已没有用户文件引用（硬链接数为1）的内容块。
+
+        Returns:
+            int: 释放的字节数
+        """
+        if not self.store_dir.exists():
+            return 0
+        freed = 0
+        removed = set()
+        with os.scandir(self.store_dir) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                    if entry.is_file() and stat.st_nlink == 1:
+                        os.unlink(entry.path)
+                        freed += stat.st_size
+                        removed.add(entry.path)
+                except OSError as e:
+                    log.error(f"回收内容块 {entry.name} 失败: {e}")
+
+        if removed:
+            stale = [k for k, v in self.redis.hgetall(CONTENT_KEY).items() if json.loads(v)["blob"] in removed]
+            if stale:
+                self.redis.hdel(CONTENT_KEY, *stale)
+            log.info(f"回收 {len(removed)} 个无引用的内容块，释放 {freed / (1024 * 1024):.2f}MB")
+        return freed
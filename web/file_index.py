@@ -0,0 +1,175 @@
+# web/file_index.py
+"""
+下载文件索引
+用Redis有序集合记录每个已下载文件的到期时间，清理任务只处理到期的条目，
+开销与到期数量成正比，而不是与下载目录中的文件总数成正比。
+"""
+
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+# 有序集合: 文件路径 -> 到期时间戳（凭证过期时间或孤立文件的清理时间）
+INDEX_KEY = "downloads:file_index"
+# 哈希: 文件路径 -> 任务ID，用于判断文件是否仍被有效凭证引用
+OWNER_KEY = "downloads:file_owner"
+# 上次扫描时下载目录的mtime，目录未变化时跳过孤立文件发现
+SCAN_MTIME_KEY = "downloads:index_scan_mtime"
+
+
+class DownloadFileIndex:
+    """基于Redis有序集合的下载文件到期索引"""
+
+    def __init__(self, redis_client, download_folder: Path, orphan_seconds: int, batch_size: int = 500):
+        """
+        Args:
+            redis_client: Redis客户端（decode_responses=True）
+            download_folder: 下载目录
+            orphan_seconds: 未登记文件在修改多久后视为孤立文件
+            batch_size: 单次清理处理的最多到期条目数
+        """
+        self.redis = redis_client
+        self.download_folder = Path(download_folder)
+        self.orphan_seconds = orphan_seconds
+        self.batch_size = batch_size
+
+    def register(self, task_id: str, file_path: Path, expiry_seconds: int) -> None:
+        """登记下载完成的文件，到期时间与下载凭证一致。"""
+        path = str(Path(file_path).resolve())
+        pipe = self.redis.pipeline()
+        pipe.zadd(INDEX_KEY, {path: time.time() + expiry_seconds})
+        pipe.hset(OWNER_KEY, path, task_id)
+        pipe.execute()
+
+    def unregister(self, file_path: Path) -> None:
+        """文件被主动删除后移除索引。"""
+        path = str(Path(file_path).resolve())
+        pipe = self.redis.pipeline()
+        pipe.zrem(INDEX_KEY, path)
+        pipe.hdel(OWNER_KEY, path)
+        pipe.execute()
+
+    def cleanup_due(self, now: Optional[float] = None) -> Dict[str, List]:
+        """
+        删除已到期的文件，并增量发现新的孤立文件。
+
+        Returns:
+            清理统计: expired_files_deleted / orphaned_files_deleted / total_size_freed_mb / errors
+        """
+        now = now or time.time()
+        stats = {"expired_files_deleted": [], "orphaned_files_deleted": [], "total_size_freed_mb": 0, "errors": []}
+
+        self._discover_orphans()
+
+        due_paths = self.redis.zrangebyscore(INDEX_KEY, "-inf", now, start=0, num=self.batch_size)
+        if not due_paths:
+            return stats
+
+        owners = self.redis.hmget(OWNER_KEY, due_paths)
+        live = self._live_owners([owner for owner in owners if owner])
+        pipe = self.redis.pipeline()
+        for path, owner in zip(due_paths, owners):
+            if owner and owner in live:
+                # 凭证被续期，按剩余TTL重新排期
+                pipe.zadd(INDEX_KEY, {path: now + live[owner]})
+                continue
+            if not owner:
+                # 孤立文件按发现时的mtime排期，期间仍在写入的文件按新的mtime重新排期
+                due_at = self._orphan_due_at(Path(path))
+                if due_at is not None and due_at > now:
+                    pipe.zadd(INDEX_KEY, {path: due_at})
+                    continue
+            freed = self._delete_file(Path(path), stats)
+            if freed is not None:
+                stats["expired_files_deleted" if owner else "orphaned_files_deleted"].append(Path(path).name)
+                stats["total_size_freed_mb"] += freed / (1024 * 1024)
+            pipe.zrem(INDEX_KEY, path)
+            pipe.hdel(OWNER_KEY, path)
+        pipe.execute()
+
+        stats["total_size_freed_mb"] = round(stats["total_size_freed_mb"], 2)
+        return stats
+
+    def _live_owners(self, task_ids: List[str]) -> Dict[str, int]:
+        """批量查询凭证剩余TTL，返回仍有效的 {任务ID: 剩余秒数}。"""
+        if not task_ids:
+            return {}
+        pipe = self.redis.pipeline()
+        for task_id in task_ids:
+            pipe.ttl(f"download:{task_id}")
+        # ttl: -2 键不存在，-1 永不过期
+        return {
+            task_id: (ttl if ttl > 0 else self.orphan_seconds)
+            for task_id, ttl in zip(task_ids, pipe.execute())
+            if ttl != -2
+        }
+
+    def _orphan_due_at(self, file_path: Path) -> Optional[float]:
+        """按文件当前的mtime计算孤立文件的清理时间；文件已不存在时返回None。"""
+        try:
+            return file_path.stat().st_mtime + self.orphan_seconds
+        except OSError:
+            return None
+
+    def _delete_file(self, file_path: Path, stats: Dict[str, List]) -> Optional[int]:
+        """删除文件并返回释放的字节数；文件已不存在时返回None。"""
+        try:
+            stat = file_path.stat()
+            file_path.unlink()
+            # 内容存储的硬链接在内容块被回收时才释放空间
+            size = stat.st_size if stat.st_nlink == 1 else 0
+            log.info(f"清理到期文件: {file_path.name} ({size / (1024 * 1024):.2f}MB)")
+            return size
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            stats["errors"].append(f"删除文件失败: {file_path.name} - {e}")
+            log.error(f"删除文件 {file_path.name} 失败: {e}")
+            return None
+
+    def _discover_orphans(self) -> None:
+        """
+        增量发现孤立文件：仅当下载目录mtime变化（有文件增删）时才列目录，
+        未登记的文件按 mtime + orphan_seconds 加入索引，之后由到期清理统一处理。
+        """
+        try:
+            dir_mtime = self.download_folder.stat().st_mtime
+        except FileNotFoundError:
+            return
+
+        last_mtime = self.redis.get(SCAN_MTIME_KEY)
+        if last_mtime is not None and float(last_mtime) == dir_mtime:
+            return
+        if last_mtime is None:
+            self._backfill_credentials()
+
+        candidates = {}
+        with os.scandir(self.download_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith("."):
+                    candidates[str(Path(entry.path).resolve())] = entry.stat().st_mtime + self.orphan_seconds
+
+        if candidates:
+            paths = list(candidates)
+            scores = self.redis.zmscore(INDEX_KEY, paths)
+            unknown = {path: candidates[path] for path, score in zip(paths, scores) if score is None}
+            if unknown:
+                self.redis.zadd(INDEX_KEY, unknown, nx=True)
+                log.info(f"发现 {len(unknown)} 个未登记文件，已加入孤立文件清理索引")
+        self.redis.set(SCAN_MTIME_KEY, dir_mtime)
+
+    def _backfill_credentials(self) -> None:
+        """首次运行时把索引上线前已存在的下载凭证登记到索引中（只执行一次）。"""
+        count = 0
+        for key in self.redis.scan_iter(match="download:*"):
+            file_path = self.redis.hget(key, "file_path")
+            ttl = self.redis.ttl(key)
+            if file_path and ttl != -2:
+                self.register(key.split(":", 1)[1], Path(file_path), ttl if ttl > 0 else self.orphan_seconds)
+                count += 1
+        if count:
+            log.info(f"已将 {count} 个现有下载凭证登记到文件索引")
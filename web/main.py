@@ -1,29 +1,51 @@
 # web/main.py
 import asyncio
+import collections
 import json
 import logging
+import math
 import os
 import platform
 import subprocess
 import sys
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 from urllib.parse import urlparse
 
-import psutil
-from cachetools import TTLCache, cached
+from cachetools import cached
 from celery.result import AsyncResult
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
 from config_manager import config_manager
+from core.circuit_breaker import CircuitBreaker
 from core.command_builder import CommandBuilder
+from core.exceptions import CircuitOpenException
 from core.format_analyzer import FormatAnalyzer
+from core.metrics import (
+    CIRCUIT_REJECTIONS,
+    EXTRACTION_SECONDS,
+    STREAM_BYTES,
+    mark_process_dead,
+    record_cache,
+    render_metrics,
+    timed,
+    url_domain,
+)
 
 from .celery_app import celery_app
-from .tasks import download_video_task
+from .file_index import DownloadFileIndex
+from .process_registry import DisconnectAwareStreamingResponse, ProcessRegistry
+from .shared_cache import SharedTTLCache
+from .storage_manager import StorageManager
+from .stream_transport import coalesced_chunks, enlarge_stdout_pipe
+from .tasks import circuit_breaker, download_video_task, redis_client, work_dirs
+from .validation import is_playlist_url, validate_format_id, validate_url_security
+from .worker_control import WorkerControl
 
 
 def get_unified_audio_formats(raw_formats):
@@ -99,14 +121,33 @@ def select_best_audio_with_analyzer(raw_formats):
     return best_audio_info.raw_format
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    工作进程启动时加入Redis控制频道；停止时（ASGI服务器已等待进行中的流式下载结束）
+    回收剩余的子进程并注销。
+    """
+    await worker_control.start()
+    try:
+        yield
+    finally:
+        await worker_control.stop()
+        mark_process_dead(os.getpid())
+
+
 app = FastAPI(
     title="SmartDownloader API",
     description="API for downloading videos and audio.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Initialize application state
-app.state.active_processes = set()
+# 流式下载等接口启动的子进程登记在这里，取消接口和 /admin/processes 通过它回收和查看；
+# 多个工作进程时通过Redis控制频道互相通知回收
+process_registry = ProcessRegistry()
+worker_control = WorkerControl.from_config(redis_client, process_registry)
+app.state.process_registry = process_registry
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
@@ -117,10 +158,15 @@ log = logging.getLogger(__name__)
 # --- Cache Setup ---
 # Create a cache with a Time-To-Live (TTL) of 1 hour.
 # It will store up to 1024 recent results.
-cache = TTLCache(maxsize=1024, ttl=3600)
+# 多个工作进程时缓存保存在Redis中，所有进程共享；Redis不可用时退回到进程内
+shared_cache_redis = redis_client if config_manager.config.web.shared_state else None
+cache = SharedTTLCache(shared_cache_redis, "ytdlp_info", maxsize=1024, ttl=3600)
 
 # 专门的视频信息缓存，用于在视频和音频请求间共享数据
-video_info_cache = TTLCache(maxsize=512, ttl=3600)  # 1小时缓存
+video_info_cache = SharedTTLCache(shared_cache_redis, "video_info", maxsize=512, ttl=3600)  # 1小时缓存
+
+# 共享的命令构建器，按站点缓存yt-dlp参数模板
+command_builder = CommandBuilder()
 
 # --- Pydantic Models ---
 
@@ -131,6 +177,9 @@ class DownloadRequest(BaseModel):
     format_id: str = Field(..., description="The specific format ID to download.")
     resolution: str = Field("", description="The resolution of the video (e.g., '1080p60').")
     title: str = Field("", description="The title of the video/audio.")
+    filesize: Optional[float] = Field(
+        None, description="Estimated size in bytes of the selected format, used to reserve storage."
+    )
 
 
 class CancelRequest(BaseModel):
@@ -221,30 +270,31 @@ def get_cached_video_info(url: str, download_type: str = "all") -> Optional[dict
         缓存的视频信息，如果没有缓存则返回None
     """
     # 先检查完整信息缓存（download_type="all"）
-    full_cache_key = f"{url}:all"
-    if full_cache_key in video_info_cache:
+    # 共享缓存每次查询都访问Redis，用 get 一次取回，不先判断是否存在
+    full_info = video_info_cache.get(f"{url}:all")
+    if full_info is not None:
         log.info(f"命中完整视频信息缓存: {url}")
-        return video_info_cache[full_cache_key]
+        return full_info
 
     # 如果请求音频，检查是否有视频缓存可以复用
     if download_type == "audio":
-        video_cache_key = f"{url}:video"
-        if video_cache_key in video_info_cache:
+        video_info = video_info_cache.get(f"{url}:video")
+        if video_info is not None:
             log.info(f"音频请求复用视频缓存: {url}")
-            return video_info_cache[video_cache_key]
+            return video_info
 
     # 如果请求视频，检查是否有音频缓存可以复用
     if download_type == "video":
-        audio_cache_key = f"{url}:audio"
-        if audio_cache_key in video_info_cache:
+        audio_info = video_info_cache.get(f"{url}:audio")
+        if audio_info is not None:
             log.info(f"视频请求复用音频缓存: {url}")
-            return video_info_cache[audio_cache_key]
+            return audio_info
 
     # 检查当前请求类型的缓存
-    current_cache_key = f"{url}:{download_type}"
-    if current_cache_key in video_info_cache:
+    current_info = video_info_cache.get(f"{url}:{download_type}")
+    if current_info is not None:
         log.info(f"命中当前类型缓存: {url}:{download_type}")
-        return video_info_cache[current_cache_key]
+        return current_info
 
     return None
 
@@ -263,7 +313,25 @@ def set_video_info_cache(url: str, download_type: str, video_info: dict):
     log.debug(f"设置视频信息缓存: {cache_key}")
 
 
-@cached(cache)
+def estimate_format_size(video_info: dict, format_id: str) -> Optional[float]:
+    """
+    按视频信息估算所选格式的文件大小，合并格式（如 137+140）为各部分之和
+
+    Returns:
+        估算的字节数，任一部分没有大小信息时返回None
+    """
+    formats = {str(f.get("format_id")): f for f in video_info.get("formats", [])}
+    total = 0
+    for part in format_id.split("+"):
+        fmt = formats.get(part) or {}
+        size = fmt.get("filesize") or fmt.get("filesize_approx")
+        if not size:
+            return None
+        total += size
+    return total
+
+
+@cached(cache, key=lambda url, download_type="all": f"{url}:{download_type}")
 def fetch_video_info_sync(url: str, download_type: str = "all") -> dict:
     """
     This is a SYNCHRONOUS and BLOCKING function that fetches video info.
@@ -319,15 +387,18 @@ def fetch_video_info_sync(url: str, download_type: str = "all") -> dict:
             ]
         )
 
+        # 与下载使用同一站点档案，提取到的格式列表才一致
+        cmd.extend(command_builder.profile_args(url))
         cmd.append(url)
 
-        process = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=45,
-            check=True,  # 减少总超时时间
-        )
+        with timed(EXTRACTION_SECONDS, url_domain(url)):
+            process = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=45,
+                check=True,  # 减少总超时时间
+            )
         return json.loads(process.stdout)
     except subprocess.TimeoutExpired:
         # Raise standard exceptions to be handled by the endpoint
@@ -351,6 +422,16 @@ async def get_service_worker():
     return FileResponse(BASE_DIR / "static" / "service-worker.js", media_type="application/javascript")
 
 
+def circuit_open_error(error: CircuitOpenException, url: str, entrypoint: str) -> HTTPException:
+    """站点熔断时返回503，并通过Retry-After告知客户端冷却剩余时间"""
+    CIRCUIT_REJECTIONS.labels(url_domain(url), entrypoint).inc()
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+
+
 @app.post("/video-info", response_model=VideoInfo)
 async def get_video_info(request: VideoInfoRequest):
     """
@@ -388,7 +469,9 @@ async def get_video_info(request: VideoInfoRequest):
 
     try:
         # 首先尝试从智能缓存获取数据
-        cached_data = get_cached_video_info(request.url, request.download_type)
+        # 共享缓存在Redis中，查询放到线程中执行，不阻塞事件循环
+        cached_data = await asyncio.to_thread(get_cached_video_info, request.url, request.download_type)
+        record_cache("video_info", bool(cached_data))
 
         if cached_data:
             log.info(f"使用缓存的视频信息: {request.url} ({request.download_type})")
@@ -400,17 +483,20 @@ async def get_video_info(request: VideoInfoRequest):
             # Run the synchronous, cached function in a separate thread to avoid
             # blocking the main FastAPI event loop.
             # Provide backward compatibility for Python < 3.9
-            if sys.version_info >= (3, 9):
-                video_data_raw = await asyncio.to_thread(fetch_video_info_sync, request.url, request.download_type)
-            else:
-                loop = asyncio.get_running_loop()
-                video_data_raw = await loop.run_in_executor(
-                    None, fetch_video_info_sync, request.url, request.download_type
-                )
+            async with circuit_breaker.async_guard(request.url):
+                if sys.version_info >= (3, 9):
+                    video_data_raw = await asyncio.to_thread(fetch_video_info_sync, request.url, request.download_type)
+                else:
+                    loop = asyncio.get_running_loop()
+                    video_data_raw = await loop.run_in_executor(
+                        None, fetch_video_info_sync, request.url, request.download_type
+                    )
 
             # 将新获取的数据保存到智能缓存
-            set_video_info_cache(request.url, request.download_type, video_data_raw)
+            await asyncio.to_thread(set_video_info_cache, request.url, request.download_type, video_data_raw)
 
+    except CircuitOpenException as e:
+        raise circuit_open_error(e, request.url, "video_info")
     except TimeoutError as e:
         raise HTTPException(status_code=408, detail=str(e))
     except (RuntimeError, ValueError) as e:
@@ -846,236 +932,6 @@ async def get_video_info(request: VideoInfoRequest):
     )
 
 
-def is_playlist_url(url: str) -> bool:
-    """
-    检测URL是否为播放列表
-
-    Args:
-        url: 要检测的URL
-
-    Returns:
-        bool: 如果是播放列表URL返回True，否则返回False
-    """
-    import re
-    from urllib.parse import parse_qs, urlparse
-
-    try:
-        parsed_url = urlparse(url.lower())
-        query_params = parse_qs(parsed_url.query)
-
-        # YouTube播放列表检测
-        if "youtube.com" in parsed_url.netloc or "youtu.be" in parsed_url.netloc:
-            # 检查是否有播放列表参数
-            if "list" in query_params:
-                return True
-            # 检查URL路径是否包含播放列表标识
-            if "/playlist" in parsed_url.path:
-                return True
-
-        # Bilibili播放列表检测
-        if "bilibili.com" in parsed_url.netloc:
-            # 检查是否为播放列表/合集页面
-            if re.search(r"/video/[^/]+\?p=\d+", url):  # 分P视频
-                return True
-            if "/medialist/" in parsed_url.path:  # 播放列表
-                return True
-            if "/favlist/" in parsed_url.path:  # 收藏夹
-                return True
-
-        # 其他平台的通用播放列表检测
-        playlist_indicators = [
-            "playlist",
-            "album",
-            "collection",
-            "series",
-            "set",
-            "channel",
-            "user/",
-            "/c/",
-            "/channel/",
-        ]
-
-        for indicator in playlist_indicators:
-            if indicator in parsed_url.path.lower():
-                return True
-
-        return False
-
-    except Exception:
-        # 如果URL解析失败，保守处理，返回False
-        return False
-
-
-def validate_url_security(url: str) -> Tuple[bool, str]:
-    """
-    验证URL的安全性
-
-    Returns:
-        tuple[bool, str]: (is_valid, error_message)
-    """
-    if not url or not url.strip():
-        return False, "URL cannot be empty"
-
-    url = url.strip()
-
-    # 长度限制
-    if len(url) > 2048:
-        return False, "URL too long (max 2048 characters)"
-
-    # 安全协议检查
-    dangerous_protocols = [
-        "javascript:",
-        "data:",
-        "file:",
-        "ftp:",
-        "mailto:",
-        "tel:",
-        "sms:",
-        "vbscript:",
-        "about:",
-        "chrome:",
-        "chrome-extension:",
-        "moz-extension:",
-        "ms-appx:",
-        "x-javascript:",
-    ]
-
-    url_lower = url.lower()
-    for protocol in dangerous_protocols:
-        if url_lower.startswith(protocol):
-            return False, f"Dangerous protocol not allowed: {protocol}"
-
-    # XSS防护
-    import re
-
-    dangerous_patterns = [
-        r"<script[^>]*>",
-        r"</script>",
-        r"<iframe[^>]*>",
-        r"<object[^>]*>",
-        r"<embed[^>]*>",
-        r"<link[^>]*>",
-        r"<meta[^>]*>",
-        r"on\w+\s*=",  # 事件处理器
-    ]
-
-    for pattern in dangerous_patterns:
-        if re.search(pattern, url, re.IGNORECASE):
-            return False, "URL contains dangerous characters or tags"
-
-    # 检查空字节和换行符
-    if "\x00" in url or "\r" in url or "\n" in url:
-        return False, "URL contains dangerous characters or tags"
-
-    # URL格式验证和SSRF防护
-    try:
-        from urllib.parse import urlparse
-
-        parsed = urlparse(url)
-
-        # 只允许HTTP/HTTPS
-        if parsed.scheme not in ["http", "https"]:
-            return False, "Only HTTP and HTTPS protocols are allowed"
-
-        # 防止SSRF攻击
-        hostname = parsed.hostname
-        if not hostname:
-            return False, "Invalid hostname"
-
-        hostname_lower = hostname.lower()
-
-        # 禁止本地地址
-        forbidden_hosts = ["localhost", "127.0.0.1", "0.0.0.0", "::1", "[::1]"]
-
-        if hostname_lower in forbidden_hosts:
-            return False, "Access to local addresses is not allowed"
-
-        # 检查内网IP段
-        import ipaddress
-
-        try:
-            ip = ipaddress.ip_address(hostname)
-            if ip.is_private or ip.is_loopback or ip.is_link_local:
-                return False, "Access to private network addresses is not allowed"
-        except ValueError:
-            # 不是IP地址，是域名，继续检查
-            pass
-
-        # 检查端口安全性
-        if parsed.port:
-            dangerous_ports = [
-                22,
-                23,
-                25,
-                53,
-                110,
-                143,
-                993,
-                995,
-                1433,
-                3306,
-                5432,
-                6379,
-                27017,
-            ]
-            if parsed.port in dangerous_ports:
-                return False, f"Access to port {parsed.port} is not allowed"
-
-    except Exception as e:
-        return False, f"Invalid URL format: {str(e)}"
-
-    return True, ""
-
-
-def validate_format_id(format_id: str) -> Tuple[bool, str]:
-    """
-    验证格式ID的安全性和有效性
-
-    Returns:
-        tuple[bool, str]: (is_valid, error_message)
-    """
-    if not format_id or not format_id.strip():
-        return False, "Format ID cannot be empty"
-
-    # 防止路径遍历和注入攻击
-    dangerous_patterns = [
-        "../",  # 路径遍历
-        "..\\",  # Windows路径遍历
-        "<",
-        ">",
-        '"',
-        "'",
-        "\\",  # HTML/JS注入字符
-        "\x00",  # 空字节
-        "\r",
-        "\n",  # 换行符
-        ";",
-        "&",
-        "|",
-        "`",
-        "$",  # 命令注入字符
-    ]
-
-    for pattern in dangerous_patterns:
-        if pattern in format_id:
-            return False, f"Format ID contains dangerous characters: {pattern}"
-
-    # 长度限制
-    if len(format_id) > 100:
-        return False, "Format ID too long (max 100 characters)"
-
-    # 只允许字母、数字、连字符、下划线和加号
-    import re
-
-    if not re.match(r"^[a-zA-Z0-9_+-]+$", format_id):
-        return (
-            False,
-            "Format ID contains invalid characters (only alphanumeric, _, +, - allowed)",
-        )
-
-    return True, ""
-
-
 @app.post("/downloads", response_model=DownloadResponse, status_code=202)
 async def start_download(request: DownloadRequest):
     # 验证URL安全性
@@ -1092,12 +948,20 @@ async def start_download(request: DownloadRequest):
     if request.download_type not in ["video", "audio"]:
         raise HTTPException(status_code=400, detail="Invalid download type. Must be 'video' or 'audio'")
 
+    # 前端未提供文件大小时，从缓存的视频信息中查找所选格式的大小，用于预留存储空间
+    filesize = request.filesize
+    if not filesize:
+        video_info = await asyncio.to_thread(get_cached_video_info, request.url, request.download_type)
+        filesize = estimate_format_size(video_info, request.format_id) if video_info else None
+
     task = download_video_task.delay(
         video_url=request.url,
         download_type=request.download_type,
         format_id=request.format_id,
         resolution=request.resolution,
         title=request.title,
+        estimated_size=filesize,
+        enqueued_at=time.time(),
     )
     return {"task_id": task.id, "status": "pending"}
 
@@ -1207,6 +1071,14 @@ async def download_stream(
     if status_code == 200:
         log.info(f"Serving full content with chunked encoding (estimated size: {total_size or 'unknown'})")
 
+    # --- Circuit Breaker ---
+    # 请求参数都校验通过后再检查，被拒绝的请求不会占用半开状态下的探测名额
+    breaker_key = CircuitBreaker.key_for(url)
+    try:
+        breaker_probe = await asyncio.to_thread(circuit_breaker.allow, breaker_key)
+    except CircuitOpenException as e:
+        raise circuit_open_error(e, url, "stream")
+
     # --- Streamer Definition ---
     async def stream_downloader():
         import shutil
@@ -1215,50 +1087,64 @@ async def download_stream(
         # 1. 创建唯一的临时目录
         base_temp_dir = Path(config_manager.config.downloader.temp_path)
         unique_temp_dir = base_temp_dir / str(uuid.uuid4())
-        process = None  # 确保process变量在finally块中可用
+        record = None  # 确保record变量在finally块中可用
+        outcome_recorded = False
 
         try:
             unique_temp_dir.mkdir(parents=True, exist_ok=True)
             log.info(f"为下载创建了唯一的临时目录: {unique_temp_dir}")
 
             # 2. 构建并执行命令
-            command_builder = CommandBuilder()
             cmd = command_builder.build_streaming_download_cmd_to_stdout(
                 url, format_spec=format_id, byte_range=byte_range_tuple, temp_dir_path=str(unique_temp_dir)
             )
             log.info(f"Executing streaming command: {' '.join(cmd)}")
 
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
+            downloader_config = config_manager.config.downloader
+            max_chunk = downloader_config.stream_chunk_size_kb * 1024
+            record = await process_registry.spawn(
+                cmd,
+                owner="download-stream",
+                client=request.client.host if request.client else None,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
                 cwd=str(unique_temp_dir),  # 设置子进程工作目录为临时目录，避免在web目录生成--Frag*文件
+                limit=max_chunk,  # 读取端缓冲超过上限后暂停读取管道，向yt-dlp施加背压
             )
+            process = record.process
+            enlarge_stdout_pipe(process, downloader_config.stream_pipe_size_kb * 1024)
 
             async def log_stderr():
                 while True:
                     chunk = await process.stderr.read(1024)
                     if not chunk:
                         break
-                    log.warning(f"yt-dlp stderr: {chunk.decode(errors='ignore').strip()}")
+                    text = chunk.decode(errors="ignore")
+                    # 只保留最近的错误输出，供熔断器判断是否被限流
+                    stderr_tail.append(text)
+                    log.warning(f"yt-dlp stderr: {text.strip()}")
 
+            stderr_tail = collections.deque(maxlen=8)
             stderr_logger_task = asyncio.create_task(log_stderr())
+            client_disconnected = False
 
             # 3. 流式传输数据
+            # 客户端断开由 DisconnectAwareStreamingResponse 监听 http.disconnect 发现，
+            # 生成器在 yield 处收到 GeneratorExit（或读取时收到 CancelledError）
+            chunks = coalesced_chunks(process.stdout, max_chunk)
             try:
-                while True:
-                    if await request.is_disconnected():
-                        log.warning("Client disconnected, terminating download process.")
-                        process.terminate()
-                        break
-                    chunk = await process.stdout.read(65536)
-                    if not chunk:
-                        break
+                async for chunk in chunks:
+                    STREAM_BYTES.inc(len(chunk))
+                    record.bytes_sent += len(chunk)
                     yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                log.warning("Client disconnected, terminating download process group.")
+                client_disconnected = True
+                raise
             finally:
-                if process and process.returncode is None:
-                    process.terminate()
-                    await process.wait()
+                await chunks.aclose()
+                # 回收整个进程组，yt-dlp启动的ffmpeg不会残留
+                await process_registry.reap(record)
 
                 stderr_logger_task.cancel()
                 try:
@@ -1266,9 +1152,17 @@ async def download_stream(
                 except asyncio.CancelledError:
                     log.debug("Stderr logger task was correctly cancelled.")
 
-                log.info(f"yt-dlp process finished with exit code {process.returncode if process else 'N/A'}")
+                log.info(f"yt-dlp process finished with exit code {process.returncode}")
+                # 客户端中途断开时结果未知，不计入熔断状态
+                if not client_disconnected:
+                    error = None if process.returncode == 0 else "".join(stderr_tail) or "yt-dlp failed"
+                    await asyncio.to_thread(circuit_breaker.record_outcome, breaker_key, error, breaker_probe)
+                    outcome_recorded = True
 
         finally:
+            # 客户端断开或子进程未能启动时没有结果，释放探测名额，下一个请求可以重新探测
+            if breaker_probe and not outcome_recorded:
+                await asyncio.to_thread(circuit_breaker.release_probe, breaker_key)
             # 4. 强制清理唯一的临时目录
             if unique_temp_dir.exists():
                 shutil.rmtree(unique_temp_dir, ignore_errors=True)
@@ -1276,7 +1170,7 @@ async def download_stream(
 
     # --- Return Final Response ---
     try:
-        return StreamingResponse(
+        return DisconnectAwareStreamingResponse(
             stream_downloader(),
             media_type=media_type,
             headers=headers,
@@ -1377,43 +1271,6 @@ async def download_direct():
     }
 
 
-async def terminate_process_tree(process):
-    """
-    Terminate a process and all its child processes.
-    """
-    try:
-        if process.returncode is None:  # Process is still running
-            # First try graceful termination
-            process.terminate()
-            try:
-                await asyncio.wait_for(process.wait(), timeout=5.0)
-            except asyncio.TimeoutError:
-                # Force kill if graceful termination fails
-                log.warning(f"Process {process.pid} didn't terminate gracefully, force killing")
-                process.kill()
-                await process.wait()
-
-            # Also kill any child processes using psutil
-            try:
-                parent = psutil.Process(process.pid)
-                children = parent.children(recursive=True)
-                for child in children:
-                    child.terminate()
-                # Wait for children to terminate
-                psutil.wait_procs(children, timeout=3)
-                # Force kill any remaining children
-                for child in children:
-                    if child.is_running():
-                        child.kill()
-            except psutil.NoSuchProcess:
-                pass  # Process already terminated
-            except Exception as e:
-                log.warning(f"Failed to clean up child processes: {e}")
-
-    except Exception as e:
-        log.error(f"Error terminating process tree: {e}")
-
-
 @app.get("/debug/task/{task_id}")
 async def debug_task_status(task_id: str):
     """Debug endpoint to examine task status in detail"""
@@ -1541,8 +1398,10 @@ async def cancel_downloads(request: CancelRequest):
     # 2. Clean up any active streaming processes
     await cleanup_active_processes()
 
-    # 3. Clean up incomplete download files
+    # 3. Clean up incomplete download files, including the cancelled tasks' resumable work dirs
     cleanup_result = await cleanup_incomplete_downloads()
+    for task_id in request.task_ids:
+        await asyncio.to_thread(work_dirs.discard, task_id)
 
     # 4. Reset application state (lightweight approach)
     await reset_application_state()
@@ -1559,29 +1418,8 @@ async def cleanup_active_processes():
     Clean up any active streaming download processes.
     """
     try:
-        active_processes = getattr(app.state, "active_processes", set())
-        for pid in active_processes.copy():  # Use copy to avoid modification during iteration
-            try:
-                process = psutil.Process(pid)
-                if process.is_running():
-                    log.info(f"Terminating active process {pid}")
-                    process.terminate()
-                    # Wait a bit for graceful termination
-                    try:
-                        process.wait(timeout=3)
-                    except psutil.TimeoutExpired:
-                        # Force kill if needed
-                        process.kill()
-                active_processes.discard(pid)
-            except psutil.NoSuchProcess:
-                # Process already terminated
-                active_processes.discard(pid)
-            except Exception as e:
-                log.warning(f"Failed to terminate process {pid}: {e}")
-                active_processes.discard(pid)  # Remove from tracking anyway
-
-        # Clear the set
-        app.state.active_processes = set()
+        # 本进程立即回收，其他工作进程通过Redis控制频道收到通知
+        await worker_control.reap()
         log.info("Active processes cleanup completed")
 
     except Exception as e:
@@ -1634,7 +1472,7 @@ async def reset_application_state():
     """
     try:
         # 1. Clear cache
-        cache.clear()
+        await asyncio.to_thread(cache.clear)
         log.info("Application cache cleared")
 
         # 2. Reset any global variables or state
@@ -1763,8 +1601,11 @@ async def delete_file_by_task_id(task_id: str):
                 log.error(f"删除文件失败: {filename} - {e}")
                 raise HTTPException(status_code=500, detail=f"删除文件失败: {str(e)}")
 
-        # 3. 清理 Redis 记录
+        # 3. 清理 Redis 记录和文件索引
         redis_deleted = redis_client.delete(download_key)
+        orphan_seconds = config_manager.config.file_management.orphan_cleanup_seconds
+        DownloadFileIndex(redis_client, file_path.parent, orphan_seconds).unregister(file_path)
+        StorageManager.from_config(redis_client).forget(file_path)
 
         # 4. 返回删除结果
         result = {
@@ -1822,6 +1663,9 @@ async def download_file_by_task_id(task_id: str):
     if not file_path.is_file():
         raise HTTPException(status_code=404, detail="文件已从服务器清理，请重新发起下载。")
 
+    # 刷新访问时间，最近被取走的文件最后才会被配额淘汰
+    StorageManager.from_config(redis_client).record_access(file_path)
+
     # 3. 使用 FileResponse 提供下载
     # FileResponse 会自动设置 Content-Disposition 和 Content-Type
     return FileResponse(path=file_path, filename=filename, media_type=media_type)
@@ -1840,6 +1684,53 @@ async def list_downloads():
     return JSONResponse(content={"files": files})
 
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus指标。
+    """
+    if not config_manager.config.monitoring.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/admin/processes", response_class=JSONResponse)
+async def list_processes():
+    """
+    所有工作进程正在运行的子进程：所在工作进程、所有者、进程组、启动时间、已发送字节数和进程组中的孙进程。
+    其他工作进程的数据来自最近一次上报（web.heartbeat_seconds）。
+    """
+    workers = await asyncio.to_thread(worker_control.workers)
+    processes = [process for worker in workers for process in worker.pop("processes")]
+    return {"count": len(processes), "processes": processes, "workers": workers}
+
+
+@app.delete("/admin/processes/{pid}", response_class=JSONResponse)
+async def cancel_process(pid: int, worker: str):
+    """
+    结束指定的子进程（连同其进程组）。worker 为 /admin/processes 返回的工作进程ID（必填），
+    子进程在其他工作进程中时通过Redis控制频道通知该进程；不同主机上的PID可能相同，不能只按PID广播。
+    """
+    reaped = await worker_control.reap(worker=worker, pid=pid)
+    return {"pid": pid, "worker": worker, "reaped_locally": reaped}
+
+
+@app.get("/storage", response_class=JSONResponse)
+async def get_storage_usage():
+    """
+    返回下载存储的配额使用情况（已用、预留、磁盘剩余空间等）。
+    """
+    import redis
+
+    redis_client = redis.Redis.from_url(config_manager.config.celery.broker_url, decode_responses=True)
+    try:
+        report = await asyncio.to_thread(StorageManager.from_config(redis_client).report)
+    except redis.RedisError as e:
+        raise HTTPException(status_code=503, detail=f"无法读取存储状态: {e}")
+    return JSONResponse(content=report)
+
+
 @app.get("/files/{file_name}", response_class=FileResponse)
 @app.head("/files/{file_name}")
 async def get_downloaded_file(request: Request, file_name: str):
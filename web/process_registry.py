@@ -0,0 +1,203 @@
+# web/process_registry.py
+"""
+Web层子进程登记
+/download-stream 等接口启动的yt-dlp子进程都在这里登记（所有者、启动时间、已发送字节数），
+每个子进程运行在独立的进程组中，回收时向整个进程组发送信号，yt-dlp启动的ffmpeg等孙进程
+也一并结束。取消接口和管理接口通过登记表看到所有正在运行的子进程。
+
+流式响应使用 DisconnectAwareStreamingResponse：发送数据的同时监听ASGI的 http.disconnect 事件，
+客户端断开后立即关闭数据源，而不是等到下一次发送失败或轮询。
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import psutil
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from core.metrics import ACTIVE_SUBPROCESSES
+from core.tracing import redact_command
+
+log = logging.getLogger(__name__)
+
+# Windows没有进程组信号，退回到按进程树逐个结束
+_USE_PROCESS_GROUPS = os.name == "posix"
+
+
+@dataclass
+class ProcessRecord:
+    """一个登记的子进程"""
+
+    process: asyncio.subprocess.Process
+    owner: str
+    command: List[str]
+    client: Optional[str] = None
+    pgid: Optional[int] = None
+    started_at: float = field(default_factory=time.time)
+    bytes_sent: int = 0
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def describe(self) -> Dict[str, Any]:
+        """管理接口返回的进程信息，包括进程组中仍在运行的孙进程"""
+        members = []
+        try:
+            for child in psutil.Process(self.pid).children(recursive=True):
+                try:
+                    members.append({"pid": child.pid, "name": child.name()})
+                except psutil.Error:
+                    continue
+        except psutil.Error:
+            pass
+        return {
+            "pid": self.pid,
+            "pgid": self.pgid,
+            "owner": self.owner,
+            "client": self.client,
+            "command": " ".join(self.command),
+            "started_at": self.started_at,
+            "age_seconds": round(time.time() - self.started_at, 1),
+            "bytes_sent": self.bytes_sent,
+            "returncode": self.process.returncode,
+            "children": members,
+        }
+
+
+class ProcessRegistry:
+    """Web进程内所有子进程的登记表"""
+
+    def __init__(self, terminate_timeout: float = 5.0):
+        """
+        Args:
+            terminate_timeout: 发送SIGTERM后等待进程退出的时间（秒），超时后对整个进程组发送SIGKILL
+        """
+        self.terminate_timeout = terminate_timeout
+        self._records: Dict[int, ProcessRecord] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    async def spawn(self, cmd: List[str], owner: str, client: Optional[str] = None, **kwargs) -> ProcessRecord:
+        """
+        在新的进程组中启动子进程并登记
+
+        Args:
+            cmd: 命令，登记时隐去URL中的凭据
+            owner: 启动子进程的接口，取消时可按所有者回收
+            client: 发起请求的客户端地址
+            **kwargs: 传给 asyncio.create_subprocess_exec 的参数
+        """
+        if _USE_PROCESS_GROUPS:
+            kwargs["start_new_session"] = True
+        process = await asyncio.create_subprocess_exec(*cmd, **kwargs)
+        record = ProcessRecord(process, owner, redact_command(cmd), client)
+        if _USE_PROCESS_GROUPS:
+            try:
+                record.pgid = os.getpgid(process.pid)
+            except ProcessLookupError:
+                pass  # 已经退出，回收时按单个进程处理
+        self._records[process.pid] = record
+        ACTIVE_SUBPROCESSES.inc()
+        log.debug(f"登记子进程 {process.pid} ({owner})")
+        return record
+
+    def records(self, owner: Optional[str] = None) -> List[ProcessRecord]:
+        return [r for r in self._records.values() if owner is None or r.owner == owner]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [record.describe() for record in self._records.values()]
+
+    def _signal_group(self, record: ProcessRecord, sig: int) -> bool:
+        """向进程组（或进程树）发送信号，返回是否还有进程收到"""
+        if record.pgid is not None:
+            try:
+                os.killpg(record.pgid, sig)
+                return True
+            except (ProcessLookupError, PermissionError):
+                return False
+
+        try:
+            parent = psutil.Process(record.pid)
+            targets = parent.children(recursive=True) + [parent]
+        except psutil.NoSuchProcess:
+            return False
+        for target in targets:
+            try:
+                target.send_signal(sig)
+            except psutil.NoSuchProcess:
+                continue
+        return True
+
+    async def reap(self, record: ProcessRecord) -> Optional[int]:
+        """
+        结束子进程及其进程组中的所有进程并取消登记。
+        子进程已经自行退出时，仍会清理残留的孙进程。
+
+        Returns:
+            子进程的退出码
+        """
+        if self._records.pop(record.pid, None) is None:
+            return record.process.returncode
+        ACTIVE_SUBPROCESSES.dec()
+
+        if record.process.returncode is None:
+            self._signal_group(record, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(record.process.wait(), timeout=self.terminate_timeout)
+            except asyncio.TimeoutError:
+                log.warning(f"子进程 {record.pid} 未在 {self.terminate_timeout}s 内退出，强制结束进程组")
+        # 子进程退出后同一进程组中可能还留有孙进程（如ffmpeg）
+        if self._signal_group(record, getattr(signal, "SIGKILL", signal.SIGTERM)):
+            log.info(f"已结束子进程 {record.pid} 进程组中的残留进程")
+        if record.process.returncode is None:
+            await record.process.wait()
+        return record.process.returncode
+
+    async def reap_all(self, owner: Optional[str] = None) -> int:
+        """结束所有（或指定所有者的）子进程，返回结束的数量"""
+        records = self.records(owner)
+        await asyncio.gather(*(self.reap(record) for record in records), return_exceptions=True)
+        if records:
+            log.info(f"已回收 {len(records)} 个子进程")
+        return len(records)
+
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """
+    不论服务器声明的ASGI版本，都在发送数据的同时监听 http.disconnect 事件。
+    客户端断开时取消发送并关闭数据源，数据源（异步生成器）的 finally 块立即执行，
+    负责回收子进程；数据源在断开时收到 GeneratorExit 或 CancelledError。
+    """
+
+    async def _wait_for_disconnect(self, receive: Receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stream = asyncio.create_task(self.stream_response(send))
+        listener = asyncio.create_task(self._wait_for_disconnect(receive))
+        try:
+            await asyncio.wait({stream, listener}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (stream, listener):
+                task.cancel()
+            await asyncio.gather(stream, listener, return_exceptions=True)
+            await self.body_iterator.aclose()
+
+        if not stream.cancelled() and stream.exception() is not None:
+            if isinstance(stream.exception(), OSError):
+                raise ClientDisconnect() from stream.exception()
+            raise stream.exception()
+        if self.background is not None and not stream.cancelled():
+            await self.background()
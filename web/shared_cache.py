@@ -0,0 +1,109 @@
+# web/shared_cache.py
+"""
+Web工作进程共享的TTL缓存
+多个工作进程时，视频信息缓存放在Redis中（JSON序列化、按TTL过期），任一进程解析过的视频
+其他进程直接命中。Redis出错时在一段时间内改用进程内的TTLCache，不影响请求。
+缓存的读写都是同步的Redis调用，异步接口中应通过 asyncio.to_thread 使用。
+"""
+
+import json
+import logging
+import time
+from collections.abc import MutableMapping
+from typing import Any, Iterator
+
+from cachetools import TTLCache
+
+log = logging.getLogger(__name__)
+
+# Redis出错后改用进程内缓存的时间（秒），之后再尝试Redis
+_RETRY_AFTER_SECONDS = 30
+
+
+class SharedTTLCache(MutableMapping):
+    """键为字符串、值可JSON序列化的TTL缓存，可直接用于 cachetools.cached"""
+
+    def __init__(self, redis_client, namespace: str, maxsize: int, ttl: int):
+        """
+        Args:
+            redis_client: Redis客户端（decode_responses=True）；None时只使用进程内缓存
+            namespace: Redis键前缀 webcache:<namespace>:
+            maxsize: 进程内缓存的条目上限
+            ttl: 过期时间（秒）
+        """
+        self.redis = redis_client
+        self.prefix = f"webcache:{namespace}:"
+        self.ttl = ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._retry_at = 0.0
+
+    def _shared(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._retry_at
+
+    def _fail(self, e: Exception) -> None:
+        log.warning(f"共享缓存 {self.prefix} 不可用，{_RETRY_AFTER_SECONDS}秒内使用进程内缓存: {e}")
+        self._retry_at = time.monotonic() + _RETRY_AFTER_SECONDS
+
+    def __getitem__(self, key: str) -> Any:
+        if self._shared():
+            try:
+                raw = self.redis.get(self.prefix + key)
+            except Exception as e:
+                self._fail(e)
+            else:
+                if raw is None:
+                    raise KeyError(key)
+                return json.loads(raw)
+        return self._local[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self._shared():
+            try:
+                self.redis.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+                return
+            except Exception as e:
+                self._fail(e)
+        self._local[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if self._shared():
+            try:
+                if not self.redis.delete(self.prefix + key):
+                    raise KeyError(key)
+                return
+            except KeyError:
+                raise
+            except Exception as e:
+                self._fail(e)
+        del self._local[key]
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        if self._shared():
+            try:
+                keys = [key[len(self.prefix) :] for key in self.redis.scan_iter(match=self.prefix + "*")]
+            except Exception as e:
+                self._fail(e)
+            else:
+                return iter(keys)
+        return iter(list(self._local))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def clear(self) -> None:
+        """清空缓存（包括Redis中其他工作进程写入的条目）"""
+        self._local.clear()
+        if self._shared():
+            try:
+                keys = list(self.redis.scan_iter(match=self.prefix + "*"))
+                if keys:
+                    self.redis.delete(*keys)
+            except Exception as e:
+                self._fail(e)
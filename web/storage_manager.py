@@ -0,0 +1,214 @@
+# web/storage_manager.py
+"""
+磁盘配额管理
+下载前按预估文件大小预留空间；预留会超出配额时，按最近最少访问（LRU）
+淘汰已完成的下载文件。预留和访问记录保存在Redis中，由所有worker共享。
+"""
+
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config_manager import config
+from core import InsufficientStorageException
+
+from .content_store import ContentStore
+from .file_index import OWNER_KEY, DownloadFileIndex
+
+log = logging.getLogger(__name__)
+
+# 哈希: 任务ID -> "预留字节数:过期时间戳"
+RESERVATIONS_KEY = "storage:reservations"
+# 有序集合: 已完成文件路径 -> 最近一次被访问（下载完成或被用户取走）的时间戳
+ACCESS_KEY = "storage:last_access"
+# 跨worker串行化配额判断的锁
+LOCK_KEY = "storage:lock"
+
+MB = 1024 * 1024
+
+
+class StorageManager:
+    """下载目录和临时目录的配额管理器"""
+
+    def __init__(
+        self,
+        redis_client,
+        roots: List[Path],
+        quota_bytes: int = 0,
+        min_free_bytes: int = 0,
+        reservation_ttl: int = 900,
+    ):
+        """
+        Args:
+            redis_client: Redis客户端（decode_responses=True）
+            roots: 计入配额的目录（下载目录、临时目录）
+            quota_bytes: 配额字节数，0表示只检查磁盘剩余空间
+            min_free_bytes: 磁盘至少保留的剩余空间
+            reservation_ttl: 预留的最长有效期（秒），防止崩溃的任务永久占用配额
+        """
+        self.redis = redis_client
+        self.roots = [Path(root).resolve() for root in roots]
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self.reservation_ttl = reservation_ttl
+
+    @classmethod
+    def from_config(cls, redis_client) -> "StorageManager":
+        """按配置创建配额管理器"""
+        fm_config = config.file_management
+        roots = [Path(config.downloader.save_path)]
+        if config.downloader.temp_path:
+            roots.append(Path(config.downloader.temp_path))
+        return cls(redis_client, roots, fm_config.storage_quota_mb * MB, fm_config.min_free_space_mb * MB)
+
+    def usage_bytes(self) -> int:
+        """统计各目录中文件的总字节数（嵌套目录只统计一次，同一内容的硬链接只统计一次）"""
+        roots = [root for root in self.roots if not any(other in root.parents for other in self.roots)]
+        total = 0
+        linked = set()
+        for root in dict.fromkeys(roots):
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    try:
+                        stat = os.stat(os.path.join(dirpath, name))
+                    except OSError:
+                        continue
+                    if stat.st_nlink > 1:
+                        if (stat.st_dev, stat.st_ino) in linked:
+                            continue
+                        linked.add((stat.st_dev, stat.st_ino))
+                    total += stat.st_size
+        return total
+
+    def reserved_bytes(self, now: Optional[float] = None) -> int:
+        """当前有效预留的总字节数，顺带清除过期的预留"""
+        now = now or time.time()
+        total = 0
+        expired = []
+        for task_id, value in self.redis.hgetall(RESERVATIONS_KEY).items():
+            size, expires_at = value.split(":")
+            if float(expires_at) < now:
+                expired.append(task_id)
+            else:
+                total += int(size)
+        if expired:
+            self.redis.hdel(RESERVATIONS_KEY, *expired)
+        return total
+
+    def reserve(self, task_id: str, estimated_bytes: int) -> None:
+        """
+        为下载任务预留空间，必要时按LRU淘汰已完成的文件。
+
+        Raises:
+            InsufficientStorageException: 淘汰后仍无法满足预留
+        """
+        with self.redis.lock(LOCK_KEY, timeout=60, blocking_timeout=30):
+            shortfall = self._shortfall(estimated_bytes)
+            if shortfall > 0:
+                freed = self.evict(shortfall)
+                shortfall -= freed
+            if shortfall > 0:
+                raise InsufficientStorageException(
+                    f"存储空间不足: 需要 {estimated_bytes / MB:.1f}MB，淘汰后仍缺 {shortfall / MB:.1f}MB"
+                )
+            self.redis.hset(RESERVATIONS_KEY, task_id, f"{estimated_bytes}:{time.time() + self.reservation_ttl}")
+        log.info(f"已为任务 {task_id} 预留 {estimated_bytes / MB:.1f}MB 存储空间")
+
+    def shrink(self, task_id: str, remaining_bytes: int) -> None:
+        """
+        下载过程中缩减任务的预留。已写入磁盘的部分已计入磁盘用量，
+        预留只需覆盖尚未写入的部分；预留只减不增，保留原过期时间。
+        """
+        value = self.redis.hget(RESERVATIONS_KEY, task_id)
+        if not value:
+            return
+        size, expires_at = value.split(":")
+        remaining_bytes = max(0, int(remaining_bytes))
+        if remaining_bytes < int(size):
+            self.redis.hset(RESERVATIONS_KEY, task_id, f"{remaining_bytes}:{expires_at}")
+
+    def release(self, task_id: str) -> None:
+        """释放任务的预留（下载完成或失败后调用）"""
+        self.redis.hdel(RESERVATIONS_KEY, task_id)
+
+    def record_access(self, file_path: Path) -> None:
+        """记录已完成文件的最近访问时间，作为LRU淘汰依据"""
+        self.redis.zadd(ACCESS_KEY, {str(Path(file_path).resolve()): time.time()})
+
+    def forget(self, file_path: Path) -> None:
+        """文件被删除后移除访问记录"""
+        self.redis.zrem(ACCESS_KEY, str(Path(file_path).resolve()))
+
+    def evict(self, bytes_needed: int) -> int:
+        """
+        按最近最少访问顺序删除已完成的文件，同时作废其下载凭证。
+
+        Returns:
+            int: 实际释放的字节数
+        """
+        freed = 0
+        evicted = []
+        content_store = ContentStore(self.redis, self.roots[0])
+        for path in self.redis.zrange(ACCESS_KEY, 0, -1):
+            if freed >= bytes_needed:
+                break
+            file_path = Path(path)
+            try:
+                stat = file_path.stat()
+                file_path.unlink()
+                # 内容存储中的硬链接只有在最后一个引用删除后才真正释放空间
+                freed += stat.st_size if stat.st_nlink == 1 else content_store.collect()
+                evicted.append(file_path.name)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.error(f"淘汰文件 {file_path.name} 失败: {e}")
+                continue
+
+            owner = self.redis.hget(OWNER_KEY, path)
+            if owner:
+                self.redis.delete(f"download:{owner}")
+            DownloadFileIndex(self.redis, file_path.parent, 0).unregister(file_path)
+            self.forget(file_path)
+
+        if evicted:
+            log.warning(f"配额不足，按LRU淘汰 {len(evicted)} 个文件，释放 {freed / MB:.1f}MB: {evicted}")
+        return freed
+
+    def _shortfall(self, estimated_bytes: int) -> int:
+        """预留estimated_bytes后超出配额或低于最小剩余空间的字节数"""
+        reserved = self.reserved_bytes()
+        shortfall = 0
+        if self.quota_bytes:
+            shortfall = self.usage_bytes() + reserved + estimated_bytes - self.quota_bytes
+        return max(shortfall, self.min_free_bytes + reserved + estimated_bytes - self._disk_free())
+
+    def _disk_free(self) -> int:
+        """各目录所在磁盘中最小的剩余空间（目录尚未创建时取最近的已存在上级目录）"""
+        free = []
+        for root in self.roots:
+            existing = root
+            while not existing.exists() and existing != existing.parent:
+                existing = existing.parent
+            free.append(shutil.disk_usage(existing).free)
+        return min(free)
+
+    def report(self) -> Dict[str, Any]:
+        """配额使用情况"""
+        used = self.usage_bytes()
+        reserved = self.reserved_bytes()
+        disk_free = self._disk_free()
+        report = {
+            "used_mb": round(used / MB, 2),
+            "reserved_mb": round(reserved / MB, 2),
+            "disk_free_mb": round(disk_free / MB, 2),
+            "quota_mb": round(self.quota_bytes / MB, 2) if self.quota_bytes else None,
+            "utilization_percent": None,
+            "tracked_files": self.redis.zcard(ACCESS_KEY),
+        }
+        if self.quota_bytes:
+            report["utilization_percent"] = round((used + reserved) * 100 / self.quota_bytes, 1)
+        return report
@@ -0,0 +1,98 @@
+# web/stream_transport.py
+"""
+流式下载的子进程输出传输
+yt-dlp的stdout管道默认只有64KB，按64KB读取、逐块交给ASGI服务器时，每GB需要约16000次
+事件循环往返。这里把管道扩大到配置的容量（Linux的 F_SETPIPE_SZ），并按客户端的消费速度
+合并数据块：客户端跟不上yt-dlp时缓冲区会积满，数据块逐步加大到上限，减少往返次数；
+数据来得比客户端消费慢时数据块缩小，不增加首字节延迟。
+
+读取端的缓冲区超过上限后暂停读取管道，管道写满后yt-dlp阻塞在写入上，慢客户端不会让
+Web进程无限占用内存。ASGI不暴露客户端套接字，无法用splice把管道直接接到套接字上。
+"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# 数据块的下限，与原先的固定读取大小相同
+MIN_CHUNK_SIZE = 64 * 1024
+_PIPE_MAX_SIZE_FILE = "/proc/sys/fs/pipe-max-size"
+
+
+def _pipe_max_size() -> Optional[int]:
+    """非特权进程可设置的管道容量上限"""
+    try:
+        with open(_PIPE_MAX_SIZE_FILE, encoding="ascii") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def enlarge_pipe(fd: int, size: int) -> Optional[int]:
+    """
+    扩大管道容量。
+
+    Args:
+        fd: 管道任一端的文件描述符
+        size: 期望的容量（字节），超过系统上限时取上限
+
+    Returns:
+        实际容量，平台不支持时返回None
+    """
+    if fcntl is None or not hasattr(fcntl, "F_SETPIPE_SZ"):
+        return None
+    limit = _pipe_max_size()
+    if limit:
+        size = min(size, limit)
+    try:
+        return fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, size)
+    except OSError as e:
+        log.debug(f"无法把管道容量设置为 {size} 字节: {e}")
+        try:
+            return fcntl.fcntl(fd, fcntl.F_GETPIPE_SZ)
+        except OSError:
+            return None
+
+
+def enlarge_stdout_pipe(process: asyncio.subprocess.Process, size: int) -> Optional[int]:
+    """扩大子进程stdout管道的容量，管道写端由子进程持有，在读取端设置即可"""
+    if size <= 0:
+        return None
+    transport = getattr(process, "_transport", None)
+    pipe_transport = transport.get_pipe_transport(1) if transport else None
+    pipe = pipe_transport.get_extra_info("pipe") if pipe_transport else None
+    if pipe is None:
+        return None
+    capacity = enlarge_pipe(pipe.fileno(), size)
+    if capacity:
+        log.debug(f"子进程 {process.pid} 的stdout管道容量: {capacity // 1024}KB")
+    return capacity
+
+
+async def coalesced_chunks(
+    reader: asyncio.StreamReader, max_chunk: int, min_chunk: int = MIN_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    读取到EOF，按消费速度合并数据块。
+
+    生成器在上一块发送完之后才继续读取，这时缓冲区中积累的数据说明客户端比数据源慢：
+    读满当前块大小时加倍（不超过 max_chunk），不足四分之一时减半（不低于 min_chunk）。
+    读取端的缓冲上限（StreamReader的limit）应不小于 max_chunk，否则数据块到不了上限。
+    """
+    chunk_size = min_chunk
+    while True:
+        chunk = await reader.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) == chunk_size and chunk_size < max_chunk:
+            chunk_size = min(chunk_size * 2, max_chunk)
+        elif len(chunk) < chunk_size // 4 and chunk_size > min_chunk:
+            chunk_size = max(chunk_size // 2, min_chunk)
@@ -1,6 +1,7 @@
 # web/tasks.py
 import asyncio
 import logging
+import math
 import sys
 import time
 from datetime import datetime, timezone
@@ -12,9 +13,27 @@ from celery import Task
 from celery.signals import task_failure, task_postrun, task_prerun, task_revoked
 
 from config_manager import config, config_manager
+from core.circuit_breaker import CircuitBreaker
+from core.exceptions import CircuitOpenException
+from core.metrics import (
+    CIRCUIT_REJECTIONS,
+    DOWNLOAD_BYTES,
+    DOWNLOAD_SECONDS,
+    DOWNLOAD_THROUGHPUT,
+    PROGRESS_UPDATES,
+    QUEUE_WAIT_SECONDS,
+    record_cache,
+    url_domain,
+)
+from core.retry_manager import RetryBudget, retry_budget
+from core.transfer_tuner import TransferTuner
 from downloader import Downloader
 
 from .celery_app import celery_app
+from .content_store import ContentStore
+from .file_index import DownloadFileIndex
+from .storage_manager import MB, StorageManager
+from .work_dirs import TaskWorkDirs
 
 # 这是一个常见的模式，以确保当Celery worker在不同环境中启动时，
 # 它仍然可以找到项目根目录下的模块（如`downloader`, `core`等）。
@@ -32,6 +51,21 @@ except Exception as e:
     log.error(f"无法在模块加载时初始化Redis客户端: {e}")
     redis_client = None
 
+# 按站点的熔断器，状态保存在Redis中，所有worker共享
+circuit_breaker = CircuitBreaker.from_config(redis_client)
+
+# 分片并发数的站点统计和全局连接预算，所有worker共享
+transfer_tuner = TransferTuner.from_config(redis_client)
+
+
+def _result_expiry_seconds() -> int:
+    expires = celery_app.conf.result_expires
+    return int(expires.total_seconds()) if hasattr(expires, "total_seconds") else int(expires or 86400)
+
+
+# 可续传下载的任务工作目录；任务结果过期后仍无变化的目录视为废弃
+work_dirs = TaskWorkDirs.from_config(_result_expiry_seconds())
+
 
 class BaseDownloadTask(Task):
     """基础下载任务类，提供通用功能"""
@@ -200,8 +234,6 @@ def task_revoked_handler(
     bind=True,
     name="download_video_task",
     base=BaseDownloadTask,
-    autoretry_for=(ConnectionError, TimeoutError),
-    retry_kwargs={"max_retries": 3, "countdown": 60},
     soft_time_limit=600,  # 10分钟软限制
     time_limit=900,  # 15分钟硬限制
     acks_late=True,
@@ -215,13 +247,21 @@ def download_video_task(
     resolution: str = "",
     title: str = "",
     custom_path: str = None,
+    estimated_size: float = None,
+    enqueued_at: float = None,
+    retry_state: dict = None,
 ):
     task_id = self.request.id
+    storage = None
+    # 任务级重试预算，下载器内的各重试层共享；Celery重试时通过 retry_state 延续已花费的部分
+    budget = RetryBudget.from_config(retry_state)
     try:
         if not redis_client:
             raise ConnectionError("Redis client not initialized")
 
         self.start_time = time.time()
+        if enqueued_at:
+            QUEUE_WAIT_SECONDS.observe(max(0.0, self.start_time - enqueued_at))
 
         # 更新任务状态
         self.update_state(state="PROGRESS", meta={"status": "正在下载中", "progress": 0})
@@ -241,10 +281,8 @@ def download_video_task(
             if not download_folder.exists():
                 download_folder.mkdir(parents=True, exist_ok=True)
 
-            # 检查磁盘空间（至少需要1GB）
-            free_space = psutil.disk_usage(download_folder).free
-            if free_space < 1024 * 1024 * 1024:  # 1GB
-                raise Exception(f"Insufficient disk space: {free_space / 1024 / 1024:.2f} MB available")
+            # 本次下载的完整预留和上次按进度缩减预留时的进度
+            reservation_state = {"full": 0, "progress": 0}
 
             # 定义进度回调函数
             def progress_callback(message: str, progress: int, eta_seconds: int = 0, speed: str = ""):
@@ -252,6 +290,14 @@ def download_video_task(
                 # 确保进度值在合理范围内
                 progress = max(0, min(100, progress))
 
+                # 已写入磁盘的部分会计入磁盘用量，按进度逐步缩减预留，避免重复计算而淘汰文件
+                if reservation_state["full"] and progress - reservation_state["progress"] >= 5:
+                    reservation_state["progress"] = progress
+                    try:
+                        storage.shrink(task_id, reservation_state["full"] * (100 - progress) // 100)
+                    except Exception as shrink_error:
+                        log.debug(f"缩减存储预留失败: {shrink_error}")
+
                 meta = {"status": message, "progress": progress}
 
                 # 如果有ETA信息，添加到meta中
@@ -268,6 +314,7 @@ def download_video_task(
 
                 try:
                     self.update_state(state="PROGRESS", meta=meta)
+                    PROGRESS_UPDATES.labels("celery").inc()
                 except Exception as update_error:
                     # 进度更新失败时只记录日志，不影响下载过程
                     log.debug(f"Failed to update progress state: {update_error}")
@@ -275,42 +322,96 @@ def download_video_task(
                 # 记录详细的进度信息用于调试
                 log.debug(f"进度回调: {progress}% - {message} (ETA: {eta_seconds}s, 速度: {speed})")
 
+            # 同一视频的同一格式已被下载过时，直接从内容存储链接，无需重新下载
+            content_key = ContentStore.content_key(video_url, download_type, format_id, resolution)
+            output_file = None
+            if content_key:
+                output_file = content_store.checkout(content_key, download_folder, task_id)
+                record_cache("content_store", output_file is not None)
+
+            reused = output_file is not None
+            workdir = None
+            breaker_key = CircuitBreaker.key_for(video_url)
+            breaker_probe = False
+            if not reused:
+                # 站点熔断时直接抛出 CircuitOpenException，任务按剩余冷却时间推迟；
+                # 在占用工作目录和预留空间（可能淘汰文件）之前检查
+                breaker_probe = circuit_breaker.allow(breaker_key)
+                try:
+                    # 续传模式下在任务自己的工作目录中下载，重试和重新投递时从已下载的部分继续
+                    if config.downloader.resumable_downloads:
+                        workdir = work_dirs.acquire(task_id, download_type, format_id, resolution)
+                    # 按预估大小预留存储空间（留10%余量），不足时按LRU淘汰旧文件
+                    if estimated_size:
+                        reservation = int(estimated_size * 1.1)
+                    else:
+                        reservation = config.file_management.default_reservation_mb * MB
+                    reservation_state["full"] = reservation
+                    # 已下载的部分已经占用磁盘，只预留剩余部分
+                    if workdir:
+                        reservation = max(0, reservation - TaskWorkDirs.size(workdir))
+                    storage.reserve(task_id, reservation)
+                except Exception:
+                    if breaker_probe:
+                        circuit_breaker.release_probe(breaker_key)
+                    raise
+
             # 初始化下载器，传入进度回调
-            self.downloader = Downloader(download_folder=download_folder, progress_callback=progress_callback)
-
-            if download_type == "video":
-                # 视频下载 - 使用智能策略
-                output_file = await self.downloader.download_with_smart_strategy(
-                    video_url=video_url,
-                    fallback_prefix=title or task_id,
-                    format_id=format_id if format_id != "best" else None,
-                    resolution=resolution,
-                )
-
-            elif download_type == "audio":
-                # 音频下载逻辑
-                if format_id and "conversion" in format_id:
-                    audio_format = format_id.split("-")[0]
-                    if audio_format not in ["mp3", "m4a", "wav"]:
-                        audio_format = "mp3"
-                    log.info(
-                        f"音频转换任务: url={video_url}, 请求的format_id='{format_id}', 解析的audio_format='{audio_format}'"
-                    )
-                else:
-                    audio_format = format_id
-                    log.info(f"直接音频下载任务: url={video_url}, 使用原始format_id='{audio_format}'")
-
-                output_file = await self.downloader.download_audio(
-                    video_url=video_url,
-                    audio_format=audio_format,
-                    fallback_prefix=title or task_id,
-                )
+            self.downloader = Downloader(
+                download_folder=workdir or download_folder,
+                progress_callback=progress_callback,
+                resumable=workdir is not None,
+                transfer_tuner=transfer_tuner,
+            )
+
+            if output_file:
+                progress_callback("下载完成", 100)
             else:
-                raise ValueError(f"无效的下载类型: {download_type}")
+                with circuit_breaker.track(breaker_key, breaker_probe):
+                    if download_type == "video":
+                        # 视频下载 - 使用智能策略
+                        output_file = await self.downloader.download_with_smart_strategy(
+                            video_url=video_url,
+                            fallback_prefix=title or task_id,
+                            format_id=format_id if format_id != "best" else None,
+                            resolution=resolution,
+                        )
+
+                    elif download_type == "audio":
+                        # 音频下载逻辑
+                        if format_id and "conversion" in format_id:
+                            audio_format = format_id.split("-")[0]
+                            if audio_format not in ["mp3", "m4a", "wav"]:
+                                audio_format = "mp3"
+                            log.info(
+                                f"音频转换任务: url={video_url}, 请求的format_id='{format_id}', 解析的audio_format='{audio_format}'"
+                            )
+                        else:
+                            audio_format = format_id
+                            log.info(f"直接音频下载任务: url={video_url}, 使用原始format_id='{audio_format}'")
+
+                        output_file = await self.downloader.download_audio(
+                            video_url=video_url,
+                            audio_format=audio_format,
+                            fallback_prefix=title or task_id,
+                        )
+                    else:
+                        raise ValueError(f"无效的下载类型: {download_type}")
 
             # 验证输出文件
             if not output_file or not output_file.exists():
                 raise FileNotFoundError("下载后未找到输出文件")
+            if workdir:
+                output_file = work_dirs.promote(workdir, output_file, download_folder, task_id)
+            if content_key:
+                content_store.ingest(content_key, output_file)
+            if not reused:
+                file_size = output_file.stat().st_size
+                elapsed = time.time() - self.start_time
+                DOWNLOAD_BYTES.labels(download_type).inc(file_size)
+                DOWNLOAD_SECONDS.labels(download_type).observe(elapsed)
+                if elapsed > 0:
+                    DOWNLOAD_THROUGHPUT.labels(download_type).observe(file_size / elapsed)
 
             # --- 新增逻辑：注册下载凭证到 Redis ---
             download_key = f"download:{task_id}"
@@ -326,6 +427,10 @@ def download_video_task(
             pipe.hset(download_key, mapping=file_info)
             pipe.expire(download_key, config.file_management.redis_expiry_seconds)  # 使用配置的Redis过期时间
             pipe.execute()
+            # 登记到文件索引，凭证过期后由清理任务删除对应文件
+            file_index = DownloadFileIndex(redis_client, download_folder, config.file_management.orphan_cleanup_seconds)
+            file_index.register(task_id, output_file, config.file_management.redis_expiry_seconds)
+            storage.record_access(output_file)
 
             log.info(f"文件下载完成并注册到 Redis: {output_file.name} (凭证: {task_id})")
 
@@ -338,6 +443,11 @@ def download_video_task(
                 "file_size": output_file.stat().st_size,
                 "duration": time.time() - self.start_time,
             }
+            # 各下载阶段的耗时，便于定位慢任务卡在哪一步（复用已存储内容时没有下载过程）
+            if self.downloader.last_trace is not None:
+                final_result["timings"] = self.downloader.last_trace.summary()
+            if budget.retries or budget.fallbacks:
+                final_result["retries"] = budget.report()
 
             # 更新最终状态，将完整结果放入 meta
             try:
@@ -354,22 +464,48 @@ def download_video_task(
             log.warning(f"High memory usage: {memory.percent}%")
             # 可以选择延迟任务或减少并发
 
+        storage = StorageManager.from_config(redis_client)
+        content_store = ContentStore.from_config(redis_client)
+
         # 运行异步下载
-        result = asyncio.run(_async_download())
+        with retry_budget(budget):
+            result = asyncio.run(_async_download())
         return result
 
+    except CircuitOpenException as e:
+        # 站点限流期间不占用worker，等熔断冷却后再执行
+        log.warning(f"任务 {task_id} 推迟 {e.retry_after:.0f}s: {e}")
+        CIRCUIT_REJECTIONS.labels(url_domain(video_url), "celery").inc()
+        raise self.retry(exc=e, countdown=math.ceil(e.retry_after), max_retries=3)
+
     except (ConnectionError, TimeoutError) as e:
-        log.error(f"Redis连接错误: {e}")
-        raise self.retry(exc=e, countdown=10, max_retries=3)
+        log.error(f"连接错误: {e}")
+        delay = budget.acquire("celery", e)
+        if delay is None:
+            log.error(f"任务 {task_id} 重试预算已用尽: {budget.report()}")
+            work_dirs.discard(task_id)
+            raise Exception(f"Task failed: {str(e)}")
+        raise self.retry(
+            exc=e,
+            countdown=math.ceil(delay),
+            max_retries=config.downloader.max_retries,
+            kwargs={**self.request.kwargs, "retry_state": budget.report()},
+        )
 
     except Exception as e:
-        # 记录详细错误信息
+        # 记录详细错误信息，包括重试预算的花费情况
         log.error(f"Download task {task_id} failed: {str(e)}", exc_info=True)
+        if budget.retries or budget.fallbacks:
+            log.error(f"任务 {task_id} 重试预算花费: {budget.report()}")
+        # 任务不会再被重试，部分下载已无用
+        work_dirs.discard(task_id)
         # 确保异常信息格式正确
         error_message = f"Task failed: {str(e)}"
         raise Exception(error_message)
 
     finally:
+        if storage:
+            storage.release(task_id)
         # 清理资源
         self.cleanup_resources()
 
@@ -378,9 +514,9 @@ def download_video_task(
 @celery_app.task(bind=True, name="cleanup_expired_files", soft_time_limit=300, time_limit=600)
 def cleanup_expired_files(self):
     """
-    定期清理过期文件的任务
-    - 清理Redis中已过期的下载凭证对应的文件
-    - 清理孤立的文件（没有对应Redis记录的文件）
+    定期清理过期文件的任务（基于文件索引的增量清理）
+    - 删除下载凭证已过期的文件（按索引中的到期时间，只处理到期条目）
+    - 清理孤立的文件（下载目录有变化时增量登记，超过孤立时间后删除）
     """
     log.info("开始执行文件清理任务...")
 
@@ -389,97 +525,32 @@ def cleanup_expired_files(self):
         return
 
     download_folder = Path(config_manager.config.downloader.save_path)
-
-    cleanup_stats = {
-        "expired_files_deleted": [],
-        "orphaned_files_deleted": [],
-        "total_size_freed_mb": 0,
-        "errors": [],
-    }
+    if not download_folder.exists():
+        log.info("下载目录不存在，跳过清理")
+        return {"expired_files_deleted": [], "orphaned_files_deleted": [], "total_size_freed_mb": 0, "errors": []}
 
     try:
-        if not download_folder.exists():
-            log.info("下载目录不存在，跳过清理")
-            return cleanup_stats
-
-        # 1. 获取所有现存文件
-        existing_files = {}
-        for file_path in download_folder.iterdir():
-            if file_path.is_file() and not file_path.name.startswith("."):
-                existing_files[str(file_path)] = file_path
-
-        log.info(f"发现 {len(existing_files)} 个文件需要检查")
-
-        # 2. 获取所有Redis中的下载记录
-        active_download_keys = set()
-        valid_file_paths = set()
-
-        # 扫描Redis中所有以"download:"开头的键
-        for key in redis_client.scan_iter(match="download:*"):
-            try:
-                file_info = redis_client.hgetall(key)
-                if file_info and "file_path" in file_info:
-                    active_download_keys.add(key)
-                    valid_file_paths.add(file_info["file_path"])
-            except Exception as e:
-                log.error(f"检查Redis键 {key} 时出错: {e}")
-                cleanup_stats["errors"].append(f"Redis键检查错误: {key}")
-
-        log.info(f"Redis中有 {len(active_download_keys)} 个活跃的下载记录")
-
-        # 3. 清理孤立文件（存在于文件系统但没有Redis记录的文件）
-        for file_path_str, file_path in existing_files.items():
-            if file_path_str not in valid_file_paths:
-                try:
-                    # 检查文件是否超过1.5小时（90分钟），给一些缓冲时间
-                    file_age = time.time() - file_path.stat().st_mtime
-                    if file_age > config.file_management.orphan_cleanup_seconds:  # 使用配置的孤立文件清理时间
-                        file_size = file_path.stat().st_size
-                        file_path.unlink()
-                        cleanup_stats["orphaned_files_deleted"].append(file_path.name)
-                        cleanup_stats["total_size_freed_mb"] += file_size / (1024 * 1024)
-                        log.info(f"清理孤立文件: {file_path.name} ({file_size / (1024 * 1024):.2f}MB)")
-                except Exception as e:
-                    cleanup_stats["errors"].append(f"删除孤立文件失败: {file_path.name} - {str(e)}")
-                    log.error(f"删除孤立文件 {file_path.name} 失败: {e}")
-
-        # 4. 清理已过期的Redis记录对应的文件
-        for key in list(active_download_keys):
-            try:
-                # 检查键是否仍然存在（可能已被Redis自动过期）
-                if not redis_client.exists(key):
-                    # 键已过期，查找对应文件并删除
-                    task_id = key.replace("download:", "")
-                    # 尝试找到可能存在的对应文件
-                    for file_path_str, file_path in existing_files.items():
-                        if task_id in file_path.name or file_path.name in [
-                            f.get("filename", "")
-                            for f in [redis_client.hgetall(k) for k in active_download_keys if redis_client.exists(k)]
-                        ]:
-                            continue  # 这个文件还有有效的Redis记录
-
-                    # 如果文件确实对应于过期的记录，删除它
-                    # 这里的逻辑可能需要根据实际的文件命名规则调整
-                    pass  # 暂时跳过，因为Redis自动过期已经处理了大部分情况
-
-            except Exception as e:
-                cleanup_stats["errors"].append(f"处理过期记录失败: {key} - {str(e)}")
-                log.error(f"处理过期记录 {key} 失败: {e}")
-
-        # 5. 记录清理结果
-        cleanup_stats["total_size_freed_mb"] = round(cleanup_stats["total_size_freed_mb"], 2)
+        file_index = DownloadFileIndex(redis_client, download_folder, config.file_management.orphan_cleanup_seconds)
+        cleanup_stats = file_index.cleanup_due()
+        # 最后一个引用被清理后回收内容块
+        blob_freed = ContentStore.from_config(redis_client).collect()
+        # 回收崩溃后没有再被执行的任务留下的工作目录
+        work_stats = work_dirs.collect()
+        cleanup_stats["abandoned_work_dirs_deleted"] = work_stats["removed"]
+        cleanup_stats["total_size_freed_mb"] = round(
+            cleanup_stats["total_size_freed_mb"] + (blob_freed + work_stats["freed_bytes"]) / (1024 * 1024), 2
+        )
 
         log.info(
-            f"文件清理完成 - 孤立文件: {len(cleanup_stats['orphaned_files_deleted'])}个, "
+            f"文件清理完成 - 过期文件: {len(cleanup_stats['expired_files_deleted'])}个, "
+            f"孤立文件: {len(cleanup_stats['orphaned_files_deleted'])}个, "
             f"释放空间: {cleanup_stats['total_size_freed_mb']}MB, "
             f"错误: {len(cleanup_stats['errors'])}个"
         )
-
         return cleanup_stats
 
     except Exception as e:
         log.error(f"文件清理任务失败: {e}")
-        cleanup_stats["errors"].append(f"清理任务错误: {str(e)}")
         raise e
 
 
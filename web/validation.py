@@ -0,0 +1,182 @@
+# web/validation.py
+"""
+请求参数校验
+URL安全校验、格式ID校验和播放列表识别，供 /video-info、/downloads、/download-stream 共用。
+所有模式在导入时编译为合并的正则，黑名单用集合查找；URL校验结果只取决于URL本身，
+按去除首尾空白后的URL缓存最近的结论，同一视频的重复请求无需再次解析。
+"""
+
+import ipaddress
+import re
+from functools import lru_cache
+from typing import Tuple
+from urllib.parse import parse_qs, urlparse
+
+MAX_URL_LENGTH = 2048
+MAX_FORMAT_ID_LENGTH = 100
+
+# 最近URL校验结论的缓存条数
+URL_VERDICT_CACHE_SIZE = 4096
+
+_DANGEROUS_PROTOCOLS = (
+    "javascript:",
+    "data:",
+    "file:",
+    "ftp:",
+    "mailto:",
+    "tel:",
+    "sms:",
+    "vbscript:",
+    "about:",
+    "chrome:",
+    "chrome-extension:",
+    "moz-extension:",
+    "ms-appx:",
+    "x-javascript:",
+)
+_DANGEROUS_PROTOCOL_PATTERN = re.compile("|".join(map(re.escape, _DANGEROUS_PROTOCOLS)), re.IGNORECASE)
+
+# XSS防护: 脚本类标签、事件处理器（onload= 等）以及空字节和换行符
+_DANGEROUS_CONTENT_PATTERN = re.compile(
+    r"<(?:script|iframe|object|embed|link|meta)[^>]*>|</script>|on\w+\s*=|[\x00\r\n]",
+    re.IGNORECASE,
+)
+
+_ALLOWED_SCHEMES = frozenset({"http", "https"})
+_FORBIDDEN_HOSTS = frozenset({"localhost", "127.0.0.1", "0.0.0.0", "::1", "[::1]"})
+_DANGEROUS_PORTS = frozenset({22, 23, 25, 53, 110, 143, 993, 995, 1433, 3306, 5432, 6379, 27017})
+
+# 合法格式ID只含字母、数字、_、+、-；命中即可直接放行
+_FORMAT_ID_PATTERN = re.compile(rf"[a-zA-Z0-9_+-]{{1,{MAX_FORMAT_ID_LENGTH}}}")
+# 路径遍历、HTML/JS注入和命令注入字符，按报告优先级排列
+_FORMAT_ID_DANGEROUS = ("../", "..\\", "<", ">", '"', "'", "\\", "\x00", "\r", "\n", ";", "&", "|", "`", "$")
+
+_YOUTUBE_HOSTS = ("youtube.com", "youtu.be")
+_BILIBILI_PART_PATTERN = re.compile(r"/video/[^/]+\?p=\d+")
+_BILIBILI_LIST_PATTERN = re.compile(r"/medialist/|/favlist/")
+_PLAYLIST_PATH_PATTERN = re.compile(
+    "|".join(
+        map(re.escape, ("playlist", "album", "collection", "series", "set", "channel", "user/", "/c/", "/channel/"))
+    )
+)
+
+
+def validate_url_security(url: str) -> Tuple[bool, str]:
+    """
+    验证URL的安全性
+
+    Returns:
+        tuple[bool, str]: (is_valid, error_message)
+    """
+    if not url or not url.strip():
+        return False, "URL cannot be empty"
+
+    url = url.strip()
+
+    # 长度限制（在查缓存之前，超长URL不进入缓存）
+    if len(url) > MAX_URL_LENGTH:
+        return False, f"URL too long (max {MAX_URL_LENGTH} characters)"
+
+    return _check_url(url)
+
+
+@lru_cache(maxsize=URL_VERDICT_CACHE_SIZE)
+def _check_url(url: str) -> Tuple[bool, str]:
+    """对已去除首尾空白的URL做协议、XSS和SSRF检查，结论按URL缓存"""
+    protocol = _DANGEROUS_PROTOCOL_PATTERN.match(url)
+    if protocol:
+        return False, f"Dangerous protocol not allowed: {protocol.group().lower()}"
+
+    if _DANGEROUS_CONTENT_PATTERN.search(url):
+        return False, "URL contains dangerous characters or tags"
+
+    # URL格式验证和SSRF防护
+    try:
+        parsed = urlparse(url)
+
+        # 只允许HTTP/HTTPS
+        if parsed.scheme not in _ALLOWED_SCHEMES:
+            return False, "Only HTTP and HTTPS protocols are allowed"
+
+        hostname = parsed.hostname
+        if not hostname:
+            return False, "Invalid hostname"
+
+        # 禁止本地地址
+        if hostname.lower() in _FORBIDDEN_HOSTS:
+            return False, "Access to local addresses is not allowed"
+
+        # 检查内网IP段；域名直接跳过
+        if hostname[0].isdigit() or ":" in hostname:
+            try:
+                ip = ipaddress.ip_address(hostname)
+                if ip.is_private or ip.is_loopback or ip.is_link_local:
+                    return False, "Access to private network addresses is not allowed"
+            except ValueError:
+                pass
+
+        # 检查端口安全性
+        if parsed.port in _DANGEROUS_PORTS:
+            return False, f"Access to port {parsed.port} is not allowed"
+
+    except Exception as e:
+        return False, f"Invalid URL format: {str(e)}"
+
+    return True, ""
+
+
+def validate_format_id(format_id: str) -> Tuple[bool, str]:
+    """
+    验证格式ID的安全性和有效性
+
+    Returns:
+        tuple[bool, str]: (is_valid, error_message)
+    """
+    if _FORMAT_ID_PATTERN.fullmatch(format_id or ""):
+        return True, ""
+
+    # 不合法时逐项检查，给出具体原因
+    if not format_id or not format_id.strip():
+        return False, "Format ID cannot be empty"
+
+    for pattern in _FORMAT_ID_DANGEROUS:
+        if pattern in format_id:
+            return False, f"Format ID contains dangerous characters: {pattern}"
+
+    if len(format_id) > MAX_FORMAT_ID_LENGTH:
+        return False, f"Format ID too long (max {MAX_FORMAT_ID_LENGTH} characters)"
+
+    return False, "Format ID contains invalid characters (only alphanumeric, _, +, - allowed)"
+
+
+@lru_cache(maxsize=URL_VERDICT_CACHE_SIZE)
+def is_playlist_url(url: str) -> bool:
+    """
+    检测URL是否为播放列表
+
+    Args:
+        url: 要检测的URL
+
+    Returns:
+        bool: 如果是播放列表URL返回True，否则返回False
+    """
+    try:
+        parsed_url = urlparse(url.lower())
+        netloc, path = parsed_url.netloc, parsed_url.path
+
+        # YouTube播放列表: list参数或 /playlist 路径
+        if any(host in netloc for host in _YOUTUBE_HOSTS):
+            if "list" in parse_qs(parsed_url.query) or "/playlist" in path:
+                return True
+
+        # Bilibili分P视频、播放列表和收藏夹
+        if "bilibili.com" in netloc:
+            if _BILIBILI_PART_PATTERN.search(url) or _BILIBILI_LIST_PATTERN.search(path):
+                return True
+
+        # 其他平台的通用播放列表检测
+        return bool(_PLAYLIST_PATH_PATTERN.search(path))
+
+    except Exception:
+        # 如果URL解析失败，保守处理，返回False
+        return False
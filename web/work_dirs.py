@@ -0,0 +1,134 @@
+# web/work_dirs.py
+"""
+可续传下载的任务工作目录
+每个下载任务在临时目录下使用独立的工作目录（按任务ID和请求的格式命名），yt-dlp以续传方式
+在其中下载。任务重试或worker崩溃后重新投递时，同一任务会回到同一目录，从已下载的
+.part 文件和分片继续，而不是从头开始。
+
+下载完成后文件移动到下载目录并删除工作目录；任务最终失败或被取消时直接删除。
+worker崩溃且任务没有再被执行时留下的目录，在超过任务结果的有效期仍无变化后由清理任务回收。
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config_manager import config
+
+from .content_store import task_file_name
+
+log = logging.getLogger(__name__)
+
+WORK_DIR_NAME = "work"
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class TaskWorkDirs:
+    """管理临时目录下各任务的工作目录"""
+
+    def __init__(self, root: Path, expiry_seconds: int):
+        """
+        Args:
+            root: 所有工作目录的父目录
+            expiry_seconds: 工作目录无任何写入多久后视为已废弃（与任务结果的有效期一致）
+        """
+        self.root = Path(root).resolve()
+        self.expiry_seconds = expiry_seconds
+
+    @classmethod
+    def from_config(cls, expiry_seconds: int) -> "TaskWorkDirs":
+        temp_path = config.downloader.temp_path or config.downloader.save_path
+        return cls(Path(temp_path) / WORK_DIR_NAME, expiry_seconds)
+
+    @staticmethod
+    def key(task_id: str, download_type: str, format_id: str, resolution: str = "") -> str:
+        """工作目录名: 任务ID加请求格式的摘要，同一任务换了格式时不会续传到错误的文件上"""
+        digest = hashlib.sha1(f"{download_type}|{format_id}|{resolution}".encode("utf-8")).hexdigest()[:12]
+        return f"{_UNSAFE_CHARS.sub('_', task_id)}-{digest}"
+
+    def acquire(self, task_id: str, download_type: str, format_id: str, resolution: str = "") -> Path:
+        """返回任务的工作目录；已存在时（重试或重新投递）保留其中的部分下载"""
+        workdir = self.root / self.key(task_id, download_type, format_id, resolution)
+        if workdir.exists():
+            log.info(f"续传任务 {task_id}: 工作目录中已有 {self.size(workdir) / (1024 * 1024):.1f}MB")
+        workdir.mkdir(parents=True, exist_ok=True)
+        return workdir
+
+    @staticmethod
+    def size(workdir: Path) -> int:
+        """工作目录中已下载的字节数"""
+        total = 0
+        for dirpath, _, filenames in os.walk(workdir):
+            for name in filenames:
+                try:
+                    total += os.stat(os.path.join(dirpath, name)).st_size
+                except OSError:
+                    continue
+        return total
+
+    def promote(self, workdir: Path, output_file: Path, destination: Path, task_id: str) -> Path:
+        """
+        把下载完成的文件移动到下载目录，并删除工作目录。
+        下载目录中已有同名文件（属于其他任务）时，文件名后加任务ID的前8位，不覆盖已有文件。
+        """
+        destination.mkdir(parents=True, exist_ok=True)
+        final_path = destination / output_file.name
+        if final_path.exists():
+            final_path = destination / task_file_name(output_file.name, task_id)
+        shutil.move(str(output_file), str(final_path))
+        shutil.rmtree(workdir, ignore_errors=True)
+        return final_path
+
+    def discard(self, task_id: str) -> int:
+        """删除任务的所有工作目录（任务最终失败或被取消），返回释放的字节数"""
+        freed = 0
+        prefix = f"{_UNSAFE_CHARS.sub('_', task_id)}-"
+        if not self.root.exists():
+            return freed
+        for workdir in self.root.iterdir():
+            if workdir.is_dir() and workdir.name.startswith(prefix):
+                freed += self.size(workdir)
+                shutil.rmtree(workdir, ignore_errors=True)
+                log.info(f"删除任务 {task_id} 的工作目录: {workdir.name}")
+        return freed
+
+    @staticmethod
+    def _last_activity(workdir: Path) -> float:
+        """目录及其中文件的最近修改时间（下载中的 .part 文件会持续更新）"""
+        latest = workdir.stat().st_mtime
+        for dirpath, _, filenames in os.walk(workdir):
+            for name in filenames:
+                try:
+                    latest = max(latest, os.stat(os.path.join(dirpath, name)).st_mtime)
+                except OSError:
+                    continue
+        return latest
+
+    def collect(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """回收超过有效期仍无变化的工作目录"""
+        now = now or time.time()
+        stats = {"removed": [], "freed_bytes": 0}
+        if not self.root.exists():
+            return stats
+        for workdir in self.root.iterdir():
+            try:
+                if not workdir.is_dir() or now - self._last_activity(workdir) < self.expiry_seconds:
+                    continue
+                size = self.size(workdir)
+                shutil.rmtree(workdir)
+            except OSError as e:
+                log.warning(f"回收工作目录失败 {workdir}: {e}")
+                continue
+            stats["removed"].append(workdir.name)
+            stats["freed_bytes"] += size
+        if stats["removed"]:
+            log.info(
+                f"回收 {len(stats['removed'])} 个废弃的工作目录，释放 {stats['freed_bytes'] / (1024 * 1024):.1f}MB"
+            )
+        return stats
@@ -0,0 +1,190 @@
+# web/worker_control.py
+"""
+Web工作进程间的协调
+每个工作进程有自己的 ProcessRegistry。多个工作进程时：
+- 取消请求可能落在任一进程上，回收子进程的指令通过Redis频道 web:control 发给所有进程，
+  指令可指定目标进程和子进程PID；
+- 每个进程定期把自己登记的子进程写入 web:worker:<进程ID>（带过期时间），
+  /admin/processes 汇总所有进程的列表；
+- 进程停止时（包括滚动重启），在ASGI服务器等待进行中的流式下载结束之后，
+  回收仍在运行的子进程并注销。
+
+Redis不可用时只作用于本进程。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional
+
+from config_manager import config
+
+from .process_registry import ProcessRegistry
+
+log = logging.getLogger(__name__)
+
+CONTROL_CHANNEL = "web:control"
+WORKER_KEY_PREFIX = "web:worker:"
+
+
+class WorkerControl:
+    """本工作进程的子进程登记表在Redis上的入口"""
+
+    def __init__(self, redis_client, registry: ProcessRegistry, heartbeat_seconds: int = 5):
+        """
+        Args:
+            redis_client: Redis客户端（decode_responses=True）；None时只作用于本进程
+            registry: 本进程的子进程登记表
+            heartbeat_seconds: 上报子进程列表的间隔（秒），记录在三个间隔后过期
+        """
+        self.redis = redis_client
+        self.registry = registry
+        self.heartbeat_seconds = heartbeat_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.started_at = time.time()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, redis_client, registry: ProcessRegistry) -> "WorkerControl":
+        settings = config.web
+        return cls(redis_client if settings.shared_state else None, registry, settings.heartbeat_seconds)
+
+    @property
+    def connected(self) -> bool:
+        return self._listener is not None
+
+    async def start(self) -> None:
+        """订阅控制频道并开始上报，Redis不可用时只记录警告"""
+        if self.redis is None:
+            return
+        self._loop = asyncio.get_running_loop()
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{CONTROL_CHANNEL: self._on_message})
+            self._listener = pubsub.run_in_thread(
+                sleep_time=1.0, daemon=True, exception_handler=self._on_listener_error
+            )
+        except Exception as e:
+            log.warning(f"无法订阅 {CONTROL_CHANNEL}，取消下载只作用于本进程: {e}")
+            return
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        log.info(f"工作进程 {self.worker_id} 已加入 {CONTROL_CHANNEL}")
+
+    async def stop(self) -> None:
+        """回收本进程剩余的子进程，停止订阅并注销"""
+        reaped = await self.registry.reap_all()
+        if reaped:
+            log.warning(f"工作进程 {self.worker_id} 停止时仍有 {reaped} 个流式下载未结束，已回收")
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+            try:
+                self.redis.delete(WORKER_KEY_PREFIX + self.worker_id)
+            except Exception as e:
+                log.debug(f"注销工作进程失败: {e}")
+
+    def state(self) -> Dict[str, Any]:
+        """本进程的状态和登记的子进程"""
+        processes = self.registry.snapshot()
+        for process in processes:
+            process["worker"] = self.worker_id
+        return {
+            "worker": self.worker_id,
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "updated_at": time.time(),
+            "processes": processes,
+        }
+
+    def _report(self) -> None:
+        self.redis.set(
+            WORKER_KEY_PREFIX + self.worker_id,
+            json.dumps(self.state(), ensure_ascii=False),
+            ex=self.heartbeat_seconds * 3,
+        )
+
+    async def _heartbeat(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self._report)
+            except Exception as e:
+                log.debug(f"上报工作进程状态失败: {e}")
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    def workers(self) -> List[Dict[str, Any]]:
+        """所有工作进程的状态，本进程的是实时数据，其他进程的来自最近一次上报"""
+        states = {self.worker_id: self.state()}
+        if self.connected:
+            try:
+                for key in self.redis.scan_iter(match=WORKER_KEY_PREFIX + "*"):
+                    raw = self.redis.get(key)
+                    if raw:
+                        state = json.loads(raw)
+                        states.setdefault(state["worker"], state)
+            except Exception as e:
+                log.warning(f"读取其他工作进程状态失败: {e}")
+        return list(states.values())
+
+    async def handle(self, command: Dict[str, Any]) -> int:
+        """
+        执行回收指令。
+
+        Args:
+            command: {"action": "reap", "worker": 目标进程（可选）, "pid": 子进程PID（可选）,
+                "owner": 所有者（可选）}
+
+        Returns:
+            回收的子进程数
+        """
+        if command.get("action") != "reap":
+            log.warning(f"未知的控制指令: {command}")
+            return 0
+        if command.get("worker") not in (None, self.worker_id):
+            return 0
+        pid = command.get("pid")
+        records = [r for r in self.registry.records(command.get("owner")) if pid is None or r.pid == pid]
+        await asyncio.gather(*(self.registry.reap(record) for record in records), return_exceptions=True)
+        if records:
+            log.info(f"工作进程 {self.worker_id} 按指令回收了 {len(records)} 个子进程")
+        return len(records)
+
+    def _on_listener_error(self, error: BaseException, pubsub, thread) -> None:
+        """连接断开时订阅线程稍后重试，期间其他进程发出的指令会丢失"""
+        log.warning(f"控制频道连接异常，{self.heartbeat_seconds}秒后重试: {error}")
+        time.sleep(self.heartbeat_seconds)
+
+    def _on_message(self, message: Dict[str, Any]) -> None:
+        """订阅线程收到指令，交给事件循环执行；本进程发出的指令已在本地执行过"""
+        try:
+            command = json.loads(message["data"])
+        except (TypeError, ValueError):
+            log.warning(f"无法解析控制指令: {message.get('data')!r}")
+            return
+        if command.get("origin") == self.worker_id or self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.handle(command), self._loop)
+
+    async def reap(self, worker: Optional[str] = None, pid: Optional[int] = None, owner: Optional[str] = None) -> int:
+        """
+        回收子进程：本进程立即执行，其他工作进程通过控制频道通知。
+
+        Returns:
+            本进程回收的子进程数
+        """
+        command = {"action": "reap", "worker": worker, "pid": pid, "owner": owner, "origin": self.worker_id}
+        reaped = await self.handle(command)
+        if self.connected and worker != self.worker_id:
+            try:
+                await asyncio.to_thread(self.redis.publish, CONTROL_CHANNEL, json.dumps(command))
+            except Exception as e:
+                log.warning(f"无法通知其他工作进程回收子进程: {e}")
+        return reaped